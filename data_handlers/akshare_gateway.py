@@ -0,0 +1,269 @@
+#!/usr/bin/env python3
+"""
+akshare调用网关
+所有akshare上游调用统一经由此处：按函数名与规范化参数缓存结果（按交易日历确定有效期、
+LRU淘汰），合并相同的并发请求，每个函数独立熔断，并在单次超时与时间预算内等待结果
+"""
+
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, NamedTuple, Optional, Tuple
+
+import akshare as ak
+import pandas as pd
+
+from utils.circuit_breaker import CircuitBreaker, CircuitOpenError
+from utils.rate_limiter import RateLimiter
+from utils.single_flight import SingleFlight
+from utils.trading_calendar import TradingCalendar, trading_calendar
+from utils.upstream import Budget, upstream
+
+logger = logging.getLogger(__name__)
+
+
+class FunctionPolicy(NamedTuple):
+    """akshare函数的缓存策略"""
+    kind: Optional[str]  # 交易日历中的数据类别，决定缓存有效期；None表示不缓存
+    timeout: float = 30  # 单次调用超时（秒）
+
+
+# 各akshare函数的缓存策略，未登记的函数使用DEFAULT_POLICY
+FUNCTION_POLICIES: Dict[str, FunctionPolicy] = {
+    'stock_sh_a_spot_em': FunctionPolicy(None, timeout=120),  # 行情快照由数据处理器自行缓存
+    'stock_individual_info_em': FunctionPolicy('company_info', timeout=10),
+    'stock_value_em': FunctionPolicy('valuation'),
+    'stock_individual_fund_flow': FunctionPolicy('fund_flow'),
+    'stock_zh_index_daily_em': FunctionPolicy('index_history'),
+    'stock_zh_a_hist': FunctionPolicy('daily_bars'),
+    'stock_zh_a_hist_min_em': FunctionPolicy('intraday_bars'),
+    'stock_intraday_em': FunctionPolicy(None, timeout=20),  # 逐笔成交由采集管道自行去重落盘
+    'stock_zh_a_tick_tx_js': FunctionPolicy(None, timeout=20),
+    'stock_intraday_sina': FunctionPolicy(None, timeout=20),
+    'stock_financial_abstract': FunctionPolicy('fundamental'),
+    'stock_financial_report_sina': FunctionPolicy('fundamental'),
+}
+
+DEFAULT_POLICY = FunctionPolicy('fundamental')
+
+# 空结果的缓存时间（秒），避免无效代码反复请求上游
+EMPTY_RESULT_TTL = 300
+
+
+class _Entry:
+    """缓存条目"""
+
+    __slots__ = ('value', 'fetched_at', 'expires_at')
+
+    def __init__(self, value: Any, fetched_at: float, expires_at: float):
+        self.value = value
+        self.fetched_at = fetched_at
+        self.expires_at = expires_at
+
+
+def _normalize(value: Any) -> Hashable:
+    """规范化参数值，使等价参数得到相同的缓存键"""
+    if isinstance(value, str):
+        return value.strip()
+    if isinstance(value, (list, tuple)):
+        return tuple(_normalize(v) for v in value)
+    if isinstance(value, dict):
+        return tuple(sorted((k, _normalize(v)) for k, v in value.items()))
+    return value
+
+
+def _copy(value: Any) -> Any:
+    """DataFrame结果返回副本，避免调用方修改缓存内容"""
+    if isinstance(value, (pd.DataFrame, pd.Series)):
+        return value.copy()
+    return value
+
+
+def _is_empty(value: Any) -> bool:
+    if value is None:
+        return True
+    if isinstance(value, (pd.DataFrame, pd.Series)):
+        return value.empty
+    return False
+
+
+class AkshareGateway:
+    """akshare调用网关"""
+
+    def __init__(self, max_entries: Optional[int] = None, calendar: Optional[TradingCalendar] = None,
+                 max_stale_seconds: Optional[float] = None):
+        """
+        Args:
+            max_entries: 缓存条目上限，默认读取AKSHARE_CACHE_MAX_ENTRIES
+            calendar: 交易日历，决定缓存有效期
+            max_stale_seconds: 上游不可用时过期缓存最长可用时间（秒），默认读取AKSHARE_MAX_STALE_SECONDS
+        """
+        self.max_entries = max_entries or int(os.environ.get('AKSHARE_CACHE_MAX_ENTRIES', 512))
+        self.max_stale_seconds = (max_stale_seconds if max_stale_seconds is not None
+                                  else float(os.environ.get('AKSHARE_MAX_STALE_SECONDS', 7 * 86400)))
+        self.calendar = calendar or trading_calendar
+
+        self._cache: 'OrderedDict[Tuple, _Entry]' = OrderedDict()
+        self._lock = threading.Lock()
+        self._single_flight = SingleFlight()
+        self._breakers: Dict[str, CircuitBreaker] = {}
+        self._stats: Dict[str, Dict[str, float]] = {}
+
+    def breaker(self, func_name: str) -> CircuitBreaker:
+        """获取akshare函数对应的熔断器"""
+        with self._lock:
+            breaker = self._breakers.get(func_name)
+            if breaker is None:
+                breaker = self._breakers[func_name] = CircuitBreaker(func_name)
+            return breaker
+
+    def _record(self, func_name: str, field: str, latency_ms: Optional[float] = None):
+        with self._lock:
+            stats = self._stats.get(func_name)
+            if stats is None:
+                stats = self._stats[func_name] = {'hits': 0, 'misses': 0, 'errors': 0, 'stale_served': 0,
+                                                  'upstream': 0, 'upstream_ms_total': 0.0, 'upstream_ms_max': 0.0}
+            stats[field] += 1
+            if latency_ms is not None:
+                stats['upstream_ms_total'] += latency_ms
+                stats['upstream_ms_max'] = max(stats['upstream_ms_max'], latency_ms)
+
+    def _get_entry(self, key: Tuple) -> Optional[_Entry]:
+        with self._lock:
+            entry = self._cache.get(key)
+            if entry is not None:
+                self._cache.move_to_end(key)
+            return entry
+
+    def _put_entry(self, key: Tuple, entry: _Entry):
+        with self._lock:
+            self._cache[key] = entry
+            self._cache.move_to_end(key)
+            while len(self._cache) > self.max_entries:
+                self._cache.popitem(last=False)
+
+    def call(self, func_name: str, use_cache: bool = True, timeout: Optional[float] = None,
+             budget: Optional[Budget] = None, rate_limiter: Optional[RateLimiter] = None, **kwargs) -> Any:
+        """
+        调用akshare函数
+
+        Args:
+            func_name: akshare函数名
+            use_cache: 是否使用缓存，为False时总是请求上游、失败时不返回旧数据，结果也不写入缓存
+                （批量同步等自行落盘的调用方，其参数含增量起点，写入缓存只会挤出常用条目）
+            timeout: 单次调用超时（秒），默认使用函数策略
+            budget: 请求整体时间预算
+            rate_limiter: 发起上游请求前需要获取令牌的限流器
+            **kwargs: akshare函数参数
+
+        Returns:
+            akshare函数返回值（DataFrame为副本）
+
+        Raises:
+            CircuitOpenError: 熔断且没有可用的旧数据
+            UpstreamTimeout: 超时且没有可用的旧数据
+        """
+        policy = FUNCTION_POLICIES.get(func_name, DEFAULT_POLICY)
+        key = (func_name, _normalize(kwargs))
+        cacheable = policy.kind is not None
+
+        if use_cache and cacheable:
+            entry = self._get_entry(key)
+            if entry is not None and entry.expires_at > time.time():
+                self._record(func_name, 'hits')
+                return _copy(entry.value)
+
+        def load():
+            # 合并期间其他调用者可能已刷新缓存
+            if use_cache and cacheable:
+                entry = self._get_entry(key)
+                if entry is not None and entry.expires_at > time.time():
+                    self._record(func_name, 'hits')
+                    return entry.value
+            return self._fetch(func_name, key, policy, timeout, budget, rate_limiter, use_cache, kwargs)
+
+        # 不缓存的调用结果不能在调用者之间共享，因此不合并
+        value = self._single_flight.do((key, use_cache), load) if cacheable else load()
+        return _copy(value)
+
+    def _fetch(self, func_name: str, key: Tuple, policy: FunctionPolicy, timeout: Optional[float],
+               budget: Optional[Budget], rate_limiter: Optional[RateLimiter], use_cache: bool,
+               kwargs: Dict) -> Any:
+        """请求上游，use_cache时写入缓存，且上游不可用时返回未超过最长可用时间的旧数据"""
+        self._record(func_name, 'misses')
+        breaker = self.breaker(func_name)
+        try:
+            if not breaker.allow():
+                raise CircuitOpenError(func_name, breaker.retry_in())
+            if rate_limiter is not None:
+                rate_limiter.acquire()
+            start = time.perf_counter()
+            try:
+                value = upstream.call(func_name, getattr(ak, func_name),
+                                      timeout=timeout or policy.timeout, budget=budget, **kwargs)
+            except Exception as e:
+                breaker.record_failure(e)
+                raise
+            breaker.record_success()
+        except Exception as e:
+            self._record(func_name, 'errors')
+            stale = self._get_entry(key) if use_cache and policy.kind is not None else None
+            if stale is not None and time.time() - stale.expires_at < self.max_stale_seconds:
+                self._record(func_name, 'stale_served')
+                logger.warning(f"akshare接口 {func_name} 不可用，返回 {time.time() - stale.fetched_at:.0f} 秒前的缓存: {str(e)}")
+                return stale.value
+            raise
+
+        latency_ms = (time.perf_counter() - start) * 1000
+        self._record(func_name, 'upstream', latency_ms)
+
+        if use_cache and policy.kind is not None:
+            now = time.time()
+            expires_at = self.calendar.expires_at(policy.kind, now)
+            if _is_empty(value):
+                expires_at = min(expires_at, now + EMPTY_RESULT_TTL)
+            self._put_entry(key, _Entry(value, now, expires_at))
+        return value
+
+    def invalidate(self, func_name: Optional[str] = None):
+        """清除缓存，func_name为None时清除全部"""
+        with self._lock:
+            if func_name is None:
+                self._cache.clear()
+            else:
+                for key in [key for key in self._cache if key[0] == func_name]:
+                    del self._cache[key]
+
+    def stats(self) -> Dict:
+        """获取缓存条目数及各函数的命中、延迟与熔断统计"""
+        with self._lock:
+            functions = {}
+            for name, stats in self._stats.items():
+                upstream_calls = int(stats['upstream'])
+                hits, misses = int(stats['hits']), int(stats['misses'])
+                functions[name] = {
+                    'hits': hits,
+                    'misses': misses,
+                    'hit_rate': round(hits / (hits + misses), 3) if hits + misses else None,
+                    'errors': int(stats['errors']),
+                    'stale_served': int(stats['stale_served']),
+                    'upstream_calls': upstream_calls,
+                    'avg_upstream_ms': round(stats['upstream_ms_total'] / upstream_calls, 1) if upstream_calls else None,
+                    'max_upstream_ms': round(stats['upstream_ms_max'], 1)
+                }
+            breakers = list(self._breakers.values())
+            entries = len(self._cache)
+        for breaker in breakers:
+            functions.setdefault(breaker.name, {})['circuit'] = breaker.stats()
+        return {'entries': entries, 'max_entries': self.max_entries, 'functions': functions}
+
+
+# 全局网关实例
+akshare_gateway = AkshareGateway()
+
+
+def call_akshare(func_name: str, **kwargs) -> Any:
+    """通过全局网关调用akshare函数的便捷函数"""
+    return akshare_gateway.call(func_name, **kwargs)
@@ -0,0 +1,393 @@
+#!/usr/bin/env python3
+"""
+向量化回测引擎
+基于本地日线仓库构建（日期×股票）矩阵，信号、目标仓位与收益均按矩阵计算。
+信号在第t日收盘后产生，第t+1日按收盘价成交；计入佣金、印花税与滑点，
+并模拟A股T+1、涨停无法买入、跌停无法卖出及停牌无法交易的约束
+"""
+
+import logging
+import time
+from typing import Callable, Dict, Iterable, List, NamedTuple, Optional
+
+import numpy as np
+
+from data_handlers.bar_warehouse import bar_warehouse, format_date_int, to_date_int
+
+logger = logging.getLogger(__name__)
+
+# 年化使用的交易日数
+TRADING_DAYS_PER_YEAR = 252
+
+# 从不复权日线读取的字段
+RAW_PANEL_FIELDS = ('close', 'high', 'low', 'volume', 'amount', 'change_percent', 'turnover_rate')
+
+
+class CostModel(NamedTuple):
+    """交易成本，均为成交金额的比例"""
+    commission: float = 0.00025  # 佣金，买卖双向
+    stamp_duty: float = 0.0005  # 印花税，仅卖出
+    slippage: float = 0.0005  # 滑点，买卖双向
+
+
+# 创业板注册制改革后涨跌停幅度由10%调整为20%的首个交易日
+CHINEXT_20PCT_FROM = 20200824
+
+
+def price_limit(symbol: str, dates: np.ndarray) -> np.ndarray:
+    """
+    按板块及交易日获取涨跌停幅度：科创板20%，创业板2020-08-24起20%（此前10%），北交所30%，其余10%。
+    日线不含历史ST状态，ST股票（5%）按所在板块的幅度处理，ST期间未封死在板块幅度的涨跌停不受约束；
+    新股上市初期不设涨跌停的交易日同样未区分
+
+    Args:
+        symbol: 股票代码
+        dates: YYYYMMDD整数日期
+
+    Returns:
+        与日期对应的涨跌停幅度（小数）
+    """
+    if symbol.startswith(('688', '689')):
+        return np.full(len(dates), 0.2)
+    if symbol.startswith(('300', '301')):
+        return np.where(np.asarray(dates) >= CHINEXT_20PCT_FROM, 0.2, 0.1)
+    if symbol.startswith(('8', '4', '92')):
+        return np.full(len(dates), 0.3)
+    return np.full(len(dates), 0.1)
+
+
+class BarPanel:
+    """按交易日对齐的（日期×股票）日线矩阵，缺失（停牌或未上市）为NaN"""
+
+    def __init__(self, dates: np.ndarray, symbols: List[str], fields: Dict[str, np.ndarray]):
+        """
+        Args:
+            dates: YYYYMMDD整数日期，升序
+            symbols: 股票代码，与矩阵的列对应
+            fields: 字段名到（日期×股票）矩阵的映射；close等为不复权价格，adj_close为后复权收盘价
+        """
+        self.dates = dates
+        self.symbols = symbols
+        self.fields = fields
+
+    @property
+    def shape(self):
+        return len(self.dates), len(self.symbols)
+
+    def field(self, name: str) -> np.ndarray:
+        """获取字段矩阵"""
+        return self.fields[name]
+
+    def returns(self) -> np.ndarray:
+        """按后复权收盘价计算的日收益率，停牌及首个交易日为0"""
+        close = self.fields['adj_close']
+        prev = np.empty_like(close)
+        prev[0] = np.nan
+        # 停牌后复牌按停牌前最后收盘价计算收益
+        prev[1:] = _ffill(close)[:-1]
+        with np.errstate(invalid='ignore', divide='ignore'):
+            result = close / prev - 1
+        return np.nan_to_num(result, nan=0.0, posinf=0.0, neginf=0.0)
+
+    def limit_flags(self):
+        """
+        判断每根K线是否收于涨停或跌停
+
+        由涨跌幅反推前收盘价（除权日即为除权参考价），涨跌停价按交易所规则四舍五入到分
+
+        Returns:
+            (涨停矩阵, 跌停矩阵)
+        """
+        close = self.fields['close']
+        limit = np.empty(self.shape)
+        for j, symbol in enumerate(self.symbols):
+            limit[:, j] = price_limit(symbol, self.dates)
+        with np.errstate(invalid='ignore'):
+            prev = close / (1 + self.fields['change_percent'] / 100)
+            up = close >= np.round(prev * (1 + limit), 2) - 0.005
+            down = close <= np.round(prev * (1 - limit), 2) + 0.005
+        return up, down
+
+    @classmethod
+    def load(cls, warehouse=None, symbols: Optional[Iterable[str]] = None, start_date=None,
+             end_date=None) -> 'BarPanel':
+        """
+        从日线仓库读取本地日线构建矩阵，不触发同步
+
+        Args:
+            warehouse: 日线仓库，默认全局实例
+            symbols: 股票代码，默认本地已有日线的全部股票
+            start_date: 开始日期（含）
+            end_date: 结束日期（含）
+
+        Returns:
+            日线矩阵
+        """
+        warehouse = warehouse or bar_warehouse
+        loaded = []
+        for symbol in (symbols if symbols is not None else warehouse.symbols()):
+            raw = warehouse.get_bars(symbol, start_date, end_date, adjust='none', sync=False)
+            hfq = warehouse.get_bars(symbol, start_date, end_date, adjust='hfq', sync=False)
+            if raw is None or hfq is None or not len(raw):
+                continue
+            loaded.append((symbol, raw, hfq))
+
+        dates = np.unique(np.concatenate([raw.column('date') for _, raw, _ in loaded])) if loaded \
+            else np.array([], dtype=np.int32)
+        shape = (len(dates), len(loaded))
+        fields = {name: np.full(shape, np.nan) for name in RAW_PANEL_FIELDS + ('adj_close',)}
+        for j, (_, raw, hfq) in enumerate(loaded):
+            rows = np.searchsorted(dates, raw.column('date'))
+            for name in RAW_PANEL_FIELDS:
+                fields[name][rows, j] = raw.column(name)
+            fields['adj_close'][np.searchsorted(dates, hfq.column('date')), j] = hfq.column('close')
+        return cls(dates, [symbol for symbol, _, _ in loaded], fields)
+
+
+def _ffill(values: np.ndarray) -> np.ndarray:
+    """沿时间维向前填充NaN"""
+    rows = np.where(np.isnan(values), 0, np.arange(len(values))[:, None])
+    np.maximum.accumulate(rows, axis=0, out=rows)
+    return np.take_along_axis(values, rows, axis=0)
+
+
+def signal_to_weights(signal: np.ndarray, top_n: int, ascending: bool = False) -> np.ndarray:
+    """
+    每个交易日按信号选出前top_n只股票等权配置，NaN表示不可选
+
+    Args:
+        signal: （日期×股票）信号矩阵
+        top_n: 持仓数量
+        ascending: True表示信号越小越优先
+
+    Returns:
+        （日期×股票）目标权重矩阵，每行权重之和为1或0（无可选股票）
+    """
+    weights = np.zeros(signal.shape)
+    count = min(top_n, signal.shape[1])
+    if count <= 0:
+        return weights
+    key = np.where(np.isnan(signal), np.inf, signal if ascending else -signal)
+    columns = np.argpartition(key, count - 1, axis=1)[:, :count]
+    chosen = np.isfinite(np.take_along_axis(key, columns, axis=1))
+    selected = chosen.sum(axis=1, keepdims=True)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        np.put_along_axis(weights, columns, np.where(chosen, 1.0 / selected, 0.0), axis=1)
+    return weights
+
+
+def run_backtest(panel: BarPanel, weights: np.ndarray, rebalance_days: int = 1,
+                 costs: CostModel = CostModel(), min_hold_days: int = 1) -> Dict:
+    """
+    按目标权重回测
+
+    第t日收盘产生的目标权重在第t+1日收盘成交。收益、持仓漂移与调仓均为对全部股票的向量运算，
+    按日推进（受限成交使持仓依赖历史路径）。成交受以下约束：
+    停牌（无K线或成交量为0）不能买卖；收于涨停不能买入，收于跌停不能卖出；
+    买入后至少持有min_hold_days个交易日才能卖出（T+1）；现金不足时按比例缩减买入
+
+    Args:
+        panel: 日线矩阵
+        weights: （日期×股票）目标权重矩阵
+        rebalance_days: 调仓间隔（交易日）
+        costs: 交易成本
+        min_hold_days: 最短持有交易日数，A股T+1为1
+
+    Returns:
+        净值曲线、回撤、换手与汇总指标
+    """
+    start = time.perf_counter()
+    days, size = panel.shape
+    returns = panel.returns()
+    volume = panel.field('volume')
+    suspended = ~(volume > 0)
+    limit_up, limit_down = panel.limit_flags()
+    no_buy = suspended | limit_up
+    no_sell = suspended | limit_down
+    buy_rate = costs.commission + costs.slippage
+    sell_rate = costs.commission + costs.stamp_duty + costs.slippage
+
+    equity = np.ones(days)
+    turnover = np.zeros(days)
+    cost = np.zeros(days)
+    exposure = np.zeros(days)
+    holdings = np.zeros(days, dtype=np.int64)
+    blocked = {'limit_up': 0, 'limit_down': 0, 'suspended': 0, 't_plus_1': 0}
+
+    position = np.zeros(size)
+    last_buy = np.full(size, -min_hold_days)
+    value = 1.0
+    for t in range(days):
+        if t > 0:
+            # 按当日收益率更新净值与持仓权重
+            gross = position @ returns[t]
+            position = position * (1 + returns[t]) / (1 + gross)
+            value *= 1 + gross
+
+        if t > 0 and (t - 1) % rebalance_days == 0:
+            delta = weights[t - 1] - position
+            buy = delta > 0
+            sell = delta < 0
+            locked = sell & (t - last_buy < min_hold_days)
+            blocked['suspended'] += int(np.count_nonzero((buy | sell) & suspended[t]))
+            blocked['limit_up'] += int(np.count_nonzero(buy & limit_up[t] & ~suspended[t]))
+            blocked['limit_down'] += int(np.count_nonzero(sell & limit_down[t] & ~suspended[t]))
+            blocked['t_plus_1'] += int(np.count_nonzero(locked & ~no_sell[t]))
+            delta[(buy & no_buy[t]) | (sell & (no_sell[t] | locked))] = 0.0
+
+            sold = -delta[delta < 0].sum()
+            bought = delta[delta > 0].sum()
+            cash = 1.0 - position.sum() + sold * (1 - sell_rate)
+            if bought * (1 + buy_rate) > cash + 1e-12:
+                scale = max(cash, 0.0) / (bought * (1 + buy_rate))
+                delta[delta > 0] *= scale
+                bought *= scale
+
+            fee = sold * sell_rate + bought * buy_rate
+            position = (position + delta) / (1 - fee)
+            value *= 1 - fee
+            last_buy[delta > 0] = t
+            turnover[t] = (sold + bought) / 2
+            cost[t] = fee
+
+        equity[t] = value
+        exposure[t] = position.sum()
+        holdings[t] = np.count_nonzero(position > 1e-12)
+
+    drawdown = equity / np.maximum.accumulate(equity) - 1 if days else equity
+    elapsed_ms = (time.perf_counter() - start) * 1000
+    logger.info(f"回测完成，{days} 个交易日 × {size} 只股票，耗时 {elapsed_ms:.1f}ms")
+
+    return {
+        'dates': [format_date_int(int(value)) for value in panel.dates],
+        'equity': np.round(equity, 6).tolist(),
+        'drawdown': np.round(drawdown, 6).tolist(),
+        'turnover': np.round(turnover, 6).tolist(),
+        'holdings': holdings.tolist(),
+        'stats': _summary(panel.dates, equity, drawdown, turnover, cost, exposure, holdings, rebalance_days),
+        'blocked_trades': blocked,
+        'elapsed_ms': round(elapsed_ms, 1),
+    }
+
+
+def _summary(dates, equity, drawdown, turnover, cost, exposure, holdings, rebalance_days) -> Dict:
+    """汇总收益、风险与换手指标"""
+    days = len(equity)
+    if days < 2:
+        return {'days': days}
+    daily = equity[1:] / equity[:-1] - 1
+    years = (days - 1) / TRADING_DAYS_PER_YEAR
+    volatility = float(daily.std(ddof=1)) if days > 2 else 0.0
+    trough = int(np.argmin(drawdown))
+    peak = int(np.argmax(equity[:trough + 1]))
+    rebalances = turnover[1::rebalance_days]
+    return {
+        'days': days,
+        'start_date': format_date_int(int(dates[0])),
+        'end_date': format_date_int(int(dates[-1])),
+        'total_return': round(float(equity[-1] - 1), 6),
+        'annual_return': round(float(equity[-1] ** (1 / years) - 1), 6),
+        'annual_volatility': round(volatility * np.sqrt(TRADING_DAYS_PER_YEAR), 6),
+        'sharpe': round(float(daily.mean() / volatility * np.sqrt(TRADING_DAYS_PER_YEAR)), 4) if volatility else None,
+        'max_drawdown': round(float(drawdown[trough]), 6),
+        'max_drawdown_start': format_date_int(int(dates[peak])),
+        'max_drawdown_end': format_date_int(int(dates[trough])),
+        'avg_turnover': round(float(rebalances.mean()), 6) if len(rebalances) else 0.0,
+        'annual_turnover': round(float(turnover.sum() / years), 4),
+        'total_cost': round(float(cost.sum()), 6),
+        'avg_exposure': round(float(exposure.mean()), 4),
+        'avg_holdings': round(float(holdings.mean()), 2),
+    }
+
+
+# ==================== 策略 ====================
+
+def low_turnover(panel: BarPanel, min_price: float = 10.0, max_price: float = 60.0,
+                 min_turnover_rate: float = 1.0, max_turnover_rate: float = 5.0,
+                 min_market_cap: float = 100.0) -> np.ndarray:
+    """
+    低换手率策略，与/low-turnover-stocks相同的条件：价格、换手率区间与最低流通市值，
+    换手率越低越优先。历史流通市值由成交额与换手率推算
+
+    Args:
+        panel: 日线矩阵
+        min_price / max_price: 不复权收盘价区间
+        min_turnover_rate / max_turnover_rate: 换手率区间(%)
+        min_market_cap: 最低流通市值(亿元)
+
+    Returns:
+        信号矩阵（换手率），不满足条件为NaN
+    """
+    close = panel.field('close')
+    turnover_rate = panel.field('turnover_rate')
+    with np.errstate(invalid='ignore', divide='ignore'):
+        market_cap = panel.field('amount') / (turnover_rate / 100) / 1e8
+        eligible = ((close >= min_price) & (close <= max_price)
+                    & (turnover_rate >= min_turnover_rate) & (turnover_rate <= max_turnover_rate)
+                    & (market_cap >= min_market_cap))
+    return np.where(eligible, turnover_rate, np.nan)
+
+
+class StrategySpec(NamedTuple):
+    """策略定义"""
+    func: Callable[..., np.ndarray]  # 由日线矩阵生成信号矩阵
+    params: Dict[str, float]  # 参数及默认值，参数类型与默认值一致
+    ascending: bool  # 信号越小越优先
+    description: str
+
+
+STRATEGIES: Dict[str, StrategySpec] = {
+    'low_turnover': StrategySpec(low_turnover, {'min_price': 10.0, 'max_price': 60.0, 'min_turnover_rate': 1.0,
+                                                'max_turnover_rate': 5.0, 'min_market_cap': 100.0},
+                                 True, '低换手率优质股，按换手率升序等权持有'),
+}
+
+
+def backtest_strategy(name: str, params: Optional[Dict] = None, symbols: Optional[Iterable[str]] = None,
+                      start_date=None, end_date=None, top_n: int = 20, rebalance_days: int = 5,
+                      costs: CostModel = CostModel(), warehouse=None) -> Optional[Dict]:
+    """
+    回测内置策略
+
+    Args:
+        name: 策略名
+        params: 策略参数，值可为字符串；未知参数忽略
+        symbols: 股票池，默认本地已有日线的全部股票
+        start_date / end_date: 回测区间
+        top_n: 持仓数量
+        rebalance_days: 调仓间隔（交易日）
+        costs: 交易成本
+        warehouse: 日线仓库，默认全局实例
+
+    Returns:
+        回测结果，区间内没有本地日线时返回None
+
+    Raises:
+        ValueError: 策略不存在或参数不合法
+    """
+    spec = STRATEGIES.get(name)
+    if spec is None:
+        raise ValueError(f"不支持的策略: {name}，可选值: {', '.join(STRATEGIES)}")
+    if top_n <= 0 or rebalance_days <= 0:
+        raise ValueError("top_n与rebalance_days必须为正整数")
+    params = params or {}
+    resolved = {key: type(default)(params.get(key, default)) for key, default in spec.params.items()}
+
+    start = time.perf_counter()
+    panel = BarPanel.load(warehouse, symbols, to_date_int(start_date), to_date_int(end_date))
+    if not len(panel.dates):
+        return None
+    load_ms = (time.perf_counter() - start) * 1000
+
+    weights = signal_to_weights(spec.func(panel, **resolved), top_n, spec.ascending)
+    result = run_backtest(panel, weights, rebalance_days, costs)
+    result.update({
+        'strategy': name,
+        'params': resolved,
+        'top_n': top_n,
+        'rebalance_days': rebalance_days,
+        'costs': costs._asdict(),
+        'symbols': len(panel.symbols),
+        'load_ms': round(load_ms, 1),
+    })
+    return result
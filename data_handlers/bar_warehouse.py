@@ -0,0 +1,480 @@
+#!/usr/bin/env python3
+"""
+A股日线仓库
+按股票代码持久化日K线，每只股票每种复权方式一个目录，每个字段一个.npy列文件，读取时内存映射；
+每次写入生成新版本的列文件，再原子替换meta.json（记录当前版本）切换读取方，不重命名可能正被映射的文件或目录。
+增量同步只请求最后一根已存K线之后的数据。落盘保存不复权与后复权两份，
+前复权由后复权价格按最新不复权收盘价换算得到，除权除息后无需重写历史数据
+"""
+
+import json
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime
+from pathlib import Path
+from typing import Callable, Dict, Iterable, List, Optional, Union
+
+import numpy as np
+import pandas as pd
+
+from data_handlers.akshare_gateway import akshare_gateway
+from data_handlers.stock_snapshot import FieldSpec
+from utils.rate_limiter import RateLimiter
+from utils.single_flight import SingleFlight
+from utils.trading_calendar import trading_calendar
+
+logger = logging.getLogger(__name__)
+
+# 日线字段，date以YYYYMMDD整数存储
+BAR_FIELDS = [
+    FieldSpec('date', np.int32, '日期'),
+    FieldSpec('open', np.float64, '开盘'),
+    FieldSpec('close', np.float64, '收盘'),
+    FieldSpec('high', np.float64, '最高'),
+    FieldSpec('low', np.float64, '最低'),
+    FieldSpec('volume', np.float64, '成交量'),
+    FieldSpec('amount', np.float64, '成交额'),
+    FieldSpec('amplitude', np.float64, '振幅'),
+    FieldSpec('change_percent', np.float64, '涨跌幅'),
+    FieldSpec('change_amount', np.float64, '涨跌额'),
+    FieldSpec('turnover_rate', np.float64, '换手率'),
+]
+
+BAR_FIELD_NAMES = [spec.name for spec in BAR_FIELDS]
+
+# 随复权方式变化的价格字段
+PRICE_FIELDS = ('open', 'close', 'high', 'low')
+
+# 复权方式：none不复权、qfq前复权、hfq后复权；落盘的复权方式及对应的akshare参数
+ADJUSTS = ('none', 'qfq', 'hfq')
+STORED_ADJUSTS = {'none': '', 'hfq': 'hfq'}
+
+# 上游全量历史的起始日期
+HISTORY_START_DATE = '19900101'
+
+DateLike = Union[str, int, date, datetime, None]
+
+# 替换meta.json遇到读取方短暂占用（Windows）时的重试次数与间隔（秒）
+REPLACE_RETRIES = 5
+REPLACE_RETRY_DELAY = 0.05
+
+
+def _column_file(directory: Path, name: str, version: int) -> Path:
+    """列文件路径，版本0为未带版本号的旧版文件名"""
+    return directory / (f'{name}.npy' if version == 0 else f'{name}.{version}.npy')
+
+
+def _file_version(path: Path) -> int:
+    """由列文件名解析版本号"""
+    parts = path.name.split('.')
+    return int(parts[1]) if len(parts) == 3 and parts[1].isdigit() else 0
+
+
+def _replace(src: Path, dst: Path):
+    """原子替换文件；Windows上目标文件正被其他线程打开时短暂重试"""
+    for attempt in range(REPLACE_RETRIES):
+        try:
+            os.replace(src, dst)
+            return
+        except PermissionError:
+            if attempt == REPLACE_RETRIES - 1:
+                raise
+            time.sleep(REPLACE_RETRY_DELAY)
+
+
+def to_date_int(value: DateLike) -> Optional[int]:
+    """将日期转换为YYYYMMDD整数"""
+    if value is None or value == '':
+        return None
+    if isinstance(value, (int, np.integer)):
+        return int(value)
+    return int(pd.Timestamp(value).strftime('%Y%m%d'))
+
+
+def format_date_int(value: int) -> str:
+    """YYYYMMDD整数转换为YYYY-MM-DD"""
+    return f'{value // 10000:04d}-{value // 100 % 100:02d}-{value % 100:02d}'
+
+
+class DailyBars:
+    """单只股票的列式日线数据"""
+
+    def __init__(self, symbol: str, adjust: str, columns: Dict[str, np.ndarray]):
+        """
+        Args:
+            symbol: 股票代码
+            adjust: 复权方式
+            columns: 字段名到数组的映射
+        """
+        self.symbol = symbol
+        self.adjust = adjust
+        self._columns = columns
+
+    def __len__(self) -> int:
+        return len(self._columns['date'])
+
+    def column(self, name: str) -> np.ndarray:
+        """获取字段数组"""
+        return self._columns[name]
+
+    @property
+    def last_date(self) -> Optional[str]:
+        """最后一根K线的日期"""
+        return format_date_int(int(self._columns['date'][-1])) if len(self) else None
+
+    def between(self, start_date: DateLike = None, end_date: DateLike = None) -> 'DailyBars':
+        """
+        按日期区间截取，日期列有序，使用二分查找
+
+        Args:
+            start_date: 开始日期（含）
+            end_date: 结束日期（含）
+
+        Returns:
+            截取后的日线数据（数组视图）
+        """
+        dates = self._columns['date']
+        start = to_date_int(start_date)
+        end = to_date_int(end_date)
+        lo = int(np.searchsorted(dates, start, side='left')) if start is not None else 0
+        hi = int(np.searchsorted(dates, end, side='right')) if end is not None else len(dates)
+        return DailyBars(self.symbol, self.adjust, {name: array[lo:hi] for name, array in self._columns.items()})
+
+    def tail(self, count: int) -> 'DailyBars':
+        """最后count根K线"""
+        return DailyBars(self.symbol, self.adjust, {name: array[-count:] for name, array in self._columns.items()})
+
+    def to_records(self) -> List[Dict]:
+        """渲染为字典列表，日期格式为YYYY-MM-DD"""
+        values = [self._columns[name].tolist() for name in BAR_FIELD_NAMES]
+        values[0] = [format_date_int(value) for value in values[0]]
+        return [dict(zip(BAR_FIELD_NAMES, row)) for row in zip(*values)]
+
+    def to_frame(self) -> pd.DataFrame:
+        """转换为与ak.stock_zh_a_hist相同列名的DataFrame"""
+        frame = pd.DataFrame({spec.source: np.asarray(self._columns[spec.name]) for spec in BAR_FIELDS})
+        frame['日期'] = pd.to_datetime(frame['日期'].astype(str), format='%Y%m%d')
+        frame.insert(1, '股票代码', self.symbol)
+        return frame
+
+
+class BarWarehouse:
+    """A股日线仓库"""
+
+    def __init__(self, root: Optional[str] = None, gateway=None, calendar=None):
+        """
+        Args:
+            root: 仓库根目录，默认data/bars
+            gateway: akshare网关
+            calendar: 交易日历，决定同步间隔
+        """
+        self.root = Path(root) if root else Path(__file__).parent.parent / 'data' / 'bars'
+        self.gateway = gateway or akshare_gateway
+        self.calendar = calendar or trading_calendar
+
+        self.sync_workers = int(os.environ.get('BAR_SYNC_WORKERS', 4))  # 批量同步线程数
+        self.rate_limiter = RateLimiter(float(os.environ.get('BAR_SYNC_RATE_PER_SEC', 5)))  # 日线接口每秒请求数上限
+        self._single_flight = SingleFlight()
+        self._write_lock = threading.Lock()
+        self._listeners: List[Callable[[str], None]] = []
+
+    def _dir(self, adjust: str, symbol: str) -> Path:
+        return self.root / adjust / symbol
+
+    def _read_meta(self, adjust: str, symbol: str) -> Optional[Dict]:
+        try:
+            with open(self._dir(adjust, symbol) / 'meta.json', 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+
+    def _load(self, adjust: str, symbol: str) -> Optional[Dict[str, np.ndarray]]:
+        """以内存映射方式加载meta.json所指版本的列文件"""
+        directory = self._dir(adjust, symbol)
+        for _ in range(2):
+            meta = self._read_meta(adjust, symbol)
+            if meta is None:
+                return None
+            version = meta.get('version', 0)
+            try:
+                return {name: np.load(_column_file(directory, name, version), mmap_mode='r')
+                        for name in BAR_FIELD_NAMES}
+            except FileNotFoundError:
+                # 读取meta.json后版本已被切换并清理，按新版本重读
+                continue
+        return None
+
+    def _write(self, adjust: str, symbol: str, columns: Dict[str, np.ndarray], meta: Dict):
+        """
+        写入新版本的列文件后原子替换meta.json切换版本，读取方不会看到写了一半的数据；
+        保留上一版本供切换瞬间的读取方使用，更早的版本删除（仍被映射而删除失败的留待下次写入时清理）
+        """
+        directory = self._dir(adjust, symbol)
+        directory.mkdir(parents=True, exist_ok=True)
+        with self._write_lock:
+            versions = {_file_version(path) for path in directory.glob('date*.npy')}
+            version = max(versions, default=0) + 1
+            for spec in BAR_FIELDS:
+                with open(_column_file(directory, spec.name, version), 'wb') as f:
+                    np.save(f, np.ascontiguousarray(columns[spec.name], dtype=spec.dtype))
+            previous = self._read_meta(adjust, symbol)
+            self._write_meta(directory, dict(meta, version=version))
+
+            keep = {version, previous.get('version', 0)} if previous is not None else {version}
+            for path in directory.glob('*.npy'):
+                if _file_version(path) not in keep:
+                    try:
+                        path.unlink()
+                    except OSError:
+                        pass
+
+    @staticmethod
+    def _write_meta(directory: Path, meta: Dict):
+        tmp = directory / 'meta.json.tmp'
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump(meta, f)
+        _replace(tmp, directory / 'meta.json')
+
+    @staticmethod
+    def _from_frame(frame: pd.DataFrame) -> Dict[str, np.ndarray]:
+        """按BAR_FIELDS将上游DataFrame转换为列数组"""
+        frame = frame.sort_values('日期')
+        columns = {'date': pd.to_datetime(frame['日期']).dt.strftime('%Y%m%d').astype(np.int32).to_numpy()}
+        for spec in BAR_FIELDS[1:]:
+            values = pd.to_numeric(frame[spec.source], errors='coerce').to_numpy(dtype=np.float64)
+            columns[spec.name] = np.where(np.isnan(values), spec.fill, values)
+        return columns
+
+    def needs_sync(self, symbol: str, end_date: DateLike = None) -> bool:
+        """
+        判断查询是否需要先同步：没有本地数据，或查询区间覆盖到最后一根已存K线之后且同步已过期
+
+        Args:
+            symbol: 股票代码
+            end_date: 查询结束日期，None表示至今
+
+        Returns:
+            是否需要同步
+        """
+        for adjust in STORED_ADJUSTS:
+            meta = self._read_meta(adjust, symbol)
+            if meta is None:
+                return True
+            end = to_date_int(end_date)
+            if (end is None or end >= meta['last_date']) and not self.calendar.is_fresh('daily_bars', meta['synced_at']):
+                return True
+        return False
+
+    def sync(self, symbol: str, force: bool = False) -> Dict:
+        """
+        增量同步一只股票的不复权与后复权日线
+
+        Args:
+            symbol: 股票代码
+            force: 是否忽略同步间隔
+
+        Returns:
+            各复权方式的同步结果
+        """
+        if not force and not self.needs_sync(symbol):
+            return {'synced': False}
+        result = self._single_flight.do(symbol, lambda: {
+            adjust: self._sync_adjust(symbol, adjust) for adjust in STORED_ADJUSTS
+        })
+        for listener in list(self._listeners):
+            try:
+                listener(symbol)
+            except Exception as e:
+                logger.error(f"{symbol} 日线同步监听器执行失败: {str(e)}")
+        return result
+
+    def add_listener(self, listener: Callable[[str], None]):
+        """
+        注册日线同步监听器，每只股票同步完成后以股票代码调用
+
+        Args:
+            listener: 回调函数
+        """
+        if listener not in self._listeners:
+            self._listeners.append(listener)
+
+    def _sync_adjust(self, symbol: str, adjust: str, full: bool = False) -> Dict:
+        """
+        增量同步一种复权方式的日线；full为True时拉取全部历史替换本地数据。
+        新数据写入新版本后才切换meta.json，拉取失败时本地数据保持不变
+        """
+        start = time.perf_counter()
+        meta = self._read_meta(adjust, symbol)
+        stored = self._load(adjust, symbol) if meta else None
+        if full or meta is None or stored is None or not len(stored['date']):
+            start_date = HISTORY_START_DATE
+        else:
+            start_date = str(meta['last_date'])
+
+        frame = self.gateway.call('stock_zh_a_hist', use_cache=False, rate_limiter=self.rate_limiter,
+                                  symbol=symbol, period='daily', start_date=start_date,
+                                  adjust=STORED_ADJUSTS[adjust])
+        now = time.time()
+        if frame is None or frame.empty:
+            if meta is not None:
+                # 全量同步返回空数据时保留本地数据且不更新同步时间，下次读取时重试
+                if not full:
+                    self._touch(adjust, symbol, meta, now)
+                return {'rows': 0, 'last_date': meta['last_date']}
+            frame = pd.DataFrame(columns=[spec.source for spec in BAR_FIELDS])
+
+        fresh = self._from_frame(frame)
+        if stored is not None and len(fresh['date']) and start_date != HISTORY_START_DATE:
+            first = fresh['date'][0]
+            keep = int(np.searchsorted(stored['date'], first, side='left'))
+            # 重叠K线的开盘价不一致说明历史数据口径变化（如后复权因子调整），重新全量同步，
+            # 同步完成前读取方继续使用本地旧版本
+            if keep < len(stored['date']) and stored['date'][keep] == first and \
+                    not np.isclose(stored['open'][keep], fresh['open'][0], rtol=1e-6):
+                logger.warning(f"{symbol}({adjust}) 历史日线与上游不一致，重新全量同步")
+                return self._sync_adjust(symbol, adjust, full=True)
+            columns = {name: np.concatenate([stored[name][:keep], fresh[name]]) for name in BAR_FIELD_NAMES}
+        else:
+            columns = fresh
+
+        last_date = int(columns['date'][-1]) if len(columns['date']) else 0
+        self._write(adjust, symbol, columns, {
+            'symbol': symbol,
+            'adjust': adjust,
+            'rows': int(len(columns['date'])),
+            'last_date': last_date,
+            'synced_at': now
+        })
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        logger.info(f"{symbol}({adjust}) 日线同步完成，新增/更新 {len(fresh['date'])} 条，共 {len(columns['date'])} 条，"
+                    f"耗时 {elapsed_ms:.1f}ms")
+        return {'rows': int(len(fresh['date'])), 'last_date': last_date}
+
+    def _touch(self, adjust: str, symbol: str, meta: Dict, now: float):
+        """上游没有新数据时只更新同步时间"""
+        with self._write_lock:
+            self._write_meta(self._dir(adjust, symbol), dict(meta, synced_at=now))
+
+    def sync_many(self, symbols: Iterable[str], force: bool = False) -> Dict[str, int]:
+        """
+        并发同步多只股票，请求速率受日线接口限流约束
+
+        Args:
+            symbols: 股票代码列表
+            force: 是否忽略同步间隔
+
+        Returns:
+            成功、跳过、失败的股票数
+        """
+        counts = {'synced': 0, 'skipped': 0, 'failed': 0}
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=self.sync_workers, thread_name_prefix='bar-sync') as executor:
+            futures = {symbol: executor.submit(self.sync, symbol, force) for symbol in symbols}
+            for symbol, future in futures.items():
+                try:
+                    result = future.result()
+                    counts['skipped' if result.get('synced') is False else 'synced'] += 1
+                except Exception as e:
+                    counts['failed'] += 1
+                    logger.error(f"{symbol} 日线同步失败: {str(e)}")
+        logger.info(f"批量日线同步完成: 同步{counts['synced']}只，跳过{counts['skipped']}只，失败{counts['failed']}只，"
+                    f"耗时{time.perf_counter() - start:.1f}秒")
+        return counts
+
+    def get_bars(self, symbol: str, start_date: DateLike = None, end_date: DateLike = None,
+                 adjust: str = 'qfq', sync: bool = True) -> Optional[DailyBars]:
+        """
+        读取日期区间内的日线；查询区间已在本地覆盖时不访问网络，同步失败时返回本地数据
+
+        Args:
+            symbol: 股票代码
+            start_date: 开始日期（含），None表示最早
+            end_date: 结束日期（含），None表示至今
+            adjust: 复权方式，none、qfq或hfq
+            sync: 是否按需增量同步
+
+        Returns:
+            日线数据，本地及上游均没有数据时返回None
+        """
+        if adjust not in ADJUSTS:
+            raise ValueError(f"不支持的复权方式: {adjust}")
+
+        if sync and self.needs_sync(symbol, end_date):
+            try:
+                self.sync(symbol, force=True)
+            except Exception as e:
+                logger.warning(f"{symbol} 日线同步失败，使用本地数据: {str(e)}")
+
+        if adjust == 'qfq':
+            columns = self._load_qfq(symbol)
+        else:
+            columns = self._load(adjust, symbol)
+        if columns is None:
+            return None
+        return DailyBars(symbol, adjust, columns).between(start_date, end_date)
+
+    def _load_qfq(self, symbol: str) -> Optional[Dict[str, np.ndarray]]:
+        """
+        由后复权数据换算前复权：前复权价 = 后复权价 × 最新不复权收盘价 / 最新后复权收盘价
+        """
+        raw = self._load('none', symbol)
+        hfq = self._load('hfq', symbol)
+        if raw is None or hfq is None:
+            return None
+        if not len(raw['date']) or not len(hfq['date']):
+            return dict(raw)
+
+        # 以两份数据共同的最后一个交易日计算换算系数
+        last = min(int(raw['date'][-1]), int(hfq['date'][-1]))
+        raw_close = raw['close'][int(np.searchsorted(raw['date'], last))]
+        hfq_close = hfq['close'][int(np.searchsorted(hfq['date'], last))]
+        factor = raw_close / hfq_close if hfq_close else 1.0
+
+        columns = {name: hfq[name] for name in BAR_FIELD_NAMES}
+        for name in PRICE_FIELDS:
+            columns[name] = np.round(hfq[name] * factor, 2)
+        columns['change_amount'] = np.round(hfq['change_amount'] * factor, 2)
+        return columns
+
+    def latest(self, symbol: str) -> Optional[Dict]:
+        """获取最新一根不复权日线"""
+        bars = self.get_bars(symbol, adjust='none')
+        if bars is None or not len(bars):
+            return None
+        return bars.tail(1).to_records()[0]
+
+    def symbols(self) -> List[str]:
+        """本地已有日线的股票代码"""
+        directory = self.root / 'none'
+        if not directory.exists():
+            return []
+        return sorted(path.name for path in directory.iterdir() if (path / 'meta.json').exists())
+
+    def meta(self, symbol: str) -> Dict[str, Optional[Dict]]:
+        """获取各复权方式的同步信息"""
+        return {adjust: self._read_meta(adjust, symbol) for adjust in STORED_ADJUSTS}
+
+
+# 全局实例
+bar_warehouse = BarWarehouse()
+
+
+def get_daily_bars(symbol: str, start_date: DateLike = None, end_date: DateLike = None,
+                   adjust: str = 'qfq') -> Optional[DailyBars]:
+    """读取日线的便捷函数"""
+    return bar_warehouse.get_bars(symbol, start_date, end_date, adjust=adjust)
+
+
+if __name__ == "__main__":
+    # 同步上证A股全部股票的日线：python -m data_handlers.bar_warehouse
+    from data_handlers.sh_a_stock_data import get_sh_a_realtime_snapshot
+
+    logging.basicConfig(level=logging.INFO)
+    snapshot = get_sh_a_realtime_snapshot()
+    if snapshot is None:
+        print("获取股票列表失败")
+    else:
+        print(bar_warehouse.sync_many(snapshot.column('code').tolist()))
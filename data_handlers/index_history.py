@@ -0,0 +1,248 @@
+#!/usr/bin/env python3
+"""
+指数日线本地存储
+按指数代码保存日线数据，增量同步上游新增的K线，入库时预先计算涨跌额、涨跌幅、振幅，
+日期区间查询直接走主键索引
+"""
+
+import logging
+import time
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+
+from data_handlers.akshare_gateway import akshare_gateway
+from utils.database import SQLiteConnectionManager
+from utils.single_flight import SingleFlight
+from utils.trading_calendar import trading_calendar
+
+logger = logging.getLogger(__name__)
+
+# 上游全量历史的起始日期
+HISTORY_START_DATE = '19900101'
+
+
+def index_symbol(code: str) -> str:
+    """
+    将指数代码转换为上游接口使用的带市场前缀代码
+
+    Args:
+        code: 指数代码，如000001（上证指数）、399001（深证成指），已带前缀时原样返回
+
+    Returns:
+        带市场前缀的代码，如sh000001
+    """
+    code = code.strip().lower()
+    if code.startswith(('sh', 'sz', 'bj', 'csi')):
+        return code
+    if code.startswith('399'):
+        return 'sz' + code
+    return 'sh' + code
+
+
+def compute_derived(close: np.ndarray, high: np.ndarray, low: np.ndarray,
+                    prev_close: Optional[float]) -> Dict[str, np.ndarray]:
+    """
+    计算涨跌额、涨跌幅、振幅
+
+    Args:
+        close: 收盘价
+        high: 最高价
+        low: 最低价
+        prev_close: 第一根K线前一交易日的收盘价，没有时第一根K线的衍生指标为0
+
+    Returns:
+        衍生指标数组
+    """
+    previous = np.empty_like(close)
+    previous[1:] = close[:-1]
+    previous[:1] = prev_close if prev_close is not None else np.nan
+
+    valid = np.isfinite(previous) & (previous != 0)
+    change_amount = np.where(valid, close - previous, 0.0)
+    change_percent = np.round(np.divide(change_amount * 100, previous, out=np.zeros_like(close), where=valid), 2)
+    amplitude = np.round(np.divide((high - low) * 100, previous, out=np.zeros_like(close), where=valid), 2)
+    return {'change_amount': change_amount, 'change_percent': change_percent, 'amplitude': amplitude}
+
+
+class IndexHistoryStore:
+    """指数日线存储"""
+
+    def __init__(self, db_path: Optional[str] = None, gateway=None, calendar=None):
+        """
+        Args:
+            db_path: 数据库文件路径，默认data/market_data.db
+            gateway: akshare网关
+            calendar: 交易日历，决定同步间隔
+        """
+        self.db_path = db_path or self._get_db_path()
+        self.db = SQLiteConnectionManager(self.db_path)
+        self.gateway = gateway or akshare_gateway
+        self.calendar = calendar or trading_calendar
+        self._single_flight = SingleFlight()
+        self._init_database()
+
+    @staticmethod
+    def _get_db_path() -> str:
+        """获取数据库文件路径"""
+        db_dir = Path(__file__).parent.parent / 'data'
+        db_dir.mkdir(exist_ok=True)
+        return str(db_dir / 'market_data.db')
+
+    def _init_database(self):
+        """初始化数据库表"""
+        with self.db.transaction() as conn:
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS index_daily_bars (
+                    index_code TEXT NOT NULL,
+                    date TEXT NOT NULL,
+                    open REAL,
+                    close REAL,
+                    high REAL,
+                    low REAL,
+                    volume REAL,
+                    amount REAL,
+                    change_amount REAL,
+                    change_percent REAL,
+                    amplitude REAL,
+                    PRIMARY KEY (index_code, date)
+                ) WITHOUT ROWID
+            ''')
+
+            # 每个指数的同步进度
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS index_sync_state (
+                    index_code TEXT PRIMARY KEY,
+                    symbol TEXT NOT NULL,
+                    last_date TEXT,
+                    synced_at REAL NOT NULL
+                )
+            ''')
+
+    def _sync_state(self, index_code: str) -> Optional[tuple]:
+        with self.db.connection() as conn:
+            return conn.execute('''
+                SELECT last_date, synced_at FROM index_sync_state WHERE index_code = ?
+            ''', (index_code,)).fetchone()
+
+    def sync(self, index_code: str, force: bool = False) -> Dict:
+        """
+        增量同步指数日线：仅请求最后一根已存K线及之后的数据（最后一根K线可能在盘中更新）
+
+        Args:
+            index_code: 指数代码
+            force: 是否忽略同步间隔
+
+        Returns:
+            同步结果
+        """
+        symbol = index_symbol(index_code)
+        state = self._sync_state(symbol)
+        if not force and state is not None and self.calendar.is_fresh('index_history', state[1]):
+            return {'synced': False, 'last_date': state[0]}
+        return self._single_flight.do(symbol, lambda: self._sync(symbol, state[0] if state else None))
+
+    def _sync(self, symbol: str, last_date: Optional[str]) -> Dict:
+        start = time.perf_counter()
+        start_date = last_date.replace('-', '') if last_date else HISTORY_START_DATE
+        bars = self.gateway.call('stock_zh_index_daily_em', use_cache=False, symbol=symbol, start_date=start_date)
+        now = time.time()
+
+        if bars is None or bars.empty:
+            with self.db.transaction() as conn:
+                conn.execute('''
+                    INSERT OR REPLACE INTO index_sync_state (index_code, symbol, last_date, synced_at)
+                    VALUES (?, ?, ?, ?)
+                ''', (symbol, symbol, last_date, now))
+            return {'synced': True, 'rows': 0, 'last_date': last_date}
+
+        bars = bars.sort_values('date')
+        dates = pd.to_datetime(bars['date']).dt.strftime('%Y-%m-%d').tolist()
+        columns = {name: np.nan_to_num(pd.to_numeric(bars[name], errors='coerce').to_numpy(dtype=np.float64))
+                   for name in ('open', 'close', 'high', 'low', 'volume', 'amount')}
+
+        with self.db.transaction() as conn:
+            # 衍生指标以新数据第一根K线之前的已存收盘价为基准
+            row = conn.execute('''
+                SELECT close FROM index_daily_bars
+                WHERE index_code = ? AND date < ?
+                ORDER BY date DESC LIMIT 1
+            ''', (symbol, dates[0])).fetchone()
+            derived = compute_derived(columns['close'], columns['high'], columns['low'], row[0] if row else None)
+
+            conn.executemany('''
+                INSERT OR REPLACE INTO index_daily_bars
+                (index_code, date, open, close, high, low, volume, amount,
+                 change_amount, change_percent, amplitude)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            ''', zip([symbol] * len(dates), dates,
+                     *(columns[name].tolist() for name in ('open', 'close', 'high', 'low', 'volume', 'amount')),
+                     *(derived[name].tolist() for name in ('change_amount', 'change_percent', 'amplitude'))))
+            conn.execute('''
+                INSERT OR REPLACE INTO index_sync_state (index_code, symbol, last_date, synced_at)
+                VALUES (?, ?, ?, ?)
+            ''', (symbol, symbol, dates[-1], now))
+
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        logger.info(f"指数 {symbol} 日线同步完成，写入 {len(dates)} 条（{dates[0]} ~ {dates[-1]}），耗时 {elapsed_ms:.1f}ms")
+        return {'synced': True, 'rows': len(dates), 'last_date': dates[-1]}
+
+    def get_bars(self, index_code: str, start_date: str, end_date: str) -> List[Dict]:
+        """
+        获取日期区间内的指数日线，先按需增量同步；同步失败时返回已存数据
+
+        Args:
+            index_code: 指数代码
+            start_date: 开始日期，YYYY-MM-DD
+            end_date: 结束日期，YYYY-MM-DD
+
+        Returns:
+            日线数据列表，字段与原接口一致
+        """
+        symbol = index_symbol(index_code)
+        try:
+            self.sync(symbol)
+        except Exception as e:
+            if self._sync_state(symbol) is None:
+                raise
+            logger.warning(f"指数 {symbol} 日线同步失败，返回已存数据: {str(e)}")
+
+        start = pd.to_datetime(start_date).strftime('%Y-%m-%d')
+        end = pd.to_datetime(end_date).strftime('%Y-%m-%d')
+        with self.db.connection() as conn:
+            rows = conn.execute('''
+                SELECT date, open, close, high, low, volume, amount,
+                       change_amount, change_percent, amplitude
+                FROM index_daily_bars
+                WHERE index_code = ? AND date BETWEEN ? AND ?
+                ORDER BY date
+            ''', (symbol, start, end)).fetchall()
+
+        return [
+            {
+                '日期': row[0],
+                'date': row[0],
+                '开盘': row[1],
+                '收盘': row[2],
+                '最高': row[3],
+                '最低': row[4],
+                '成交量': row[5],
+                '成交额': row[6],
+                '涨跌额': row[7],
+                '涨跌幅': row[8],
+                '振幅': row[9],
+                '换手率': 0.0  # 大盘指数换手率设为0
+            }
+            for row in rows
+        ]
+
+
+# 全局实例
+index_history_store = IndexHistoryStore()
+
+
+def get_index_daily_bars(code: str, start_date: str, end_date: str) -> List[Dict]:
+    """获取指数日线的便捷函数"""
+    return index_history_store.get_bars(code, start_date, end_date)
@@ -0,0 +1,678 @@
+#!/usr/bin/env python3
+"""
+技术指标流式更新
+为每只股票保存指标的递推状态（EMA当前值、滑动窗口环形缓冲区与窗口和、前收盘价等），
+状态以股票为行存放在数组中，按行下标更新：新日线到达时提交状态，每只股票的更新量
+与历史长度无关；行情快照到达时只以最新价试算当日未收盘K线的指标值，不修改状态。
+状态定期写入检查点，重启后无需从历史重新计算
+"""
+
+import json
+import logging
+import os
+import threading
+import time
+from abc import ABC, abstractmethod
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+from data_handlers.bar_warehouse import bar_warehouse, format_date_int
+from data_handlers.indicators import _to_list, parse_indicator_label
+from data_handlers.stock_snapshot import StockSnapshot
+from utils.scheduler import PeriodicTask
+from utils.trading_calendar import trading_calendar
+
+logger = logging.getLogger(__name__)
+
+# 检查点格式版本，状态布局变化时递增
+CHECKPOINT_VERSION = 1
+
+
+# ==================== 状态单元 ====================
+
+class _Part:
+    """按股票为行保存的状态数组，子类在FIELDS中声明数组名与初始值"""
+
+    FIELDS: Dict[str, float] = {}
+
+    def __init__(self, size: int, width: Optional[int] = None):
+        self.width = width
+        self.arrays: Dict[str, np.ndarray] = {}
+        for name, fill in self.FIELDS.items():
+            dtype = np.int64 if isinstance(fill, int) else np.float64
+            self.arrays[name] = np.full(self._shape(name, size), fill, dtype=dtype)
+
+    def _shape(self, name: str, size: int) -> Tuple[int, ...]:
+        return (size,)
+
+    def resize(self, size: int):
+        """扩展到size行，新增行为初始值"""
+        for name, array in self.arrays.items():
+            extra = size - len(array)
+            if extra > 0:
+                pad = np.full((extra,) + array.shape[1:], self.FIELDS[name], dtype=array.dtype)
+                self.arrays[name] = np.concatenate([array, pad])
+
+    def reset(self, rows: np.ndarray):
+        """将指定行恢复为初始值"""
+        for name, array in self.arrays.items():
+            array[rows] = self.FIELDS[name]
+
+
+class _Smooth(_Part):
+    """指数平滑 Y = alpha * X + (1 - alpha) * Y'，以第一个有效值为初值"""
+
+    FIELDS = {'value': np.nan}
+
+    def __init__(self, size: int, alpha: float):
+        super().__init__(size)
+        self.alpha = alpha
+
+    def update(self, rows: np.ndarray, x: np.ndarray, commit: bool) -> np.ndarray:
+        current = self.arrays['value'][rows]
+        new = np.where(np.isnan(current), x, self.alpha * x + (1 - self.alpha) * current)
+        new = np.where(np.isfinite(x), new, current)
+        if commit:
+            self.arrays['value'][rows] = new
+        return new
+
+
+class _Previous(_Part):
+    """上一根K线的值"""
+
+    FIELDS = {'value': np.nan}
+
+    def update(self, rows: np.ndarray, x: np.ndarray, commit: bool) -> np.ndarray:
+        previous = self.arrays['value'][rows]
+        if commit:
+            self.arrays['value'][rows] = np.where(np.isfinite(x), x, previous)
+        return previous
+
+
+class _Cumulative(_Part):
+    """累计值，从第一个有效值开始累加"""
+
+    FIELDS = {'value': np.nan}
+
+    def update(self, rows: np.ndarray, x: np.ndarray, commit: bool) -> np.ndarray:
+        current = self.arrays['value'][rows]
+        new = np.where(np.isfinite(x), np.nan_to_num(current) + np.nan_to_num(x), current)
+        if commit:
+            self.arrays['value'][rows] = new
+        return new
+
+
+class _Window(_Part):
+    """长度为n的滑动窗口：环形缓冲区、写入位置、有效个数、窗口和与平方和"""
+
+    FIELDS = {'ring': np.nan, 'pos': 0, 'count': 0, 'total': 0.0, 'total_sq': 0.0}
+
+    def __init__(self, size: int, n: int):
+        super().__init__(size, width=n)
+        self.n = n
+
+    def _shape(self, name: str, size: int) -> Tuple[int, ...]:
+        return (size, self.width) if name == 'ring' else (size,)
+
+    def update(self, rows: np.ndarray, x: np.ndarray, commit: bool) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        写入新值，返回更新后的窗口和、平方和与有效个数；窗口已满时减去移出的最旧值
+        """
+        a = self.arrays
+        valid = np.isfinite(x)
+        pos = a['pos'][rows]
+        count = a['count'][rows]
+        oldest = np.where(count == self.n, a['ring'][rows, pos], 0.0)
+        value = np.where(valid, x, 0.0)
+        total = np.where(valid, a['total'][rows] - oldest + value, a['total'][rows])
+        total_sq = np.where(valid, a['total_sq'][rows] - oldest * oldest + value * value, a['total_sq'][rows])
+        new_count = np.where(valid, np.minimum(count + 1, self.n), count)
+        if commit:
+            written = rows[valid]
+            a['ring'][written, pos[valid]] = x[valid]
+            a['pos'][written] = (pos[valid] + 1) % self.n
+            a['count'][rows] = new_count
+            a['total'][rows] = total
+            a['total_sq'][rows] = total_sq
+        return total, total_sq, new_count
+
+    def extreme(self, rows: np.ndarray, x: np.ndarray, ufunc: np.ufunc) -> np.ndarray:
+        """写入新值后窗口内的最大或最小值（ufunc为np.fmax或np.fmin），需在update之前调用"""
+        window = self.arrays['ring'][rows]
+        pos = self.arrays['pos'][rows]
+        line = np.arange(len(rows))
+        window[line, pos] = np.where(np.isfinite(x), x, window[line, pos])
+        return ufunc.reduce(window, axis=1)
+
+
+# ==================== 流式指标 ====================
+
+class StreamingIndicator(ABC):
+    """流式指标基类，step在rows行上推进一根K线并返回这些行的指标值"""
+
+    def __init__(self, size: int, **params):
+        self.params = params
+        self.parts: Dict[str, _Part] = {}
+
+    @abstractmethod
+    def step(self, rows: np.ndarray, inputs: Dict[str, np.ndarray], commit: bool) -> Dict[str, np.ndarray]:
+        """
+        在rows行上推进一根K线
+
+        Args:
+            rows: 状态行号
+            inputs: 各输入字段的新值，NaN表示该行不推进
+            commit: 是否提交状态，False时只试算
+
+        Returns:
+            输出字段到指标值数组的映射
+        """
+
+    def current(self, rows: np.ndarray) -> Dict[str, np.ndarray]:
+        """不推进K线，返回已提交状态对应的指标值"""
+        empty = np.full(len(rows), np.nan)
+        return self.step(rows, {'close': empty, 'high': empty, 'low': empty, 'volume': empty}, commit=False)
+
+
+class StreamingMA(StreamingIndicator):
+    def __init__(self, size: int, n: int):
+        super().__init__(size, n=n)
+        self.parts['window'] = _Window(size, n)
+
+    def step(self, rows, inputs, commit):
+        total, _, count = self.parts['window'].update(rows, inputs['close'], commit)
+        return {'ma': np.where(count == self.params['n'], total / self.params['n'], np.nan)}
+
+
+class StreamingEMA(StreamingIndicator):
+    def __init__(self, size: int, n: int):
+        super().__init__(size, n=n)
+        self.parts['ema'] = _Smooth(size, 2 / (n + 1))
+
+    def step(self, rows, inputs, commit):
+        return {'ema': self.parts['ema'].update(rows, inputs['close'], commit)}
+
+
+class StreamingMACD(StreamingIndicator):
+    def __init__(self, size: int, fast: int, slow: int, signal: int):
+        super().__init__(size, fast=fast, slow=slow, signal=signal)
+        self.parts['fast'] = _Smooth(size, 2 / (fast + 1))
+        self.parts['slow'] = _Smooth(size, 2 / (slow + 1))
+        self.parts['signal'] = _Smooth(size, 2 / (signal + 1))
+
+    def step(self, rows, inputs, commit):
+        close = inputs['close']
+        dif = self.parts['fast'].update(rows, close, commit) - self.parts['slow'].update(rows, close, commit)
+        # 没有新K线的行DIF不变，DEA也不应推进
+        dea = self.parts['signal'].update(rows, np.where(np.isfinite(close), dif, np.nan), commit)
+        return {'dif': dif, 'dea': dea, 'macd': 2 * (dif - dea)}
+
+
+class StreamingRSI(StreamingIndicator):
+    def __init__(self, size: int, n: int):
+        super().__init__(size, n=n)
+        self.parts['previous'] = _Previous(size)
+        self.parts['up'] = _Smooth(size, 1 / n)
+        self.parts['total'] = _Smooth(size, 1 / n)
+
+    def step(self, rows, inputs, commit):
+        close = inputs['close']
+        diff = close - self.parts['previous'].update(rows, close, commit)
+        up = self.parts['up'].update(rows, np.where(np.isnan(diff), np.nan, np.maximum(diff, 0)), commit)
+        total = self.parts['total'].update(rows, np.abs(diff), commit)
+        value = np.divide(up * 100, total, out=np.full(len(rows), np.nan), where=total > 0)
+        return {'rsi': np.where((total == 0) & np.isfinite(total), 50.0, value)}
+
+
+class StreamingKDJ(StreamingIndicator):
+    def __init__(self, size: int, n: int, m1: int, m2: int):
+        super().__init__(size, n=n, m1=m1, m2=m2)
+        self.parts['high'] = _Window(size, n)
+        self.parts['low'] = _Window(size, n)
+        self.parts['k'] = _Smooth(size, 1 / m1)
+        self.parts['d'] = _Smooth(size, 1 / m2)
+
+    def step(self, rows, inputs, commit):
+        # 窗口极值按环形缓冲区计算，每只股票的计算量为n
+        highest = self.parts['high'].extreme(rows, inputs['high'], np.fmax)
+        lowest = self.parts['low'].extreme(rows, inputs['low'], np.fmin)
+        _, _, count = self.parts['high'].update(rows, inputs['high'], commit)
+        self.parts['low'].update(rows, inputs['low'], commit)
+
+        spread = highest - lowest
+        rsv = np.divide((inputs['close'] - lowest) * 100, spread, out=np.full(len(rows), 50.0), where=spread > 0)
+        rsv = np.where((count == self.params['n']) & np.isfinite(inputs['close']), rsv, np.nan)
+        k = self.parts['k'].update(rows, rsv, commit)
+        d = self.parts['d'].update(rows, np.where(np.isfinite(rsv), k, np.nan), commit)
+        return {'k': k, 'd': d, 'j': 3 * k - 2 * d}
+
+
+class StreamingBOLL(StreamingIndicator):
+    def __init__(self, size: int, n: int, k: float):
+        super().__init__(size, n=n, k=k)
+        self.parts['window'] = _Window(size, n)
+
+    def step(self, rows, inputs, commit):
+        n = self.params['n']
+        total, total_sq, count = self.parts['window'].update(rows, inputs['close'], commit)
+        mid = np.where(count == n, total / n, np.nan)
+        std = np.sqrt(np.maximum(total_sq / n - mid * mid, 0))
+        return {'mid': mid, 'upper': mid + self.params['k'] * std, 'lower': mid - self.params['k'] * std}
+
+
+class StreamingATR(StreamingIndicator):
+    def __init__(self, size: int, n: int):
+        super().__init__(size, n=n)
+        self.parts['previous'] = _Previous(size)
+        self.parts['tr'] = _Previous(size)
+        self.parts['window'] = _Window(size, n)
+
+    def step(self, rows, inputs, commit):
+        prev_close = self.parts['previous'].update(rows, inputs['close'], commit)
+        high, low = inputs['high'], inputs['low']
+        tr = np.fmax(high - low, np.fmax(np.abs(high - prev_close), np.abs(low - prev_close)))
+        last_tr = self.parts['tr'].update(rows, tr, commit)
+        total, _, count = self.parts['window'].update(rows, tr, commit)
+        # 没有新K线的行返回最后一根K线的真实波幅
+        return {'tr': np.where(np.isfinite(tr), tr, last_tr),
+                'atr': np.where(count == self.params['n'], total / self.params['n'], np.nan)}
+
+
+class StreamingOBV(StreamingIndicator):
+    def __init__(self, size: int):
+        super().__init__(size)
+        self.parts['previous'] = _Previous(size)
+        self.parts['obv'] = _Cumulative(size)
+
+    def step(self, rows, inputs, commit):
+        close = inputs['close']
+        diff = close - self.parts['previous'].update(rows, close, commit)
+        signed = np.where(np.isfinite(close), np.sign(np.nan_to_num(diff)) * np.nan_to_num(inputs['volume']), np.nan)
+        return {'obv': self.parts['obv'].update(rows, signed, commit)}
+
+
+STREAMING_INDICATORS = {
+    'ma': StreamingMA,
+    'ema': StreamingEMA,
+    'macd': StreamingMACD,
+    'rsi': StreamingRSI,
+    'kdj': StreamingKDJ,
+    'boll': StreamingBOLL,
+    'atr': StreamingATR,
+    'obv': StreamingOBV,
+}
+
+STREAM_INPUTS = ('close', 'high', 'low', 'volume')
+
+DEFAULT_STREAM_INDICATORS = 'ma5,ma10,ma20,ma60,ema12,ema26,macd,rsi6,rsi14,kdj,boll,atr14,obv'
+
+
+class IndicatorStream:
+    """全市场技术指标的流式状态"""
+
+    def __init__(self, warehouse=None, checkpoint_path: Optional[str] = None,
+                 names: Optional[Iterable[str]] = None, lookback: Optional[int] = None, calendar=None):
+        """
+        Args:
+            warehouse: 日线仓库，提供初始化与新K线数据（前复权）
+            checkpoint_path: 检查点文件路径，默认data/indicator_state.npz
+            names: 维护的指标标签，如ma20、rsi14、macd，默认读取STREAM_INDICATORS（逗号分隔）
+            lookback: 初始化状态时回放的K线数
+            calendar: 交易日历，确定快照所属的交易日
+        """
+        self.warehouse = warehouse or bar_warehouse
+        self.calendar = calendar or trading_calendar
+        self.checkpoint_path = Path(checkpoint_path) if checkpoint_path else \
+            Path(__file__).parent.parent / 'data' / 'indicator_state.npz'
+        names = names or [name.strip() for name in
+                          os.environ.get('STREAM_INDICATORS', DEFAULT_STREAM_INDICATORS).split(',') if name.strip()]
+        # 指标标签到(指标名, 参数)的映射
+        self.params = {label: parse_indicator_label(label) for label in names}
+        self.lookback = lookback or int(os.environ.get('STREAM_SEED_LOOKBACK', 250))
+        self.checkpoint_seconds = float(os.environ.get('STREAM_CHECKPOINT_SECONDS', 300))
+
+        self._lock = threading.RLock()
+        self._reset_state()
+        self._dirty = False
+        self._live: Optional[Dict] = None
+        self.version = 0  # 状态或试算结果每次变化时递增，供下游缓存判断
+        self._stats = {'bars_committed': 0, 'seeded': 0, 'snapshots': 0, 'last_snapshot_ms': None}
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='indicator-stream')
+        self.checkpoint_task = PeriodicTask('indicator-stream-checkpoint', self.save_checkpoint,
+                                            interval=self.checkpoint_seconds, initial_delay=self.checkpoint_seconds)
+        self._attached = False
+
+    def _reset_state(self, size: int = 0):
+        self.codes: List[str] = []
+        self._index: Dict[str, int] = {}
+        self.last_date = np.zeros(size, dtype=np.int64)  # 已提交的最后一根K线日期，0表示未初始化，-1表示无日线
+        self.last_close = np.full(size, np.nan)  # 已提交的前复权收盘价，用于发现除权除息
+        self.indicators: Dict[str, StreamingIndicator] = {
+            label: STREAMING_INDICATORS[name](size, **dict(params)) for label, (name, params) in self.params.items()
+        }
+
+    def _signature(self) -> str:
+        return json.dumps({'version': CHECKPOINT_VERSION, 'params': self.params}, sort_keys=True)
+
+    def _rows(self, codes: Iterable[str]) -> np.ndarray:
+        """代码对应的行下标，新代码追加到末尾"""
+        rows = []
+        added = False
+        for code in codes:
+            row = self._index.get(code)
+            if row is None:
+                row = self._index[code] = len(self.codes)
+                self.codes.append(code)
+                added = True
+            rows.append(row)
+        if added:
+            size = len(self.codes)
+            self.last_date = np.concatenate([self.last_date, np.zeros(size - len(self.last_date), dtype=np.int64)])
+            self.last_close = np.concatenate([self.last_close, np.full(size - len(self.last_close), np.nan)])
+            for indicator in self.indicators.values():
+                for part in indicator.parts.values():
+                    part.resize(size)
+        return np.asarray(rows, dtype=np.int64)
+
+    def _step(self, rows: np.ndarray, inputs: Dict[str, np.ndarray], commit: bool) -> Dict[str, Dict[str, np.ndarray]]:
+        return {name: indicator.step(rows, inputs, commit) for name, indicator in self.indicators.items()}
+
+    def seed(self, codes: Iterable[str]) -> int:
+        """
+        从日线仓库回放最近lookback根K线初始化状态，各股票右对齐后按K线逐根批量推进
+
+        Args:
+            codes: 股票代码
+
+        Returns:
+            有日线的股票数
+        """
+        with self._lock:
+            rows = self._rows(codes)
+            for indicator in self.indicators.values():
+                for part in indicator.parts.values():
+                    part.reset(rows)
+            self.last_date[rows] = -1
+            self.last_close[rows] = np.nan
+
+            seeded_rows, panels, dates = [], {field: [] for field in STREAM_INPUTS}, []
+            for row in rows.tolist():
+                bars = self.warehouse.get_bars(self.codes[row], adjust='qfq', sync=False)
+                if bars is None or not len(bars):
+                    continue
+                bars = bars.tail(self.lookback)
+                seeded_rows.append(row)
+                dates.append(int(bars.column('date')[-1]))
+                for field in STREAM_INPUTS:
+                    padded = np.full(self.lookback, np.nan)
+                    padded[self.lookback - len(bars):] = bars.column(field)
+                    panels[field].append(padded)
+            if not seeded_rows:
+                return 0
+
+            seeded = np.asarray(seeded_rows, dtype=np.int64)
+            matrix = {field: np.column_stack(values) for field, values in panels.items()}
+            for t in range(self.lookback):
+                present = np.isfinite(matrix['close'][t])
+                if present.any():
+                    self._step(seeded[present], {field: matrix[field][t, present] for field in STREAM_INPUTS},
+                               commit=True)
+            self.last_date[seeded] = dates
+            self.last_close[seeded] = matrix['close'][-1]
+            self._stats['seeded'] += len(seeded)
+            self.version += 1
+            self._dirty = True
+            return len(seeded)
+
+    def on_bars(self, code: str) -> int:
+        """
+        日线同步完成后推进状态：只提交最后一根已提交K线之后的新K线；
+        前复权历史变化（除权除息）或尚未初始化时重新回放
+
+        Args:
+            code: 股票代码
+
+        Returns:
+            提交的K线数
+        """
+        with self._lock:
+            row = self._index.get(code)
+            if row is None or self.last_date[row] <= 0:
+                self.seed([code])
+                return 0
+
+            bars = self.warehouse.get_bars(code, adjust='qfq', sync=False)
+            if bars is None or not len(bars):
+                return 0
+            dates = bars.column('date')
+            pos = int(np.searchsorted(dates, self.last_date[row]))
+            if pos >= len(dates) or dates[pos] != self.last_date[row] or \
+                    not np.isclose(bars.column('close')[pos], self.last_close[row], rtol=1e-6):
+                logger.info(f"{code} 前复权历史变化，重新初始化指标状态")
+                self.seed([code])
+                return 0
+
+            rows = np.asarray([row], dtype=np.int64)
+            committed = 0
+            for i in range(pos + 1, len(dates)):
+                self._step(rows, {field: np.asarray([bars.column(field)[i]], dtype=np.float64)
+                                  for field in STREAM_INPUTS}, commit=True)
+                self.last_date[row] = int(dates[i])
+                self.last_close[row] = bars.column('close')[i]
+                committed += 1
+            if committed:
+                self._stats['bars_committed'] += committed
+                self.version += 1
+                self._dirty = True
+            return committed
+
+    def on_snapshot(self, snapshot: StockSnapshot):
+        """行情快照监听器，在独立线程中试算，不阻塞快照刷新"""
+        self._executor.submit(self.update_from_snapshot, snapshot)
+
+    def update_from_snapshot(self, snapshot: StockSnapshot) -> Optional[Dict]:
+        """
+        以快照最新价作为当日未收盘K线试算全部股票的指标值，不修改状态；
+        快照所属交易日为最近一个已开盘的交易日（北京时间），该交易日日线已提交的股票不再试算，
+        因此开盘前、周末及节假日的快照不会把上一交易日收盘价重复试算为新K线
+
+        Args:
+            snapshot: 行情快照
+
+        Returns:
+            试算结果摘要
+        """
+        start = time.perf_counter()
+        trade_date = int(self.calendar.last_session_date(snapshot.fetched_at).strftime('%Y%m%d'))
+        codes = snapshot.column('code')
+        price = snapshot.column('latest_price').astype(np.float64)
+
+        with self._lock:
+            live = self._live
+            if live is not None and live['fetched_at'] == snapshot.fetched_at:
+                return None
+            unknown = [code for code in codes.tolist() if code not in self._index]
+            if unknown:
+                self.seed(unknown)
+            rows = self._rows(codes.tolist())
+            pending = (price > 0) & (self.last_date[rows] < trade_date)
+            inputs = {
+                'close': np.where(pending, price, np.nan),
+                'high': np.where(pending, snapshot.column('high'), np.nan),
+                'low': np.where(pending, snapshot.column('low'), np.nan),
+                'volume': np.where(pending, snapshot.column('volume').astype(np.float64), np.nan),
+            }
+            outputs = self._step(rows, inputs, commit=False)
+            position = np.full(len(self.codes), -1, dtype=np.int64)
+            position[rows] = np.arange(len(rows))
+            elapsed_ms = round((time.perf_counter() - start) * 1000, 1)
+            self._live = {'fetched_at': snapshot.fetched_at, 'date': trade_date, 'rows': rows,
+                          'pending': pending, 'position': position, 'outputs': outputs}
+            self._stats['snapshots'] += 1
+            self.version += 1
+            self._stats['last_snapshot_ms'] = elapsed_ms
+        return {'rows': len(rows), 'pending': int(pending.sum()), 'elapsed_ms': elapsed_ms}
+
+    def latest(self, code: str) -> Optional[Dict]:
+        """
+        获取一只股票已提交日线的指标值，以及最近一次快照试算的当日指标值
+
+        Args:
+            code: 股票代码
+
+        Returns:
+            指标值，股票未初始化时返回None
+        """
+        with self._lock:
+            row = self._index.get(code)
+            if row is None or self.last_date[row] <= 0:
+                return None
+            rows = np.asarray([row], dtype=np.int64)
+            committed = {name: {output: _to_list(values)[0] for output, values in indicator.current(rows).items()}
+                         for name, indicator in self.indicators.items()}
+            result = {'code': code, 'date': format_date_int(int(self.last_date[row])), 'indicators': committed,
+                      'live': None}
+
+            live = self._live
+            if live is not None and row < len(live['position']) and live['position'][row] >= 0:
+                pos = live['position'][row]
+                if live['pending'][pos]:
+                    result['live'] = {
+                        'date': format_date_int(live['date']),
+                        'fetched_at': datetime.fromtimestamp(live['fetched_at']).isoformat(),
+                        'indicators': {name: {output: _to_list(values[pos:pos + 1])[0]
+                                              for output, values in outputs.items()}
+                                       for name, outputs in live['outputs'].items()}
+                    }
+            return result
+
+    def outputs(self, label: str) -> List[str]:
+        """指标的输出字段名，指标未维护时返回空列表"""
+        indicator = self.indicators.get(label)
+        if indicator is None:
+            return []
+        return list(indicator.current(np.zeros(0, dtype=np.int64)))
+
+    def column(self, label: str, output: str, codes: List[str]) -> np.ndarray:
+        """
+        按代码顺序获取指标输出数组：有快照试算值时取试算值，否则取已提交值，未初始化的股票为NaN
+
+        Args:
+            label: 指标标签
+            output: 输出字段名
+            codes: 股票代码
+
+        Returns:
+            与codes等长的数组
+        """
+        with self._lock:
+            rows = np.fromiter((self._index.get(code, -1) for code in codes), dtype=np.int64, count=len(codes))
+            known = rows >= 0
+            known[known] = self.last_date[rows[known]] > 0
+            values = np.full(len(codes), np.nan)
+            if known.any():
+                values[known] = self.indicators[label].current(rows[known])[output]
+
+            live = self._live
+            if live is not None:
+                position = np.full(len(codes), -1, dtype=np.int64)
+                inside = known & (rows < len(live['position']))
+                position[inside] = live['position'][rows[inside]]
+                has_live = position >= 0
+                has_live[has_live] = live['pending'][position[has_live]]
+                values[has_live] = live['outputs'][label][output][position[has_live]]
+            return values
+
+    def save_checkpoint(self) -> Optional[Dict]:
+        """状态有变化时写入检查点（先写临时文件再替换）"""
+        with self._lock:
+            if not self._dirty:
+                return None
+            arrays = {
+                'signature': np.array(self._signature()),
+                'codes': np.array(self.codes, dtype=str),
+                'last_date': self.last_date,
+                'last_close': self.last_close,
+            }
+            for name, indicator in self.indicators.items():
+                for part_name, part in indicator.parts.items():
+                    for field, array in part.arrays.items():
+                        arrays[f'{name}.{part_name}.{field}'] = array
+            self.checkpoint_path.parent.mkdir(parents=True, exist_ok=True)
+            tmp = self.checkpoint_path.with_suffix('.tmp')
+            with open(tmp, 'wb') as f:
+                np.savez(f, **arrays)
+            os.replace(tmp, self.checkpoint_path)
+            self._dirty = False
+            return {'rows': len(self.codes), 'bytes': self.checkpoint_path.stat().st_size}
+
+    def load_checkpoint(self) -> bool:
+        """
+        从检查点恢复状态，指标配置不一致时忽略检查点
+
+        Returns:
+            是否恢复成功
+        """
+        if not self.checkpoint_path.exists():
+            return False
+        try:
+            with np.load(self.checkpoint_path, allow_pickle=False) as data:
+                if str(data['signature']) != self._signature():
+                    logger.info("指标状态检查点的配置已变化，忽略检查点")
+                    return False
+                with self._lock:
+                    codes = data['codes'].tolist()
+                    self._reset_state(len(codes))
+                    self.codes = codes
+                    self._index = {code: row for row, code in enumerate(codes)}
+                    self.last_date = data['last_date'].copy()
+                    self.last_close = data['last_close'].copy()
+                    for name, indicator in self.indicators.items():
+                        for part_name, part in indicator.parts.items():
+                            for field in part.arrays:
+                                part.arrays[field] = data[f'{name}.{part_name}.{field}'].copy()
+                    self.version += 1
+            logger.info(f"已从检查点恢复 {len(self.codes)} 只股票的指标状态")
+            return True
+        except Exception as e:
+            logger.error(f"读取指标状态检查点失败: {str(e)}")
+            return False
+
+    def attach(self, handler=None):
+        """
+        恢复检查点并订阅日线同步与行情快照，启动检查点任务，重复调用无副作用
+
+        Args:
+            handler: 行情数据处理器，默认上证A股处理器
+        """
+        if self._attached:
+            return
+        self._attached = True
+        if handler is None:
+            from data_handlers.sh_a_stock_data import sh_a_stock_handler
+            handler = sh_a_stock_handler
+        self.load_checkpoint()
+        self.warehouse.add_listener(self.on_bars)
+        handler.add_snapshot_listener(self.on_snapshot)
+        self.checkpoint_task.start()
+
+    def stats(self) -> Dict:
+        """获取状态规模与更新统计"""
+        with self._lock:
+            live = self._live
+            return dict(self._stats, symbols=len(self.codes), indicators=list(self.params),
+                        live_date=format_date_int(live['date']) if live else None,
+                        checkpoint=dict(self.checkpoint_task.stats(), last_result=self.checkpoint_task.last_result))
+
+
+# 全局实例
+indicator_stream = IndicatorStream()
+
+
+def get_streaming_indicators(code: str) -> Optional[Dict]:
+    """获取一只股票流式指标值的便捷函数"""
+    return indicator_stream.latest(code)
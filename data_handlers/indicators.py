@@ -0,0 +1,382 @@
+#!/usr/bin/env python3
+"""
+技术指标计算引擎
+指标函数以NumPy数组整体计算，时间为第0维：传入一维数组计算单只股票，
+传入（日期×股票）二维数组时一次计算全部股票。单只股票的结果按
+（代码、复权方式、指标、参数、最后一根K线日期）缓存，有新K线时自动失效
+"""
+
+import logging
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Dict, Iterable, List, NamedTuple, Optional, Tuple
+
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+from data_handlers.bar_warehouse import DailyBars, bar_warehouse, format_date_int, to_date_int
+
+logger = logging.getLogger(__name__)
+
+
+# ==================== 基础运算 ====================
+
+def _shift(x: np.ndarray, periods: int = 1) -> np.ndarray:
+    """沿时间维后移，空出的位置为NaN"""
+    out = np.full(x.shape, np.nan)
+    out[periods:] = x[:-periods]
+    return out
+
+
+def _rolling(x: np.ndarray, n: int, reducer: Callable) -> np.ndarray:
+    """滑动窗口聚合，窗口不足n或含NaN时为NaN"""
+    out = np.full(x.shape, np.nan)
+    if len(x) >= n:
+        out[n - 1:] = reducer(sliding_window_view(x, n, axis=0), axis=-1)
+    return out
+
+
+def _recursive(x: np.ndarray, alpha: float) -> np.ndarray:
+    """
+    指数平滑 Y = alpha * X + (1 - alpha) * Y'，以各列第一个有效值为初值，NaN不更新状态
+    """
+    if x.ndim == 1:
+        # 单只股票逐元素递推，标量运算比逐行数组运算快一个数量级
+        values = []
+        state = float('nan')
+        for value in x.tolist():
+            if state != state:
+                state = value
+            elif value == value:
+                state = alpha * value + (1 - alpha) * state
+            values.append(state)
+        return np.array(values, dtype=np.float64)
+
+    out = np.empty(x.shape)
+    state = np.full(x.shape[1:], np.nan)
+    for t in range(len(x)):
+        value = x[t]
+        state = np.where(np.isnan(state), value,
+                         np.where(np.isnan(value), state, alpha * value + (1 - alpha) * state))
+        out[t] = state
+    return out
+
+
+# ==================== 指标函数 ====================
+
+def sma(close: np.ndarray, n: int = 5) -> Dict[str, np.ndarray]:
+    """简单移动平均，累加和实现，窗口内有NaN时为NaN"""
+    valid = np.isfinite(close)
+    total = np.cumsum(np.where(valid, close, 0.0), axis=0)
+    count = np.cumsum(valid, axis=0)
+    window_total = total.copy()
+    window_count = count.copy()
+    window_total[n:] -= total[:-n]
+    window_count[n:] -= count[:-n]
+    ma = np.where(window_count == n, window_total / n, np.nan)
+    return {'ma': ma}
+
+
+def ema(close: np.ndarray, n: int = 12) -> Dict[str, np.ndarray]:
+    """指数移动平均，alpha = 2 / (n + 1)"""
+    return {'ema': _recursive(close, 2 / (n + 1))}
+
+
+def macd(close: np.ndarray, fast: int = 12, slow: int = 26, signal: int = 9) -> Dict[str, np.ndarray]:
+    """MACD，柱状值按国内惯例为2倍(DIF-DEA)"""
+    dif = _recursive(close, 2 / (fast + 1)) - _recursive(close, 2 / (slow + 1))
+    dea = _recursive(dif, 2 / (signal + 1))
+    return {'dif': dif, 'dea': dea, 'macd': 2 * (dif - dea)}
+
+
+def rsi(close: np.ndarray, n: int = 14) -> Dict[str, np.ndarray]:
+    """RSI，涨幅与波幅以SMA(X, N, 1)平滑"""
+    diff = close - _shift(close)
+    up = _recursive(np.where(np.isnan(diff), np.nan, np.maximum(diff, 0)), 1 / n)
+    total = _recursive(np.abs(diff), 1 / n)
+    value = np.divide(up * 100, total, out=np.full(close.shape, np.nan), where=total > 0)
+    return {'rsi': np.where((total == 0) & np.isfinite(total), 50.0, value)}
+
+
+def kdj(high: np.ndarray, low: np.ndarray, close: np.ndarray,
+        n: int = 9, m1: int = 3, m2: int = 3) -> Dict[str, np.ndarray]:
+    """KDJ，RSV以N日最高最低价计算，K、D分别为SMA(RSV, M1, 1)、SMA(K, M2, 1)"""
+    highest = _rolling(high, n, np.max)
+    lowest = _rolling(low, n, np.min)
+    spread = highest - lowest
+    rsv = np.divide((close - lowest) * 100, spread, out=np.full(close.shape, 50.0), where=spread > 0)
+    rsv = np.where(np.isnan(spread), np.nan, rsv)
+    k = _recursive(rsv, 1 / m1)
+    d = _recursive(k, 1 / m2)
+    return {'k': k, 'd': d, 'j': 3 * k - 2 * d}
+
+
+def boll(close: np.ndarray, n: int = 20, k: float = 2.0) -> Dict[str, np.ndarray]:
+    """布林带，标准差为总体标准差，由均值与平方均值计算"""
+    mid = sma(close, n)['ma']
+    std = np.sqrt(np.maximum(sma(close * close, n)['ma'] - mid * mid, 0))
+    return {'mid': mid, 'upper': mid + k * std, 'lower': mid - k * std}
+
+
+def atr(high: np.ndarray, low: np.ndarray, close: np.ndarray, n: int = 14) -> Dict[str, np.ndarray]:
+    """平均真实波幅，ATR = MA(TR, N)"""
+    prev_close = _shift(close)
+    tr = np.fmax(high - low, np.fmax(np.abs(high - prev_close), np.abs(low - prev_close)))
+    return {'tr': tr, 'atr': sma(tr, n)['ma']}
+
+
+def obv(close: np.ndarray, volume: np.ndarray) -> Dict[str, np.ndarray]:
+    """能量潮，从各列第一根有效K线开始累计"""
+    signed = np.sign(np.nan_to_num(close - _shift(close))) * np.nan_to_num(volume)
+    return {'obv': np.where(np.isfinite(close), np.cumsum(signed, axis=0), np.nan)}
+
+
+class IndicatorSpec(NamedTuple):
+    """指标定义"""
+    func: Callable[..., Dict[str, np.ndarray]]  # 指标函数
+    inputs: Tuple[str, ...]  # 输入的日线字段
+    params: Dict[str, float]  # 参数及默认值，参数类型与默认值一致
+    description: str
+
+
+INDICATORS: Dict[str, IndicatorSpec] = {
+    'ma': IndicatorSpec(sma, ('close',), {'n': 5}, '简单移动平均'),
+    'ema': IndicatorSpec(ema, ('close',), {'n': 12}, '指数移动平均'),
+    'macd': IndicatorSpec(macd, ('close',), {'fast': 12, 'slow': 26, 'signal': 9}, '指数平滑异同移动平均'),
+    'rsi': IndicatorSpec(rsi, ('close',), {'n': 14}, '相对强弱指标'),
+    'kdj': IndicatorSpec(kdj, ('high', 'low', 'close'), {'n': 9, 'm1': 3, 'm2': 3}, '随机指标'),
+    'boll': IndicatorSpec(boll, ('close',), {'n': 20, 'k': 2.0}, '布林带'),
+    'atr': IndicatorSpec(atr, ('high', 'low', 'close'), {'n': 14}, '平均真实波幅'),
+    'obv': IndicatorSpec(obv, ('close', 'volume'), {}, '能量潮'),
+}
+
+
+def resolve_params(name: str, params: Optional[Dict] = None) -> Tuple[Tuple[str, float], ...]:
+    """
+    校验指标参数并补全默认值
+
+    Args:
+        name: 指标名
+        params: 参数，值可为字符串；未知参数忽略
+
+    Returns:
+        按参数名排序的(参数名, 值)元组，可直接作为缓存键
+
+    Raises:
+        ValueError: 指标不存在或参数不合法
+    """
+    spec = INDICATORS.get(name)
+    if spec is None:
+        raise ValueError(f"不支持的指标: {name}，可选值: {', '.join(INDICATORS)}")
+    params = params or {}
+    resolved = {}
+    for key, default in spec.params.items():
+        value = type(default)(params.get(key, default))
+        if value <= 0:
+            raise ValueError(f"指标参数 {key} 必须为正数")
+        resolved[key] = value
+    return tuple(sorted(resolved.items()))
+
+
+def parse_indicator_label(label: str) -> Tuple[str, Tuple[Tuple[str, float], ...]]:
+    """
+    解析指标标签，标签为指标名加可选周期，如ma20、rsi14、macd；周期对应参数n
+
+    Args:
+        label: 指标标签
+
+    Returns:
+        (指标名, 参数)
+
+    Raises:
+        ValueError: 标签不合法
+    """
+    match = re.fullmatch(r'([a-z]+?)(\d+)?', label.strip().lower())
+    if match is None:
+        raise ValueError(f"指标标签格式错误: {label}")
+    name, period = match.groups()
+    if name not in INDICATORS:
+        raise ValueError(f"不支持的指标: {label}，可选值: {', '.join(INDICATORS)}")
+    if period is not None and 'n' not in INDICATORS[name].params:
+        raise ValueError(f"指标 {name} 不支持周期写法: {label}")
+    return name, resolve_params(name, {'n': period} if period is not None else None)
+
+
+def _to_list(values: np.ndarray) -> List[Optional[float]]:
+    """数组转换为列表，NaN转换为None"""
+    return [round(value, 4) if value == value else None for value in values.tolist()]
+
+
+class IndicatorEngine:
+    """基于日线仓库的技术指标引擎"""
+
+    def __init__(self, warehouse=None, max_entries: Optional[int] = None):
+        """
+        Args:
+            warehouse: 日线仓库
+            max_entries: 单只股票指标结果的缓存上限，默认读取INDICATOR_CACHE_MAX_ENTRIES
+        """
+        self.warehouse = warehouse or bar_warehouse
+        self.max_entries = max_entries or int(os.environ.get('INDICATOR_CACHE_MAX_ENTRIES', 1024))
+        self.batch_lookback = int(os.environ.get('INDICATOR_BATCH_LOOKBACK', 250))  # 批量计算使用的K线数
+
+        self._cache: 'OrderedDict[Tuple, Dict[str, np.ndarray]]' = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = {'hits': 0, 'misses': 0}
+
+    def compute(self, symbol: str, name: str, params: Optional[Dict] = None,
+                adjust: str = 'qfq') -> Optional[Tuple[DailyBars, Dict[str, np.ndarray]]]:
+        """
+        计算单只股票的指标（全部历史，保证预热期足够）
+
+        Args:
+            symbol: 股票代码
+            name: 指标名
+            params: 指标参数
+            adjust: 复权方式
+
+        Returns:
+            (日线, 指标输出)，没有日线时返回None
+        """
+        resolved = resolve_params(name, params)
+        # 同一交易日内最后一根K线会被重写，复权因子变化时全部历史会被重写，以仓库数据版本区分；
+        # 读取前后版本不一致说明读取期间发生了写入，结果不缓存
+        version = self._data_version(symbol)
+        bars = self.warehouse.get_bars(symbol, adjust=adjust)
+        if bars is None or not len(bars):
+            return None
+        cacheable = self._data_version(symbol) == version
+
+        key = (symbol, adjust, name, resolved, int(bars.column('date')[-1]), version)
+        with self._lock:
+            outputs = self._cache.get(key) if cacheable else None
+            if outputs is not None:
+                self._cache.move_to_end(key)
+                self._stats['hits'] += 1
+                return bars, outputs
+            self._stats['misses'] += 1
+
+        spec = INDICATORS[name]
+        inputs = [np.asarray(bars.column(field), dtype=np.float64) for field in spec.inputs]
+        outputs = spec.func(*inputs, **dict(resolved))
+        for values in outputs.values():
+            values.setflags(write=False)
+
+        if cacheable:
+            with self._lock:
+                self._cache[key] = outputs
+                while len(self._cache) > self.max_entries:
+                    self._cache.popitem(last=False)
+        return bars, outputs
+
+    def _data_version(self, symbol: str) -> Tuple:
+        """仓库中各存储复权方式的数据版本，每次写入列文件时递增"""
+        return tuple(meta.get('version', 0) if meta else None for meta in self.warehouse.meta(symbol).values())
+
+    def series(self, symbol: str, name: str, params: Optional[Dict] = None, adjust: str = 'qfq',
+               start_date=None, end_date=None) -> Optional[Dict]:
+        """
+        获取日期区间内的指标序列
+
+        Returns:
+            包含日期与各输出序列的字典，没有日线时返回None
+        """
+        result = self.compute(symbol, name, params, adjust)
+        if result is None:
+            return None
+        bars, outputs = result
+        dates = bars.column('date')
+        start = to_date_int(start_date)
+        end = to_date_int(end_date)
+        lo = int(np.searchsorted(dates, start, side='left')) if start is not None else 0
+        hi = int(np.searchsorted(dates, end, side='right')) if end is not None else len(dates)
+
+        return {
+            'code': symbol,
+            'indicator': name,
+            'params': dict(resolve_params(name, params)),
+            'adjust': adjust,
+            'dates': [format_date_int(value) for value in dates[lo:hi].tolist()],
+            'values': {output: _to_list(values[lo:hi]) for output, values in outputs.items()}
+        }
+
+    def batch(self, name: str, params: Optional[Dict] = None, symbols: Optional[Iterable[str]] = None,
+              adjust: str = 'qfq', lookback: Optional[int] = None) -> Dict:
+        """
+        一次计算多只股票的最新指标值：各股票最近lookback根K线右对齐为（K线×股票）矩阵，
+        指标函数对整个矩阵计算一次。只读取本地日线，不触发同步
+
+        Args:
+            name: 指标名
+            params: 指标参数
+            symbols: 股票代码，默认本地已有日线的全部股票
+            adjust: 复权方式
+            lookback: 每只股票使用的K线数
+
+        Returns:
+            各股票最新一根K线的日期与指标值
+        """
+        resolved = resolve_params(name, params)
+        spec = INDICATORS[name]
+        lookback = lookback or self.batch_lookback
+        start = time.perf_counter()
+
+        codes = []
+        last_dates = []
+        columns = []
+        for symbol in (symbols if symbols is not None else self.warehouse.symbols()):
+            bars = self.warehouse.get_bars(symbol, adjust=adjust, sync=False)
+            if bars is None or not len(bars):
+                continue
+            bars = bars.tail(lookback)
+            codes.append(symbol)
+            last_dates.append(int(bars.column('date')[-1]))
+            columns.append([bars.column(field) for field in spec.inputs])
+
+        panels = [np.full((lookback, len(codes)), np.nan) for _ in spec.inputs]
+        for j, values in enumerate(columns):
+            for panel, column in zip(panels, values):
+                panel[lookback - len(column):, j] = column
+
+        outputs = spec.func(*panels, **dict(resolved)) if codes else {}
+        latest = {output: _to_list(values[-1]) for output, values in outputs.items()}
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        logger.info(f"批量计算指标 {name} 完成，{len(codes)} 只股票，耗时 {elapsed_ms:.1f}ms")
+
+        return {
+            'indicator': name,
+            'params': dict(resolved),
+            'adjust': adjust,
+            'lookback': lookback,
+            'total': len(codes),
+            'elapsed_ms': round(elapsed_ms, 1),
+            'items': [
+                dict({'code': code, 'date': format_date_int(last_date)},
+                     **{output: values[j] for output, values in latest.items()})
+                for j, (code, last_date) in enumerate(zip(codes, last_dates))
+            ]
+        }
+
+    def stats(self) -> Dict:
+        """获取缓存统计"""
+        with self._lock:
+            return dict(self._stats, entries=len(self._cache), max_entries=self.max_entries)
+
+
+# 全局实例
+indicator_engine = IndicatorEngine()
+
+
+def get_indicator_series(symbol: str, name: str, params: Optional[Dict] = None, adjust: str = 'qfq',
+                         start_date=None, end_date=None) -> Optional[Dict]:
+    """获取单只股票指标序列的便捷函数"""
+    return indicator_engine.series(symbol, name, params, adjust, start_date, end_date)
+
+
+def get_indicator_batch(name: str, params: Optional[Dict] = None, symbols: Optional[Iterable[str]] = None,
+                        adjust: str = 'qfq') -> Dict:
+    """批量计算最新指标值的便捷函数"""
+    return indicator_engine.batch(name, params, symbols, adjust)
@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+"""
+行业索引
+基于行情快照与股票代码到行业的映射，一次性向量化计算各行业聚合指标和成分股行号
+"""
+
+import time
+from typing import Dict, List, Mapping, Optional
+
+import numpy as np
+
+from data_handlers.stock_snapshot import StockSnapshot
+
+# 映射中没有行业信息的股票归入该分类
+UNKNOWN_INDUSTRY = '其他'
+
+
+class IndustryIndex:
+    """单个行情快照上的行业聚合结果"""
+
+    def __init__(self, snapshot: StockSnapshot, industry_map: Mapping[str, str]):
+        """
+        Args:
+            snapshot: 行情快照
+            industry_map: 股票代码到行业名称的映射
+        """
+        start = time.perf_counter()
+        self.snapshot = snapshot
+
+        labels = np.array([industry_map.get(code) or UNKNOWN_INDUSTRY for code in snapshot.column('code')],
+                          dtype=object)
+        self.labels = labels  # 与快照行对齐的行业名称
+        names, inverse = np.unique(labels, return_inverse=True)
+        size = len(names)
+
+        change = snapshot.column('change_percent')
+        cap = snapshot.column('circulation_market_cap')
+        counts = np.bincount(inverse, minlength=size)
+        cap_sum = np.bincount(inverse, weights=cap, minlength=size)
+        weighted_change = np.divide(np.bincount(inverse, weights=cap * change, minlength=size), cap_sum,
+                                    out=np.zeros(size), where=cap_sum > 0)
+
+        self.names: List[str] = names.tolist()
+        self.aggregates: Dict[str, Dict] = {}
+        metrics = zip(
+            self.names,
+            counts.tolist(),
+            weighted_change.tolist(),
+            (np.bincount(inverse, weights=change, minlength=size) / np.maximum(counts, 1)).tolist(),
+            (np.bincount(inverse, weights=snapshot.column('turnover_rate'), minlength=size) / np.maximum(counts, 1)).tolist(),
+            np.bincount(inverse, weights=snapshot.column('amount'), minlength=size).tolist(),
+            np.bincount(inverse, weights=snapshot.column('total_market_cap'), minlength=size).tolist(),
+            np.bincount(inverse, weights=change > 0, minlength=size).astype(np.int64).tolist(),
+            np.bincount(inverse, weights=change < 0, minlength=size).astype(np.int64).tolist(),
+        )
+        for name, count, weighted, avg_change, avg_turnover, amount, market_cap, up, down in metrics:
+            self.aggregates[name] = {
+                'industry': name,
+                'count': count,
+                'weighted_change_percent': round(weighted, 2),  # 流通市值加权涨跌幅
+                'avg_change_percent': round(avg_change, 2),
+                'avg_turnover_rate': round(avg_turnover, 2),
+                'total_amount': round(amount, 2),
+                'total_market_cap': round(market_cap, 2),  # 亿元
+                'up_count': up,
+                'down_count': down,
+                'flat_count': count - up - down
+            }
+
+        # 按行业分组的行号，组内保持快照顺序
+        order = np.argsort(inverse, kind='stable')
+        self._members: Dict[str, np.ndarray] = dict(zip(self.names, np.split(order, np.cumsum(counts)[:-1])))
+
+        self.build_ms = round((time.perf_counter() - start) * 1000, 1)
+
+    def __len__(self) -> int:
+        return len(self.names)
+
+    def members(self, industry: str) -> Optional[np.ndarray]:
+        """获取行业成分股在快照中的行号，行业不存在时返回None"""
+        return self._members.get(industry)
+
+    def to_list(self, include_stocks: bool = False) -> List[Dict]:
+        """
+        按成分股数量降序输出行业列表
+
+        Args:
+            include_stocks: 是否附带完整的成分股数据
+
+        Returns:
+            行业聚合数据列表
+        """
+        result = []
+        for aggregate in sorted(self.aggregates.values(), key=lambda x: x['count'], reverse=True):
+            item = dict(aggregate)
+            if include_stocks:
+                item['stocks'] = self.snapshot.to_records(self._members[item['industry']])
+            result.append(item)
+        return result
+
+    def get(self, industry: str) -> Optional[Dict]:
+        """
+        获取单个行业的聚合数据及成分股
+
+        Args:
+            industry: 行业名称
+
+        Returns:
+            行业数据，不存在时返回None
+        """
+        aggregate = self.aggregates.get(industry)
+        if aggregate is None:
+            return None
+        return dict(aggregate, stocks=self.snapshot.to_records(self._members[industry]))
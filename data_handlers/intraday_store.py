@@ -0,0 +1,496 @@
+#!/usr/bin/env python3
+"""
+A股分钟线存储
+按股票代码持久化分钟K线，每次同步把新增的已完成1分钟K线追加为压缩的列块文件（.npz）。
+保留分级：1分钟线保留最近若干天，到期后降采样为5分钟线，5分钟线到期后再降采样为30分钟线长期保存。
+块文件按周期分组（1分钟按日、5分钟按月、30分钟按年），同组的块在该组不再追加时合并为一个文件，
+当日的1分钟块累积到一定数量时也随同步合并；区间查询只打开时间范围重叠的块，已读取的块按文件缓存
+"""
+
+import json
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from datetime import date, datetime, timedelta
+from pathlib import Path
+from typing import Dict, Iterable, List, NamedTuple, Optional, Tuple, Union
+
+import numpy as np
+import pandas as pd
+
+from data_handlers.akshare_gateway import akshare_gateway
+from data_handlers.stock_snapshot import FieldSpec
+from utils.single_flight import SingleFlight
+from utils.trading_calendar import trading_calendar
+
+logger = logging.getLogger(__name__)
+
+# 分钟线字段，time以YYYYMMDDHHMM整数存储（K线结束时刻，与上游一致）
+MINUTE_FIELDS = [
+    FieldSpec('time', np.int64, '时间'),
+    FieldSpec('open', np.float64, '开盘'),
+    FieldSpec('close', np.float64, '收盘'),
+    FieldSpec('high', np.float64, '最高'),
+    FieldSpec('low', np.float64, '最低'),
+    FieldSpec('volume', np.float64, '成交量'),
+    FieldSpec('amount', np.float64, '成交额'),
+]
+
+MINUTE_FIELD_NAMES = [spec.name for spec in MINUTE_FIELDS]
+
+
+class Tier(NamedTuple):
+    """保留级别"""
+    name: str
+    minutes: int  # K线周期（分钟）
+    group_digits: int  # 块分组键取time的前几位：8按日、6按月、4按年
+
+
+TIERS = (Tier('1m', 1, 8), Tier('5m', 5, 6), Tier('30m', 30, 4))
+TIER_BY_NAME = {tier.name: tier for tier in TIERS}
+
+# 上午、下午开盘时刻（自0点起的分钟数），集合竞价K线并入开盘后第一根K线
+SESSION_OPENS = (9 * 60 + 30, 13 * 60)
+
+TimeLike = Union[str, int, datetime, date, None]
+
+
+def to_minute_int(value: TimeLike, end: bool = False) -> Optional[int]:
+    """
+    将时间转换为YYYYMMDDHHMM整数
+
+    Args:
+        value: 时间，只有日期时按当日开始（end为True时按当日结束）处理
+        end: 是否作为区间终点
+
+    Returns:
+        YYYYMMDDHHMM整数
+    """
+    if value is None or value == '':
+        return None
+    if isinstance(value, (int, np.integer)):
+        value = int(value)
+        if value < 10 ** 8:
+            return value * 10000 + (2359 if end else 0)
+        return value
+    if isinstance(value, str) and len(value.strip()) <= 10:
+        day = int(pd.Timestamp(value).strftime('%Y%m%d'))
+        return day * 10000 + (2359 if end else 0)
+    return int(pd.Timestamp(value).strftime('%Y%m%d%H%M'))
+
+
+def format_minute_int(value: int) -> str:
+    """YYYYMMDDHHMM整数转换为YYYY-MM-DD HH:MM"""
+    day, hhmm = divmod(int(value), 10000)
+    return f'{day // 10000:04d}-{day // 100 % 100:02d}-{day % 100:02d} {hhmm // 100:02d}:{hhmm % 100:02d}'
+
+
+def _dedup(columns: Dict[str, np.ndarray]) -> Dict[str, np.ndarray]:
+    """按时间排序去重，同一时刻保留最后写入的K线"""
+    times = columns['time']
+    if len(times) < 2 or (np.all(times[1:] > times[:-1])):
+        return columns
+    # 反转后取首次出现即最后写入
+    _, index = np.unique(times[::-1], return_index=True)
+    keep = len(times) - 1 - index
+    return {name: values[keep] for name, values in columns.items()}
+
+
+def resample(columns: Dict[str, np.ndarray], minutes: int) -> Dict[str, np.ndarray]:
+    """
+    将分钟线降采样为更长周期：按K线结束时刻向上取整到周期，集合竞价K线并入开盘后第一根
+
+    Args:
+        columns: 按时间升序的分钟线
+        minutes: 目标周期（分钟）
+
+    Returns:
+        降采样后的K线
+    """
+    times = columns['time']
+    if not len(times):
+        return {name: values[:0] for name, values in columns.items()}
+    day, hhmm = np.divmod(times, 10000)
+    of_day = hhmm // 100 * 60 + hhmm % 100
+    bucket = -(-of_day // minutes) * minutes
+    session_open = np.where(of_day <= SESSION_OPENS[0] + 120, SESSION_OPENS[0], SESSION_OPENS[1])
+    bucket = np.maximum(bucket, session_open + minutes)
+    keys = day * 10000 + bucket // 60 * 100 + bucket % 60
+
+    starts = np.flatnonzero(np.r_[True, keys[1:] != keys[:-1]])
+    ends = np.r_[starts[1:], len(keys)] - 1
+    return {
+        'time': keys[starts],
+        'open': columns['open'][starts],
+        'close': columns['close'][ends],
+        'high': np.maximum.reduceat(columns['high'], starts),
+        'low': np.minimum.reduceat(columns['low'], starts),
+        'volume': np.add.reduceat(columns['volume'], starts),
+        'amount': np.add.reduceat(columns['amount'], starts),
+    }
+
+
+class IntradayStore:
+    """A股分钟线存储"""
+
+    def __init__(self, root: Optional[str] = None, gateway=None, calendar=None):
+        """
+        Args:
+            root: 存储根目录，默认data/intraday
+            gateway: akshare网关
+            calendar: 交易日历，决定同步间隔
+        """
+        self.root = Path(root) if root else Path(__file__).parent.parent / 'data' / 'intraday'
+        self.gateway = gateway or akshare_gateway
+        self.calendar = calendar or trading_calendar
+
+        self.retention_days = {
+            '1m': int(os.environ.get('INTRADAY_1M_RETENTION_DAYS', 10)),  # 1分钟线保留天数
+            '5m': int(os.environ.get('INTRADAY_5M_RETENTION_DAYS', 120)),  # 5分钟线保留天数，30分钟线长期保留
+        }
+        self.chunk_cache_size = int(os.environ.get('INTRADAY_CHUNK_CACHE_SIZE', 512))  # 已读取块文件的缓存数
+        self.merge_chunks = int(os.environ.get('INTRADAY_MERGE_CHUNKS', 10))  # 当日1分钟块累积到该数量时合并
+
+        self._single_flight = SingleFlight()
+        self._locks: Dict[str, threading.Lock] = {}
+        self._locks_guard = threading.Lock()
+        self._chunks: 'OrderedDict[Path, Dict[str, np.ndarray]]' = OrderedDict()
+        self._chunks_lock = threading.Lock()
+        self._stats = {'chunk_hits': 0, 'chunk_reads': 0, 'compactions': 0}
+
+    # ==================== 块文件 ====================
+
+    def _lock(self, symbol: str) -> threading.Lock:
+        with self._locks_guard:
+            return self._locks.setdefault(symbol, threading.Lock())
+
+    def _tier_dir(self, symbol: str, tier: str) -> Path:
+        return self.root / symbol / tier
+
+    def _list_chunks(self, symbol: str, tier: str) -> List[Tuple[int, int, Path]]:
+        """列出块文件，按（首根K线时间, 末根K线时间, 路径）排序；时间范围由文件名给出，无需打开文件"""
+        directory = self._tier_dir(symbol, tier)
+        if not directory.exists():
+            return []
+        chunks = []
+        for path in directory.glob('*.npz'):
+            first, last = path.stem.split('_')
+            chunks.append((int(first), int(last), path))
+        return sorted(chunks)
+
+    def _read_chunk(self, path: Path) -> Dict[str, np.ndarray]:
+        with self._chunks_lock:
+            columns = self._chunks.get(path)
+            if columns is not None:
+                self._chunks.move_to_end(path)
+                self._stats['chunk_hits'] += 1
+                return columns
+        with np.load(path) as data:
+            columns = {name: data[name] for name in MINUTE_FIELD_NAMES}
+        for values in columns.values():
+            values.setflags(write=False)
+        with self._chunks_lock:
+            self._stats['chunk_reads'] += 1
+            self._chunks[path] = columns
+            while len(self._chunks) > self.chunk_cache_size:
+                self._chunks.popitem(last=False)
+        return columns
+
+    def _write_chunks(self, symbol: str, tier: Tier, columns: Dict[str, np.ndarray]) -> List[Tuple[str, Path]]:
+        """
+        按分组拆分后逐组写入新块，先写临时文件再改名，读取方不会看到写了一半的块
+
+        Returns:
+            写入的（分组键, 块路径）
+        """
+        directory = self._tier_dir(symbol, tier.name)
+        directory.mkdir(parents=True, exist_ok=True)
+        times = columns['time']
+        groups = times // 10 ** (12 - tier.group_digits)
+        starts = np.flatnonzero(np.r_[True, groups[1:] != groups[:-1]])
+        ends = np.r_[starts[1:], len(times)]
+        written = []
+        for lo, hi in zip(starts, ends):
+            name = f'{int(times[lo])}_{int(times[hi - 1])}'
+            tmp = directory / f'{name}.tmp'
+            with open(tmp, 'wb') as f:
+                np.savez_compressed(f, **{spec.name: np.ascontiguousarray(columns[spec.name][lo:hi], dtype=spec.dtype)
+                                          for spec in MINUTE_FIELDS})
+            path = directory / f'{name}.npz'
+            os.replace(tmp, path)
+            with self._chunks_lock:
+                self._chunks.pop(path, None)
+            written.append((str(int(groups[lo])), path))
+        return written
+
+    def _load_chunks(self, chunks: Iterable[Tuple[int, int, Path]]) -> Dict[str, np.ndarray]:
+        parts = [self._read_chunk(path) for _, _, path in chunks]
+        if not parts:
+            return {spec.name: np.empty(0, dtype=spec.dtype) for spec in MINUTE_FIELDS}
+        return _dedup({name: np.concatenate([part[name] for part in parts]) for name in MINUTE_FIELD_NAMES})
+
+    def _remove_chunks(self, chunks: Iterable[Tuple[int, int, Path]]):
+        for _, _, path in chunks:
+            path.unlink(missing_ok=True)
+            with self._chunks_lock:
+                self._chunks.pop(path, None)
+
+    def _merge_groups(self, symbol: str, tier: Tier, groups: Optional[Iterable[str]] = None,
+                      before: Optional[str] = None, min_chunks: int = 2):
+        """合并同一分组内至少min_chunks个块；先写合并后的块再删除原块，中途失败时读取按时间去重"""
+        by_group: Dict[str, List] = {}
+        for chunk in self._list_chunks(symbol, tier.name):
+            by_group.setdefault(str(chunk[0])[:tier.group_digits], []).append(chunk)
+        targets = set(groups) if groups is not None else set(by_group)
+        for group, chunks in by_group.items():
+            if len(chunks) < max(min_chunks, 2) or group not in targets or (before is not None and group >= before):
+                continue
+            written = {path for _, path in self._write_chunks(symbol, tier, self._load_chunks(chunks))}
+            self._remove_chunks(chunk for chunk in chunks if chunk[2] not in written)
+
+    # ==================== 同步 ====================
+
+    def _meta_path(self, symbol: str) -> Path:
+        return self.root / symbol / 'meta.json'
+
+    def _read_meta(self, symbol: str) -> Optional[Dict]:
+        try:
+            with open(self._meta_path(symbol), 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+
+    def _write_meta(self, symbol: str, meta: Dict):
+        path = self._meta_path(symbol)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_suffix('.tmp')
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump(meta, f)
+        os.replace(tmp, path)
+
+    def needs_sync(self, symbol: str) -> bool:
+        """没有本地数据，或上次同步已过期"""
+        meta = self._read_meta(symbol)
+        return meta is None or not self.calendar.is_fresh('intraday_bars', meta['synced_at'])
+
+    @staticmethod
+    def _from_frame(frame: pd.DataFrame) -> Dict[str, np.ndarray]:
+        """按MINUTE_FIELDS将上游DataFrame转换为列数组"""
+        frame = frame.sort_values('时间')
+        columns = {'time': pd.to_datetime(frame['时间']).dt.strftime('%Y%m%d%H%M').astype(np.int64).to_numpy()}
+        for spec in MINUTE_FIELDS[1:]:
+            values = pd.to_numeric(frame[spec.source], errors='coerce').to_numpy(dtype=np.float64)
+            columns[spec.name] = np.where(np.isnan(values), spec.fill, values)
+        return columns
+
+    def sync(self, symbol: str, force: bool = False, now: Optional[datetime] = None) -> Dict:
+        """
+        增量同步1分钟线：只请求最后一根已存K线之后的数据，只追加已完成的K线（K线结束时刻不晚于当前时间），
+        同步后按保留策略整理
+
+        Args:
+            symbol: 股票代码
+            force: 是否忽略同步间隔
+            now: 当前时间（北京时间，与上游分钟线时间一致），默认按交易日历取当前北京时间
+
+        Returns:
+            同步结果
+        """
+        if not force and not self.needs_sync(symbol):
+            return {'synced': False}
+        return self._single_flight.do(symbol, lambda: self._sync(symbol, now or self.calendar.to_local()))
+
+    def _sync(self, symbol: str, now: datetime) -> Dict:
+        start = time.perf_counter()
+        meta = self._read_meta(symbol) or {'symbol': symbol, 'last_time': 0}
+        start_time = format_minute_int(meta['last_time']) + ':00' if meta['last_time'] else '1979-09-01 09:32:00'
+        frame = self.gateway.call('stock_zh_a_hist_min_em', use_cache=False, symbol=symbol, period='1',
+                                  adjust='', start_date=start_time, end_date='2222-01-01 09:32:00')
+
+        rows = 0
+        with self._lock(symbol):
+            if frame is not None and not frame.empty:
+                columns = self._from_frame(frame)
+                keep = (columns['time'] > meta['last_time']) & (columns['time'] <= int(now.strftime('%Y%m%d%H%M')))
+                columns = {name: values[keep] for name, values in columns.items()}
+                rows = len(columns['time'])
+                if rows:
+                    self._write_chunks(symbol, TIER_BY_NAME['1m'], columns)
+                    meta['last_time'] = int(columns['time'][-1])
+            meta['synced_at'] = time.time()
+            self._write_meta(symbol, meta)
+            self._compact(symbol, now.date())
+
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        logger.info(f"{symbol} 分钟线同步完成，新增 {rows} 条，耗时 {elapsed_ms:.1f}ms")
+        return {'synced': True, 'rows': rows, 'last_time': format_minute_int(meta['last_time']) if meta['last_time'] else None}
+
+    # ==================== 整理 ====================
+
+    def compact(self, symbol: str, today: Optional[date] = None) -> Dict[str, int]:
+        """
+        按保留策略整理：到期的1分钟线降采样为5分钟线，到期的5分钟线降采样为30分钟线；
+        已结束的分组（1分钟线为当日之前的日期）内多个块合并为一个
+
+        Args:
+            symbol: 股票代码
+            today: 当前日期（北京时间），默认按交易日历取当日
+
+        Returns:
+            各级别被降采样的K线数
+        """
+        with self._lock(symbol):
+            return self._compact(symbol, today or self.calendar.to_local().date())
+
+    def _compact(self, symbol: str, today: date) -> Dict[str, int]:
+        counts = {}
+        for source, target in zip(TIERS[:-1], TIERS[1:]):
+            cutoff = int((today - timedelta(days=self.retention_days[source.name])).strftime('%Y%m%d'))
+            touched = [chunk for chunk in self._list_chunks(symbol, source.name) if chunk[0] // 10000 < cutoff]
+            counts[source.name] = 0
+            if not touched:
+                continue
+
+            # 跨越保留期边界的块（5分钟线按月分组）拆开，未到期部分写回原级别
+            columns = self._load_chunks(touched)
+            expired = columns['time'] // 10000 < cutoff
+            remaining = {name: values[~expired] for name, values in columns.items()}
+            columns = resample({name: values[expired] for name, values in columns.items()}, target.minutes)
+            existing = self._list_chunks(symbol, target.name)
+            if existing:
+                # 目标级别已有的K线不重复写入（整理中途失败后重试）
+                keep = columns['time'] > existing[-1][1]
+                columns = {name: values[keep] for name, values in columns.items()}
+
+            kept = self._write_chunks(symbol, source, remaining) if len(remaining['time']) else []
+            written = self._write_chunks(symbol, target, columns) if len(columns['time']) else []
+            kept_paths = {path for _, path in kept}
+            self._remove_chunks(chunk for chunk in touched if chunk[2] not in kept_paths)
+            self._merge_groups(symbol, target, [group for group, _ in written])
+            counts[source.name] = int(np.count_nonzero(expired))
+            with self._chunks_lock:
+                self._stats['compactions'] += 1
+            logger.info(f"{symbol} {counts[source.name]} 根{source.name}K线降采样为{target.name}")
+
+        # 已结束交易日的1分钟块合并为一个；当日仍在追加，块数累积到merge_chunks时合并，限制区间读取打开的文件数
+        self._merge_groups(symbol, TIERS[0], before=today.strftime('%Y%m%d'))
+        self._merge_groups(symbol, TIERS[0], [today.strftime('%Y%m%d')], min_chunks=self.merge_chunks)
+        return counts
+
+    def compact_all(self, today: Optional[date] = None) -> Dict[str, int]:
+        """整理全部股票"""
+        totals = {tier.name: 0 for tier in TIERS[:-1]}
+        for symbol in self.symbols():
+            for tier, count in self.compact(symbol, today).items():
+                totals[tier] += count
+        return totals
+
+    # ==================== 查询 ====================
+
+    def get_bars(self, symbol: str, start: TimeLike = None, end: TimeLike = None, period: str = '1m',
+                 sync: bool = True) -> Optional[Dict[str, np.ndarray]]:
+        """
+        读取时间区间内的分钟线。所请求周期由不长于它的各保留级别拼接：
+        较新的数据由更细的级别降采样得到，早于该周期保留期的数据不返回（如1分钟线只覆盖1分钟保留期）
+
+        Args:
+            symbol: 股票代码
+            start: 开始时间（含），None表示最早
+            end: 结束时间（含），None表示至今
+            period: 周期，1m、5m或30m
+            sync: 查询区间覆盖到最新数据时是否按需增量同步
+
+        Returns:
+            按时间升序的列数组，本地及上游均没有数据时返回None
+        """
+        tier = TIER_BY_NAME.get(period)
+        if tier is None:
+            raise ValueError(f"不支持的周期: {period}，可选值: {', '.join(TIER_BY_NAME)}")
+        lo = to_minute_int(start) or 0
+        hi = to_minute_int(end, end=True) or 10 ** 12 - 1
+
+        meta = self._read_meta(symbol)
+        if sync and (meta is None or hi > meta['last_time']) and self.needs_sync(symbol):
+            try:
+                self.sync(symbol, force=True)
+            except Exception as e:
+                if meta is None:
+                    raise
+                logger.warning(f"{symbol} 分钟线同步失败，使用本地数据: {str(e)}")
+            meta = self._read_meta(symbol)
+        if meta is None:
+            return None
+
+        # 同步与整理在同一锁内合并、删除块文件，列出与读取块期间持有锁，避免读到已删除的块
+        parts = []
+        with self._lock(symbol):
+            for source in TIERS[:TIERS.index(tier) + 1]:
+                chunks = [chunk for chunk in self._list_chunks(symbol, source.name) if chunk[1] >= lo and chunk[0] <= hi]
+                if chunks:
+                    parts.append((source, self._load_chunks(chunks)))
+        parts = [resample(columns, tier.minutes) if source is not tier else columns for source, columns in parts]
+        if not parts:
+            return {spec.name: np.empty(0, dtype=spec.dtype) for spec in MINUTE_FIELDS}
+
+        columns = _dedup({name: np.concatenate([part[name] for part in parts]) for name in MINUTE_FIELD_NAMES})
+        times = columns['time']
+        left = int(np.searchsorted(times, lo, side='left'))
+        right = int(np.searchsorted(times, hi, side='right'))
+        return {name: values[left:right] for name, values in columns.items()}
+
+    def symbols(self) -> List[str]:
+        """本地已有分钟线的股票代码"""
+        if not self.root.exists():
+            return []
+        return sorted(path.name for path in self.root.iterdir() if (path / 'meta.json').exists())
+
+    def meta(self, symbol: str) -> Optional[Dict]:
+        """获取同步信息与各级别的块数、时间范围"""
+        meta = self._read_meta(symbol)
+        if meta is None:
+            return None
+        tiers = {}
+        for tier in TIERS:
+            chunks = self._list_chunks(symbol, tier.name)
+            tiers[tier.name] = {
+                'chunks': len(chunks),
+                'first_time': format_minute_int(chunks[0][0]) if chunks else None,
+                'last_time': format_minute_int(chunks[-1][1]) if chunks else None,
+            }
+        return {
+            'symbol': symbol,
+            'last_time': format_minute_int(meta['last_time']) if meta['last_time'] else None,
+            'synced_at': meta['synced_at'],
+            'retention_days': self.retention_days,
+            'tiers': tiers,
+        }
+
+    def stats(self) -> Dict:
+        """块缓存与整理统计"""
+        with self._chunks_lock:
+            return dict(self._stats, cached_chunks=len(self._chunks), chunk_cache_size=self.chunk_cache_size)
+
+
+def to_records(columns: Dict[str, np.ndarray]) -> List[Dict]:
+    """渲染为字典列表，时间格式为YYYY-MM-DD HH:MM"""
+    values = [columns[name].tolist() for name in MINUTE_FIELD_NAMES]
+    values[0] = [format_minute_int(value) for value in values[0]]
+    return [dict(zip(MINUTE_FIELD_NAMES, row)) for row in zip(*values)]
+
+
+# 全局实例
+intraday_store = IntradayStore()
+
+
+def get_minute_bars(symbol: str, start: TimeLike = None, end: TimeLike = None,
+                    period: str = '1m') -> Optional[Dict[str, np.ndarray]]:
+    """读取分钟线的便捷函数"""
+    return intraday_store.get_bars(symbol, start, end, period)
+
+
+if __name__ == "__main__":
+    # 按保留策略整理全部股票的分钟线：python -m data_handlers.intraday_store
+    logging.basicConfig(level=logging.INFO)
+    print(intraday_store.compact_all())
@@ -0,0 +1,260 @@
+#!/usr/bin/env python3
+"""
+整数关口穿越分析
+对指数或股票的收盘价序列单次遍历，统计每个整数关口（步长的整数倍）的上穿与下穿、
+相邻关口之间的推进用时，以及创新高式的整数关口突破（history_file/daily-open-close.py
+中calculate_100_point_breakthroughs的线性时间实现）。结果按（品种、代码、步长、最后一根K线）缓存
+"""
+
+import bisect
+import logging
+import math
+import os
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from data_handlers.bar_warehouse import bar_warehouse, format_date_int
+from data_handlers.index_history import HISTORY_START_DATE, index_history_store, index_symbol
+
+logger = logging.getLogger(__name__)
+
+# 支持的品种
+KINDS = ('index', 'stock')
+
+
+def _day_numbers(dates: np.ndarray) -> np.ndarray:
+    """YYYYMMDD整数日期转换为自1970-01-01起的天数，用于计算自然日间隔"""
+    dates = np.asarray(dates, dtype=np.int64)
+    return pd.to_datetime(dates.astype(str), format='%Y%m%d').to_numpy().astype('datetime64[D]').astype(np.int64)
+
+
+def _duration_stats(days: List[int], bars: List[int]) -> Dict:
+    """用时统计（自然日与K线数）"""
+    if not days:
+        return {'count': 0}
+    days = np.asarray(days)
+    bars = np.asarray(bars)
+    return {
+        'count': len(days),
+        'mean_days': round(float(days.mean()), 1),
+        'median_days': float(np.median(days)),
+        'min_days': int(days.min()),
+        'max_days': int(days.max()),
+        'mean_bars': round(float(bars.mean()), 1),
+        'median_bars': float(np.median(bars)),
+    }
+
+
+def analyze_levels(dates: np.ndarray, close: np.ndarray, step: float,
+                   start_level: Optional[float] = None) -> Dict:
+    """
+    单次遍历收盘价序列，计算关口穿越、推进用时与整数关口突破
+
+    - 穿越：相邻两根K线收盘价跨过关口L（上穿 前收<L≤收盘，下穿 收盘<L≤前收），一根K线可跨过多个关口
+    - 推进用时：上穿L且上一次穿越是上穿L-step时，两次穿越之间的用时即向上推进一档的用时，向下同理
+    - 突破：收盘价所在关口高于此前已突破的最高关口时，记录距上一次收于该关口之下的用时。
+      维护收盘价单调递增的栈（栈中每个元素都低于其后全部收盘价），
+      二分查找即得最近一次低于关口的位置，整体为O(n)遍历
+
+    Args:
+        dates: YYYYMMDD整数日期，升序
+        close: 收盘价
+        step: 关口步长，如100
+        start_level: 只统计收盘价首次达到该点位之后的突破，默认从第一根K线开始
+
+    Returns:
+        穿越记录、各关口统计、推进用时统计与突破记录
+    """
+    if step <= 0:
+        raise ValueError("步长必须为正数")
+    if float(step).is_integer():
+        step = int(step)
+    day_numbers = _day_numbers(dates)
+    close = np.asarray(close, dtype=np.float64)
+    values = close.tolist()
+
+    crossings = []
+    levels: Dict[float, Dict] = {}
+    advances = {'up': ([], []), 'down': ([], [])}
+    last_cross = None  # (关口序号, 方向, K线位置)
+
+    breakthroughs = []
+    stack_close: List[float] = []
+    stack_index: List[int] = []
+    current_level = 0.0
+    started = start_level is None
+    prev_index = None
+
+    for i, price in enumerate(values):
+        if price != price:
+            continue
+
+        if prev_index is not None:
+            prev = values[prev_index]
+            low_k = math.floor(prev / step)
+            high_k = math.floor(price / step)
+            if high_k != low_k:
+                direction = 'up' if high_k > low_k else 'down'
+                ks = range(low_k + 1, high_k + 1) if direction == 'up' else range(low_k, high_k, -1)
+                for k in ks:
+                    level = k * step
+                    crossings.append((i, level, direction))
+                    summary = levels.setdefault(level, {'up': 0, 'down': 0, 'first': i, 'last': i})
+                    summary[direction] += 1
+                    summary['last'] = i
+                    if last_cross is not None:
+                        previous_k, previous_direction, previous_i = last_cross
+                        if previous_direction == direction and previous_k == k - (1 if direction == 'up' else -1):
+                            advances[direction][0].append(int(day_numbers[i] - day_numbers[previous_i]))
+                            advances[direction][1].append(i - previous_i)
+                    last_cross = (k, direction, i)
+
+        if not started and price >= start_level:
+            started = True
+        if started:
+            target = math.floor(price / step) * step
+            if target > current_level:
+                position = bisect.bisect_left(stack_close, target) - 1
+                if position >= 0:
+                    below = stack_index[position]
+                    breakthroughs.append({
+                        'level': target,
+                        'date': format_date_int(int(dates[i])),
+                        'close': price,
+                        'days': int(day_numbers[i] - day_numbers[below]),
+                        'bars': i - below,
+                        'from_close': values[below],
+                        'from_date': format_date_int(int(dates[below])),
+                    })
+                    current_level = target
+
+        # 入栈前弹出不低于当前收盘价的K线：之后的查询中当前K线总是更近且更低
+        while stack_close and stack_close[-1] >= price:
+            stack_close.pop()
+            stack_index.pop()
+        stack_close.append(price)
+        stack_index.append(i)
+        prev_index = i
+
+    breakthrough_days = [item['days'] for item in breakthroughs]
+    return {
+        'step': step,
+        'bars': len(values),
+        'crossings': [
+            {'date': format_date_int(int(dates[i])), 'level': level, 'direction': direction, 'close': values[i]}
+            for i, level, direction in crossings
+        ],
+        'levels': [
+            {'level': level, 'up': summary['up'], 'down': summary['down'],
+             'first_date': format_date_int(int(dates[summary['first']])),
+             'last_date': format_date_int(int(dates[summary['last']]))}
+            for level, summary in sorted(levels.items())
+        ],
+        'advance_stats': {direction: _duration_stats(*samples) for direction, samples in advances.items()},
+        'breakthroughs': breakthroughs,
+        'breakthrough_stats': _duration_stats(breakthrough_days, [item['bars'] for item in breakthroughs]),
+    }
+
+
+class LevelCrossingService:
+    """基于本地日线的关口穿越分析服务"""
+
+    def __init__(self, warehouse=None, index_store=None, max_entries: Optional[int] = None):
+        """
+        Args:
+            warehouse: 股票日线仓库
+            index_store: 指数日线存储
+            max_entries: 结果缓存上限，默认读取LEVEL_CACHE_MAX_ENTRIES
+        """
+        self.warehouse = warehouse or bar_warehouse
+        self.index_store = index_store or index_history_store
+        self.max_entries = max_entries or int(os.environ.get('LEVEL_CACHE_MAX_ENTRIES', 256))
+
+        self._cache: 'OrderedDict[Tuple, Dict]' = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = {'hits': 0, 'misses': 0}
+
+    def _load(self, kind: str, code: str, adjust: str) -> Optional[Tuple[np.ndarray, np.ndarray]]:
+        """读取全部历史的日期与收盘价"""
+        if kind == 'index':
+            rows = self.index_store.get_bars(code, HISTORY_START_DATE, datetime.now().strftime('%Y-%m-%d'))
+            if not rows:
+                return None
+            dates = np.array([int(row['date'].replace('-', '')) for row in rows], dtype=np.int64)
+            return dates, np.array([row['收盘'] for row in rows], dtype=np.float64)
+
+        bars = self.warehouse.get_bars(code, adjust=adjust)
+        if bars is None or not len(bars):
+            return None
+        return np.asarray(bars.column('date')), np.asarray(bars.column('close'), dtype=np.float64)
+
+    def analyze(self, code: str, step: float, kind: str = 'index', adjust: str = 'qfq',
+                start_level: Optional[float] = None) -> Optional[Dict]:
+        """
+        分析指数或股票的关口穿越，按（品种、代码、复权方式、步长、起始点位、最后一根K线）缓存；
+        最后一根K线可能在盘中更新，缓存键包含其日期与收盘价
+
+        Args:
+            code: 指数或股票代码
+            step: 关口步长
+            kind: index或stock
+            adjust: 股票复权方式，指数忽略
+            start_level: 突破统计的起始点位
+
+        Returns:
+            分析结果，没有日线时返回None
+        """
+        if kind not in KINDS:
+            raise ValueError(f"不支持的品种: {kind}，可选值: {', '.join(KINDS)}")
+        if step <= 0:
+            raise ValueError("步长必须为正数")
+
+        loaded = self._load(kind, code, adjust)
+        if loaded is None:
+            return None
+        dates, close = loaded
+
+        symbol = index_symbol(code) if kind == 'index' else code
+        key = (kind, symbol, adjust if kind == 'stock' else None, step, start_level,
+               int(dates[-1]), float(close[-1]))
+        with self._lock:
+            result = self._cache.get(key)
+            if result is not None:
+                self._cache.move_to_end(key)
+                self._stats['hits'] += 1
+                return result
+            self._stats['misses'] += 1
+
+        start = time.perf_counter()
+        result = analyze_levels(dates, close, step, start_level)
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        logger.info(f"{kind} {symbol} 关口分析完成（步长{step}），{len(dates)} 根K线，耗时 {elapsed_ms:.1f}ms")
+        result.update({'kind': kind, 'code': code, 'adjust': key[2], 'start_level': start_level,
+                       'last_date': format_date_int(int(dates[-1])), 'elapsed_ms': round(elapsed_ms, 1)})
+
+        with self._lock:
+            self._cache[key] = result
+            while len(self._cache) > self.max_entries:
+                self._cache.popitem(last=False)
+        return result
+
+    def stats(self) -> Dict:
+        """获取缓存统计"""
+        with self._lock:
+            return dict(self._stats, entries=len(self._cache), max_entries=self.max_entries)
+
+
+# 全局实例
+level_crossing_service = LevelCrossingService()
+
+
+def get_level_crossings(code: str, step: float, kind: str = 'index', adjust: str = 'qfq',
+                        start_level: Optional[float] = None) -> Optional[Dict]:
+    """关口穿越分析的便捷函数"""
+    return level_crossing_service.analyze(code, step, kind, adjust, start_level)
@@ -0,0 +1,250 @@
+#!/usr/bin/env python3
+"""
+股票参考数据存储
+保存行业、上市时间、股本等变化缓慢的个股基本信息，与行情缓存分层管理：
+记录不随行情一起清理，按较长的有效期由后台任务分批复核，并通过内容摘要识别实际变化
+"""
+
+import hashlib
+import json
+import logging
+import sqlite3
+import time
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from data_handlers.stock_snapshot import StockSnapshot
+from utils.database import SQLiteConnectionManager, ensure_columns
+
+logger = logging.getLogger(__name__)
+
+# 参与变化检测的字段
+REFERENCE_FIELDS = ('name', 'industry', 'list_date', 'total_shares', 'circulating_shares')
+
+# 行情推算的总股本与缓存值相差超过该比例时，认为股本已变化需要复核
+SHARE_CHANGE_TOLERANCE = 0.02
+
+# 股本疑似变化的记录距上次复核至少间隔该时间（秒），避免口径差异导致反复请求
+SHARE_CHANGE_RECHECK_SECONDS = 24 * 3600
+
+
+def content_hash(info: Dict) -> str:
+    """计算参考数据内容摘要"""
+    payload = json.dumps([info.get(field) for field in REFERENCE_FIELDS], ensure_ascii=False)
+    return hashlib.sha1(payload.encode('utf-8')).hexdigest()
+
+
+class StockReferenceStore:
+    """个股基本信息存储，基于stock_basic_info_cache表"""
+
+    # 批量查询时每条SQL的代码数量，低于SQLite默认参数上限999
+    QUERY_CHUNK = 500
+
+    def __init__(self, db: SQLiteConnectionManager, ttl_seconds: float):
+        """
+        Args:
+            db: SQLite连接池
+            ttl_seconds: 记录有效期（秒），超过后由后台任务复核，期间仍正常提供
+        """
+        self.db = db
+        self.ttl_seconds = ttl_seconds
+
+    @staticmethod
+    def init_schema(cursor: sqlite3.Cursor):
+        """创建或升级参考数据表"""
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS stock_basic_info_cache (
+                code TEXT PRIMARY KEY,
+                name TEXT,
+                industry TEXT,
+                list_date TEXT,
+                total_shares REAL,
+                circulating_shares REAL,
+                timestamp TEXT NOT NULL,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        ''')
+
+        # fetched_at: 最近一次从上游获取的时间；checked_at: 最近一次复核时间；
+        # changed_at: 内容最近一次变化的时间
+        ensure_columns(cursor, 'stock_basic_info_cache', {
+            'fetched_at': 'REAL',
+            'checked_at': 'REAL',
+            'content_hash': 'TEXT',
+            'changed_at': 'REAL'
+        })
+
+        cursor.execute('''
+            CREATE INDEX IF NOT EXISTS idx_basic_code
+            ON stock_basic_info_cache(code)
+        ''')
+
+        cursor.execute('''
+            CREATE INDEX IF NOT EXISTS idx_basic_checked_at
+            ON stock_basic_info_cache(checked_at)
+        ''')
+
+    def is_stale(self, checked_at: Optional[float], now: Optional[float] = None) -> bool:
+        """判断记录是否超过有效期，旧版本没有复核时间的记录视为过期"""
+        if checked_at is None:
+            return True
+        return (now if now is not None else time.time()) - checked_at > self.ttl_seconds
+
+    def _select(self, conn: sqlite3.Connection, codes: List[str]) -> List[tuple]:
+        rows = []
+        for i in range(0, len(codes), self.QUERY_CHUNK):
+            chunk = codes[i:i + self.QUERY_CHUNK]
+            placeholders = ','.join('?' * len(chunk))
+            rows.extend(conn.execute(f'''
+                SELECT code, name, industry, list_date,
+                       total_shares, circulating_shares, timestamp, checked_at, content_hash
+                FROM stock_basic_info_cache
+                WHERE code IN ({placeholders})
+            ''', chunk).fetchall())
+        return rows
+
+    def load_many(self, codes: List[str]) -> Dict[str, Dict]:
+        """
+        批量加载基本信息，过期记录同样返回
+
+        Args:
+            codes: 股票代码列表
+
+        Returns:
+            股票代码到基本信息的映射
+        """
+        with self.db.connection() as conn:
+            rows = self._select(conn, codes)
+        return {
+            row[0]: {
+                'code': row[0],
+                'name': row[1],
+                'industry': row[2],
+                'list_date': row[3],
+                'total_shares': row[4],
+                'circulating_shares': row[5],
+                'timestamp': row[6]
+            }
+            for row in rows
+        }
+
+    def save_many(self, infos: List[Dict], now: Optional[float] = None) -> Dict[str, int]:
+        """
+        在一个事务中写入上游获取的基本信息，内容未变化的记录只更新复核时间
+
+        Args:
+            infos: 基本信息字典列表
+            now: 获取时间（epoch秒），默认当前时间
+
+        Returns:
+            新增、变化、未变化的记录数
+        """
+        counts = {'inserted': 0, 'changed': 0, 'unchanged': 0}
+        if not infos:
+            return counts
+
+        now = now if now is not None else time.time()
+        with self.db.transaction() as conn:
+            previous = {row[0]: row[8] for row in self._select(conn, [info['code'] for info in infos])}
+            params = []
+            for info in infos:
+                digest = content_hash(info)
+                old = previous.get(info['code'])
+                if info['code'] not in previous:
+                    counts['inserted'] += 1
+                elif old == digest:
+                    counts['unchanged'] += 1
+                else:
+                    counts['changed'] += 1
+                params.append((
+                    info['code'],
+                    info['name'],
+                    info['industry'],
+                    info['list_date'],
+                    info['total_shares'],
+                    info['circulating_shares'],
+                    info['timestamp'],
+                    now,
+                    now,
+                    digest,
+                    now
+                ))
+
+            conn.executemany('''
+                INSERT INTO stock_basic_info_cache
+                (code, name, industry, list_date, total_shares,
+                 circulating_shares, timestamp, fetched_at, checked_at, content_hash, changed_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT(code) DO UPDATE SET
+                    name = excluded.name,
+                    industry = excluded.industry,
+                    list_date = excluded.list_date,
+                    total_shares = excluded.total_shares,
+                    circulating_shares = excluded.circulating_shares,
+                    timestamp = excluded.timestamp,
+                    fetched_at = excluded.fetched_at,
+                    checked_at = excluded.checked_at,
+                    changed_at = CASE WHEN content_hash IS excluded.content_hash
+                                      THEN changed_at ELSE excluded.changed_at END,
+                    content_hash = excluded.content_hash
+            ''', params)
+        return counts
+
+    def refresh_candidates(self, snapshot: StockSnapshot, limit: int,
+                           now: Optional[float] = None) -> Dict[str, List[str]]:
+        """
+        选出需要从上游重新获取的股票：缺少记录的股票全部选出（冷启动时即全部股票）；
+        已有记录的按优先级依次为行情推算股本与缓存明显不一致的股票、超过有效期的股票（最久未复核的优先）
+
+        Args:
+            snapshot: 当前行情快照
+            limit: 已有记录的股票本次最多选出的数量
+            now: 当前时间（epoch秒）
+
+        Returns:
+            各类别的股票代码列表，share_changed与stale合计不超过limit
+        """
+        codes = snapshot.column('code').tolist()
+        with self.db.connection() as conn:
+            rows = {row[0]: row for row in self._select(conn, codes)}
+
+        missing = [code for code in codes if code not in rows]
+
+        # 总市值（亿元）/ 最新价 推算总股本，与缓存股本比较
+        cached_shares = np.array([(rows[code][4] or 0.0) if code in rows else 0.0 for code in codes])
+        price = snapshot.column('latest_price')
+        implied_shares = np.divide(snapshot.column('total_market_cap') * 1e8, price,
+                                   out=np.zeros(len(codes)), where=price > 0)
+        deviation = np.divide(np.abs(implied_shares - cached_shares), cached_shares,
+                              out=np.zeros(len(codes)), where=(cached_shares > 0) & (implied_shares > 0))
+        now = now if now is not None else time.time()
+        changed = [code for code in (codes[i] for i in np.flatnonzero(deviation > SHARE_CHANGE_TOLERANCE).tolist())
+                   if (rows[code][7] or 0.0) < now - SHARE_CHANGE_RECHECK_SECONDS]
+
+        changed_set = set(changed)
+        stale = sorted((code for code, row in rows.items() if code not in changed_set and self.is_stale(row[7], now)),
+                       key=lambda code: rows[code][7] or 0.0)
+
+        result = {'missing': missing, 'share_changed': changed[:limit]}
+        result['stale'] = stale[:limit - len(result['share_changed'])]
+        return result
+
+    def industry_map(self) -> Dict[str, str]:
+        """获取代码到行业的映射"""
+        with self.db.connection() as conn:
+            rows = conn.execute('''
+                SELECT code, industry FROM stock_basic_info_cache
+                WHERE industry IS NOT NULL AND industry != ''
+            ''').fetchall()
+        return dict(rows)
+
+    def stats(self, now: Optional[float] = None) -> Dict[str, int]:
+        """获取记录总数与过期记录数"""
+        cutoff = (now if now is not None else time.time()) - self.ttl_seconds
+        with self.db.connection() as conn:
+            total, stale = conn.execute('''
+                SELECT COUNT(*), SUM(CASE WHEN checked_at IS NULL OR checked_at < ? THEN 1 ELSE 0 END)
+                FROM stock_basic_info_cache
+            ''', (cutoff,)).fetchone()
+        return {'rows': total, 'stale_rows': stale or 0}
@@ -0,0 +1,353 @@
+#!/usr/bin/env python3
+"""
+全市场选股
+将布尔表达式（如 rsi14 < 30 and pe_ratio between 5 and 20 and change_60day > 0）
+解析为语法树后编译为向量化的掩码计算，编译结果按表达式缓存；字段可以是行情快照字段、
+行业、以及流式维护的技术指标。筛选结果支持多字段排序与取前k条
+"""
+
+import ast
+import logging
+import operator
+import re
+import time
+from datetime import datetime
+from functools import lru_cache
+from typing import Callable, Dict, List, NamedTuple, Optional, Sequence, Tuple
+
+import numpy as np
+
+from data_handlers.indicator_stream import indicator_stream
+from data_handlers.sh_a_stock_data import sh_a_stock_handler
+from data_handlers.stock_snapshot import FIELD_NAMES, StockSnapshot
+
+logger = logging.getLogger(__name__)
+
+Columns = Dict[str, np.ndarray]
+
+# 表达式长度上限，避免解析过大的输入
+MAX_EXPRESSION_LENGTH = 1000
+
+# 行业字段名
+INDUSTRY_FIELD = 'industry'
+
+# x between a and b 改写为 (a <= x <= b)
+_BETWEEN = re.compile(r'([A-Za-z_]\w*)\s+between\s+(-?\d+(?:\.\d+)?)\s+and\s+(-?\d+(?:\.\d+)?)', re.IGNORECASE)
+
+_COMPARE_OPS = {
+    ast.Lt: operator.lt,
+    ast.LtE: operator.le,
+    ast.Gt: operator.gt,
+    ast.GtE: operator.ge,
+    ast.Eq: operator.eq,
+    ast.NotEq: operator.ne,
+}
+
+_BINARY_OPS = {
+    ast.Add: np.add,
+    ast.Sub: np.subtract,
+    ast.Mult: np.multiply,
+    ast.Div: np.divide,
+}
+
+_FUNCTIONS = {
+    'abs': np.abs,
+}
+
+
+class ScreenError(ValueError):
+    """选股表达式或排序参数不合法"""
+
+
+class CompiledScreen(NamedTuple):
+    """编译后的选股表达式"""
+    expression: str
+    fields: Tuple[str, ...]  # 表达式引用的字段
+    evaluate: Callable[[Columns, int], np.ndarray]  # 输入字段数组与行数，返回布尔掩码
+
+
+def _compile_node(node: ast.AST, fields: set) -> Callable[[Columns], object]:
+    """将语法树节点编译为以字段数组为输入的闭包"""
+    if isinstance(node, ast.BoolOp):
+        parts = [_compile_node(value, fields) for value in node.values]
+        combine = np.logical_and if isinstance(node.op, ast.And) else np.logical_or
+
+        def bool_op(columns):
+            result = parts[0](columns)
+            for part in parts[1:]:
+                result = combine(result, part(columns))
+            return result
+        return bool_op
+
+    if isinstance(node, ast.UnaryOp):
+        operand = _compile_node(node.operand, fields)
+        if isinstance(node.op, ast.Not):
+            return lambda columns: np.logical_not(operand(columns))
+        if isinstance(node.op, ast.USub):
+            return lambda columns: np.negative(operand(columns))
+        if isinstance(node.op, ast.UAdd):
+            return operand
+
+    if isinstance(node, ast.Compare):
+        left = _compile_node(node.left, fields)
+        steps = []
+        for op, comparator in zip(node.ops, node.comparators):
+            if isinstance(op, (ast.In, ast.NotIn)):
+                if not isinstance(comparator, (ast.List, ast.Tuple, ast.Set)) or \
+                        not all(isinstance(item, ast.Constant) for item in comparator.elts):
+                    raise ScreenError("in 右侧必须是常量列表")
+                values = [item.value for item in comparator.elts]
+                negate = isinstance(op, ast.NotIn)
+                steps.append((None, values, negate))
+            elif type(op) in _COMPARE_OPS:
+                steps.append((_COMPARE_OPS[type(op)], _compile_node(comparator, fields), False))
+            else:
+                raise ScreenError(f"不支持的比较运算: {type(op).__name__}")
+
+        def compare(columns):
+            current = left(columns)
+            result = True
+            for func, right, negate in steps:
+                if func is None:
+                    mask = np.isin(current, right)
+                    result = np.logical_and(result, ~mask if negate else mask)
+                else:
+                    value = right(columns)
+                    result = np.logical_and(result, func(current, value))
+                    current = value
+            return result
+        return compare
+
+    if isinstance(node, ast.BinOp) and type(node.op) in _BINARY_OPS:
+        func = _BINARY_OPS[type(node.op)]
+        left = _compile_node(node.left, fields)
+        right = _compile_node(node.right, fields)
+
+        def binary(columns):
+            with np.errstate(divide='ignore', invalid='ignore'):
+                return func(left(columns), right(columns))
+        return binary
+
+    if isinstance(node, ast.Call) and isinstance(node.func, ast.Name) and node.func.id in _FUNCTIONS \
+            and len(node.args) == 1 and not node.keywords:
+        func = _FUNCTIONS[node.func.id]
+        argument = _compile_node(node.args[0], fields)
+        return lambda columns: func(argument(columns))
+
+    if isinstance(node, ast.Name):
+        name = node.id
+        fields.add(name)
+        return lambda columns: columns[name]
+
+    if isinstance(node, ast.Constant) and isinstance(node.value, (int, float, str, bool)):
+        value = node.value
+        return lambda columns: value
+
+    raise ScreenError(f"不支持的表达式: {ast.dump(node)[:80]}")
+
+
+@lru_cache(maxsize=256)
+def compile_screen(expression: str) -> CompiledScreen:
+    """
+    编译选股表达式，结果按表达式文本缓存
+
+    Args:
+        expression: 布尔表达式，支持 and/or/not、比较运算（可连写）、between、in、四则运算与abs()
+
+    Returns:
+        编译后的表达式
+
+    Raises:
+        ScreenError: 表达式不合法
+    """
+    if not expression or not expression.strip():
+        raise ScreenError("选股表达式不能为空")
+    if len(expression) > MAX_EXPRESSION_LENGTH:
+        raise ScreenError(f"选股表达式长度不能超过{MAX_EXPRESSION_LENGTH}")
+    source = _BETWEEN.sub(r'(\2 <= \1 <= \3)', expression.strip())
+    try:
+        tree = ast.parse(source, mode='eval')
+    except SyntaxError as e:
+        raise ScreenError(f"选股表达式语法错误: {e.msg}")
+
+    fields: set = set()
+    body = _compile_node(tree.body, fields)
+
+    def evaluate(columns: Columns, size: int) -> np.ndarray:
+        return np.broadcast_to(np.asarray(body(columns), dtype=bool), (size,))
+    return CompiledScreen(expression, tuple(sorted(fields)), evaluate)
+
+
+def parse_sort(sort: Optional[str]) -> List[Tuple[str, bool]]:
+    """
+    解析排序参数，如 "change_percent desc, pe_ratio" 或 "-change_percent,pe_ratio"
+
+    Returns:
+        (字段, 是否降序)列表
+    """
+    keys = []
+    for item in (sort or '').split(','):
+        item = item.strip()
+        if not item:
+            continue
+        parts = item.split()
+        name, descending = parts[0], False
+        if name.startswith('-'):
+            name, descending = name[1:], True
+        if len(parts) > 2 or (len(parts) == 2 and parts[1].lower() not in ('asc', 'desc')):
+            raise ScreenError(f"排序参数格式错误: {item}")
+        if len(parts) == 2:
+            descending = parts[1].lower() == 'desc'
+        keys.append((name, descending))
+    return keys
+
+
+def _sort_key(values: np.ndarray, descending: bool) -> np.ndarray:
+    """生成升序排序键，缺失值总是排在最后"""
+    if values.dtype == object:
+        _, values = np.unique(values.astype(str), return_inverse=True)
+    values = values.astype(np.float64)
+    key = -values if descending else values
+    return np.where(np.isnan(key), np.inf, key)
+
+
+class Screener:
+    """全市场选股"""
+
+    def __init__(self, handler=None, stream=None):
+        """
+        Args:
+            handler: 行情数据处理器，提供快照与行业
+            stream: 流式指标，提供技术指标字段
+        """
+        self.handler = handler or sh_a_stock_handler
+        self.stream = stream or indicator_stream
+        self._columns: Optional[Tuple[StockSnapshot, int, Columns]] = None
+
+    def available_fields(self) -> Dict[str, List[str]]:
+        """可用于表达式与排序的字段"""
+        indicators = []
+        for label in self.stream.indicators:
+            outputs = self.stream.outputs(label)
+            indicators.extend([label] if len(outputs) == 1 else [f'{label}_{output}' for output in outputs])
+        return {'snapshot': FIELD_NAMES, 'reference': [INDUSTRY_FIELD], 'indicators': indicators}
+
+    def _resolve_indicator(self, field: str) -> Optional[Tuple[str, str]]:
+        """字段名解析为(指标标签, 输出)，单输出指标可省略输出名"""
+        if field in self.stream.indicators:
+            outputs = self.stream.outputs(field)
+            return (field, outputs[0]) if len(outputs) == 1 else None
+        label, _, output = field.rpartition('_')
+        if label in self.stream.indicators and output in self.stream.outputs(label):
+            return label, output
+        return None
+
+    def _column(self, snapshot: StockSnapshot, field: str) -> np.ndarray:
+        if snapshot.has_field(field):
+            return snapshot.column(field)
+        if field == INDUSTRY_FIELD:
+            index = self.handler.get_industry_index()
+            if index is None or index.snapshot is not snapshot:
+                raise ScreenError("行业数据不可用")
+            return index.labels
+        indicator = self._resolve_indicator(field)
+        if indicator is None:
+            raise ScreenError(f"未知字段: {field}，可用字段见 /api/sh-a/screen/fields")
+        return self.stream.column(indicator[0], indicator[1], snapshot.column('code').tolist())
+
+    def columns(self, snapshot: StockSnapshot, fields: Sequence[str]) -> Columns:
+        """
+        获取字段数组；非快照字段按（快照、流式指标版本）缓存
+
+        Args:
+            snapshot: 行情快照
+            fields: 字段名
+
+        Returns:
+            字段名到与快照行对齐的数组
+        """
+        cached = self._columns
+        if cached is None or cached[0] is not snapshot or cached[1] != self.stream.version:
+            cached = (snapshot, self.stream.version, {})
+            self._columns = cached
+        result = {}
+        for field in fields:
+            if snapshot.has_field(field):
+                result[field] = snapshot.column(field)
+                continue
+            column = cached[2].get(field)
+            if column is None:
+                column = cached[2][field] = self._column(snapshot, field)
+            result[field] = column
+        return result
+
+    def screen(self, expression: str, sort: Optional[str] = None, limit: Optional[int] = None) -> Optional[Dict]:
+        """
+        执行选股
+
+        Args:
+            expression: 布尔表达式
+            sort: 排序参数，多个字段以逗号分隔，字段后加desc或字段前加-表示降序
+            limit: 返回前limit条
+
+        Returns:
+            选股结果，快照不可用时返回None
+
+        Raises:
+            ScreenError: 表达式、字段或排序参数不合法
+        """
+        start = time.perf_counter()
+        compiled = compile_screen(expression)
+        sort_keys = parse_sort(sort)
+        snapshot = self.handler.get_realtime_snapshot()
+        if snapshot is None:
+            return None
+
+        extra = [field for field in compiled.fields if not snapshot.has_field(field)]
+        extra += [name for name, _ in sort_keys if not snapshot.has_field(name) and name not in extra]
+        columns = self.columns(snapshot, list(compiled.fields) + [name for name, _ in sort_keys])
+
+        try:
+            rows = np.flatnonzero(compiled.evaluate(columns, len(snapshot)))
+        except (TypeError, ValueError) as e:
+            raise ScreenError(f"选股表达式计算失败: {str(e)}")
+        total = len(rows)
+
+        if sort_keys:
+            keys = [_sort_key(columns[name][rows], descending) for name, descending in sort_keys]
+            if limit and len(keys) == 1 and limit < len(rows):
+                # 单字段排序取前k条时先部分排序
+                top = np.argpartition(keys[0], limit - 1)[:limit]
+                rows = rows[top[np.argsort(keys[0][top], kind='stable')]]
+            else:
+                # lexsort以最后一个键为主键
+                rows = rows[np.lexsort(keys[::-1])]
+        if limit:
+            rows = rows[:limit]
+
+        items = snapshot.to_records(rows)
+        for field in extra:
+            values = columns[field][rows]
+            values = values.tolist() if values.dtype == object else \
+                [round(value, 4) if value == value else None for value in values.tolist()]
+            for item, value in zip(items, values):
+                item[field] = value
+
+        return {
+            'expression': compiled.expression,
+            'total': total,
+            'count': len(items),
+            'fields': extra,
+            'snapshot_time': datetime.fromtimestamp(snapshot.fetched_at).isoformat(),
+            'elapsed_ms': round((time.perf_counter() - start) * 1000, 2),
+            'items': items
+        }
+
+
+# 全局实例
+screener = Screener()
+
+
+def screen_sh_a_stocks(expression: str, sort: Optional[str] = None, limit: Optional[int] = None) -> Optional[Dict]:
+    """执行选股的便捷函数"""
+    return screener.screen(expression, sort, limit)
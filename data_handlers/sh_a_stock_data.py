@@ -6,9 +6,9 @@
 
 import logging
 from re import S
-from typing import Dict, List, Optional
+from typing import Callable, Dict, List, Optional, Tuple
+import numpy as np
 import pandas as pd
-import akshare as ak
 import requests
 from datetime import datetime
 import time
@@ -16,35 +16,107 @@ import sqlite3
 import os
 from pathlib import Path
 import json
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor, wait
+from itertools import repeat
+
+from data_handlers.akshare_gateway import akshare_gateway
+from data_handlers.industry_index import IndustryIndex
+from data_handlers.reference_data import StockReferenceStore
+from data_handlers.stock_snapshot import FIELD_NAMES, StockSnapshot
+from config import Config
+from utils.circuit_breaker import OPEN, CircuitBreaker, CircuitOpenError, NegativeCache
+from utils.database import SQLiteConnectionManager, ensure_columns
+from utils.rate_limiter import RateLimiter
+from utils.scheduler import PeriodicTask
+from utils.single_flight import SingleFlight
+from utils.trading_calendar import trading_calendar
+from utils.upstream import Budget, upstream
 
 logger = logging.getLogger(__name__)
 
 class SHAStockDataHandler:
     """上证A股数据处理类"""
     
-    def __init__(self):
+    def __init__(self, db_path: Optional[str] = None):
         import os
         
-        self.cache_timeout = 60  # 缓存60秒
         self.last_update = None
-        self.cached_data = None
+        
+        # 交易日历决定各类缓存的有效期；交易时段内行情快照按DATA_UPDATE_INTERVAL刷新
+        self.calendar = trading_calendar
+        self.refresh_interval = Config.DATA_UPDATE_INTERVAL
+        self.off_hours_refresh_interval = int(os.environ.get('STOCK_OFF_HOURS_REFRESH_SECONDS', 1800))  # 休市期间后台任务最长唤醒间隔
+        
+        # 内存中的列式行情快照，所有查询方法共享
+        self._snapshot: Optional[StockSnapshot] = None
+        self._snapshot_listeners: List[Callable[[StockSnapshot], None]] = []
+        
+        # 合并并发的快照加载与上游请求
+        self._single_flight = SingleFlight()
         
         # 从环境变量读取超时配置
         self.request_timeout = int(os.environ.get('STOCK_DATA_TIMEOUT', 120))  # 请求超时时间(秒)
         self.max_retries = int(os.environ.get('STOCK_DATA_RETRIES', 3))  # 最大重试次数
         self.retry_delay = int(os.environ.get('STOCK_DATA_RETRY_DELAY', 2))  # 重试间隔(秒)
+        self.request_budget = float(os.environ.get('STOCK_DATA_BUDGET', 180))  # 一次刷新含重试的总时间预算(秒)
+        
+        # 个股基本信息接口的并发与限流配置
+        self.basic_info_workers = int(os.environ.get('STOCK_INFO_WORKERS', 16))  # 并发请求线程数
+        self.basic_info_timeout = float(os.environ.get('STOCK_INFO_TIMEOUT', 10))  # 单次请求超时(秒)
+        self.basic_info_batch_budget = float(os.environ.get('STOCK_INFO_BATCH_BUDGET', 10))  # 批量接口的时间预算(秒)
+        self.basic_info_rate_limiter = RateLimiter(float(os.environ.get('STOCK_INFO_RATE_PER_SEC', 30)))  # 每秒请求数上限
+        self._basic_info_executor = ThreadPoolExecutor(max_workers=self.basic_info_workers,
+                                                       thread_name_prefix='sh-a-basic-info')
+        self._basic_info_flight = SingleFlight()
+        
+        # 上游调用统一经由akshare网关（熔断、超时与统计）；返回空结果的代码在一段时间内不再请求
+        self.gateway = akshare_gateway
+        self._basic_info_negative_cache = NegativeCache(float(os.environ.get('NEGATIVE_CACHE_SECONDS', 6 * 3600)))
         
         # 缓存配置
-        self.cache_max_age_minutes = int(os.environ.get('CACHE_MAX_AGE_MINUTES', 360))
-        self.cache_cleanup_hours = int(os.environ.get('CACHE_CLEANUP_HOURS', 24))
+        self.cache_max_age_minutes = int(os.environ.get('CACHE_MAX_AGE_MINUTES', 360))  # 快照过期后最长可用时间，超过后不再返回旧数据
+        self.cache_cleanup_hours = int(os.environ.get('CACHE_CLEANUP_HOURS', 24))  # 缓存维护任务执行周期
+        self.cache_retention_hours = int(os.environ.get('CACHE_RETENTION_HOURS', 24))  # 行情快照保留时间
+        
+        # 历史快照不再变化，按快照编号缓存最近查询过的历史快照
+        self.history_cache_size = int(os.environ.get('SNAPSHOT_HISTORY_CACHE_SIZE', 8))
+        self._history_cache: 'OrderedDict[int, StockSnapshot]' = OrderedDict()
+        self._history_lock = threading.Lock()
+        self._history_stats = {'hits': 0, 'misses': 0}
+        
+        # 后台任务配置，首次查询时启动
+        self.background_jobs_enabled = os.environ.get('STOCK_BACKGROUND_JOBS', 'true').lower() != 'false'
+        self._background_jobs_started = False
+        self._background_lock = threading.Lock()
+        self.maintenance_task = PeriodicTask('sh-a-cache-maintenance', self._run_maintenance,
+                                             interval=self.cache_cleanup_hours * 3600, initial_delay=60)
+        self.refresher_task = PeriodicTask('sh-a-snapshot-refresher', self._refresh_in_background,
+                                           interval=self._next_refresh_interval)
+        
+        # 参考数据（个股基本信息）配置：长有效期，由后台任务分批复核
+        self.reference_ttl_days = float(os.environ.get('REFERENCE_DATA_TTL_DAYS', 14))  # 基本信息有效期
+        self.reference_sweep_minutes = float(os.environ.get('REFERENCE_SWEEP_INTERVAL_MINUTES', 30))  # 复核任务执行间隔
+        self.reference_sweep_batch = int(os.environ.get('REFERENCE_SWEEP_BATCH', 200))  # 每次复核的最大股票数
+        self.reference_sweep_task = PeriodicTask('sh-a-reference-sweep', self._sweep_reference_data,
+                                                 interval=self.reference_sweep_minutes * 60, initial_delay=30)
+        
+        # 代码到行业的映射与按快照计算的行业索引
+        self._industry_map: Optional[Dict[str, str]] = None
+        self._industry_map_version = 0
+        self._industry_map_lock = threading.Lock()
+        self._industry_index: Optional[Tuple[StockSnapshot, int, IndustryIndex]] = None
         
         # 数据库配置
-        self.db_path = self._get_db_path()
+        self.db_path = db_path or self._get_db_path()
+        self.db = SQLiteConnectionManager(self.db_path, auto_vacuum='INCREMENTAL')
+        self.reference = StockReferenceStore(self.db, ttl_seconds=self.reference_ttl_days * 86400)
         self._init_database()
         
         logger.info(f"股票数据处理器配置: timeout={self.request_timeout}s, retries={self.max_retries}, retry_delay={self.retry_delay}s")
         logger.info(f"数据库路径: {self.db_path}")
-        logger.info(f"SQLite缓存配置: 数据库路径={self.db_path}, 缓存有效期={self.cache_max_age_minutes}分钟, 清理周期={self.cache_cleanup_hours}小时")
+        logger.info(f"SQLite缓存配置: 数据库路径={self.db_path}, 缓存有效期={self.cache_max_age_minutes}分钟, 清理周期={self.cache_cleanup_hours}小时, 快照保留={self.cache_retention_hours}小时")
         logger.info("股票数据字段已完整映射: 包含序号、代码、名称、最新价、涨跌幅、涨跌额、成交量、成交额、振幅、最高、最低、今开、昨收、量比、换手率、市盈率-动态、市净率、总市值、流通市值、涨速、5分钟涨跌、60日涨跌幅、年初至今涨跌幅等全部字段")
     
     def _get_db_path(self) -> str:
@@ -57,7 +129,9 @@ class SHAStockDataHandler:
     def _init_database(self):
         """初始化数据库表"""
         try:
-            with sqlite3.connect(self.db_path) as conn:
+            self._check_incremental_vacuum()
+            
+            with self.db.transaction() as conn:
                 cursor = conn.cursor()
                 
                 # 创建股票数据缓存表
@@ -88,23 +162,27 @@ class SHAStockDataHandler:
                         change_ytd REAL,
                         timestamp TEXT NOT NULL,
                         created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+                        snapshot_id INTEGER,
                         UNIQUE(code, timestamp)
                     )
                 ''')
                 
-                # 创建股票基本信息缓存表
+                # 创建行情快照表，每次上游刷新对应一条记录
                 cursor.execute('''
-                    CREATE TABLE IF NOT EXISTS stock_basic_info_cache (
-                        code TEXT PRIMARY KEY,
-                        name TEXT,
-                        industry TEXT,
-                        list_date TEXT,
-                        total_shares REAL,
-                        circulating_shares REAL,
-                        timestamp TEXT NOT NULL,
-                        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                    CREATE TABLE IF NOT EXISTS snapshots (
+                        snapshot_id INTEGER PRIMARY KEY AUTOINCREMENT,
+                        fetched_at REAL NOT NULL,
+                        row_count INTEGER NOT NULL DEFAULT 0,
+                        source TEXT NOT NULL,
+                        complete INTEGER NOT NULL DEFAULT 0
                     )
                 ''')
+                
+                # 旧版本数据库的行情缓存表没有snapshot_id列，补充该列
+                ensure_columns(cursor, 'stock_data_cache', {'snapshot_id': 'INTEGER'})
+                
+                # 创建股票基本信息（参考数据）表
+                StockReferenceStore.init_schema(cursor)
 
                 # 创建索引以提高查询性能
                 cursor.execute('''
@@ -118,17 +196,69 @@ class SHAStockDataHandler:
                 ''')
 
                 cursor.execute('''
-                    CREATE INDEX IF NOT EXISTS idx_basic_code 
-                    ON stock_basic_info_cache(code)
+                    CREATE INDEX IF NOT EXISTS idx_snapshot_code 
+                    ON stock_data_cache(snapshot_id, code)
+                ''')
+                
+                cursor.execute('''
+                    CREATE INDEX IF NOT EXISTS idx_snapshots_complete 
+                    ON snapshots(complete, snapshot_id)
+                ''')
+                
+                # 按时刻查询历史快照时定位该时刻之前最后一个完整快照
+                cursor.execute('''
+                    CREATE INDEX IF NOT EXISTS idx_snapshots_complete_fetched_at 
+                    ON snapshots(complete, fetched_at)
+                ''')
+                
+                # 缓存维护按时间清理时使用
+                cursor.execute('''
+                    CREATE INDEX IF NOT EXISTS idx_snapshots_fetched_at 
+                    ON snapshots(fetched_at)
                 ''')
                 
-                conn.commit()
                 logger.info("数据库初始化完成")
                 
         except Exception as e:
             logger.error(f"数据库初始化失败: {str(e)}")
             raise
     
+    def _check_incremental_vacuum(self):
+        """
+        检查增量回收空间模式。新建的数据库在连接时（切换WAL之前）即已开启；已有数据的旧数据库需要执行一次
+        VACUUM才能生效，VACUUM在大数据库上耗时较长且持有写锁，不在启动时执行，改由vacuum()（命令行一次性执行）完成
+        """
+        with self.db.connection() as conn:
+            if conn.execute('PRAGMA auto_vacuum').fetchone()[0] != 2:
+                logger.warning("数据库尚未切换为增量回收空间模式，维护任务无法回收空间；"
+                               "请在服务停止时执行一次 python -m data_handlers.sh_a_stock_data vacuum")
+    
+    def vacuum(self) -> Dict:
+        """
+        执行一次完整VACUUM，使增量回收空间模式对旧数据库生效；耗时与数据库大小成正比，期间阻塞写入
+        
+        Returns:
+            执行结果
+        """
+        start = time.perf_counter()
+        with self.db.connection() as conn:
+            conn.execute('PRAGMA auto_vacuum=INCREMENTAL')
+            conn.execute('VACUUM')
+            mode = conn.execute('PRAGMA auto_vacuum').fetchone()[0]
+        result = {'auto_vacuum': mode, 'duration_ms': round((time.perf_counter() - start) * 1000, 1)}
+        logger.info(f"VACUUM完成，耗时{result['duration_ms']}ms")
+        return result
+    
+    @property
+    def spot_breaker(self) -> CircuitBreaker:
+        """行情接口熔断器"""
+        return self.gateway.breaker('stock_sh_a_spot_em')
+    
+    @property
+    def basic_info_breaker(self) -> CircuitBreaker:
+        """个股基本信息接口熔断器"""
+        return self.gateway.breaker('stock_individual_info_em')
+    
     def get_stock_type_info(self, stock_code: str) -> Optional[Dict]:
         """
         获取指定股票的基本信息，优先使用SQLite缓存
@@ -149,55 +279,19 @@ class SHAStockDataHandler:
             股票基本信息，包含行业、股本等
         """
         try:
-            # 首先从缓存获取
-            cached_info = self._load_stock_basic_info_from_cache(stock_code)
+            # 首先从缓存获取，过期记录由后台任务复核，期间照常返回
+            cached_info = self.reference.load_many([str(stock_code)]).get(str(stock_code))
             if cached_info:
                 logger.info(f"从缓存获取股票{stock_code}基本信息")
                 return cached_info
             
             # 缓存中没有，从akshare获取
-            stock_info = ak.stock_individual_info_em(symbol=stock_code)
-            
-            if stock_info is None or stock_info.empty:
-                logger.warning(f"无法获取股票{stock_code}的基本信息")
+            type_info = self._fetch_stock_basic_info(stock_code)
+            if type_info is None:
                 return None
             
-            # 创建字典映射，避免索引问题
-            info_dict = {}
-            for _, row in stock_info.iterrows():
-                item = str(row['item']).strip()
-                value = str(row['value']).strip()
-                info_dict[item] = value
-            
-            # 安全地提取数据
-            name = info_dict.get('股票简称', '')
-            industry = info_dict.get('行业', '')
-            list_date = info_dict.get('上市时间', '')
-            
-            # 安全地转换数值类型
-            try:
-                total_shares = float(info_dict.get('总股本', '0').replace(',', ''))
-            except (ValueError, AttributeError):
-                total_shares = 0.0
-            
-            try:
-                circulating_shares = float(info_dict.get('流通市值', '0').replace(',', ''))
-            except (ValueError, AttributeError):
-                circulating_shares = 0.0
-            
-            # 构建股票基本信息
-            type_info = {
-                'code': str(stock_code),
-                'name': name,
-                'industry': industry,
-                'list_date': list_date,
-                'total_shares': total_shares,
-                'circulating_shares': circulating_shares,
-                'timestamp': datetime.now().isoformat()
-            }
-            
             # 保存到缓存
-            self._save_stock_basic_info_to_cache(type_info)
+            self.reference.save_many([type_info])
             
             return type_info
             
@@ -205,22 +299,93 @@ class SHAStockDataHandler:
             logger.error(f"获取股票{stock_code}基本信息失败: {str(e)}")
             return None
     
+    def _fetch_stock_basic_info(self, stock_code: str) -> Optional[Dict]:
+        """
+        从akshare获取单只股票基本信息，请求受数据源限流约束，同一代码的并发请求合并为一次
+        
+        Args:
+            stock_code: 股票代码
+            
+        Returns:
+            股票基本信息，获取失败时返回None
+        """
+        return self._basic_info_flight.do(stock_code,
+                                      lambda: self._fetch_stock_basic_info_once(stock_code))
+    
+    def _fetch_stock_basic_info_once(self, stock_code: str) -> Optional[Dict]:
+        # 近期确认没有数据的代码不再请求；熔断期间直接失败，不占用限流令牌
+        if stock_code in self._basic_info_negative_cache:
+            return None
+        
+        # 参考数据表即为缓存，这里总是请求上游
+        stock_info = self.gateway.call('stock_individual_info_em', use_cache=False, symbol=stock_code,
+                                       timeout=self.basic_info_timeout, rate_limiter=self.basic_info_rate_limiter)
+        
+        if stock_info is None or stock_info.empty:
+            logger.warning(f"无法获取股票{stock_code}的基本信息")
+            self._basic_info_negative_cache.add(stock_code)
+            return None
+        
+        # 创建字典映射，避免索引问题
+        info_dict = {}
+        for item, value in zip(stock_info['item'], stock_info['value']):
+            info_dict[str(item).strip()] = str(value).strip()
+        
+        # 安全地提取数据
+        name = info_dict.get('股票简称', '')
+        industry = info_dict.get('行业', '')
+        list_date = info_dict.get('上市时间', '')
+        
+        # 安全地转换数值类型
+        try:
+            total_shares = float(info_dict.get('总股本', '0').replace(',', ''))
+        except (ValueError, AttributeError):
+            total_shares = 0.0
+        
+        try:
+            circulating_shares = float(info_dict.get('流通股', '0').replace(',', ''))
+        except (ValueError, AttributeError):
+            circulating_shares = 0.0
+        
+        # 构建股票基本信息
+        return {
+            'code': str(stock_code),
+            'name': name,
+            'industry': industry,
+            'list_date': list_date,
+            'total_shares': total_shares,
+            'circulating_shares': circulating_shares,
+            'timestamp': datetime.now().isoformat()
+        }
+    
     def get_stock_type_batch(self, stock_codes: List[str]) -> Optional[List[Dict]]:
         """
         批量获取股票类型信息
         
+        缓存中已有的代码通过一次批量查询获取；缓存中没有的代码并发请求上游，
+        结果在一个事务中写回缓存。超过时间预算时返回已获取的部分结果，
+        未完成的请求在后台继续执行并写入缓存
+        
         Args:
             stock_codes: 股票代码列表
             
         Returns:
-            股票类型信息列表
+            股票类型信息列表，顺序与输入一致，获取失败的代码被跳过
         """
         try:
-            result = []
-            for code in stock_codes:
-                type_info = self.get_stock_type_info(code)
-                if type_info:
-                    result.append(type_info)
+            start = time.perf_counter()
+            codes = list(dict.fromkeys(str(code) for code in stock_codes))
+            found = self.reference.load_many(codes)
+            misses = [code for code in codes if code not in found]
+            
+            fetched = self._fetch_stock_basic_info_batch(misses, budget=Budget(self.basic_info_batch_budget))
+            self.reference.save_many(fetched)
+            found.update((info['code'], info) for info in fetched)
+            
+            result = [found[code] for code in codes if code in found]
+            elapsed_ms = (time.perf_counter() - start) * 1000
+            logger.info(f"批量获取股票基本信息: 共{len(codes)}只，缓存命中{len(codes) - len(misses)}只，"
+                        f"上游获取{len(fetched)}/{len(misses)}只，耗时{elapsed_ms:.1f}ms")
             
             return result if result else None
             
@@ -228,51 +393,333 @@ class SHAStockDataHandler:
             logger.error(f"批量获取股票类型信息失败: {str(e)}")
             return None
     
-    def get_all_industries(self) -> Optional[List[Dict]]:
+    def _fetch_stock_basic_info_batch(self, stock_codes: List[str],
+                                      budget: Optional[Budget] = None) -> List[Dict]:
+        """
+        通过有界线程池并发获取多只股票的基本信息，请求速率受数据源限流约束
+        
+        Args:
+            stock_codes: 股票代码列表
+            budget: 时间预算，用完后不再等待剩余请求，其结果在完成时单独写入缓存
+            
+        Returns:
+            预算内获取成功的基本信息列表，顺序与输入一致
+        """
+        futures = [(code, self._basic_info_executor.submit(self._fetch_stock_basic_info, code))
+                   for code in stock_codes]
+        if not futures:
+            return []
+        done, pending = wait([future for _, future in futures],
+                             timeout=budget.remaining() if budget is not None else None)
+        
+        fetched = []
+        rejected = 0
+        for code, future in futures:
+            if future not in done:
+                future.add_done_callback(self._save_late_basic_info)
+                continue
+            try:
+                type_info = future.result()
+            except CircuitOpenError:
+                rejected += 1
+                continue
+            except Exception as e:
+                logger.error(f"获取股票{code}基本信息失败: {str(e)}")
+                continue
+            if type_info:
+                fetched.append(type_info)
+        if rejected:
+            logger.warning(f"个股基本信息接口熔断中，跳过{rejected}只股票")
+        if pending:
+            logger.warning(f"批量获取股票基本信息超出时间预算，{len(pending)}只股票在后台继续获取")
+        return fetched
+    
+    def _save_late_basic_info(self, future: Future):
+        """保存超出时间预算后才完成的基本信息请求结果"""
+        try:
+            type_info = future.result()
+            if type_info:
+                self.reference.save_many([type_info])
+        except Exception:
+            # 失败已在熔断器中记录
+            pass
+    
+    def get_all_industries(self, include_stocks: bool = True) -> Optional[List[Dict]]:
         """
-        获取所有上证A股行业分类（基于已有股票数据，避免重复API调用）
+        获取所有上证A股行业分类及行业聚合指标
+        
+        Args:
+            include_stocks: 是否附带每个行业的完整成分股数据
         
         Returns:
-            行业信息列表
+            行业信息列表，按成分股数量降序
         """
         try:
-            # 获取上证A股实时数据
-            stocks = self.get_realtime_sh_a_stocks()
-            if not stocks:
+            index = self.get_industry_index()
+            if index is None:
                 return None
+            return index.to_list(include_stocks=include_stocks)
             
-            # 简单的行业分类（基于股票名称特征）
-            industries = {}
-            
-            for stock in stocks:
-                code = stock['code']
-                name = stock['name']
-                
-                # 根据股票名称判断行业
-                industry = "其他"
-                industry_info = self.get_stock_type_info(code)
-                if industry_info:
-                    industry = industry_info['industry']
-                
-                if industry not in industries:
-                    industries[industry] = {
-                        'industry': industry,
-                        'count': 0,
-                        'stocks': []
-                    }
-                
-                industries[industry]['count'] += 1
-                industries[industry]['stocks'].append(stock)
-          
-            # 按股票数量排序
-            result = list(industries.values())
-            result.sort(key=lambda x: x['count'], reverse=True)
+        except Exception as e:
+            logger.error(f"获取行业分类失败: {str(e)}")
+            return None
+    
+    def get_industry_detail(self, industry: str) -> Optional[Dict]:
+        """
+        获取单个行业的聚合指标及成分股
+        
+        Args:
+            industry: 行业名称
             
-            return result
+        Returns:
+            行业数据，行业不存在或获取失败时返回None
+        """
+        try:
+            index = self.get_industry_index()
+            if index is None:
+                return None
+            return index.get(industry)
             
         except Exception as e:
-            logger.error(f"获取行业分类失败: {str(e)}")
+            logger.error(f"获取行业{industry}详情失败: {str(e)}")
+            return None
+    
+    def get_industry_index(self) -> Optional[IndustryIndex]:
+        """
+        获取当前快照上的行业索引，每个快照与行业映射版本只计算一次
+        
+        Returns:
+            行业索引
+        """
+        snapshot = self.get_realtime_snapshot()
+        if not snapshot:
+            return None
+        
+        industry_map, version = self._get_industry_map()
+        cached = self._industry_index
+        if cached is not None and cached[0] is snapshot and cached[1] == version:
+            return cached[2]
+        
+        index = IndustryIndex(snapshot, industry_map)
+        self._industry_index = (snapshot, version, index)
+        logger.info(f"行业索引构建完成，共 {len(index)} 个行业，耗时 {index.build_ms}ms")
+        return index
+    
+    def _get_industry_map(self) -> Tuple[Dict[str, str], int]:
+        """获取内存中的代码到行业映射及其版本号，首次使用时从缓存表加载"""
+        if self._industry_map is None:
+            with self._industry_map_lock:
+                if self._industry_map is None:
+                    self._industry_map = self._load_industry_map()
+                    self._industry_map_version += 1
+        return self._industry_map, self._industry_map_version
+    
+    def _load_industry_map(self) -> Dict[str, str]:
+        """
+        从参考数据表加载代码到行业的映射
+        
+        Returns:
+            股票代码到行业名称的映射
+        """
+        try:
+            return self.reference.industry_map()
+        except Exception as e:
+            logger.error(f"加载行业映射失败: {str(e)}")
+            return {}
+    
+    def _sweep_reference_data(self) -> Optional[Dict]:
+        """
+        后台复核参考数据：缺少记录的股票（冷启动时即全部股票）不受批量限制，
+        按reference_sweep_batch分组以限流允许的速率尽快获取，每组写入后即更新行业映射；
+        已有记录中股本疑似变化和超过有效期的股票每次最多复核reference_sweep_batch只
+        
+        Returns:
+            复核结果
+        """
+        if self.basic_info_breaker.state == OPEN:
+            return {'skipped': 'circuit_open', 'retry_in': round(self.basic_info_breaker.retry_in(), 1)}
+        
+        snapshot = self.get_realtime_snapshot()
+        if not snapshot:
+            return None
+        
+        start = time.perf_counter()
+        candidates = self.reference.refresh_candidates(snapshot, limit=self.reference_sweep_batch)
+        missing = candidates['missing']
+        groups = [missing[i:i + self.reference_sweep_batch] for i in range(0, len(missing), self.reference_sweep_batch)]
+        groups.append(candidates['share_changed'] + candidates['stale'])
+        
+        fetched = 0
+        counts = {'inserted': 0, 'changed': 0, 'unchanged': 0}
+        for codes in groups:
+            if self.basic_info_breaker.state == OPEN:
+                logger.warning("个股基本信息接口熔断中，本次参考数据复核提前结束")
+                break
+            infos = self._fetch_stock_basic_info_batch(codes)
+            fetched += len(infos)
+            for name, count in self.reference.save_many(infos).items():
+                counts[name] += count
+            if counts['inserted'] or counts['changed'] or self._industry_map is None:
+                self._reload_industry_map()
+        
+        result = dict({name: len(group) for name, group in candidates.items()},
+                      fetched=fetched, **counts,
+                      duration_ms=round((time.perf_counter() - start) * 1000, 1))
+        logger.info(f"参考数据复核完成: 缺失{result['missing']}只、股本变化{result['share_changed']}只、"
+                    f"过期{result['stale']}只，获取{fetched}只，其中新增{counts['inserted']}、"
+                    f"变化{counts['changed']}、未变化{counts['unchanged']}，耗时{result['duration_ms']}ms")
+        return result
+    
+    def _reload_industry_map(self):
+        """从参考数据表重新加载行业映射并递增版本号，使行业索引在下次查询时重建"""
+        industry_map = self._load_industry_map()
+        with self._industry_map_lock:
+            self._industry_map = industry_map
+            self._industry_map_version += 1
+    
+    def get_realtime_snapshot(self) -> Optional[StockSnapshot]:
+        """
+        获取上证A股实时行情快照，优先使用内存快照，其次数据库缓存，最后请求原始接口
+        
+        快照有效期由交易日历决定：交易时段内为DATA_UPDATE_INTERVAL，
+        休市期间（午休、收盘后、周末及节假日）有效至下一个交易时段开始。
+        后台刷新任务运行时采用stale-while-revalidate：快照过期但过期时长未超过
+        CACHE_MAX_AGE_MINUTES时立即返回旧快照并唤醒后台刷新；
+        没有可用快照时，并发请求合并为一次加载，共享同一结果
+        
+        Returns:
+            列式行情快照或None
+        """
+        self._ensure_background_jobs()
+        
+        snapshot = self._snapshot
+        if snapshot is not None:
+            if self._is_fresh(snapshot):
+                return snapshot
+            if self.refresher_task.running and self._is_servable(snapshot):
+                self.refresher_task.trigger()
+                return snapshot
+        
+        try:
+            return self._single_flight.do('sh_a_snapshot', self._load_snapshot)
+        except Exception as e:
+            logger.error(f"获取上证A股实时行情数据失败: {str(e)}")
+            return None
+    
+    @property
+    def max_stale_seconds(self) -> float:
+        """快照过期后仍可继续使用的最长时间（秒）"""
+        return self.cache_max_age_minutes * 60
+    
+    def _is_fresh(self, snapshot: StockSnapshot) -> bool:
+        """快照是否在交易日历规定的有效期内"""
+        return self.calendar.is_fresh('realtime', snapshot.fetched_at)
+    
+    def _staleness_seconds(self, snapshot: StockSnapshot) -> float:
+        """快照已过期的秒数，未过期时为0"""
+        return max(time.time() - self.calendar.expires_at('realtime', snapshot.fetched_at), 0.0)
+    
+    def _is_servable(self, snapshot: StockSnapshot) -> bool:
+        """快照过期时长是否仍在可用范围内"""
+        return self._staleness_seconds(snapshot) < self.max_stale_seconds
+    
+    def _load_snapshot(self) -> Optional[StockSnapshot]:
+        """
+        加载行情快照：依次尝试内存快照、数据库缓存和原始接口，
+        上游请求失败时退回到仍在可用范围内的旧快照
+        
+        Returns:
+            列式行情快照或None
+        """
+        # 上一轮合并加载可能刚刚完成
+        snapshot = self._snapshot
+        if snapshot is not None and self._is_fresh(snapshot):
+            return snapshot
+        
+        # 首先尝试从缓存加载最新的完整快照
+        cached_snapshot = self._load_from_cache()
+        if cached_snapshot is not None and len(cached_snapshot) > 0:
+            if snapshot is None or cached_snapshot.fetched_at > snapshot.fetched_at:
+                snapshot = cached_snapshot
+            if self._is_fresh(cached_snapshot):
+                logger.info("使用缓存的股票数据（仍在有效期内）")
+                return self._install_snapshot(cached_snapshot)
+            if self.refresher_task.running and self._is_servable(cached_snapshot):
+                logger.info("使用缓存的过期股票数据，后台刷新中")
+                self.refresher_task.trigger()
+                return self._install_snapshot(cached_snapshot)
+        
+        # 缓存中没有，从原始接口获取
+        logger.info("缓存中没有有效数据，从原始接口获取")
+        fetched = self._fetch_snapshot()
+        if fetched is not None:
+            return fetched
+        
+        if snapshot is not None and self._is_servable(snapshot):
+            logger.warning(f"获取最新行情失败，继续使用已过期 {self._staleness_seconds(snapshot):.0f} 秒的快照")
+            return self._install_snapshot(snapshot)
+        return None
+    
+    def _next_refresh_interval(self) -> float:
+        """后台刷新任务的唤醒间隔（秒）：交易时段按刷新间隔，休市时等待到下一次开盘"""
+        if self.calendar.is_trading_time():
+            return self.refresh_interval
+        return max(min(self.calendar.seconds_until_open(), self.off_hours_refresh_interval), self.refresh_interval)
+    
+    def _refresh_in_background(self) -> Optional[Dict]:
+        """
+        后台刷新行情快照，快照仍在有效期内时跳过；失败时保留上一份快照继续提供服务
+        
+        Returns:
+            刷新结果
+        """
+        snapshot = self._snapshot
+        if snapshot is not None and self._is_fresh(snapshot):
+            return {'refreshed': False, 'age_seconds': round(snapshot.age_seconds(), 1)}
+        
+        new_snapshot = self._fetch_snapshot()
+        if new_snapshot is None:
+            age = round(snapshot.age_seconds(), 1) if snapshot is not None else None
+            logger.warning(f"后台刷新行情失败，继续使用旧快照（快照距今 {age} 秒）")
+            return {'refreshed': False, 'age_seconds': age}
+        
+        return {'refreshed': True, 'rows': len(new_snapshot)}
+    
+    def get_snapshot_meta(self) -> Dict:
+        """
+        获取当前快照的时效信息，供接口返回数据新鲜度
+        
+        Returns:
+            快照获取时间、距今秒数、过期时间及是否过期
+        """
+        snapshot = self._snapshot
+        if snapshot is None:
+            return {'data_fetched_at': None, 'data_age_seconds': None, 'data_expires_at': None, 'stale': None}
+        return {
+            'data_fetched_at': datetime.fromtimestamp(snapshot.fetched_at).isoformat(),
+            'data_age_seconds': round(snapshot.age_seconds(), 1),
+            'data_expires_at': datetime.fromtimestamp(self.calendar.expires_at('realtime', snapshot.fetched_at)).isoformat(),
+            'stale': not self._is_fresh(snapshot)
+        }
+    
+    def _fetch_snapshot(self) -> Optional[StockSnapshot]:
+        """
+        从原始接口获取行情并生成新快照，同一时间只有一个上游请求在进行
+        
+        Returns:
+            列式行情快照或None
+        """
+        return self._single_flight.do('stock_sh_a_spot_em', self._fetch_and_ingest)
+    
+    def _fetch_and_ingest(self) -> Optional[StockSnapshot]:
+        """请求原始接口并转换为快照"""
+        stock_df = self._fetch_with_retry()
+        
+        if stock_df is None or stock_df.empty:
+            logger.warning("获取到的股票数据为空")
             return None
+        
+        return self._ingest_dataframe(stock_df)
     
     def get_realtime_sh_a_stocks(self) -> Optional[List[Dict]]:
         """
@@ -282,321 +729,412 @@ class SHAStockDataHandler:
         Returns:
             过滤后的上证A股实时行情数据列表
         """
-        try:
-            # 清理过期缓存
-            self._clear_old_cache()
-            
-            # 首先尝试从缓存加载
-            cached_stocks = self._load_from_cache(max_age_minutes=self.cache_max_age_minutes)
-            if cached_stocks is not None and len(cached_stocks) > 0:
-                logger.info(f"使用缓存的股票数据（{self.cache_max_age_minutes}分钟内）")
-                return cached_stocks
-            
-            # 缓存中没有，从原始接口获取
-            logger.info("缓存中没有有效数据，从原始接口获取")
-            stock_df = self._fetch_with_retry()
-            
-            if stock_df is None or stock_df.empty:
-                logger.warning("获取到的股票数据为空")
-                return None
-            
-            # 转换数据格式
-            result = []
-            for _, row in stock_df.iterrows():
-                stock_data = {
-                    'code': str(row['代码']),
-                    'name': str(row['名称']),
-                    'latest_price': float(row['最新价']) if pd.notna(row['最新价']) else 0.0,
-                    'change_percent': float(row['涨跌幅']) if pd.notna(row['涨跌幅']) else 0.0,
-                    'change_amount': float(row['涨跌额']) if pd.notna(row['涨跌额']) else 0.0,
-                    'volume': int(row['成交量']) if pd.notna(row['成交量']) else 0,
-                    'amount': float(row['成交额']) if pd.notna(row['成交额']) else 0.0,
-                    'amplitude': float(row['振幅']) if pd.notna(row['振幅']) else 0.0,
-                    'high': float(row['最高']) if pd.notna(row['最高']) else 0.0,
-                    'low': float(row['最低']) if pd.notna(row['最低']) else 0.0,
-                    'open': float(row['今开']) if pd.notna(row['今开']) else 0.0,
-                    'close': float(row['昨收']) if pd.notna(row['昨收']) else 0.0,
-                    'volume_ratio': float(row['量比']) if pd.notna(row['量比']) else 0.0,
-                    'turnover_rate': float(row['换手率']) if pd.notna(row['换手率']) else 0.0,
-                    'pe_ratio': float(row['市盈率-动态']) if pd.notna(row['市盈率-动态']) else 0.0,
-                    'pb_ratio': float(row['市净率']) if pd.notna(row['市净率']) else 0.0,
-                    'total_market_cap': float(row['总市值']) / 100000000 if pd.notna(row['总市值']) else 0.0,  # 转换为亿元
-                    'circulation_market_cap': float(row['流通市值']) / 100000000 if pd.notna(row['流通市值']) else 0.0,  # 转换为亿元
-                    'speed': float(row['涨速']) if pd.notna(row['涨速']) else 0.0,
-                    'change_5min': float(row['5分钟涨跌']) if pd.notna(row['5分钟涨跌']) else 0.0,
-                    'change_60day': float(row['60日涨跌幅']) if pd.notna(row['60日涨跌幅']) else 0.0,
-                    'change_ytd': float(row['年初至今涨跌幅']) if pd.notna(row['年初至今涨跌幅']) else 0.0,
-                    'timestamp': datetime.now().isoformat()
-                }
-                result.append(stock_data)
-            
-            # 保存到缓存
-            if result:
-                self._save_to_cache(result)
-            
-            self.cached_data = result
-            self.last_update = datetime.now()
+        snapshot = self.get_realtime_snapshot()
+        if snapshot is None:
+            return None
+        return snapshot.to_records()
+    
+    def _ingest_dataframe(self, stock_df: pd.DataFrame) -> StockSnapshot:
+        """
+        将上游行情DataFrame向量化转换为快照，写入缓存并替换内存快照
+        
+        Args:
+            stock_df: ak.stock_sh_a_spot_em返回的DataFrame
             
-            return result
+        Returns:
+            新的行情快照
+        """
+        start = time.perf_counter()
+        snapshot = StockSnapshot.from_dataframe(stock_df)
+        logger.info(f"行情数据转换完成，共 {len(snapshot)} 条记录，耗时 {(time.perf_counter() - start) * 1000:.1f}ms")
+        
+        # 保存到缓存
+        if len(snapshot) > 0:
+            self._save_to_cache(snapshot)
+        
+        return self._install_snapshot(snapshot)
+    
+    def _install_snapshot(self, snapshot: StockSnapshot) -> StockSnapshot:
+        """
+        替换当前内存快照
+        
+        Args:
+            snapshot: 新的行情快照
             
-        except Exception as e:
-            logger.error(f"获取上证A股实时行情数据失败: {str(e)}")
-            return None
+        Returns:
+            新的行情快照
+        """
+        self._snapshot = snapshot
+        self.last_update = datetime.fromtimestamp(snapshot.fetched_at)
+        for listener in list(self._snapshot_listeners):
+            try:
+                listener(snapshot)
+            except Exception as e:
+                logger.error(f"行情快照监听器执行失败: {str(e)}")
+        return snapshot
     
-    def _fetch_with_retry(self) -> Optional[pd.DataFrame]:
+    def add_snapshot_listener(self, listener: Callable[[StockSnapshot], None]):
         """
-        使用重试机制获取股票数据，增加超时时间
+        注册行情快照监听器，每次替换内存快照后调用；监听器在刷新线程中执行，应尽快返回
+        
+        Args:
+            listener: 接收新快照的回调
+        """
+        if listener not in self._snapshot_listeners:
+            self._snapshot_listeners.append(listener)
+    
+    def _fetch_with_retry(self, budget: Optional[Budget] = None) -> Optional[pd.DataFrame]:
+        """
+        使用重试机制获取股票数据，每次请求受单次超时约束，全部重试受整体时间预算约束
+        
+        Args:
+            budget: 时间预算，默认使用STOCK_DATA_BUDGET
         
         Returns:
-            股票数据DataFrame或None
+            股票数据DataFrame或None（预算用完或全部失败时由调用方返回旧快照）
         """
         import warnings
         warnings.filterwarnings('ignore')
         
+        budget = budget or Budget(self.request_budget)
         for attempt in range(self.max_retries):
             try:
                 logger.info(f"尝试获取上证A股实时数据，第 {attempt + 1} 次尝试")
                 
-                # 设置全局超时时间
-                import socket
-                socket.setdefaulttimeout(self.request_timeout)
-                
                 # 获取数据
-                stock_df = ak.stock_sh_a_spot_em()
+                stock_df = self.gateway.call('stock_sh_a_spot_em', timeout=self.request_timeout, budget=budget)
                 
                 if stock_df is not None and not stock_df.empty:
                     logger.info(f"成功获取上证A股实时数据，共 {len(stock_df)} 条记录")
                     return stock_df
                 else:
                     logger.warning(f"第 {attempt + 1} 次尝试：获取到的数据为空")
-                    
+            
+            except CircuitOpenError as e:
+                # 熔断期间不再请求，由调用方返回旧快照
+                logger.warning(str(e))
+                return None
             except Exception as e:
                 logger.error(f"第 {attempt + 1} 次尝试失败: {str(e)}")
-                if attempt < self.max_retries - 1:
+                remaining = budget.remaining()
+                if attempt >= self.max_retries - 1:
+                    logger.error(f"所有 {self.max_retries} 次尝试均失败")
+                elif remaining is not None and remaining <= self.retry_delay:
+                    logger.error("时间预算已用完，停止重试")
+                    break
+                else:
                     logger.info(f"等待 {self.retry_delay} 秒后重试...")
                     time.sleep(self.retry_delay)
-                else:
-                    logger.error(f"所有 {self.max_retries} 次尝试均失败")
         
         return None
     
-    def _save_to_cache(self, stocks: List[Dict]) -> bool:
+    def _save_to_cache(self, snapshot: StockSnapshot) -> bool:
         """
-        将股票数据保存到数据库缓存
+        将行情快照保存到数据库缓存
+        
+        参数在事务外由列数组一次性生成，事务内只执行一次executemany，
+        快照头与行数据在同一事务中写入，写入完成后才将快照标记为完整
         
         Args:
-            stocks: 股票数据列表
+            snapshot: 行情快照
             
         Returns:
             是否保存成功
         """
         try:
-            with sqlite3.connect(self.db_path) as conn:
+            start = time.perf_counter()
+            columns = [snapshot.column(name).tolist() for name in FIELD_NAMES]
+            
+            with self.db.transaction() as conn:
                 cursor = conn.cursor()
                 
+                cursor.execute('''
+                    INSERT INTO snapshots (fetched_at, row_count, source, complete)
+                    VALUES (?, 0, ?, 0)
+                ''', (snapshot.fetched_at, snapshot.source))
+                snapshot_id = cursor.lastrowid
+                
                 # 批量插入数据
-                for stock in stocks:
-                    cursor.execute('''
+                cursor.executemany('''
                     INSERT OR REPLACE INTO stock_data_cache (
                         code, name, latest_price, change_percent, change_amount,
                         volume, amount, amplitude, high, low,
                         open_price, close_price, volume_ratio, turnover_rate,
                         pe_ratio, pb_ratio, total_market_cap, circulation_market_cap,
-                        speed, change_5min, change_60day, change_ytd, timestamp
-                    ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-                ''', (
-                    stock['code'], stock['name'], stock['latest_price'],
-                    stock['change_percent'], stock['change_amount'],
-                    stock['volume'], stock['amount'], stock['amplitude'],
-                    stock['high'], stock['low'], stock['open'], stock['close'],
-                    stock['volume_ratio'], stock['turnover_rate'],
-                    stock['pe_ratio'], stock['pb_ratio'], stock['total_market_cap'],
-                    stock['circulation_market_cap'], stock['speed'],
-                    stock['change_5min'], stock['change_60day'],
-                    stock['change_ytd'], stock['timestamp']
-                ))
+                        speed, change_5min, change_60day, change_ytd, timestamp, snapshot_id
+                    ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                ''', zip(*columns, repeat(snapshot_id)))
                 
-                conn.commit()
-                logger.info(f"成功保存 {len(stocks)} 条股票数据到缓存")
-                return True
+                cursor.execute('''
+                    UPDATE snapshots SET row_count = ?, complete = 1
+                    WHERE snapshot_id = ?
+                ''', (len(snapshot), snapshot_id))
+            
+            elapsed = max(time.perf_counter() - start, 1e-9)
+            logger.info(f"成功保存 {len(snapshot)} 条股票数据到缓存（快照 {snapshot_id}），"
+                        f"耗时 {elapsed * 1000:.1f}ms，写入速度 {len(snapshot) / elapsed:.0f} 行/秒")
+            return True
                 
         except Exception as e:
             logger.error(f"保存数据到缓存失败: {str(e)}")
             return False
     
-    def _load_from_cache(self, max_age_minutes: int = 5) -> Optional[List[Dict]]:
+    def _load_from_cache(self, max_age_minutes: Optional[int] = None) -> Optional[StockSnapshot]:
         """
-        从数据库缓存加载股票数据
+        从数据库缓存加载最新的完整快照
+        
+        只读取snapshots表中最新一条完整快照对应的行，
+        读取量与当天刷新次数无关
         
         Args:
-            max_age_minutes: 最大缓存时间（分钟）
+            max_age_minutes: 最大缓存时间（分钟），默认不限制，由调用方按交易日历判断有效期
             
         Returns:
-            股票数据列表或None
+            行情快照或None
         """
         try:
-            with sqlite3.connect(self.db_path) as conn:
+            with self.db.connection() as conn:
                 cursor = conn.cursor()
                 
-                # 查询最近的数据
+                # 通过索引定位最新的完整快照
                 cursor.execute('''
-                    SELECT code, name, latest_price, change_percent, change_amount,
-                           volume, amount, amplitude, high, low,
-                           open_price, close_price, volume_ratio, turnover_rate,
-                           pe_ratio, pb_ratio, total_market_cap, circulation_market_cap,
-                           speed, change_5min, change_60day, change_ytd, timestamp
-                    FROM stock_data_cache
-                    WHERE timestamp >= datetime('now', '-{} minutes')
-                    ORDER BY code
-                '''.format(max_age_minutes))
-                
-                rows = cursor.fetchall()
+                    SELECT snapshot_id, fetched_at
+                    FROM snapshots
+                    WHERE complete = 1
+                    ORDER BY snapshot_id DESC
+                    LIMIT 1
+                ''')
+                latest = cursor.fetchone()
                 
-                if not rows:
+                if latest is None or (max_age_minutes is not None
+                                      and latest[1] < time.time() - max_age_minutes * 60):
                     logger.info("缓存中没有有效的股票数据")
                     return None
                 
-                # 转换为字典列表
-                stocks = []
-                for row in rows:
-                    stock = {
-                        'code': row[0],
-                        'name': row[1],
-                        'latest_price': row[2],
-                        'change_percent': row[3],
-                        'change_amount': row[4],
-                        'volume': row[5],
-                        'amount': row[6],
-                        'amplitude': row[7],
-                        'high': row[8],
-                        'low': row[9],
-                        'open': row[10],
-                        'close': row[11],
-                        'volume_ratio': row[12],
-                        'turnover_rate': row[13],
-                        'pe_ratio': row[14],
-                        'pb_ratio': row[15],
-                        'total_market_cap': row[16],
-                        'circulation_market_cap': row[17],
-                        'speed': row[18],
-                        'change_5min': row[19],
-                        'change_60day': row[20],
-                        'change_ytd': row[21],
-                        'timestamp': row[22]
-                    }
-                    stocks.append(stock)
+                snapshot_id, fetched_at = latest
+                snapshot = self._read_snapshot(cursor, snapshot_id, fetched_at)
                 
-                logger.info(f"从缓存加载了 {len(stocks)} 条股票数据")
-                return stocks
+                if snapshot is None:
+                    logger.info("缓存中没有有效的股票数据")
+                    return None
+                
+                logger.info(f"从缓存加载了 {len(snapshot)} 条股票数据（快照 {snapshot_id}）")
+                return snapshot
                 
         except Exception as e:
             logger.error(f"从缓存加载数据失败: {str(e)}")
             return None
     
-    def _clear_old_cache(self, max_age_hours: int = 24):
+    @staticmethod
+    def _read_snapshot(cursor: sqlite3.Cursor, snapshot_id: int, fetched_at: float) -> Optional[StockSnapshot]:
         """
-        清理过期的缓存数据
+        按快照编号读取一个快照的全部行，经由(snapshot_id, code)索引定位，不扫描整表
         
         Args:
-            max_age_hours: 最大缓存时间（小时）
+            cursor: 数据库游标
+            snapshot_id: 快照编号
+            fetched_at: 快照获取时间（epoch秒）
+            
+        Returns:
+            行情快照，快照没有数据时返回None
         """
-        try:
-            with sqlite3.connect(self.db_path) as conn:
-                cursor = conn.cursor()
-                
-                # 清理股票行情缓存
-                cursor.execute('''
-                    DELETE FROM stock_data_cache
-                    WHERE created_at < datetime('now', '-{} hours')
-                '''.format(max_age_hours))
-                
-                # 清理股票基本信息缓存
-                cursor.execute('''
-                    DELETE FROM stock_basic_info_cache
-                    WHERE created_at < datetime('now', '-{} hours')
-                '''.format(max_age_hours))
-                
-                deleted_count = cursor.rowcount
-                conn.commit()
-                
-                if deleted_count > 0:
-                    logger.info(f"清理了 {deleted_count} 条过期缓存数据")
-                    
-        except Exception as e:
-            logger.error(f"清理缓存失败: {str(e)}")
-
-    def _load_stock_basic_info_from_cache(self, stock_code: str) -> Optional[Dict]:
+        cursor.execute('''
+            SELECT code, name, latest_price, change_percent, change_amount,
+                   volume, amount, amplitude, high, low,
+                   open_price, close_price, volume_ratio, turnover_rate,
+                   pe_ratio, pb_ratio, total_market_cap, circulation_market_cap,
+                   speed, change_5min, change_60day, change_ytd, timestamp
+            FROM stock_data_cache
+            WHERE snapshot_id = ?
+            ORDER BY code
+        ''', (snapshot_id,))
+        rows = cursor.fetchall()
+        if not rows:
+            return None
+        
+        # 按列转置后直接构建快照
+        columns = dict(zip(FIELD_NAMES, zip(*rows)))
+        return StockSnapshot(columns, fetched_at=fetched_at, source='cache')
+    
+    def get_snapshot_as_of(self, as_of: float) -> Optional[StockSnapshot]:
         """
-        从缓存加载股票基本信息
+        获取指定时刻的历史行情快照，即该时刻之前（含）最后一个完整快照
+        
+        先经由fetched_at索引定位快照编号，再按快照编号读取行；
+        历史快照不再变化，按快照编号做LRU缓存
         
         Args:
-            stock_code: 股票代码
+            as_of: 时刻（epoch秒）
             
         Returns:
-            股票基本信息或None
+            行情快照，该时刻之前没有保留的快照时返回None
         """
-        try:
-            with sqlite3.connect(self.db_path) as conn:
-                cursor = conn.cursor()
-                cursor.execute('''
-                    SELECT code, name, industry, list_date, 
-                           total_shares, circulating_shares, timestamp
-                    FROM stock_basic_info_cache
-                    WHERE code = ?
-                ''', (stock_code,))
-                
-                row = cursor.fetchone()
-                if row:
-                    return {
-                        'code': row[0],
-                        'name': row[1],
-                        'industry': row[2],
-                        'list_date': row[3],
-                        'total_shares': row[4],
-                        'circulating_shares': row[5],
-                        'timestamp': row[6]
-                    }
-                
+        with self.db.connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute('''
+                SELECT snapshot_id, fetched_at
+                FROM snapshots
+                WHERE fetched_at <= ? AND complete = 1
+                ORDER BY fetched_at DESC
+                LIMIT 1
+            ''', (as_of,))
+            found = cursor.fetchone()
+            if found is None:
                 return None
-                
-        except Exception as e:
-            logger.error(f"从缓存加载股票{stock_code}基本信息失败: {str(e)}")
-            return None
-
-    def _save_stock_basic_info_to_cache(self, stock_info: Dict) -> bool:
+            
+            snapshot_id, fetched_at = found
+            with self._history_lock:
+                snapshot = self._history_cache.get(snapshot_id)
+                if snapshot is not None:
+                    self._history_cache.move_to_end(snapshot_id)
+                    self._history_stats['hits'] += 1
+                    return snapshot
+                self._history_stats['misses'] += 1
+            
+            snapshot = self._read_snapshot(cursor, snapshot_id, fetched_at)
+        
+        if snapshot is not None:
+            with self._history_lock:
+                self._history_cache[snapshot_id] = snapshot
+                while len(self._history_cache) > self.history_cache_size:
+                    self._history_cache.popitem(last=False)
+        return snapshot
+    
+    def get_stock_history(self, code: str, start: Optional[float] = None, end: Optional[float] = None,
+                          limit: Optional[int] = None) -> List[Dict]:
         """
-        将股票基本信息保存到缓存
+        获取单只股票在保留期内各次快照中的行情序列
+        
+        每次快照写入的行以快照获取时间为timestamp，按(code, timestamp)索引做范围查找，
+        读取量只与该股票在区间内的快照数有关
         
         Args:
-            stock_info: 股票基本信息字典
+            code: 股票代码
+            start: 开始时刻（epoch秒），默认不限制
+            end: 结束时刻（epoch秒），默认不限制
+            limit: 只返回最后limit条
             
         Returns:
-            是否保存成功
+            按时间升序的行情列表
         """
-        try:
-            with sqlite3.connect(self.db_path) as conn:
-                cursor = conn.cursor()
-                cursor.execute('''
-                    INSERT OR REPLACE INTO stock_basic_info_cache 
-                    (code, name, industry, list_date, total_shares, 
-                     circulating_shares, timestamp)
-                    VALUES (?, ?, ?, ?, ?, ?, ?)
-                ''', (
-                    stock_info['code'],
-                    stock_info['name'],
-                    stock_info['industry'],
-                    stock_info['list_date'],
-                    stock_info['total_shares'],
-                    stock_info['circulating_shares'],
-                    stock_info['timestamp']
-                ))
-                
-                conn.commit()
-                return True
-                
-        except Exception as e:
-            logger.error(f"保存股票基本信息到缓存失败: {str(e)}")
-            return False
+        # timestamp与写入时相同，为本地时间的ISO格式，字符串顺序即时间顺序
+        lower = datetime.fromtimestamp(start).isoformat() if start is not None else ''
+        upper = datetime.fromtimestamp(end).isoformat() if end is not None else '9999'
+        with self.db.connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute('''
+                SELECT code, name, latest_price, change_percent, change_amount,
+                       volume, amount, amplitude, high, low,
+                       open_price, close_price, volume_ratio, turnover_rate,
+                       pe_ratio, pb_ratio, total_market_cap, circulation_market_cap,
+                       speed, change_5min, change_60day, change_ytd, timestamp
+                FROM stock_data_cache
+                WHERE code = ? AND timestamp >= ? AND timestamp <= ?
+                ORDER BY timestamp DESC
+                LIMIT ?
+            ''', (code, lower, upper, limit if limit and limit > 0 else -1))
+            rows = cursor.fetchall()
+        rows.reverse()
+        return [dict(zip(FIELD_NAMES, row)) for row in rows]
+    
+    def _clear_old_cache(self, max_age_hours: int = 24) -> Dict[str, int]:
+        """
+        清理过期的缓存数据，仅由后台维护任务调用
+        
+        Args:
+            max_age_hours: 最大缓存时间（小时）
+            
+        Returns:
+            各表清理的行数
+        """
+        cutoff = time.time() - max_age_hours * 3600
+        with self.db.transaction() as conn:
+            cursor = conn.cursor()
+            
+            # 清理过期快照的行情数据，以及没有快照编号的旧版本数据
+            cursor.execute('''
+                DELETE FROM stock_data_cache
+                WHERE snapshot_id IS NULL
+                   OR snapshot_id IN (SELECT snapshot_id FROM snapshots WHERE fetched_at < ?)
+            ''', (cutoff,))
+            quote_rows = cursor.rowcount
+            
+            # 清理过期快照记录
+            cursor.execute('''
+                DELETE FROM snapshots
+                WHERE fetched_at < ?
+            ''', (cutoff,))
+            snapshot_rows = cursor.rowcount
+        
+        # 股票基本信息属于参考数据，由后台复核任务更新，不随行情清理
+        return {
+            'quote_rows': quote_rows,
+            'snapshots': snapshot_rows
+        }
+    
+    def _run_maintenance(self) -> Dict:
+        """
+        缓存维护：清理过期数据、更新查询优化统计、增量回收空间
+        
+        Returns:
+            维护结果统计
+        """
+        start = time.perf_counter()
+        evicted = self._clear_old_cache(max_age_hours=self.cache_retention_hours)
+        
+        with self.db.connection() as conn:
+            conn.execute('PRAGMA optimize')
+            freelist_pages = conn.execute('PRAGMA freelist_count').fetchone()[0]
+            conn.execute('PRAGMA incremental_vacuum')
+        
+        result = {
+            'evicted': evicted,
+            'vacuumed_pages': freelist_pages,
+            'duration_ms': round((time.perf_counter() - start) * 1000, 1),
+            'finished_at': datetime.now().isoformat()
+        }
+        logger.info(f"缓存维护完成: 清理行情{evicted['quote_rows']}条、快照{evicted['snapshots']}个，"
+                    f"回收{freelist_pages}页，耗时{result['duration_ms']}ms")
+        return result
+    
+    def _ensure_background_jobs(self):
+        """首次使用时启动后台任务，避免模块被重复导入时创建多余线程"""
+        if self._background_jobs_started or not self.background_jobs_enabled:
+            return
+        with self._background_lock:
+            if self._background_jobs_started:
+                return
+            self._background_jobs_started = True
+            self.maintenance_task.start()
+            self.refresher_task.start()
+            self.reference_sweep_task.start()
+    
+    def get_runtime_stats(self) -> Dict:
+        """
+        获取缓存与后台任务运行状态
+        
+        Returns:
+            运行状态数据
+        """
+        snapshot = self._snapshot
+        return {
+            'snapshot': {
+                'rows': len(snapshot) if snapshot is not None else 0,
+                'source': snapshot.source if snapshot is not None else None,
+                'age_seconds': round(snapshot.age_seconds(), 1) if snapshot is not None else None
+            },
+            'snapshot_history': dict(self._history_stats, entries=len(self._history_cache),
+                                     max_entries=self.history_cache_size),
+            'single_flight': self._single_flight.stats(),
+            'basic_info_rate_limiter': self.basic_info_rate_limiter.stats(),
+            'akshare_gateway': self.gateway.stats(),
+            'basic_info_negative_cache': self._basic_info_negative_cache.stats(),
+            'upstream_calls': upstream.stats(),
+            'refresher': dict(self.refresher_task.stats(), last_result=self.refresher_task.last_result),
+            'maintenance': dict(self.maintenance_task.stats(), last_result=self.maintenance_task.last_result),
+            'reference_data': dict(self.reference_sweep_task.stats(), last_result=self.reference_sweep_task.last_result,
+                                   **self.reference.stats())
+        }
     
     def refresh_cache(self) -> bool:
         """
@@ -609,46 +1147,13 @@ class SHAStockDataHandler:
             logger.info("开始手动刷新缓存...")
             
             # 从原始接口获取最新数据
-            stock_df = self._fetch_with_retry()
-            if stock_df is None or stock_df.empty:
+            snapshot = self._fetch_snapshot()
+            if snapshot is None:
                 logger.warning("刷新缓存失败：无法获取最新数据")
                 return False
             
-            # 转换数据格式
-            stocks = []
-            for _, row in stock_df.iterrows():
-                stock_data = {
-                    'code': str(row['代码']),
-                    'name': str(row['名称']),
-                    'latest_price': float(row['最新价']) if pd.notna(row['最新价']) else 0.0,
-                    'change_percent': float(row['涨跌幅']) if pd.notna(row['涨跌幅']) else 0.0,
-                    'change_amount': float(row['涨跌额']) if pd.notna(row['涨跌额']) else 0.0,
-                    'volume': int(row['成交量']) if pd.notna(row['成交量']) else 0,
-                    'amount': float(row['成交额']) if pd.notna(row['成交额']) else 0.0,
-                    'turnover_rate': float(row['换手率']) if pd.notna(row['换手率']) else 0.0,
-                    'amplitude': float(row['振幅']) if pd.notna(row['振幅']) else 0.0,
-                    'high': float(row['最高']) if pd.notna(row['最高']) else 0.0,
-                    'low': float(row['最低']) if pd.notna(row['最低']) else 0.0,
-                    'open': float(row['今开']) if pd.notna(row['今开']) else 0.0,
-                    'close': float(row['昨收']) if pd.notna(row['昨收']) else 0.0,
-                    'total_market_cap': float(row['总市值']) / 100000000 if pd.notna(row['总市值']) else 0.0,
-                    'circulation_market_cap': float(row['流通市值']) / 100000000 if pd.notna(row['流通市值']) else 0.0,
-                    'pe_ratio': float(row['市盈率-动态']) if pd.notna(row['市盈率-动态']) else 0.0,
-                    'pb_ratio': float(row['市净率']) if pd.notna(row['市净率']) else 0.0,
-                    'timestamp': datetime.now().isoformat()
-                }
-                stocks.append(stock_data)
-            
-            # 保存到缓存
-            if stocks:
-                success = self._save_to_cache(stocks)
-                if success:
-                    self.cached_data = stocks
-                    self.last_update = datetime.now()
-                    logger.info(f"缓存刷新成功，共 {len(stocks)} 条记录")
-                    return True
-            
-            return False
+            logger.info(f"缓存刷新成功，共 {len(snapshot)} 条记录")
+            return len(snapshot) > 0
             
         except Exception as e:
             logger.error(f"刷新缓存失败: {str(e)}")
@@ -662,7 +1167,8 @@ class SHAStockDataHandler:
                      min_market_cap: float = 0,  # 亿元
                      max_market_cap: float = 100000,  # 亿元
                      sort_by: str = 'turnover_rate',
-                     ascending: bool = True) -> Optional[List[Dict]]:
+                     ascending: bool = True,
+                     limit: Optional[int] = None) -> Optional[List[Dict]]:
         """
         根据条件筛选股票
         
@@ -675,29 +1181,35 @@ class SHAStockDataHandler:
             max_market_cap: 最高流通市值(亿元)
             sort_by: 排序字段
             ascending: 是否升序
+            limit: 返回数量限制，默认返回全部
             
         Returns:
             筛选后的股票数据列表
         """
         try:
             # 获取实时数据
-            stocks = self.get_realtime_sh_a_stocks()
-            if not stocks:
+            snapshot = self.get_realtime_snapshot()
+            if not snapshot:
                 return None
             
-            # 筛选数据
-            filtered_stocks = [
-                stock for stock in stocks
-                if min_price <= stock['latest_price'] <= max_price
-                and min_turnover_rate <= stock['turnover_rate'] <= max_turnover_rate
-                and min_market_cap <= stock['circulation_market_cap'] <= max_market_cap
-            ]
+            # 向量化筛选
+            price = snapshot.column('latest_price')
+            turnover_rate = snapshot.column('turnover_rate')
+            market_cap = snapshot.column('circulation_market_cap')
+            mask = ((price >= min_price) & (price <= max_price)
+                    & (turnover_rate >= min_turnover_rate) & (turnover_rate <= max_turnover_rate)
+                    & (market_cap >= min_market_cap) & (market_cap <= max_market_cap))
+            rows = np.flatnonzero(mask)
             
-            # 排序
+            # 排序（稳定排序，与原列表排序结果一致）
             if sort_by in ['latest_price', 'change_percent', 'turnover_rate', 'total_market_cap', 'circulation_market_cap']:
-                filtered_stocks.sort(key=lambda x: x[sort_by], reverse=not ascending)
+                keys = snapshot.column(sort_by)[rows]
+                rows = rows[np.argsort(keys if ascending else -keys, kind='stable')]
+            
+            if limit is not None:
+                rows = rows[:limit]
             
-            return filtered_stocks
+            return snapshot.to_records(rows)
             
         except Exception as e:
             logger.error(f"筛选股票数据失败: {str(e)}")
@@ -714,15 +1226,11 @@ class SHAStockDataHandler:
             股票详细信息
         """
         try:
-            stocks = self.get_realtime_sh_a_stocks()
-            if not stocks:
+            snapshot = self.get_realtime_snapshot()
+            if not snapshot:
                 return None
             
-            for stock in stocks:
-                if stock['code'] == code:
-                    return stock
-            
-            return None
+            return snapshot.get(code)
             
         except Exception as e:
             logger.error(f"获取股票 {code} 信息失败: {str(e)}")
@@ -736,17 +1244,18 @@ class SHAStockDataHandler:
             市场概览数据
         """
         try:
-            stocks = self.get_realtime_sh_a_stocks()
-            if not stocks:
+            snapshot = self.get_realtime_snapshot()
+            if not snapshot:
                 return None
             
-            total_stocks = len(stocks)
-            up_stocks = len([s for s in stocks if s['change_percent'] > 0])
-            down_stocks = len([s for s in stocks if s['change_percent'] < 0])
-            flat_stocks = len([s for s in stocks if s['change_percent'] == 0])
+            change_percent = snapshot.column('change_percent')
+            total_stocks = len(snapshot)
+            up_stocks = int(np.count_nonzero(change_percent > 0))
+            down_stocks = int(np.count_nonzero(change_percent < 0))
+            flat_stocks = int(np.count_nonzero(change_percent == 0))
             
-            avg_turnover_rate = sum(s['turnover_rate'] for s in stocks) / total_stocks
-            avg_change_percent = sum(s['change_percent'] for s in stocks) / total_stocks
+            avg_turnover_rate = float(snapshot.column('turnover_rate').sum()) / total_stocks
+            avg_change_percent = float(change_percent.sum()) / total_stocks
             
             return {
                 'total_stocks': total_stocks,
@@ -770,6 +1279,10 @@ def get_sh_a_realtime_stocks() -> Optional[List[Dict]]:
     """获取上证A股实时行情数据的便捷函数"""
     return sh_a_stock_handler.get_realtime_sh_a_stocks()
 
+def get_sh_a_realtime_snapshot() -> Optional[StockSnapshot]:
+    """获取上证A股列式行情快照的便捷函数"""
+    return sh_a_stock_handler.get_realtime_snapshot()
+
 def filter_sh_a_stocks(**kwargs) -> Optional[List[Dict]]:
     """筛选上证A股股票的便捷函数"""
     return sh_a_stock_handler.filter_stocks(**kwargs)
@@ -790,13 +1303,40 @@ def get_stock_type_batch(codes: List[str]) -> Optional[List[Dict]]:
     """批量获取股票类型信息的便捷函数"""
     return sh_a_stock_handler.get_stock_type_batch(codes)
 
-def get_all_industries() -> Optional[List[Dict]]:
+def get_all_industries(include_stocks: bool = True) -> Optional[List[Dict]]:
     """获取所有上证A股行业分类的便捷函数"""
-    return sh_a_stock_handler.get_all_industries()
+    return sh_a_stock_handler.get_all_industries(include_stocks=include_stocks)
+
+def get_industry_detail(industry: str) -> Optional[Dict]:
+    """获取单个行业聚合指标及成分股的便捷函数"""
+    return sh_a_stock_handler.get_industry_detail(industry)
+
+def get_sh_a_snapshot_meta() -> Dict:
+    """获取上证A股行情快照时效信息的便捷函数"""
+    return sh_a_stock_handler.get_snapshot_meta()
+
+def get_sh_a_runtime_stats() -> Dict:
+    """获取上证A股数据缓存运行状态的便捷函数"""
+    return sh_a_stock_handler.get_runtime_stats()
+
+def get_sh_a_snapshot_as_of(as_of: float) -> Optional[StockSnapshot]:
+    """获取指定时刻上证A股历史行情快照的便捷函数"""
+    return sh_a_stock_handler.get_snapshot_as_of(as_of)
+
+def get_sh_a_stock_history(code: str, start: Optional[float] = None, end: Optional[float] = None,
+                           limit: Optional[int] = None) -> List[Dict]:
+    """获取单只股票盘中快照序列的便捷函数"""
+    return sh_a_stock_handler.get_stock_history(code, start, end, limit)
 
 
 
 if __name__ == "__main__":
+    # 旧数据库一次性切换为增量回收空间模式：python -m data_handlers.sh_a_stock_data vacuum
+    import sys
+    if sys.argv[1:] == ['vacuum']:
+        logging.basicConfig(level=logging.INFO)
+        print(sh_a_stock_handler.vacuum())
+    
     # 测试获取所有股票类型
     # all_stocks = get_sh_a_realtime_stocks()
     # if all_stocks:
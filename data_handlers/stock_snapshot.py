@@ -0,0 +1,187 @@
+#!/usr/bin/env python3
+"""
+列式行情快照
+将一次上游刷新得到的上证A股行情保存为按字段存放的NumPy数组，
+供筛选、查询、统计等方法共享，仅在API返回时按需渲染为字典
+"""
+
+import time
+from datetime import datetime
+from typing import Dict, Iterable, List, NamedTuple, Optional, Union
+
+import numpy as np
+import pandas as pd
+
+
+class FieldSpec(NamedTuple):
+    """快照字段定义"""
+    name: str  # 字段名
+    dtype: type  # 数组类型
+    source: Optional[str] = None  # akshare源列名
+    scale: float = 1.0  # 缩放系数，源值除以该系数
+    fill: object = 0  # 缺失值填充
+
+
+# 快照字段定义，顺序即API返回字典的字段顺序；上游数据转换统一由此映射完成
+SNAPSHOT_FIELDS = [
+    FieldSpec('code', object, '代码', fill=''),
+    FieldSpec('name', object, '名称', fill=''),
+    FieldSpec('latest_price', np.float64, '最新价'),
+    FieldSpec('change_percent', np.float64, '涨跌幅'),
+    FieldSpec('change_amount', np.float64, '涨跌额'),
+    FieldSpec('volume', np.int64, '成交量'),
+    FieldSpec('amount', np.float64, '成交额'),
+    FieldSpec('amplitude', np.float64, '振幅'),
+    FieldSpec('high', np.float64, '最高'),
+    FieldSpec('low', np.float64, '最低'),
+    FieldSpec('open', np.float64, '今开'),
+    FieldSpec('close', np.float64, '昨收'),
+    FieldSpec('volume_ratio', np.float64, '量比'),
+    FieldSpec('turnover_rate', np.float64, '换手率'),
+    FieldSpec('pe_ratio', np.float64, '市盈率-动态'),
+    FieldSpec('pb_ratio', np.float64, '市净率'),
+    FieldSpec('total_market_cap', np.float64, '总市值', scale=1e8),  # 转换为亿元
+    FieldSpec('circulation_market_cap', np.float64, '流通市值', scale=1e8),  # 转换为亿元
+    FieldSpec('speed', np.float64, '涨速'),
+    FieldSpec('change_5min', np.float64, '5分钟涨跌'),
+    FieldSpec('change_60day', np.float64, '60日涨跌幅'),
+    FieldSpec('change_ytd', np.float64, '年初至今涨跌幅'),
+    FieldSpec('timestamp', object, fill=''),
+]
+
+FIELD_NAMES = [spec.name for spec in SNAPSHOT_FIELDS]
+NUMERIC_FIELDS = [spec.name for spec in SNAPSHOT_FIELDS if spec.dtype is not object]
+
+RowSelector = Union[None, slice, Iterable[int], np.ndarray]
+
+
+class StockSnapshot:
+    """不可变的列式行情快照"""
+
+    def __init__(self, columns: Dict[str, np.ndarray], fetched_at: Optional[float] = None,
+                 source: str = 'akshare'):
+        """
+        Args:
+            columns: 字段名到数组的映射，必须包含SNAPSHOT_FIELDS中的全部字段
+            fetched_at: 数据获取时间（epoch秒），默认当前时间
+            source: 数据来源
+        """
+        missing = [name for name in FIELD_NAMES if name not in columns]
+        if missing:
+            raise ValueError(f"快照缺少字段: {missing}")
+
+        size = len(columns['code'])
+        self._columns: Dict[str, np.ndarray] = {}
+        for spec in SNAPSHOT_FIELDS:
+            array = np.asarray(columns[spec.name], dtype=spec.dtype)
+            if len(array) != size:
+                raise ValueError(f"字段 {spec.name} 长度 {len(array)} 与代码列长度 {size} 不一致")
+            array.flags.writeable = False
+            self._columns[spec.name] = array
+
+        self.fetched_at = fetched_at if fetched_at is not None else time.time()
+        self.source = source
+        self.code_index: Dict[str, int] = {code: i for i, code in enumerate(self._columns['code'])}
+
+    @classmethod
+    def from_records(cls, records: List[Dict], fetched_at: Optional[float] = None,
+                     source: str = 'akshare') -> 'StockSnapshot':
+        """
+        从字典列表构建快照
+
+        Args:
+            records: 股票数据字典列表
+            fetched_at: 数据获取时间（epoch秒）
+            source: 数据来源
+
+        Returns:
+            列式快照
+        """
+        columns = {
+            spec.name: np.array([record[spec.name] for record in records], dtype=spec.dtype)
+            for spec in SNAPSHOT_FIELDS
+        }
+        return cls(columns, fetched_at=fetched_at, source=source)
+
+    @classmethod
+    def from_dataframe(cls, stock_df: pd.DataFrame, fetched_at: Optional[float] = None,
+                       source: str = 'akshare') -> 'StockSnapshot':
+        """
+        按SNAPSHOT_FIELDS映射将akshare行情DataFrame整体向量化转换为快照
+
+        Args:
+            stock_df: ak.stock_sh_a_spot_em返回的DataFrame
+            fetched_at: 数据获取时间（epoch秒），默认当前时间
+            source: 数据来源
+
+        Returns:
+            列式快照
+        """
+        fetched_at = fetched_at if fetched_at is not None else time.time()
+        size = len(stock_df)
+        columns = {}
+        for spec in SNAPSHOT_FIELDS:
+            if spec.source is None or spec.source not in stock_df.columns:
+                columns[spec.name] = np.full(size, spec.fill, dtype=spec.dtype)
+            elif spec.dtype is object:
+                columns[spec.name] = stock_df[spec.source].fillna(spec.fill).astype(str).to_numpy(dtype=object)
+            else:
+                values = pd.to_numeric(stock_df[spec.source], errors='coerce').to_numpy(dtype=np.float64)
+                values = np.where(np.isnan(values), spec.fill, values / spec.scale)
+                columns[spec.name] = values.astype(spec.dtype)
+
+        columns['timestamp'] = np.full(size, datetime.fromtimestamp(fetched_at).isoformat(), dtype=object)
+        return cls(columns, fetched_at=fetched_at, source=source)
+
+    def __len__(self) -> int:
+        return len(self._columns['code'])
+
+    def column(self, name: str) -> np.ndarray:
+        """获取只读字段数组"""
+        return self._columns[name]
+
+    def has_field(self, name: str) -> bool:
+        """判断快照是否包含指定字段"""
+        return name in self._columns
+
+    def index_of(self, code: str) -> Optional[int]:
+        """根据股票代码获取行号"""
+        return self.code_index.get(code)
+
+    def age_seconds(self, now: Optional[float] = None) -> float:
+        """快照距今的秒数"""
+        return (now if now is not None else time.time()) - self.fetched_at
+
+    def get(self, code: str) -> Optional[Dict]:
+        """
+        根据股票代码渲染单只股票
+
+        Args:
+            code: 股票代码
+
+        Returns:
+            股票数据字典，不存在时返回None
+        """
+        row = self.code_index.get(code)
+        if row is None:
+            return None
+        return self.to_records([row])[0]
+
+    def to_records(self, rows: RowSelector = None) -> List[Dict]:
+        """
+        将指定行渲染为字典列表
+
+        Args:
+            rows: 行选择，可为None（全部）、切片或行号序列
+
+        Returns:
+            股票数据字典列表
+        """
+        if rows is None:
+            rows = slice(None)
+        elif not isinstance(rows, slice):
+            rows = np.asarray(rows, dtype=np.intp)
+
+        # 按列一次性转换为Python标量，再按行组装字典
+        values = [self._columns[name][rows].tolist() for name in FIELD_NAMES]
+        return [dict(zip(FIELD_NAMES, row)) for row in zip(*values)]
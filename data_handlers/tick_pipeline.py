@@ -0,0 +1,450 @@
+#!/usr/bin/env python3
+"""
+逐笔成交采集管道
+按自选股列表并发拉取当日逐笔成交，每只股票按数据源的健康状况与延迟（指数加权平均）
+选择最快的可用数据源，失败时依次切换到其他数据源。新成交按（时间、价格、成交量）去重后
+追加写入按日划分的日志文件，每轮采集后写入检查点；崩溃重启后把日志截断到检查点位置并恢复去重状态
+"""
+
+import json
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date
+from pathlib import Path
+from typing import Callable, Dict, Iterable, List, NamedTuple, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from data_handlers.akshare_gateway import akshare_gateway
+from utils.circuit_breaker import OPEN
+from utils.scheduler import PeriodicTask
+from utils.trading_calendar import trading_calendar
+
+logger = logging.getLogger(__name__)
+
+# 数据源延迟的指数加权系数
+LATENCY_EWMA_ALPHA = 0.3
+
+# 日志字段
+TICK_LOG_FIELDS = ('symbol', 'time', 'price', 'volume', 'side', 'source')
+
+CHECKPOINT_VERSION = 1
+
+
+def market_symbol(code: str) -> str:
+    """股票代码加市场前缀，如603696 -> sh603696"""
+    if code.startswith(('6', '9')):
+        return 'sh' + code
+    if code.startswith(('4', '8')):
+        return 'bj' + code
+    return 'sz' + code
+
+
+class TickSource(NamedTuple):
+    """逐笔成交数据源"""
+    name: str
+    func_name: str  # akshare函数名
+    params: Callable[[str, date], Dict]  # 由股票代码与交易日生成请求参数
+    columns: Tuple[str, str, str, str]  # 时间、价格、成交量、买卖方向的源列名
+    volume_scale: float  # 源成交量除以该系数得到手数
+    sides: Dict[str, str]  # 源买卖方向到B/S/M的映射
+
+
+TICK_SOURCES: Tuple[TickSource, ...] = (
+    TickSource('em', 'stock_intraday_em', lambda code, day: {'symbol': code},
+               ('时间', '成交价', '手数', '买卖盘性质'), 1, {'买盘': 'B', '卖盘': 'S', '中性盘': 'M'}),
+    TickSource('tx', 'stock_zh_a_tick_tx_js', lambda code, day: {'symbol': market_symbol(code)},
+               ('成交时间', '成交价格', '成交量', '性质'), 1, {'买盘': 'B', '卖盘': 'S', '中性盘': 'M'}),
+    TickSource('sina', 'stock_intraday_sina',
+               lambda code, day: {'symbol': market_symbol(code), 'date': day.strftime('%Y%m%d')},
+               ('ticktime', 'price', 'volume', 'kind'), 100, {'U': 'B', 'D': 'S', 'E': 'M'}),
+)
+
+
+def normalize_ticks(frame: pd.DataFrame, source: TickSource) -> Dict[str, np.ndarray]:
+    """
+    将数据源的DataFrame转换为按时间排序的列数组
+
+    Returns:
+        time（HHMMSS整数）、price（元）、volume（手）、side（B/S/M）
+    """
+    time_column, price_column, volume_column, side_column = source.columns
+    times = frame[time_column].astype(str).str.replace(':', '', regex=False).str[:6]
+    columns = {
+        'time': pd.to_numeric(times, errors='coerce').to_numpy(dtype=np.float64),
+        'price': pd.to_numeric(frame[price_column], errors='coerce').to_numpy(dtype=np.float64),
+        'volume': pd.to_numeric(frame[volume_column], errors='coerce').to_numpy(dtype=np.float64) / source.volume_scale,
+        'side': frame[side_column].map(source.sides).fillna('M').to_numpy(dtype=object)
+            if side_column in frame.columns else np.full(len(frame), 'M', dtype=object),
+    }
+    valid = np.isfinite(columns['time']) & np.isfinite(columns['price']) & np.isfinite(columns['volume'])
+    order = np.argsort(columns['time'][valid], kind='stable')
+    columns = {name: values[valid][order] for name, values in columns.items()}
+    columns['time'] = columns['time'].astype(np.int64)
+    columns['volume'] = np.round(columns['volume']).astype(np.int64)
+    return columns
+
+
+class SourceHealth:
+    """数据源的延迟与失败统计"""
+
+    def __init__(self, source: TickSource):
+        self.source = source
+        self.latency_ms: Optional[float] = None  # 延迟的指数加权平均
+        self.successes = 0
+        self.failures = 0
+        self.consecutive_failures = 0
+        self.last_failure_at = 0.0
+        self.last_error: Optional[str] = None
+
+    def _observe(self, latency_ms: float):
+        self.latency_ms = latency_ms if self.latency_ms is None else \
+            LATENCY_EWMA_ALPHA * latency_ms + (1 - LATENCY_EWMA_ALPHA) * self.latency_ms
+
+    def record_success(self, latency_ms: float):
+        self.successes += 1
+        self.consecutive_failures = 0
+        self._observe(latency_ms)
+
+    def record_failure(self, error: Exception, latency_ms: float):
+        """失败的耗时同样计入延迟，但不低于当前延迟：慢速超时使数据源排名后移，快速失败不会使其排名提前"""
+        self.failures += 1
+        self.consecutive_failures += 1
+        self.last_failure_at = time.time()
+        self.last_error = str(error)
+        self._observe(max(latency_ms, self.latency_ms or 0.0))
+
+    def stats(self) -> Dict:
+        return {
+            'func_name': self.source.func_name,
+            'latency_ms': round(self.latency_ms, 1) if self.latency_ms is not None else None,
+            'successes': self.successes,
+            'failures': self.failures,
+            'consecutive_failures': self.consecutive_failures,
+            'last_error': self.last_error,
+        }
+
+
+class TickPipeline:
+    """逐笔成交采集管道"""
+
+    def __init__(self, root: Optional[str] = None, gateway=None, calendar=None,
+                 watchlist: Optional[Iterable[str]] = None, sources: Tuple[TickSource, ...] = TICK_SOURCES):
+        """
+        Args:
+            root: 日志与检查点目录，默认data/ticks
+            gateway: akshare网关
+            calendar: 交易日历
+            watchlist: 采集的股票代码，默认读取TICK_WATCHLIST（逗号分隔）
+            sources: 数据源
+        """
+        self.root = Path(root) if root else Path(__file__).parent.parent / 'data' / 'ticks'
+        self.gateway = gateway or akshare_gateway
+        self.calendar = calendar or trading_calendar
+        if watchlist is None:
+            watchlist = os.environ.get('TICK_WATCHLIST', '').split(',')
+        self.watchlist = [code.strip() for code in watchlist if code.strip()]
+
+        self.workers = int(os.environ.get('TICK_WORKERS', 8))  # 并发拉取线程数
+        self.poll_seconds = float(os.environ.get('TICK_POLL_SECONDS', 10))  # 交易时段内的采集间隔
+        self.max_failures = int(os.environ.get('TICK_SOURCE_MAX_FAILURES', 3))  # 连续失败多少次后数据源降级
+        self.cooldown_seconds = float(os.environ.get('TICK_SOURCE_COOLDOWN_SECONDS', 60))  # 降级后多久重新参与排序
+
+        self.health = {source.name: SourceHealth(source) for source in sources}
+        self._lock = threading.Lock()
+        self._log_lock = threading.Lock()
+        self.day: Optional[str] = None
+        self.offset = 0  # 当日日志已确认（已写入检查点）的字节数
+        self.states: Dict[str, Dict] = {}
+        self._stats = {'cycles': 0, 'ticks': 0, 'duplicates': 0, 'fetch_failures': 0,
+                       'last_cycle': None, 'ticks_per_sec_ewma': None}
+        self.task = PeriodicTask('tick-pipeline', self.run_once, interval=self._next_interval,
+                                 initial_delay=self.poll_seconds)
+        self._attached = False
+
+    # ==================== 数据源 ====================
+
+    def _healthy(self, health: SourceHealth, now: float) -> bool:
+        if self.gateway.breaker(health.source.func_name).state == OPEN:
+            return False
+        return health.consecutive_failures < self.max_failures or now - health.last_failure_at >= self.cooldown_seconds
+
+    def ranked_sources(self) -> List[SourceHealth]:
+        """可用的数据源按延迟升序在前（尚未测得延迟的优先试用），降级的数据源在后"""
+        now = time.time()
+        return sorted(self.health.values(), key=lambda health: (
+            not self._healthy(health, now), health.latency_ms if health.latency_ms is not None else 0.0))
+
+    def fetch(self, symbol: str, day: date) -> Tuple[Optional[str], Optional[Dict[str, np.ndarray]]]:
+        """
+        按数据源排序依次拉取一只股票的当日逐笔成交，成功即返回
+
+        Returns:
+            (数据源名称, 成交列数组)，全部数据源失败时为(None, None)
+        """
+        for health in self.ranked_sources():
+            source = health.source
+            start = time.perf_counter()
+            try:
+                frame = self.gateway.call(source.func_name, use_cache=False, **source.params(symbol, day))
+                ticks = normalize_ticks(frame, source) if frame is not None and len(frame) else None
+            except Exception as e:
+                with self._lock:
+                    health.record_failure(e, (time.perf_counter() - start) * 1000)
+                logger.warning(f"{symbol} 逐笔成交数据源 {source.name} 失败，切换数据源: {str(e)}")
+                continue
+            with self._lock:
+                health.record_success((time.perf_counter() - start) * 1000)
+            return source.name, ticks
+        return None, None
+
+    # ==================== 日志与检查点 ====================
+
+    def _log_path(self, day: str) -> Path:
+        return self.root / f'{day}.csv'
+
+    @property
+    def checkpoint_path(self) -> Path:
+        return self.root / 'checkpoint.json'
+
+    def _roll(self, day: str):
+        """切换到新的交易日，去重状态清空"""
+        if self.day != day:
+            self.day = day
+            path = self._log_path(day)
+            self.offset = path.stat().st_size if path.exists() else 0
+            self.states = {}
+
+    def save_checkpoint(self):
+        """写入当日日志位置与各股票的去重状态（先写临时文件再替换）"""
+        checkpoint = {
+            'version': CHECKPOINT_VERSION,
+            'day': self.day,
+            'offset': self.offset,
+            'symbols': {symbol: {'last_time': state['last_time'], 'boundary': sorted(state['boundary']),
+                                 'ticks': state['ticks']}
+                        for symbol, state in self.states.items()},
+        }
+        self.root.mkdir(parents=True, exist_ok=True)
+        tmp = self.checkpoint_path.with_suffix('.tmp')
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump(checkpoint, f)
+        os.replace(tmp, self.checkpoint_path)
+
+    def load_checkpoint(self) -> bool:
+        """
+        从检查点恢复：日志中检查点之后的内容（上次崩溃前未确认的写入）被截断，之后重新拉取时会再次写入
+
+        Returns:
+            是否恢复成功
+        """
+        try:
+            with open(self.checkpoint_path, 'r', encoding='utf-8') as f:
+                checkpoint = json.load(f)
+        except FileNotFoundError:
+            return False
+        except Exception as e:
+            logger.error(f"读取逐笔成交检查点失败: {str(e)}")
+            return False
+        if checkpoint.get('version') != CHECKPOINT_VERSION or not checkpoint.get('day'):
+            return False
+
+        with self._lock:
+            self.day = checkpoint['day']
+            self.offset = checkpoint['offset']
+            path = self._log_path(self.day)
+            if path.exists() and path.stat().st_size > self.offset:
+                with open(path, 'r+b') as f:
+                    f.truncate(self.offset)
+                logger.warning(f"逐笔成交日志 {path.name} 截断到检查点位置 {self.offset}")
+            self.states = {symbol: {'last_time': state['last_time'],
+                                    'boundary': {tuple(key) for key in state['boundary']},
+                                    'ticks': state['ticks']}
+                           for symbol, state in checkpoint['symbols'].items()}
+        logger.info(f"已从检查点恢复 {len(self.states)} 只股票的逐笔成交采集状态（{self.day}）")
+        return True
+
+    def _dedup(self, symbol: str, ticks: Dict[str, np.ndarray]) -> Dict[str, np.ndarray]:
+        """
+        去掉已写入的成交：成交按时间有序，只需比较最后写入时刻之后的成交，
+        与最后写入时刻相同的成交按（价格、成交量）与该时刻已写入的成交比较
+        """
+        state = self.states.setdefault(symbol, {'last_time': -1, 'boundary': set(), 'ticks': 0})
+        last_time = state['last_time']
+        start = int(np.searchsorted(ticks['time'], last_time, side='left'))
+        # 价格按厘取整后比较，避免浮点误差
+        mils = np.round(ticks['price'] * 1000).astype(np.int64)
+
+        keep = []
+        seen = set()
+        for i in range(start, len(ticks['time'])):
+            key = (int(ticks['time'][i]), int(mils[i]), int(ticks['volume'][i]))
+            if key in seen or (key[0] == last_time and key[1:] in state['boundary']):
+                continue
+            seen.add(key)
+            keep.append(i)
+        keep = np.asarray(keep, dtype=np.int64)
+        fresh = {name: values[keep] for name, values in ticks.items()}
+
+        if len(keep):
+            new_last = int(fresh['time'][-1])
+            if new_last != last_time:
+                state['boundary'] = set()
+                state['last_time'] = new_last
+            at_last = fresh['time'] == new_last
+            state['boundary'].update(zip(mils[keep][at_last].tolist(), fresh['volume'][at_last].tolist()))
+            state['ticks'] += len(keep)
+        return fresh
+
+    def _append(self, batches: List[Tuple[str, str, Dict[str, np.ndarray]]]) -> int:
+        """追加写入当日日志并落盘，返回写入的成交数"""
+        lines = []
+        for symbol, source, ticks in batches:
+            for t, price, volume, side in zip(ticks['time'].tolist(), ticks['price'].tolist(),
+                                              ticks['volume'].tolist(), ticks['side'].tolist()):
+                lines.append(f'{symbol},{t:06d},{price:.3f},{volume},{side},{source}\n')
+        if not lines:
+            return 0
+        self.root.mkdir(parents=True, exist_ok=True)
+        data = ''.join(lines).encode('utf-8')
+        with self._log_lock:
+            with open(self._log_path(self.day), 'ab') as f:
+                f.write(data)
+                f.flush()
+                os.fsync(f.fileno())
+            self.offset += len(data)
+        return len(lines)
+
+    # ==================== 采集 ====================
+
+    def run_once(self, symbols: Optional[Iterable[str]] = None, now: Optional[float] = None) -> Dict:
+        """
+        采集一轮：并发拉取，去重后追加日志，再写入检查点
+
+        Args:
+            symbols: 股票代码，默认自选股列表
+            now: 当前时间（epoch秒），决定交易日
+
+        Returns:
+            本轮统计，含成交吞吐（笔/秒）
+        """
+        symbols = list(symbols) if symbols is not None else self.watchlist
+        start = time.perf_counter()
+        day = self.calendar.to_local(now).date()
+        with self._lock:
+            self._roll(day.strftime('%Y%m%d'))
+
+        if symbols:
+            with ThreadPoolExecutor(max_workers=min(self.workers, len(symbols)),
+                                    thread_name_prefix='tick-fetch') as executor:
+                results = list(executor.map(lambda symbol: (symbol, *self.fetch(symbol, day)), symbols))
+        else:
+            results = []
+        fetch_ms = (time.perf_counter() - start) * 1000
+
+        with self._lock:
+            batches = []
+            fetched = failed = 0
+            sources: Dict[str, int] = {}
+            for symbol, source, ticks in results:
+                if source is None:
+                    failed += 1
+                    continue
+                sources[source] = sources.get(source, 0) + 1
+                if ticks is None:
+                    continue
+                fetched += len(ticks['time'])
+                fresh = self._dedup(symbol, ticks)
+                if len(fresh['time']):
+                    batches.append((symbol, source, fresh))
+            appended = self._append(batches)
+            self.save_checkpoint()
+
+            elapsed = time.perf_counter() - start
+            rate = appended / elapsed if elapsed > 0 else 0.0
+            ewma = self._stats['ticks_per_sec_ewma']
+            cycle = {
+                'day': self.day,
+                'symbols': len(symbols),
+                'failed_symbols': failed,
+                'sources': sources,
+                'fetched': fetched,
+                'appended': appended,
+                'fetch_ms': round(fetch_ms, 1),
+                'elapsed_ms': round(elapsed * 1000, 1),
+                'ticks_per_sec': round(rate, 1),
+                'fetched_per_sec': round(fetched / elapsed, 1) if elapsed > 0 else 0.0,
+            }
+            self._stats['cycles'] += 1
+            self._stats['ticks'] += appended
+            self._stats['duplicates'] += fetched - appended
+            self._stats['fetch_failures'] += failed
+            self._stats['ticks_per_sec_ewma'] = round(rate if ewma is None else 0.3 * rate + 0.7 * ewma, 1)
+            self._stats['last_cycle'] = cycle
+        logger.info(f"逐笔成交采集完成：{len(symbols)} 只股票，新增 {appended} 笔，"
+                    f"{cycle['ticks_per_sec']} 笔/秒，耗时 {cycle['elapsed_ms']}ms")
+        return cycle
+
+    def _next_interval(self) -> float:
+        """交易时段内按采集间隔执行，休市时等到下一个交易时段"""
+        if self.calendar.is_trading_time():
+            return self.poll_seconds
+        return max(self.calendar.seconds_until_open(), self.poll_seconds)
+
+    def attach(self):
+        """恢复检查点并启动采集任务；自选股列表为空时不启动，重复调用无副作用"""
+        if self._attached or not self.watchlist:
+            return
+        self._attached = True
+        self.load_checkpoint()
+        self.task.start()
+
+    def read_ticks(self, symbol: str, day: Optional[str] = None) -> List[Dict]:
+        """
+        读取日志中一只股票的逐笔成交
+
+        Args:
+            symbol: 股票代码
+            day: 交易日YYYYMMDD，默认当前交易日
+
+        Returns:
+            成交列表，按写入顺序
+        """
+        day = day or self.calendar.to_local().strftime('%Y%m%d')
+        path = self._log_path(day)
+        if not path.exists():
+            return []
+        with self._log_lock:
+            frame = pd.read_csv(path, names=TICK_LOG_FIELDS, dtype={'symbol': str, 'time': str, 'side': str})
+        frame = frame[frame['symbol'] == symbol]
+        return [
+            {'time': f'{t[:2]}:{t[2:4]}:{t[4:6]}', 'price': price, 'volume': int(volume), 'side': side,
+             'source': source}
+            for t, price, volume, side, source in zip(frame['time'], frame['price'], frame['volume'],
+                                                      frame['side'], frame['source'])
+        ]
+
+    def stats(self) -> Dict:
+        """采集吞吐、去重与各数据源的延迟、健康统计"""
+        now = time.time()
+        with self._lock:
+            sources = []
+            for health in self.ranked_sources():
+                item = health.stats()
+                item.update(name=health.source.name, healthy=self._healthy(health, now))
+                sources.append(item)
+            return dict(self._stats, watchlist=self.watchlist, day=self.day, log_bytes=self.offset,
+                        sources=sources, task=self.task.stats())
+
+
+# 全局实例
+tick_pipeline = TickPipeline()
+
+
+def get_stock_ticks(symbol: str, day: Optional[str] = None) -> List[Dict]:
+    """读取逐笔成交的便捷函数"""
+    return tick_pipeline.read_ticks(symbol, day)
@@ -0,0 +1,69 @@
+#!/usr/bin/env python3
+"""
+回测API路由
+提供基于本地日线仓库的策略回测接口
+"""
+
+import logging
+
+from flask import Blueprint, request
+from utils.response import success_response, error_response
+from data_handlers.backtest import STRATEGIES, CostModel, backtest_strategy
+
+logger = logging.getLogger(__name__)
+
+# 创建蓝图
+bp = Blueprint('backtest', __name__, url_prefix='/api/backtest')
+
+
+@bp.route('/strategies', methods=['GET'])
+def list_strategies():
+    """获取支持的策略及默认参数"""
+    return success_response([
+        {'name': name, 'description': spec.description, 'params': spec.params}
+        for name, spec in STRATEGIES.items()
+    ])
+
+
+@bp.route('/<strategy>', methods=['GET', 'POST'])
+def run_strategy_backtest(strategy):
+    """
+    回测策略，只使用本地已有的日线
+
+    Args:
+        strategy: 策略名，如low_turnover
+
+    Query Parameters / POST Body:
+        start_date (str): 开始日期，默认最早
+        end_date (str): 结束日期，默认至今
+        codes (str): 逗号分隔的股票池，默认本地已有日线的全部股票
+        top_n (int): 持仓数量，默认20
+        rebalance_days (int): 调仓间隔（交易日），默认5
+        commission (float): 佣金率，默认0.00025
+        stamp_duty (float): 卖出印花税率，默认0.0005
+        slippage (float): 滑点，默认0.0005
+        其余参数为策略参数，如 max_turnover_rate=3
+
+    Returns:
+        净值曲线、回撤、换手及汇总指标JSON
+    """
+    params = (request.get_json(silent=True) or {}) if request.method == 'POST' else request.args.to_dict()
+    try:
+        codes = params.get('codes')
+        if isinstance(codes, str):
+            codes = [code.strip() for code in codes.split(',') if code.strip()]
+        defaults = CostModel()
+        costs = CostModel(*(float(params.get(field, default)) for field, default in defaults._asdict().items()))
+
+        result = backtest_strategy(strategy, params, codes, params.get('start_date'), params.get('end_date'),
+                                   top_n=int(params.get('top_n', 20)),
+                                   rebalance_days=int(params.get('rebalance_days', 5)), costs=costs)
+        if result is None:
+            return error_response('回测区间内没有本地日线数据', 404)
+        return success_response(result)
+
+    except ValueError as e:
+        return error_response(f'参数错误: {str(e)}', 400)
+    except Exception as e:
+        logger.error(f"回测策略{strategy}失败: {str(e)}")
+        return error_response(f'回测失败: {str(e)}', 500)
@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+"""
+A股日线API路由
+提供本地日线仓库数据的RESTful API接口
+"""
+
+import logging
+
+from flask import Blueprint, request
+from utils.response import success_response, error_response
+from data_handlers.bar_warehouse import ADJUSTS, bar_warehouse
+
+logger = logging.getLogger(__name__)
+
+# 创建蓝图
+bp = Blueprint('bars', __name__, url_prefix='/api/bars')
+
+
+def _valid_code(code: str) -> bool:
+    return len(code) == 6 and code.isdigit()
+
+
+@bp.route('/<code>', methods=['GET'])
+def get_daily_bars(code):
+    """
+    获取股票日线，查询区间已在本地覆盖时直接读取本地数据
+
+    Args:
+        code: 股票代码，例如：600000
+
+    Query Parameters:
+        start_date (str): 开始日期，YYYY-MM-DD或YYYYMMDD，默认最早
+        end_date (str): 结束日期，默认至今
+        adjust (str): 复权方式，none、qfq（默认）或hfq
+        limit (int): 只返回最后limit根K线
+
+    Returns:
+        日线数据JSON
+    """
+    if not _valid_code(code):
+        return error_response('股票代码格式错误，应为6位数字', 400)
+
+    adjust = request.args.get('adjust', 'qfq')
+    if adjust not in ADJUSTS:
+        return error_response(f'复权方式错误，可选值: {", ".join(ADJUSTS)}', 400)
+
+    try:
+        limit = request.args.get('limit', type=int)
+        bars = bar_warehouse.get_bars(code, request.args.get('start_date'), request.args.get('end_date'),
+                                      adjust=adjust)
+        if bars is None:
+            return error_response(f'未找到股票{code}的日线数据', 404)
+        if limit and limit > 0:
+            bars = bars.tail(limit)
+
+        return success_response({
+            'code': code,
+            'adjust': adjust,
+            'count': len(bars),
+            'bars': bars.to_records()
+        })
+
+    except ValueError as e:
+        return error_response(f'参数错误: {str(e)}', 400)
+    except Exception as e:
+        logger.error(f"获取股票{code}日线失败: {str(e)}")
+        return error_response(f'获取日线失败: {str(e)}', 500)
+
+
+@bp.route('/<code>/meta', methods=['GET'])
+def get_bar_meta(code):
+    """
+    获取股票日线的本地同步信息
+
+    Args:
+        code: 股票代码
+
+    Returns:
+        各复权方式的条数、最后日期与同步时间
+    """
+    if not _valid_code(code):
+        return error_response('股票代码格式错误，应为6位数字', 400)
+    return success_response(bar_warehouse.meta(code))
@@ -5,12 +5,13 @@
 """
 
 from datetime import datetime
-import akshare as ak
 import pandas as pd
 import logging
 
 from flask import Blueprint, jsonify, request
 from utils.response import success_response, error_response
+from data_handlers.akshare_gateway import call_akshare
+from data_handlers.bar_warehouse import bar_warehouse
 
 logger = logging.getLogger(__name__)
 
@@ -30,7 +31,7 @@ def get_company_info(code):
     """
     try:
         # 获取股票基本信息
-        stock_info = ak.stock_individual_info_em(symbol=code)
+        stock_info = call_akshare('stock_individual_info_em', symbol=code)
         
         if stock_info is None or stock_info.empty:
             return error_response(f'未找到股票{code}的基本信息', 404)
@@ -65,13 +66,12 @@ def get_company_info(code):
         
         # 尝试获取实时数据（使用单股票查询）
         try:
-            # 使用历史数据获取最新价格信息
-            hist_data = ak.stock_zh_a_hist(symbol=code, period='daily', start_date='2025-08-20', end_date='2025-08-27', adjust='')
-            if not hist_data.empty:
-                latest_record = hist_data.iloc[-1]
+            # 使用日线仓库中最新一根K线获取最新价格信息
+            latest_bar = bar_warehouse.latest(code)
+            if latest_bar is not None:
                 company_data.update({
-                    'latest_price': float(latest_record.get('收盘', 0)),
-                    'change_percent': float(latest_record.get('涨跌幅', 0))
+                    'latest_price': latest_bar['close'],
+                    'change_percent': latest_bar['change_percent']
                 })
         except Exception as realtime_error:
             logger.warning(f"获取股票{code}实时数据失败: {str(realtime_error)}")
@@ -166,7 +166,7 @@ def get_financial_indicators(code):
     """
     try:
         # 获取财务指标数据 - 使用新浪财经API
-        financial_data = ak.stock_financial_abstract(symbol=code)
+        financial_data = call_akshare('stock_financial_abstract', symbol=code)
         
         if financial_data is None or financial_data.empty:
             return error_response(f'未找到股票{code}的财务数据', 404)
@@ -198,7 +198,7 @@ def get_balance_sheet(code):
     try:
         # 获取资产负债表数据 - 使用新浪财经API
         stock_code = get_stock_prefix(code)
-        balance_data = ak.stock_financial_report_sina(stock=stock_code, symbol='资产负债表')
+        balance_data = call_akshare('stock_financial_report_sina', stock=stock_code, symbol='资产负债表')
         
         if balance_data is None or balance_data.empty:
             return error_response(f'未找到股票{code}的资产负债表数据', 404)
@@ -279,7 +279,7 @@ def get_income_statement(code):
     try:
         # 获取利润表数据 - 使用新浪财经API
         stock_code = get_stock_prefix(code)
-        income_data = ak.stock_financial_report_sina(stock=stock_code, symbol='利润表')
+        income_data = call_akshare('stock_financial_report_sina', stock=stock_code, symbol='利润表')
         
         if income_data is None or income_data.empty:
             return error_response(f'未找到股票{code}的利润表数据', 404)
@@ -363,7 +363,7 @@ def get_cash_flow(code):
     try:
         # 获取现金流量表数据 - 使用新浪财经API
         stock_code = get_stock_prefix(code)
-        cashflow_data = ak.stock_financial_report_sina(stock=stock_code, symbol='现金流量表')
+        cashflow_data = call_akshare('stock_financial_report_sina', stock=stock_code, symbol='现金流量表')
         
         if cashflow_data is None or cashflow_data.empty:
             return error_response(f'未找到股票{code}的现金流量表数据', 404)
@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+"""
+A股分钟线API路由
+提供本地分钟线存储的区间查询接口，供分时图与走势图使用
+"""
+
+import logging
+
+from flask import Blueprint, request
+from utils.response import success_response, error_response
+from data_handlers.intraday_store import TIER_BY_NAME, intraday_store, to_records
+
+logger = logging.getLogger(__name__)
+
+# 创建蓝图
+bp = Blueprint('intraday', __name__, url_prefix='/api/intraday')
+
+
+def _valid_code(code: str) -> bool:
+    return len(code) == 6 and code.isdigit()
+
+
+@bp.route('/<code>', methods=['GET'])
+def get_minute_bars(code):
+    """
+    获取股票分钟线，查询区间覆盖到最新数据且同步已过期时先增量同步
+
+    Args:
+        code: 股票代码，例如：603696
+
+    Query Parameters:
+        start (str): 开始时间，YYYY-MM-DD或YYYY-MM-DD HH:MM，默认最早
+        end (str): 结束时间，默认至今
+        period (str): 周期，1m（默认）、5m或30m
+        limit (int): 只返回最后limit根K线
+
+    Returns:
+        分钟线数据JSON
+    """
+    if not _valid_code(code):
+        return error_response('股票代码格式错误，应为6位数字', 400)
+    period = request.args.get('period', '1m')
+    if period not in TIER_BY_NAME:
+        return error_response(f'周期错误，可选值: {", ".join(TIER_BY_NAME)}', 400)
+
+    try:
+        limit = request.args.get('limit', type=int)
+        bars = intraday_store.get_bars(code, request.args.get('start'), request.args.get('end'), period)
+        if bars is None:
+            return error_response(f'未找到股票{code}的分钟线数据', 404)
+        if limit and limit > 0:
+            bars = {name: values[-limit:] for name, values in bars.items()}
+
+        return success_response({
+            'code': code,
+            'period': period,
+            'count': len(bars['time']),
+            'bars': to_records(bars)
+        })
+
+    except ValueError as e:
+        return error_response(f'参数错误: {str(e)}', 400)
+    except Exception as e:
+        logger.error(f"获取股票{code}分钟线失败: {str(e)}")
+        return error_response(f'获取分钟线失败: {str(e)}', 500)
+
+
+@bp.route('/<code>/meta', methods=['GET'])
+def get_minute_meta(code):
+    """
+    获取股票分钟线的同步信息及各保留级别的块数与时间范围
+
+    Args:
+        code: 股票代码
+    """
+    if not _valid_code(code):
+        return error_response('股票代码格式错误，应为6位数字', 400)
+    meta = intraday_store.meta(code)
+    if meta is None:
+        return error_response(f'股票{code}尚无本地分钟线', 404)
+    return success_response(meta)
+
+
+@bp.route('/stats', methods=['GET'])
+def get_intraday_stats():
+    """获取块缓存与整理统计"""
+    return success_response(intraday_store.stats())
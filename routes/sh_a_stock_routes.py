@@ -5,26 +5,40 @@
 """
 
 from datetime import datetime
-import akshare as ak
 import json
 import pandas as pd
 
 from flask import Blueprint, jsonify, request
 from utils.response import success_response, error_response
 from utils.validators import validate_stock_symbol
+from data_handlers.akshare_gateway import call_akshare
+from data_handlers.index_history import get_index_daily_bars
+from data_handlers.screener import ScreenError, screen_sh_a_stocks, screener
 from data_handlers.sh_a_stock_data import (
-    get_sh_a_realtime_stocks,
+    get_sh_a_realtime_snapshot,
     filter_sh_a_stocks,
     get_sh_a_stock_by_code,
     get_sh_a_market_summary,
     get_stock_type_info,
     get_stock_type_batch,
-    get_all_industries
+    get_all_industries,
+    get_industry_detail,
+    get_sh_a_runtime_stats,
+    get_sh_a_snapshot_meta,
+    get_sh_a_snapshot_as_of,
+    get_sh_a_stock_history
 )
 
 # 创建蓝图
 bp = Blueprint('sh_a_stock', __name__, url_prefix='/api/sh-a')
 
+def _parse_time(value: str) -> float:
+    """解析时刻参数：epoch秒，或ISO格式的本地时间（如2024-03-04T10:00:00、2024-03-04 10:00）"""
+    try:
+        return float(value)
+    except ValueError:
+        return datetime.fromisoformat(value).timestamp()
+
 @bp.route('/realtime', methods=['GET'])
 def get_realtime_stocks():
     """
@@ -33,6 +47,7 @@ def get_realtime_stocks():
     Query Parameters:
         limit (int): 返回股票数量限制，默认返回全部
         offset (int): 偏移量，默认0
+        as_of (str): 历史时刻（epoch秒或ISO时间），返回该时刻之前最后一次快照，只能查询保留期内的快照
     
     Returns:
         {
@@ -43,7 +58,10 @@ def get_realtime_stocks():
                 "total": 500,
                 "stocks": [...],
                 "query_time": "2024-01-01T12:00:00"
-            }
+            },
+            "data_fetched_at": "2024-01-01T11:59:30",
+            "data_age_seconds": 30.0,
+            "stale": false
         }
     """
     try:
@@ -51,23 +69,36 @@ def get_realtime_stocks():
         limit = request.args.get('limit', type=int)
         offset = request.args.get('offset', 0, type=int)
         
-        # 获取实时数据
-        stocks = get_sh_a_realtime_stocks()
-        if stocks is None:
-            return error_response('获取上证A股数据失败', 500)
-        
-        # 应用分页
-        total = len(stocks)
+        as_of = request.args.get('as_of')
+        if as_of:
+            try:
+                as_of_ts = _parse_time(as_of)
+            except ValueError:
+                return error_response('as_of格式错误，应为epoch秒或ISO时间', 400)
+            snapshot = get_sh_a_snapshot_as_of(as_of_ts)
+            if snapshot is None:
+                return error_response(f'{as_of} 之前没有保留的行情快照', 404)
+            meta = {'data_fetched_at': datetime.fromtimestamp(snapshot.fetched_at).isoformat(),
+                    'as_of': datetime.fromtimestamp(as_of_ts).isoformat()}
+        else:
+            # 获取实时快照
+            snapshot = get_sh_a_realtime_snapshot()
+            if snapshot is None:
+                return error_response('获取上证A股数据失败', 500)
+            meta = get_sh_a_snapshot_meta()
+        
+        # 应用分页，仅渲染当前页
+        total = len(snapshot)
         if limit:
-            stocks = stocks[offset:offset + limit]
+            stocks = snapshot.to_records(slice(offset, offset + limit))
         else:
-            stocks = stocks[offset:]
+            stocks = snapshot.to_records(slice(offset, None))
         
         return success_response({
             'total': total,
             'stocks': stocks,
             'query_time': datetime.now().isoformat()
-        })
+        }, **meta)
         
     except Exception as e:
         return error_response(f'获取上证A股实时行情失败: {str(e)}', 500)
@@ -120,13 +151,61 @@ def filter_stocks():
             'total': len(filtered_stocks),
             'stocks': filtered_stocks,
             'filters': filters
-        })
+        }, **get_sh_a_snapshot_meta())
         
     except ValueError as e:
         return error_response(f'参数格式错误: {str(e)}', 400)
     except Exception as e:
         return error_response(f'筛选股票失败: {str(e)}', 500)
 
+@bp.route('/screen', methods=['GET', 'POST'])
+def screen_stocks():
+    """
+    按布尔表达式选股，表达式编译为全市场向量化计算
+    
+    Query Parameters / POST Body:
+        expr (str): 选股表达式，如 rsi14 < 30 and pe_ratio between 5 and 20 and change_60day > 0
+        sort (str): 排序，多个字段以逗号分隔，字段后加desc或字段前加-表示降序，如 -change_percent,pe_ratio
+        limit (int): 返回前limit条
+    
+    Returns:
+        {
+            "code": 200,
+            "message": "success",
+            "data": {
+                "expression": "...",
+                "total": 35,
+                "count": 20,
+                "fields": ["rsi14"],
+                "elapsed_ms": 1.2,
+                "items": [...]
+            }
+        }
+    """
+    params = (request.get_json(silent=True) or {}) if request.method == 'POST' else request.args
+    try:
+        limit = params.get('limit')
+        limit = int(limit) if limit not in (None, '') else None
+        if limit is not None and limit <= 0:
+            return error_response('limit必须为正整数', 400)
+        
+        result = screen_sh_a_stocks(params.get('expr', ''), params.get('sort'), limit)
+        if result is None:
+            return error_response('获取行情数据失败', 500)
+        return success_response(result, **get_sh_a_snapshot_meta())
+        
+    except ScreenError as e:
+        return error_response(str(e), 400)
+    except ValueError as e:
+        return error_response(f'参数格式错误: {str(e)}', 400)
+    except Exception as e:
+        return error_response(f'选股失败: {str(e)}', 500)
+
+@bp.route('/screen/fields', methods=['GET'])
+def get_screen_fields():
+    """获取选股表达式与排序可用的字段"""
+    return success_response(screener.available_fields())
+
 @bp.route('/stock/<code>', methods=['GET'])
 def get_stock_detail(code):
     """
@@ -152,11 +231,58 @@ def get_stock_detail(code):
         if stock is None:
             return error_response(f'未找到股票 {code}', 404)
         
-        return success_response(stock)
+        return success_response(stock, **get_sh_a_snapshot_meta())
         
     except Exception as e:
         return error_response(f'获取股票详情失败: {str(e)}', 500)
 
+@bp.route('/stock/<code>/intraday', methods=['GET'])
+def get_stock_intraday(code):
+    """
+    获取单只股票在已保留行情快照中的盘中序列
+    
+    Args:
+        code (str): 股票代码
+    
+    Query Parameters:
+        start (str): 开始时刻（epoch秒或ISO时间），默认当天0点
+        end (str): 结束时刻，默认至今
+        limit (int): 只返回最后limit条
+    
+    Returns:
+        {
+            "code": 200,
+            "message": "success",
+            "data": {
+                "code": "600000",
+                "count": 2,
+                "series": [...]
+            }
+        }
+    """
+    try:
+        if not validate_stock_symbol(code):
+            return error_response('无效的股票代码格式', 400)
+        
+        try:
+            start = request.args.get('start')
+            end = request.args.get('end')
+            start = _parse_time(start) if start else \
+                datetime.now().replace(hour=0, minute=0, second=0, microsecond=0).timestamp()
+            end = _parse_time(end) if end else None
+        except ValueError:
+            return error_response('时间格式错误，应为epoch秒或ISO时间', 400)
+        
+        series = get_sh_a_stock_history(code, start, end, request.args.get('limit', type=int))
+        return success_response({
+            'code': code,
+            'count': len(series),
+            'series': series
+        })
+        
+    except Exception as e:
+        return error_response(f'获取股票盘中序列失败: {str(e)}', 500)
+
 @bp.route('/market-summary', methods=['GET'])
 def get_market_summary():
     """
@@ -182,7 +308,7 @@ def get_market_summary():
         if summary is None:
             return error_response('获取市场概览失败', 500)
         
-        return success_response(summary)
+        return success_response(summary, **get_sh_a_snapshot_meta())
         
     except Exception as e:
         return error_response(f'获取市场概览失败: {str(e)}', 500)
@@ -212,19 +338,17 @@ def get_hot_stocks():
         hot_stocks = filter_sh_a_stocks(
             min_turnover_rate=5,  # 换手率大于5%
             sort_by='turnover_rate',
-            ascending=False
+            ascending=False,
+            limit=count
         )
         
         if hot_stocks is None:
             return error_response('获取热门股票失败', 500)
         
-        # 限制返回数量
-        hot_stocks = hot_stocks[:count]
-        
         return success_response({
             'count': len(hot_stocks),
             'stocks': hot_stocks
-        })
+        }, **get_sh_a_snapshot_meta())
         
     except Exception as e:
         return error_response(f'获取热门股票失败: {str(e)}', 500)
@@ -261,15 +385,13 @@ def get_low_turnover_stocks():
             max_turnover_rate=5,
             min_market_cap=100,  # 100亿元
             sort_by='turnover_rate',
-            ascending=True
+            ascending=True,
+            limit=count
         )
         
         if low_turnover_stocks is None:
             return error_response('获取低换手率股票失败', 500)
         
-        # 限制返回数量
-        low_turnover_stocks = low_turnover_stocks[:count]
-        
         criteria = {
             'price_range': '10-60',
             'turnover_range': '1%-5%',
@@ -281,7 +403,7 @@ def get_low_turnover_stocks():
             'count': len(low_turnover_stocks),
             'stocks': low_turnover_stocks,
             'criteria': criteria
-        })
+        }, **get_sh_a_snapshot_meta())
         
     except Exception as e:
         return error_response(f'获取低换手率股票失败: {str(e)}', 500)
@@ -328,7 +450,7 @@ def get_stock_value_em(code):
         }
     """
     try:
-        info = ak.stock_value_em(symbol=code)
+        info = call_akshare('stock_value_em', symbol=code)
         if info is None:
             return error_response(f'无法获取股票{code}的估值分析信息', 404)
         
@@ -359,7 +481,7 @@ def stock_individual_fund_flow(code):
         }
     """
     try:
-        info = ak.stock_individual_fund_flow(stock=code)
+        info = call_akshare('stock_individual_fund_flow', stock=code)
         if info is None:
             return error_response(f'无法获取股票{code}的资金流向信息', 404)
         
@@ -376,10 +498,14 @@ def stock_individual_fund_flow(code):
 @bp.route('/stock/<code>/index_zh_a_hist', methods=['GET'])
 def index_zh_a_hist(code):
     """
-    获取指定指数的历史数据
+    获取指定指数的历史数据，数据来自本地指数日线存储（按需增量同步）
 
     Args:
-        code (str): 指数代码
+        code (str): 指数代码，如000001（上证指数）、399001（深证成指）
+
+    Query Parameters:
+        start_date (str): 开始日期，默认2020-01-01
+        end_date (str): 结束日期，默认2023-01-01
 
     Returns:
         {
@@ -391,49 +517,11 @@ def index_zh_a_hist(code):
     start_date = request.args.get('start_date', '2020-01-01')
     end_date = request.args.get('end_date', '2023-01-01')
     try:
-        # 使用更稳定的API获取上证指数数据
-        info = ak.stock_zh_index_daily_em(symbol='sh000001')
-        if info is None or info.empty:
-            return error_response(f'无法获取指数{code}的历史数据', 404)
-        
-        # 筛选指定日期范围
-        info['date'] = pd.to_datetime(info['date'])
-        start = pd.to_datetime(start_date)
-        end = pd.to_datetime(end_date)
-        info = info[(info['date'] >= start) & (info['date'] <= end)]
-        
-        if info.empty:
+        bars = get_index_daily_bars(code, start_date, end_date)
+        if not bars:
             return error_response(f'在指定时间范围内未找到数据', 404)
         
-        # 转换字段名为前端期望的格式
-        info = info.copy()
-        info['日期'] = info['date'].dt.strftime('%Y-%m-%d')
-        info['date'] = info['日期']  # 保留date字段供前端使用
-        info['开盘'] = info['open']
-        info['收盘'] = info['close']
-        info['最高'] = info['high']
-        info['最低'] = info['low']
-        info['成交量'] = info['volume']
-        info['成交额'] = info['amount']
-        
-        # 计算衍生指标
-        info['涨跌额'] = info['收盘'].diff()  # 今日收盘 - 昨日收盘
-        info['涨跌幅'] = (info['收盘'].pct_change() * 100).round(2)  # 涨跌幅百分比
-        info['振幅'] = ((info['最高'] - info['最低']) / info['收盘'].shift(1) * 100).round(2)  # 振幅百分比
-        info['换手率'] = 0.0  # 大盘指数换手率设为0
-        
-        # 填充NaN值
-        info = info.fillna(0)
-        
-        # 选择返回字段
-        result_columns = ['日期', 'date', '开盘', '收盘', '最高', '最低', '成交量', '成交额', 
-                         '涨跌额', '涨跌幅', '振幅', '换手率']
-        info_result = info[result_columns]
-        
-        # 转换为JSON格式
-        info_json = json.loads(info_result.to_json(orient="records", force_ascii=False))
-        
-        return success_response(info_json)
+        return success_response(bars)
         
     except Exception as e:
         return error_response(str(e), 500)
@@ -454,6 +542,7 @@ def get_stock_types_batch():
             "message": "success",
             "data": {
                 "total": 3,
+                "requested": 3,
                 "types": [...]
             }
         }
@@ -471,8 +560,10 @@ def get_stock_types_batch():
         if type_info_list is None:
             return error_response('获取股票类型信息失败', 500)
         
+        # 超出时间预算时返回部分结果，total小于requested
         return success_response({
             'total': len(type_info_list),
+            'requested': len(set(map(str, codes))),
             'types': type_info_list
         })
         
@@ -482,7 +573,11 @@ def get_stock_types_batch():
 @bp.route('/industries', methods=['GET'])
 def get_industries():
     """
-    获取所有上证A股行业分类
+    获取所有上证A股行业分类及行业聚合指标
+
+    Query Parameters:
+        include_stocks (bool): 是否附带每个行业的完整成分股数据，默认true；
+            仅需行业聚合指标时传false，成分股可通过 /industries/<industry> 获取
 
     Returns:
         {
@@ -495,14 +590,65 @@ def get_industries():
         }
     """
     try:
-        industries = get_all_industries()
+        include_stocks = request.args.get('include_stocks', 'true').lower() != 'false'
+        industries = get_all_industries(include_stocks=include_stocks)
         if industries is None:
             return error_response('获取行业分类失败', 500)
         
         return success_response({
             'total': len(industries),
             'industries': industries
-        })
+        }, **get_sh_a_snapshot_meta())
+        
+    except Exception as e:
+        return error_response(str(e), 500)
+
+@bp.route('/industries/<path:industry>', methods=['GET'])
+def get_industry(industry):
+    """
+    获取单个行业的聚合指标及成分股
+
+    Args:
+        industry: 行业名称
+
+    Returns:
+        {
+            "code": 200,
+            "message": "success",
+            "data": {
+                "industry": "银行",
+                "count": 32,
+                "stocks": [...]
+            }
+        }
+    """
+    try:
+        detail = get_industry_detail(industry)
+        if detail is None:
+            return error_response(f'未找到行业{industry}', 404)
+        
+        return success_response(detail, **get_sh_a_snapshot_meta())
+        
+    except Exception as e:
+        return error_response(str(e), 500)
+
+@bp.route('/stats', methods=['GET'])
+def get_runtime_stats():
+    """
+    获取行情缓存与后台任务的运行状态
+
+    Returns:
+        {
+            "code": 200,
+            "message": "success",
+            "data": {
+                "snapshot": {...},
+                "maintenance": {...}
+            }
+        }
+    """
+    try:
+        return success_response(get_sh_a_runtime_stats())
         
     except Exception as e:
-        return error_response(str(e), 500)
\ No newline at end of file
+        return error_response(str(e), 500)
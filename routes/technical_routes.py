@@ -0,0 +1,171 @@
+#!/usr/bin/env python3
+"""
+技术指标API路由
+提供基于本地日线仓库的技术指标计算接口
+"""
+
+import logging
+
+from flask import Blueprint, request
+from utils.response import success_response, error_response
+from data_handlers.bar_warehouse import ADJUSTS
+from data_handlers.indicators import INDICATORS, get_indicator_batch, get_indicator_series
+from data_handlers.indicator_stream import indicator_stream
+from data_handlers.level_crossings import KINDS, get_level_crossings
+
+logger = logging.getLogger(__name__)
+
+# 创建蓝图
+bp = Blueprint('technical', __name__, url_prefix='/api/technical')
+
+# 流式指标订阅日线同步与行情快照
+indicator_stream.attach()
+
+
+@bp.route('/indicators', methods=['GET'])
+def list_indicators():
+    """获取支持的指标、输入字段及默认参数"""
+    return success_response([
+        {'name': name, 'description': spec.description, 'inputs': list(spec.inputs), 'params': spec.params}
+        for name, spec in INDICATORS.items()
+    ])
+
+
+@bp.route('/<code>/<indicator>', methods=['GET'])
+def get_indicator(code, indicator):
+    """
+    获取单只股票的指标序列
+
+    Args:
+        code: 股票代码，例如：600000
+        indicator: 指标名，如ma、macd、kdj
+
+    Query Parameters:
+        start_date (str): 开始日期，默认最早
+        end_date (str): 结束日期，默认至今
+        adjust (str): 复权方式，默认qfq
+        其余参数为指标参数，如 n=20
+
+    Returns:
+        指标序列JSON
+    """
+    if len(code) != 6 or not code.isdigit():
+        return error_response('股票代码格式错误，应为6位数字', 400)
+    adjust = request.args.get('adjust', 'qfq')
+    if adjust not in ADJUSTS:
+        return error_response(f'复权方式错误，可选值: {", ".join(ADJUSTS)}', 400)
+
+    try:
+        result = get_indicator_series(code, indicator, request.args.to_dict(), adjust,
+                                      request.args.get('start_date'), request.args.get('end_date'))
+        if result is None:
+            return error_response(f'未找到股票{code}的日线数据', 404)
+        return success_response(result)
+
+    except ValueError as e:
+        return error_response(f'参数错误: {str(e)}', 400)
+    except Exception as e:
+        logger.error(f"计算股票{code}指标{indicator}失败: {str(e)}")
+        return error_response(f'计算指标失败: {str(e)}', 500)
+
+
+@bp.route('/batch/<indicator>', methods=['GET'])
+def get_indicator_for_all(indicator):
+    """
+    一次计算多只股票的最新指标值，只使用本地已有的日线
+
+    Args:
+        indicator: 指标名
+
+    Query Parameters:
+        codes (str): 逗号分隔的股票代码，默认本地已有日线的全部股票
+        adjust (str): 复权方式，默认qfq
+        其余参数为指标参数
+
+    Returns:
+        各股票最新指标值JSON
+    """
+    adjust = request.args.get('adjust', 'qfq')
+    if adjust not in ADJUSTS:
+        return error_response(f'复权方式错误，可选值: {", ".join(ADJUSTS)}', 400)
+    codes = request.args.get('codes')
+    symbols = [code.strip() for code in codes.split(',') if code.strip()] if codes else None
+
+    try:
+        return success_response(get_indicator_batch(indicator, request.args.to_dict(), symbols, adjust))
+
+    except ValueError as e:
+        return error_response(f'参数错误: {str(e)}', 400)
+    except Exception as e:
+        logger.error(f"批量计算指标{indicator}失败: {str(e)}")
+        return error_response(f'批量计算指标失败: {str(e)}', 500)
+
+
+@bp.route('/<code>/stream', methods=['GET'])
+def get_streaming_indicator(code):
+    """
+    获取流式维护的最新指标值：已收盘日线的指标值，以及按最新行情快照试算的当日指标值
+
+    Args:
+        code: 股票代码
+
+    Returns:
+        指标值JSON
+    """
+    if len(code) != 6 or not code.isdigit():
+        return error_response('股票代码格式错误，应为6位数字', 400)
+    result = indicator_stream.latest(code)
+    if result is None:
+        return error_response(f'股票{code}的指标状态尚未初始化', 404)
+    return success_response(result)
+
+
+@bp.route('/<code>/levels', methods=['GET'])
+def get_level_analysis(code):
+    """
+    整数关口穿越分析：每个关口的上穿/下穿、相邻关口的推进用时，以及创新高式的关口突破
+
+    Args:
+        code: 指数代码（如000001）或股票代码
+
+    Query Parameters:
+        kind (str): index（默认）或stock
+        step (float): 关口步长，默认100
+        start_level (float): 只统计收盘价首次达到该点位之后的突破，默认从头开始
+        adjust (str): 股票复权方式，默认qfq
+        limit (int): 只返回最近limit条穿越记录
+
+    Returns:
+        关口分析JSON
+    """
+    kind = request.args.get('kind', 'index')
+    if kind not in KINDS:
+        return error_response(f'品种错误，可选值: {", ".join(KINDS)}', 400)
+    if kind == 'stock' and (len(code) != 6 or not code.isdigit()):
+        return error_response('股票代码格式错误，应为6位数字', 400)
+    adjust = request.args.get('adjust', 'qfq')
+    if adjust not in ADJUSTS:
+        return error_response(f'复权方式错误，可选值: {", ".join(ADJUSTS)}', 400)
+
+    try:
+        step = request.args.get('step', 100, type=float)
+        start_level = request.args.get('start_level', type=float)
+        limit = request.args.get('limit', type=int)
+        result = get_level_crossings(code, step, kind, adjust, start_level)
+        if result is None:
+            return error_response(f'未找到{code}的日线数据', 404)
+        if limit and limit > 0:
+            result = dict(result, crossings=result['crossings'][-limit:])
+        return success_response(result)
+
+    except ValueError as e:
+        return error_response(f'参数错误: {str(e)}', 400)
+    except Exception as e:
+        logger.error(f"分析{code}关口穿越失败: {str(e)}")
+        return error_response(f'关口分析失败: {str(e)}', 500)
+
+
+@bp.route('/stream/stats', methods=['GET'])
+def get_stream_stats():
+    """获取流式指标的状态规模、更新与检查点统计"""
+    return success_response(indicator_stream.stats())
@@ -0,0 +1,63 @@
+#!/usr/bin/env python3
+"""
+逐笔成交API路由
+提供采集管道的吞吐与数据源健康统计，以及已落盘逐笔成交的查询接口
+"""
+
+import logging
+
+from flask import Blueprint, request
+from utils.response import success_response, error_response
+from data_handlers.tick_pipeline import tick_pipeline
+
+logger = logging.getLogger(__name__)
+
+# 创建蓝图
+bp = Blueprint('ticks', __name__, url_prefix='/api/ticks')
+
+# 配置了自选股列表时启动采集
+tick_pipeline.attach()
+
+
+@bp.route('/stats', methods=['GET'])
+def get_tick_stats():
+    """获取采集吞吐（笔/秒）、去重与各数据源的延迟、健康统计"""
+    return success_response(tick_pipeline.stats())
+
+
+@bp.route('/<code>', methods=['GET'])
+def get_ticks(code):
+    """
+    获取股票已采集的逐笔成交
+
+    Args:
+        code: 股票代码，例如：603696
+
+    Query Parameters:
+        date (str): 交易日YYYYMMDD，默认当前交易日
+        limit (int): 只返回最后limit笔成交
+
+    Returns:
+        逐笔成交数据JSON
+    """
+    if len(code) != 6 or not code.isdigit():
+        return error_response('股票代码格式错误，应为6位数字', 400)
+    day = request.args.get('date')
+    if day is not None and (len(day) != 8 or not day.isdigit()):
+        return error_response('日期格式错误，应为YYYYMMDD', 400)
+
+    try:
+        limit = request.args.get('limit', type=int)
+        ticks = tick_pipeline.read_ticks(code, day)
+        if limit and limit > 0:
+            ticks = ticks[-limit:]
+        return success_response({
+            'code': code,
+            'date': day or tick_pipeline.calendar.to_local().strftime('%Y%m%d'),
+            'count': len(ticks),
+            'ticks': ticks
+        })
+
+    except Exception as e:
+        logger.error(f"获取股票{code}逐笔成交失败: {str(e)}")
+        return error_response(f'获取逐笔成交失败: {str(e)}', 500)
@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+"""
+akshare调用网关测试
+"""
+
+import time
+from datetime import time as dtime
+
+import akshare as ak
+import pandas as pd
+import pytest
+
+from data_handlers.akshare_gateway import AkshareGateway
+from utils.trading_calendar import TradingCalendar
+
+
+class AlwaysOpenCalendar(TradingCalendar):
+    """全天交易的日历，使缓存有效期与运行时间无关"""
+
+    def __init__(self):
+        super().__init__(holidays=[], sessions=((dtime.min, dtime.max),))
+
+    def is_trading_day(self, day):
+        return True
+
+
+@pytest.fixture
+def calls(monkeypatch):
+    """替换akshare估值接口，记录上游调用"""
+    calls = []
+
+    def fake_value_em(symbol):
+        calls.append(symbol)
+        return pd.DataFrame({'数据日期': ['2025-01-02'], 'PE': [10.0]})
+
+    monkeypatch.setattr(ak, 'stock_value_em', fake_value_em)
+    return calls
+
+
+def test_repeated_calls_hit_cache(calls):
+    """测试相同参数的重复调用命中缓存，且调用方修改结果不影响缓存"""
+    gateway = AkshareGateway(calendar=AlwaysOpenCalendar())
+    first = gateway.call('stock_value_em', symbol='600000')
+    first['PE'] = 0
+    second = gateway.call('stock_value_em', symbol=' 600000 ')
+
+    assert calls == ['600000']
+    assert second['PE'].tolist() == [10.0]
+    stats = gateway.stats()['functions']['stock_value_em']
+    assert (stats['hits'], stats['misses'], stats['upstream_calls']) == (1, 1, 1)
+
+
+def test_lru_eviction(calls):
+    """测试超过条目上限时淘汰最久未使用的结果"""
+    gateway = AkshareGateway(max_entries=2, calendar=AlwaysOpenCalendar())
+    for code in ('600000', '600001', '600000', '600002', '600000', '600001'):
+        gateway.call('stock_value_em', symbol=code)
+    assert calls == ['600000', '600001', '600002', '600001']
+    assert gateway.stats()['entries'] == 2
+
+
+def test_stale_result_served_when_upstream_fails(calls, monkeypatch):
+    """测试上游失败时返回过期缓存"""
+    gateway = AkshareGateway(calendar=AlwaysOpenCalendar())
+    gateway.call('stock_value_em', symbol='600000')
+    for entry in gateway._cache.values():
+        entry.expires_at = time.time() - 1
+
+    def failing(symbol):
+        raise ConnectionError('upstream down')
+
+    monkeypatch.setattr(ak, 'stock_value_em', failing)
+    assert gateway.call('stock_value_em', symbol='600000')['PE'].tolist() == [10.0]
+    with pytest.raises(ConnectionError):
+        gateway.call('stock_value_em', symbol='600001')
+    assert gateway.stats()['functions']['stock_value_em']['stale_served'] == 1
+
+
+def test_uncached_calls_do_not_fill_cache(calls):
+    """测试use_cache=False的调用总是请求上游且不写入缓存，不挤出常用条目"""
+    gateway = AkshareGateway(calendar=AlwaysOpenCalendar(), max_entries=2)
+    gateway.call('stock_value_em', symbol='600000')
+    for symbol in ('600001', '600002', '600003'):
+        gateway.call('stock_value_em', use_cache=False, symbol=symbol)
+    assert gateway.stats()['entries'] == 1
+
+    gateway.call('stock_value_em', symbol='600000')
+    gateway.call('stock_value_em', symbol='600001')
+    assert calls == ['600000', '600001', '600002', '600003', '600001']
@@ -0,0 +1,156 @@
+#!/usr/bin/env python3
+"""
+向量化回测引擎测试
+"""
+
+import time
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from data_handlers.backtest import (
+    BarPanel, CostModel, backtest_strategy, low_turnover, run_backtest, signal_to_weights
+)
+from data_handlers.bar_warehouse import BAR_FIELD_NAMES, DailyBars
+
+NO_COSTS = CostModel(0.0, 0.0, 0.0)
+
+
+def make_panel(close, symbols=None, volume=None, turnover_rate=None, amount=None):
+    """由不复权收盘价矩阵构建日线矩阵，无除权，涨跌幅按前收盘计算"""
+    close = np.asarray(close, dtype=float)
+    days, size = close.shape
+    prev = np.vstack([close[:1], close[:-1]])
+    fields = {
+        'close': close,
+        'high': close,
+        'low': close,
+        'volume': np.ones((days, size)) if volume is None else np.asarray(volume, dtype=float),
+        'amount': np.full((days, size), 2e8) if amount is None else amount,
+        'change_percent': (close / prev - 1) * 100,
+        'turnover_rate': np.full((days, size), 2.0) if turnover_rate is None else turnover_rate,
+        'adj_close': close,
+    }
+    dates = pd.bdate_range('2024-01-01', periods=days).strftime('%Y%m%d').astype(np.int32).to_numpy()
+    return BarPanel(dates, symbols or [f'{600000 + i:06d}' for i in range(size)], fields)
+
+
+def test_costs_and_equity():
+    """测试目标权重次日成交、净值计算与买卖成本"""
+    panel = make_panel([[10, 10], [10, 10], [11, 10], [11, 10], [11, 10]])
+    weights = np.zeros((5, 2))
+    weights[0, 0] = 1.0
+
+    result = run_backtest(panel, weights, costs=NO_COSTS)
+    # 第1日收盘买入，第2日上涨10%后收盘卖出
+    assert result['equity'] == pytest.approx([1, 1, 1.1, 1.1, 1.1])
+    assert result['turnover'] == pytest.approx([0, 0.5, 0.5, 0, 0])
+    assert result['stats']['total_return'] == pytest.approx(0.1)
+
+    costs = CostModel(commission=0.001, stamp_duty=0.001, slippage=0.0)
+    result = run_backtest(panel, weights, costs=costs)
+    # 全仓买入时买入金额与佣金之和等于现金
+    after_buy = 1 / 1.001
+    assert result['equity'][1] == pytest.approx(after_buy)
+    assert result['equity'][-1] == pytest.approx(after_buy * 1.1 * (1 - 0.002))
+    assert result['stats']['total_cost'] == pytest.approx(0.001 / 1.001 + 0.002)
+
+
+def test_chinext_limit_depends_on_date():
+    """测试创业板2020-08-24之前按10%、之后按20%判断涨跌停"""
+    close = [[10, 10], [11, 11], [12.1, 12.1]]
+    panel = make_panel(close, symbols=['300001', '600000'])
+    panel.dates = np.array([20200820, 20200821, 20200824], dtype=np.int32)
+    up, down = panel.limit_flags()
+    assert up[1].tolist() == [True, True]
+    assert up[2].tolist() == [False, True]
+    assert not down.any()
+
+    panel = make_panel([[10], [12], [9.6]], symbols=['300001'])
+    panel.dates = np.array([20200824, 20200825, 20200826], dtype=np.int32)
+    up, down = panel.limit_flags()
+    assert up[:, 0].tolist() == [False, True, False] and down[:, 0].tolist() == [False, False, True]
+
+
+def test_limit_and_suspension_constraints():
+    """测试涨停不能买入、跌停不能卖出、停牌不能交易与T+1"""
+    # 股票0第1日涨停、股票1第1日停牌，第2日起均可买入
+    panel = make_panel([[10, 10], [11, 10], [11, 10], [9.9, 10], [9.9, 10], [10, 10]],
+                       volume=[[1, 1], [1, 0], [1, 1], [1, 1], [1, 1], [1, 1]])
+    weights = np.zeros((6, 2))
+    weights[0] = [0.5, 0.5]
+    weights[1] = [0.5, 0.5]
+    result = run_backtest(panel, weights, costs=NO_COSTS)
+    assert result['blocked_trades']['limit_up'] == 1
+    assert result['blocked_trades']['suspended'] == 1
+    # 股票0第3日跌停无法卖出，第4日卖出
+    assert result['blocked_trades']['limit_down'] == 1
+    assert result['holdings'] == [0, 0, 2, 1, 0, 0]
+    assert result['equity'][-1] == pytest.approx(0.5 * 0.9 + 0.5)
+
+    # 最短持有2日时第3日买入的仓位第4日不能卖出
+    weights = np.zeros((6, 2))
+    weights[2] = [0, 1]
+    result = run_backtest(panel, weights, costs=NO_COSTS, min_hold_days=2)
+    assert result['holdings'] == [0, 0, 0, 1, 1, 0]
+    assert result['blocked_trades']['t_plus_1'] == 1
+
+
+def test_signal_weights_and_low_turnover_strategy():
+    """测试按信号选股等权、低换手率条件，以及从日线仓库加载矩阵回测"""
+    signal = np.array([[3, 1, np.nan, 2], [np.nan, np.nan, np.nan, 5]])
+    weights = signal_to_weights(signal, 2, ascending=True)
+    assert weights.tolist() == [[0, 0.5, 0, 0.5], [0, 0, 0, 1]]
+
+    close = np.full((3, 4), 20.0)
+    close[:, 3] = 80.0
+    turnover_rate = np.array([[0.5, 2, 4, 2]] * 3)
+    amount = np.array([[1e8, 3e8, 3e8, 3e8]] * 3)
+    panel = make_panel(close, turnover_rate=turnover_rate, amount=amount)
+    # 流通市值 = 成交额 / 换手率：股票1为150亿，股票2为75亿
+    eligible = ~np.isnan(low_turnover(panel))
+    assert eligible[0].tolist() == [False, True, False, False]
+
+    class FakeWarehouse:
+        def __init__(self, bars):
+            self.bars = bars
+
+        def symbols(self):
+            return sorted(self.bars)
+
+        def get_bars(self, symbol, start_date=None, end_date=None, adjust='qfq', sync=True):
+            return self.bars[symbol].between(start_date, end_date)
+
+    dates = pd.bdate_range('2024-01-01', periods=10).strftime('%Y%m%d').astype(np.int32).to_numpy()
+    bars = {}
+    for j, symbol in enumerate(['600000', '600001']):
+        # 股票600001从第3日开始才有日线
+        length = len(dates) - 2 * j
+        columns = {name: np.full(length, 15.0 + j) for name in BAR_FIELD_NAMES}
+        columns.update(date=dates[2 * j:], turnover_rate=np.full(length, 2.0), amount=np.full(length, 3e8),
+                       change_percent=np.zeros(length))
+        bars[symbol] = DailyBars(symbol, 'none', columns)
+    result = backtest_strategy('low_turnover', {'max_price': '60'}, top_n=2, rebalance_days=1,
+                               warehouse=FakeWarehouse(bars))
+    assert result['symbols'] == 2
+    assert result['stats']['days'] == 10
+    assert result['holdings'][:4] == [0, 1, 1, 2]
+    with pytest.raises(ValueError):
+        backtest_strategy('unknown')
+
+
+def test_whole_market_speed():
+    """测试全市场多年回测在数秒内完成"""
+    rng = np.random.default_rng(0)
+    days, size = 1250, 2000
+    close = 20 * np.exp(np.cumsum(rng.normal(0, 0.02, (days, size)), axis=0))
+    panel = make_panel(close, turnover_rate=rng.uniform(0.5, 8, (days, size)),
+                       amount=rng.uniform(1e8, 1e9, (days, size)))
+
+    start = time.perf_counter()
+    weights = signal_to_weights(low_turnover(panel), 50, ascending=True)
+    result = run_backtest(panel, weights, rebalance_days=5)
+    assert time.perf_counter() - start < 5
+    assert result['stats']['avg_holdings'] > 40
+    assert result['stats']['max_drawdown'] < 0
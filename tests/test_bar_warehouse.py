@@ -0,0 +1,134 @@
+#!/usr/bin/env python3
+"""
+A股日线仓库测试
+"""
+
+import pandas as pd
+import pytest
+
+from data_handlers.bar_warehouse import BarWarehouse
+
+
+class FakeGateway:
+    """按复权方式返回固定日线数据的网关，按start_date截取"""
+
+    def __init__(self, bars):
+        self.bars = bars
+        self.requests = []
+
+    def call(self, func_name, use_cache=True, rate_limiter=None, **kwargs):
+        self.requests.append(kwargs)
+        bars = self.bars[kwargs['adjust']]
+        start = pd.to_datetime(kwargs['start_date'])
+        return bars[pd.to_datetime(bars['日期']) >= start].reset_index(drop=True)
+
+
+def make_bars(dates, closes, opens=None):
+    return pd.DataFrame({
+        '日期': [pd.Timestamp(d).date() for d in dates],
+        '股票代码': '600000',
+        '开盘': opens or closes,
+        '收盘': closes,
+        '最高': [c + 1 for c in closes],
+        '最低': [c - 1 for c in closes],
+        '成交量': [1000] * len(closes),
+        '成交额': [1e6] * len(closes),
+        '振幅': [1.0] * len(closes),
+        '涨跌幅': [0.5] * len(closes),
+        '涨跌额': [0.1] * len(closes),
+        '换手率': [0.2] * len(closes),
+    })
+
+
+DATES = ['2024-01-02', '2024-01-03', '2024-01-04']
+
+
+@pytest.fixture
+def warehouse(tmp_path):
+    gateway = FakeGateway({
+        '': make_bars(DATES, [10.0, 10.5, 9.0]),
+        'hfq': make_bars(DATES, [20.0, 21.0, 18.0]),
+    })
+    return BarWarehouse(root=str(tmp_path / 'bars'), gateway=gateway)
+
+
+def test_range_read_and_adjust(warehouse):
+    """测试区间读取以及由后复权换算前复权"""
+    bars = warehouse.get_bars('600000', '2024-01-03', '20240104', adjust='none')
+    assert [bar['date'] for bar in bars.to_records()] == ['2024-01-03', '2024-01-04']
+    assert bars.column('close').tolist() == [10.5, 9.0]
+
+    qfq = warehouse.get_bars('600000', adjust='qfq')
+    assert qfq.column('close').tolist() == [10.0, 10.5, 9.0]
+    assert qfq.column('high').tolist() == [10.5, 11.0, 9.5]
+    assert warehouse.latest('600000')['close'] == 9.0
+
+    # 查询区间已在本地覆盖时不访问上游
+    requests = len(warehouse.gateway.requests)
+    warehouse.get_bars('600000', '2024-01-02', '2024-01-03', adjust='hfq')
+    assert len(warehouse.gateway.requests) == requests
+
+
+def test_incremental_sync(warehouse):
+    """测试增量同步只请求最后一根已存K线之后的数据"""
+    warehouse.sync('600000')
+    assert warehouse.sync('600000')['synced'] is False
+
+    # 最后一根已存K线的收盘价在盘中更新，开盘价不变
+    warehouse.gateway.bars = {
+        '': make_bars(DATES + ['2024-01-05'], [10.0, 10.5, 9.1, 9.5], opens=[10.0, 10.5, 9.0, 9.5]),
+        'hfq': make_bars(DATES + ['2024-01-05'], [20.0, 21.0, 18.2, 19.0], opens=[20.0, 21.0, 18.0, 19.0]),
+    }
+    result = warehouse.sync('600000', force=True)
+    assert warehouse.gateway.requests[-1]['start_date'] == '20240104'
+    assert result['none'] == {'rows': 2, 'last_date': 20240105}
+
+    bars = warehouse.get_bars('600000', adjust='none', sync=False)
+    assert bars.column('close').tolist() == [10.0, 10.5, 9.1, 9.5]
+    assert warehouse.meta('600000')['hfq']['rows'] == 4
+
+
+def test_resync_when_history_changes(warehouse):
+    """测试重叠K线与已存数据不一致时重新全量同步"""
+    warehouse.sync('600000')
+    warehouse.gateway.bars = dict(warehouse.gateway.bars, hfq=make_bars(DATES, [40.0, 42.0, 36.0]))
+    warehouse.sync('600000', force=True)
+
+    assert warehouse.gateway.requests[-1]['start_date'] == '19900101'
+    hfq = warehouse.get_bars('600000', adjust='hfq', sync=False)
+    assert hfq.column('close').tolist() == [40.0, 42.0, 36.0]
+
+
+def test_failed_resync_keeps_local_bars(warehouse):
+    """测试历史口径变化后的全量同步失败时本地日线保持可读"""
+    warehouse.sync('600000')
+    warehouse.gateway.bars = dict(warehouse.gateway.bars, hfq=make_bars(DATES, [40.0, 42.0, 36.0]))
+    call = warehouse.gateway.call
+
+    def failing_full_history(func_name, **kwargs):
+        if kwargs['start_date'] == '19900101':
+            raise TimeoutError('upstream timeout')
+        return call(func_name, **kwargs)
+
+    warehouse.gateway.call = failing_full_history
+    with pytest.raises(TimeoutError):
+        warehouse.sync('600000', force=True)
+    assert warehouse.get_bars('600000', adjust='hfq', sync=False).column('close').tolist() == [20.0, 21.0, 18.0]
+    assert warehouse.get_bars('600000', adjust='qfq', sync=False) is not None
+
+
+def test_write_switches_version_without_renaming_mapped_files(warehouse):
+    """测试写入新版本后切换meta.json，已映射的旧版本仍可读取，只保留当前与上一版本"""
+    warehouse.sync('600000')
+    mapped = warehouse.get_bars('600000', adjust='none', sync=False)
+    directory = warehouse.root / 'none' / '600000'
+
+    for closes in ([10.0, 10.5, 9.2], [10.0, 10.5, 9.3]):
+        warehouse.gateway.bars = dict(warehouse.gateway.bars, **{'': make_bars(DATES, closes, opens=[10.0, 10.5, 9.0])})
+        warehouse.sync('600000', force=True)
+
+    assert mapped.column('close').tolist() == [10.0, 10.5, 9.0]
+    assert warehouse.get_bars('600000', adjust='none', sync=False).column('close').tolist() == [10.0, 10.5, 9.3]
+    assert warehouse.meta('600000')['none']['version'] == 3
+    assert sorted(path.name for path in directory.glob('close*.npy')) == ['close.2.npy', 'close.3.npy']
+    assert not list(directory.glob('*.tmp'))
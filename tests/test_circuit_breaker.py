@@ -0,0 +1,62 @@
+#!/usr/bin/env python3
+"""
+熔断器与负缓存测试
+"""
+
+import time
+
+import pytest
+
+from utils.circuit_breaker import CLOSED, HALF_OPEN, OPEN, CircuitBreaker, CircuitOpenError, NegativeCache
+
+
+def failing():
+    raise ConnectionError('upstream down')
+
+
+def test_breaker_opens_after_threshold_and_fails_fast():
+    """测试连续失败后熔断，熔断期间不再调用上游"""
+    breaker = CircuitBreaker('test', failure_threshold=2, base_backoff=60, jitter=0)
+    for _ in range(2):
+        with pytest.raises(ConnectionError):
+            breaker.call(failing)
+    assert breaker.state == OPEN
+
+    calls = []
+    with pytest.raises(CircuitOpenError):
+        breaker.call(lambda: calls.append(1))
+    assert calls == []
+    assert breaker.stats()['rejected'] == 1
+
+
+def test_half_open_probe_and_exponential_backoff():
+    """测试半开状态只放行一次试探，试探失败后退避时间加倍，成功后关闭"""
+    breaker = CircuitBreaker('test', failure_threshold=1, base_backoff=10, jitter=0)
+    with pytest.raises(ConnectionError):
+        breaker.call(failing)
+    first_backoff = breaker.open_until - time.time()
+
+    breaker.open_until = 0
+    assert breaker.allow()
+    assert breaker.state == HALF_OPEN
+    assert not breaker.allow()
+
+    breaker.record_failure(ConnectionError('still down'))
+    assert breaker.state == OPEN
+    assert breaker.open_until - time.time() == pytest.approx(first_backoff * 2, abs=1)
+
+    breaker.open_until = 0
+    assert breaker.call(lambda: 'ok') == 'ok'
+    assert breaker.state == CLOSED
+    assert breaker.open_count == 0
+
+
+def test_negative_cache_expires():
+    """测试负缓存到期后失效"""
+    cache = NegativeCache(ttl_seconds=60)
+    cache.add('600000')
+    assert '600000' in cache
+    assert '600001' not in cache
+
+    cache._expires['600000'] = time.time() - 1
+    assert '600000' not in cache
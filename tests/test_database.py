@@ -0,0 +1,36 @@
+#!/usr/bin/env python3
+"""
+SQLite连接管理测试
+"""
+
+import pytest
+
+from utils.database import SQLiteConnectionManager
+
+
+@pytest.fixture
+def db(tmp_path):
+    """创建测试用连接池"""
+    manager = SQLiteConnectionManager(str(tmp_path / 'test.db'), pool_size=2)
+    with manager.transaction() as conn:
+        conn.execute('CREATE TABLE items (id INTEGER PRIMARY KEY, value TEXT)')
+    yield manager
+    manager.close_all()
+
+def test_connection_is_tuned_and_reused(db):
+    """测试连接参数设置及连接复用"""
+    with db.connection() as conn:
+        first = conn
+        assert conn.execute('PRAGMA journal_mode').fetchone()[0] == 'wal'
+        assert conn.execute('PRAGMA synchronous').fetchone()[0] == 1  # NORMAL
+    with db.connection() as conn:
+        assert conn is first
+
+def test_transaction_rollback(db):
+    """测试事务异常回滚"""
+    with pytest.raises(RuntimeError):
+        with db.transaction() as conn:
+            conn.execute("INSERT INTO items (value) VALUES ('a')")
+            raise RuntimeError('boom')
+    with db.connection() as conn:
+        assert conn.execute('SELECT COUNT(*) FROM items').fetchone()[0] == 0
@@ -0,0 +1,76 @@
+#!/usr/bin/env python3
+"""
+指数日线存储测试
+"""
+
+import pandas as pd
+import pytest
+
+from data_handlers.index_history import IndexHistoryStore, index_symbol
+
+
+class FakeGateway:
+    """返回固定日线数据的网关，按start_date截取"""
+
+    def __init__(self, bars):
+        self.bars = bars
+        self.requests = []
+
+    def call(self, func_name, use_cache=True, **kwargs):
+        self.requests.append(kwargs)
+        start = pd.to_datetime(kwargs['start_date'])
+        return self.bars[pd.to_datetime(self.bars['date']) >= start].reset_index(drop=True)
+
+
+def make_bars(dates, closes):
+    return pd.DataFrame({
+        'date': dates,
+        'open': closes,
+        'close': closes,
+        'high': [c + 10 for c in closes],
+        'low': [c - 10 for c in closes],
+        'volume': [1e8] * len(closes),
+        'amount': [1e11] * len(closes),
+    })
+
+
+@pytest.fixture
+def store(tmp_path):
+    gateway = FakeGateway(make_bars(['2024-01-02', '2024-01-03', '2024-01-04'], [3000.0, 3030.0, 3000.0]))
+    return IndexHistoryStore(db_path=str(tmp_path / 'market_data.db'), gateway=gateway)
+
+
+def test_index_symbol():
+    """测试指数代码映射"""
+    assert index_symbol('000001') == 'sh000001'
+    assert index_symbol('399001') == 'sz399001'
+    assert index_symbol('csi931151') == 'csi931151'
+
+
+def test_bars_with_derived_columns(store):
+    """测试入库时计算衍生指标，按日期区间查询"""
+    bars = store.get_bars('000001', '2024-01-03', '2024-01-04')
+    assert [bar['date'] for bar in bars] == ['2024-01-03', '2024-01-04']
+    assert bars[0]['涨跌额'] == 30.0
+    assert bars[0]['涨跌幅'] == 1.0
+    assert bars[1]['振幅'] == round(20 * 100 / 3030, 2)
+    assert store.gateway.requests[0]['symbol'] == 'sh000001'
+
+
+def test_incremental_sync(store):
+    """测试增量同步只请求最后一根已存K线之后的数据，并以已存收盘价计算衍生指标"""
+    store.sync('000001')
+    store.gateway.bars = make_bars(['2024-01-02', '2024-01-03', '2024-01-04', '2024-01-05'],
+                                   [3000.0, 3030.0, 3010.0, 3040.1])
+
+    # 有效期内不重复同步
+    assert store.sync('000001')['synced'] is False
+    result = store.sync('000001', force=True)
+    assert store.gateway.requests[-1]['start_date'] == '20240104'
+    assert result['rows'] == 2
+
+    bars = store.get_bars('000001', '2024-01-01', '2024-12-31')
+    assert len(bars) == 4
+    assert bars[2]['收盘'] == 3010.0
+    assert bars[2]['涨跌额'] == -20.0
+    assert bars[3]['涨跌幅'] == round(30.1 * 100 / 3010, 2)
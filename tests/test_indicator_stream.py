@@ -0,0 +1,150 @@
+#!/usr/bin/env python3
+"""
+技术指标流式更新测试
+"""
+
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from data_handlers import indicators
+from data_handlers.bar_warehouse import BAR_FIELD_NAMES, DailyBars
+from data_handlers.indicator_stream import DEFAULT_STREAM_INDICATORS, IndicatorStream
+from data_handlers.stock_snapshot import StockSnapshot
+from utils.trading_calendar import CHINA_TZ, TradingCalendar
+
+
+def make_bars(symbol, length, seed):
+    rng = np.random.default_rng(seed)
+    close = 10 + np.cumsum(rng.normal(0, 0.2, length))
+    columns = {name: np.zeros(length) for name in BAR_FIELD_NAMES}
+    columns.update({
+        'date': pd.bdate_range('2023-01-02', periods=length).strftime('%Y%m%d').astype(np.int32).to_numpy(),
+        'close': close,
+        'open': close,
+        'high': close + rng.uniform(0, 0.3, length),
+        'low': close - rng.uniform(0, 0.3, length),
+        'volume': rng.uniform(1e3, 1e4, length),
+    })
+    return DailyBars(symbol, 'qfq', columns)
+
+
+class FakeWarehouse:
+    def __init__(self, bars):
+        self.bars = bars
+
+    def get_bars(self, symbol, adjust='qfq', sync=True):
+        return self.bars.get(symbol)
+
+
+def expected_last(bars):
+    """按批量实现计算全部历史，取最后一根K线的指标值"""
+    inputs = {field: np.asarray(bars.column(field)) for field in ('close', 'high', 'low', 'volume')}
+    result = {}
+    for label in DEFAULT_STREAM_INDICATORS.split(','):
+        name, params = indicators.parse_indicator_label(label)
+        spec = indicators.INDICATORS[name]
+        outputs = spec.func(*(inputs[field] for field in spec.inputs), **dict(params))
+        result[label] = {output: values[-1] for output, values in outputs.items()}
+    return result
+
+
+def assert_matches(actual, expected):
+    for name, outputs in expected.items():
+        for output, value in outputs.items():
+            assert actual[name][output] == pytest.approx(round(value, 4), abs=1e-3), (name, output)
+
+
+@pytest.fixture
+def full():
+    return {'600000': make_bars('600000', 120, 1), '600001': make_bars('600001', 140, 2)}
+
+
+@pytest.fixture
+def stream(tmp_path, full):
+    bars = {code: value.tail(len(value)) for code, value in full.items()}
+    bars['600000'] = full['600000'].between(None, int(full['600000'].column('date')[99]))
+    stream = IndicatorStream(warehouse=FakeWarehouse(bars), checkpoint_path=str(tmp_path / 'state.npz'),
+                             calendar=TradingCalendar(holidays=[]))
+    stream.seed(['600000', '600001'])
+    return stream
+
+
+def test_advance_matches_batch(stream, full):
+    """测试回放初始化后逐根推进的结果与全量批量计算一致"""
+    assert_matches(stream.latest('600001')['indicators'], expected_last(full['600001']))
+
+    stream.warehouse.bars['600000'] = full['600000']
+    assert stream.on_bars('600000') == 20
+    assert stream.on_bars('600000') == 0
+    latest = stream.latest('600000')
+    assert latest['date'] == full['600000'].last_date
+    assert_matches(latest['indicators'], expected_last(full['600000']))
+
+
+def test_snapshot_peek_does_not_commit(stream, full):
+    """测试快照试算结果等同于提交同一根K线，且不修改状态"""
+    before = stream.latest('600000')['indicators']
+    bar = full['600000'].between(int(full['600000'].column('date')[100]), int(full['600000'].column('date')[100]))
+    record = {name: 0 for name in ('change_percent', 'change_amount', 'amount', 'amplitude', 'open', 'close',
+                                   'volume_ratio', 'turnover_rate', 'pe_ratio', 'pb_ratio', 'total_market_cap',
+                                   'circulation_market_cap', 'speed', 'change_5min', 'change_60day', 'change_ytd')}
+    records = [
+        dict(record, code='600000', name='A', latest_price=bar.column('close')[0], high=bar.column('high')[0],
+             low=bar.column('low')[0], volume=int(bar.column('volume')[0]), timestamp=''),
+        dict(record, code='600001', name='B', latest_price=11.0, high=11.5, low=10.5, volume=100, timestamp=''),
+    ]
+    fetched_at = datetime.strptime(bar.last_date, '%Y-%m-%d').replace(hour=10, tzinfo=CHINA_TZ).timestamp()
+    result = stream.update_from_snapshot(StockSnapshot.from_records(records, fetched_at=fetched_at))
+
+    # 600001的日线已到快照日期及之后，不再试算
+    assert result['pending'] == 1
+    assert stream.latest('600001')['live'] is None
+    live = stream.latest('600000')
+    assert live['indicators'] == before
+    assert live['live']['date'] == bar.last_date
+    expected = expected_last(full['600000'].between(None, bar.last_date))
+    # 快照成交量取整，OBV允许误差
+    expected.pop('obv')
+    assert_matches(live['live']['indicators'], expected)
+
+
+def test_snapshot_outside_session_not_pending(stream, full):
+    """测试周末与开盘前的快照归属上一交易日，已提交该日日线的股票不重复试算"""
+    last = stream.latest('600001')
+    assert last['date'] == '2023-07-14'  # 周五
+    record = {name: 0 for name in ('change_percent', 'change_amount', 'amount', 'amplitude', 'open', 'close',
+                                   'volume_ratio', 'turnover_rate', 'pe_ratio', 'pb_ratio', 'total_market_cap',
+                                   'circulation_market_cap', 'speed', 'change_5min', 'change_60day', 'change_ytd')}
+    records = [dict(record, code='600001', name='B', latest_price=11.0, high=11.5, low=10.5, volume=100, timestamp='')]
+
+    for moment in (datetime(2023, 7, 15, 10, 0), datetime(2023, 7, 17, 8, 30)):
+        fetched_at = moment.replace(tzinfo=CHINA_TZ).timestamp()
+        result = stream.update_from_snapshot(StockSnapshot.from_records(records, fetched_at=fetched_at))
+        assert result['pending'] == 0, moment
+        assert stream.latest('600001')['live'] is None
+        assert stream.latest('600001')['indicators'] == last['indicators']
+
+    # 周一开盘后的快照为新交易日的未收盘K线
+    fetched_at = datetime(2023, 7, 17, 9, 35, tzinfo=CHINA_TZ).timestamp()
+    assert stream.update_from_snapshot(StockSnapshot.from_records(records, fetched_at=fetched_at))['pending'] == 1
+    assert stream.latest('600001')['live']['date'] == '2023-07-17'
+
+
+def test_checkpoint_and_reseed_on_adjustment(stream, full, tmp_path):
+    """测试检查点恢复，以及前复权历史变化时重新初始化"""
+    stream.save_checkpoint()
+    restored = IndicatorStream(warehouse=stream.warehouse, checkpoint_path=str(tmp_path / 'state.npz'))
+    assert restored.load_checkpoint()
+    assert restored.latest('600000') == stream.latest('600000')
+
+    # 除权后前复权价格整体变化
+    columns = {name: np.asarray(full['600000'].column(name)).copy() for name in BAR_FIELD_NAMES}
+    for name in ('close', 'high', 'low', 'open'):
+        columns[name] *= 0.9
+    adjusted = DailyBars('600000', 'qfq', columns)
+    restored.warehouse.bars['600000'] = adjusted
+    restored.on_bars('600000')
+    assert_matches(restored.latest('600000')['indicators'], expected_last(adjusted))
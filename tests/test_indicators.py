@@ -0,0 +1,121 @@
+#!/usr/bin/env python3
+"""
+技术指标引擎测试
+"""
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from data_handlers.bar_warehouse import BAR_FIELD_NAMES, DailyBars
+from data_handlers import indicators
+from data_handlers.indicators import IndicatorEngine, resolve_params
+
+
+def make_bars(symbol, length, seed):
+    rng = np.random.default_rng(seed)
+    close = 10 + np.cumsum(rng.normal(0, 0.2, length))
+    columns = {name: np.zeros(length) for name in BAR_FIELD_NAMES}
+    columns.update({
+        'date': (pd.bdate_range('2023-01-02', periods=length).strftime('%Y%m%d').astype(np.int32)).to_numpy(),
+        'close': close,
+        'open': close,
+        'high': close + rng.uniform(0, 0.3, length),
+        'low': close - rng.uniform(0, 0.3, length),
+        'volume': rng.uniform(1e3, 1e4, length),
+    })
+    return DailyBars(symbol, 'qfq', columns)
+
+
+class FakeWarehouse:
+    def __init__(self, bars):
+        self.bars = bars
+        self.loads = 0
+        self.versions = {}
+
+    def get_bars(self, symbol, adjust='qfq', sync=True):
+        self.loads += 1
+        return self.bars.get(symbol)
+
+    def meta(self, symbol):
+        return {'none': {'version': self.versions.get(symbol, 1)}, 'hfq': {'version': self.versions.get(symbol, 1)}}
+
+    def symbols(self):
+        return sorted(self.bars)
+
+
+def test_indicators_match_pandas():
+    """测试指标与pandas参考实现一致"""
+    close = make_bars('600000', 120, 1).column('close')
+    series = pd.Series(close)
+
+    np.testing.assert_allclose(indicators.sma(close, 10)['ma'], series.rolling(10).mean(), equal_nan=True)
+    np.testing.assert_allclose(indicators.ema(close, 12)['ema'], series.ewm(span=12, adjust=False).mean())
+
+    band = indicators.boll(close, 20, 2.0)
+    std = series.rolling(20).std(ddof=0)
+    np.testing.assert_allclose(band['upper'], series.rolling(20).mean() + 2 * std, equal_nan=True)
+
+    result = indicators.macd(close)
+    dif = series.ewm(span=12, adjust=False).mean() - series.ewm(span=26, adjust=False).mean()
+    np.testing.assert_allclose(result['dif'], dif)
+    np.testing.assert_allclose(result['dea'], dif.ewm(span=9, adjust=False).mean())
+
+    value = indicators.rsi(close, 14)['rsi']
+    assert np.isnan(value[0]) and np.all((value[1:] >= 0) & (value[1:] <= 100))
+
+
+def test_panel_matches_single_symbol():
+    """测试二维矩阵逐列结果与单只股票计算一致，缺失的前段为NaN"""
+    a = make_bars('600000', 80, 2)
+    b = make_bars('600001', 60, 3)
+    panel = np.full((80, 2), np.nan)
+    panel[:, 0] = a.column('close')
+    panel[20:, 1] = b.column('close')
+
+    for func in (indicators.macd, indicators.rsi, lambda x: indicators.sma(x, 5), lambda x: indicators.boll(x)):
+        combined = func(panel)
+        for output, values in func(b.column('close')).items():
+            np.testing.assert_allclose(combined[output][20:, 1], values, equal_nan=True)
+            assert np.all(np.isnan(combined[output][:20, 1]))
+        for output, values in func(a.column('close')).items():
+            np.testing.assert_allclose(combined[output][:, 0], values, equal_nan=True)
+
+
+def test_engine_cache_and_batch():
+    """测试结果按最后K线日期缓存，批量计算取各股票最新值"""
+    bars = {'600000': make_bars('600000', 100, 4), '600001': make_bars('600001', 30, 5)}
+    warehouse = FakeWarehouse(bars)
+    engine = IndicatorEngine(warehouse=warehouse)
+
+    first = engine.series('600000', 'kdj', {'n': '9'}, start_date='2023-05-01')
+    engine.series('600000', 'kdj', {'n': 9, 'm1': 3})
+    assert engine.stats()['hits'] == 1
+    assert first['dates'][0] >= '2023-05-01'
+    assert len(first['values']['k']) == len(first['dates'])
+
+    # 有新K线时重新计算
+    bars['600000'] = make_bars('600000', 101, 4)
+    before = engine.series('600000', 'kdj')
+    assert engine.stats()['misses'] == 2
+
+    # 盘中重写同一日期的最后一根K线（或复权后重写全部历史）时仓库版本变化，重新计算
+    rewritten = make_bars('600000', 101, 4)
+    rewritten.column('close')[-1] += 1
+    bars['600000'] = rewritten
+    warehouse.versions['600000'] = 2
+    after = engine.series('600000', 'kdj')
+    assert engine.stats()['misses'] == 3
+    assert after['dates'] == before['dates'] and after['values']['k'][-1] != before['values']['k'][-1]
+    engine.series('600000', 'kdj')
+    assert engine.stats()['hits'] == 2
+
+    batch = engine.batch('ma', {'n': 20}, lookback=50)
+    assert batch['total'] == 2
+    expected = indicators.sma(bars['600001'].column('close'), 20)['ma'][-1]
+    assert batch['items'][1]['ma'] == round(expected, 4)
+
+    with pytest.raises(ValueError):
+        resolve_params('unknown')
+    with pytest.raises(ValueError):
+        resolve_params('ma', {'n': '0'})
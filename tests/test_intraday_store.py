@@ -0,0 +1,194 @@
+#!/usr/bin/env python3
+"""
+A股分钟线存储测试
+"""
+
+from datetime import date, datetime
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from data_handlers.intraday_store import IntradayStore, resample, to_minute_int
+from utils.trading_calendar import CHINA_TZ
+
+DAYS = ['2024-03-04', '2024-03-05', '2024-03-06', '2024-03-07', '2024-03-08', '2024-03-11']
+
+
+def make_minutes(day, seed=0):
+    """一个交易日的1分钟线：09:30集合竞价及上下午各120根"""
+    times = [pd.Timestamp(f'{day} 09:30')]
+    times += list(pd.date_range(f'{day} 09:31', f'{day} 11:30', freq='min'))
+    times += list(pd.date_range(f'{day} 13:01', f'{day} 15:00', freq='min'))
+    rng = np.random.default_rng(seed)
+    close = 10 + np.cumsum(rng.normal(0, 0.01, len(times)))
+    return pd.DataFrame({
+        '时间': [t.strftime('%Y-%m-%d %H:%M:%S') for t in times],
+        '开盘': close - 0.005,
+        '收盘': close,
+        '最高': close + 0.01,
+        '最低': close - 0.01,
+        '成交量': rng.integers(100, 1000, len(times)).astype(float),
+        '成交额': rng.uniform(1e4, 1e5, len(times)),
+        '均价': close,
+    })
+
+
+class FakeGateway:
+    """返回固定分钟线的网关，按start_date截取（含）"""
+
+    def __init__(self, frame):
+        self.frame = frame
+        self.requests = []
+
+    def call(self, func_name, use_cache=True, **kwargs):
+        self.requests.append(kwargs)
+        return self.frame[pd.to_datetime(self.frame['时间']) >= pd.to_datetime(kwargs['start_date'])]
+
+
+class StaleCalendar:
+    def __init__(self, now=None):
+        self.now = now
+
+    def is_fresh(self, kind, fetched_at):
+        return False
+
+    def to_local(self, ts=None):
+        return self.now
+
+
+@pytest.fixture
+def frame():
+    return pd.concat([make_minutes(day, seed) for seed, day in enumerate(DAYS)], ignore_index=True)
+
+
+@pytest.fixture
+def store(tmp_path, frame, monkeypatch):
+    monkeypatch.setenv('INTRADAY_1M_RETENTION_DAYS', '2')
+    monkeypatch.setenv('INTRADAY_5M_RETENTION_DAYS', '4')
+    return IntradayStore(root=str(tmp_path / 'intraday'), gateway=FakeGateway(frame), calendar=StaleCalendar())
+
+
+def test_append_only_completed_bars(store, frame):
+    """测试只追加已完成的K线，增量同步从最后一根已存K线开始，已结束交易日的块合并"""
+    store.gateway.frame = frame[frame['时间'] < '2024-03-05']
+    store.sync('603696', now=datetime(2024, 3, 4, 10, 0, 30))
+    bars = store.get_bars('603696', '2024-03-04', '2024-03-04', sync=False)
+    assert bars['time'][-1] == 202403041000
+    assert len(bars['time']) == 31
+
+    store.sync('603696', now=datetime(2024, 3, 4, 15, 5))
+    assert store.gateway.requests[-1]['start_date'] == '2024-03-04 10:00:00'
+    assert store.meta('603696')['tiers']['1m']['chunks'] == 2
+
+    store.gateway.frame = frame[frame['时间'] < '2024-03-06']
+    store.sync('603696', now=datetime(2024, 3, 5, 15, 5))
+    meta = store.meta('603696')
+    assert meta['tiers']['1m']['chunks'] == 2
+    assert meta['last_time'] == '2024-03-05 15:00'
+
+    bars = store.get_bars('603696', '2024-03-04 09:00', '2024-03-05 15:00', sync=False)
+    expected = frame[frame['时间'] < '2024-03-06']
+    assert bars['close'].tolist() == pytest.approx(expected['收盘'].tolist())
+
+
+def test_intraday_chunks_merged_and_reads_safe_during_sync(store, frame):
+    """测试当日1分钟块累积到阈值时合并，同步合并删除块期间并发读取不会读到已删除的块"""
+    import threading
+
+    store.merge_chunks = 3
+    store.gateway.frame = frame[frame['时间'] < '2024-03-05']
+    errors = []
+    done = threading.Event()
+
+    def reader():
+        while not done.is_set():
+            try:
+                store.get_bars('603696', '2024-03-04', '2024-03-04', sync=False)
+            except Exception as e:
+                errors.append(e)
+
+    threads = [threading.Thread(target=reader) for _ in range(4)]
+    store.sync('603696', now=datetime(2024, 3, 4, 9, 31))
+    for thread in threads:
+        thread.start()
+    try:
+        for minute in range(32, 92):
+            store.sync('603696', now=datetime(2024, 3, 4, 9 + minute // 60, minute % 60))
+            assert store.meta('603696')['tiers']['1m']['chunks'] < store.merge_chunks
+    finally:
+        done.set()
+        for thread in threads:
+            thread.join()
+
+    assert not errors
+    bars = store.get_bars('603696', '2024-03-04', '2024-03-04', sync=False)
+    assert bars['time'][-1] == 202403041031 and len(bars['time']) == 62
+
+def test_default_clock_is_china_time(store, frame):
+    """测试未指定时间时按交易日历的北京时间截取已完成K线并整理，与主机时区无关"""
+    store.calendar.now = datetime(2024, 3, 4, 10, 0, 30, tzinfo=CHINA_TZ)
+    store.gateway.frame = frame[frame['时间'] < '2024-03-05']
+    assert store.sync('603696')['last_time'] == '2024-03-04 10:00'
+
+    store.calendar.now = datetime(2024, 3, 11, 15, 5, tzinfo=CHINA_TZ)
+    store.gateway.frame = frame
+    store.sync('603696')
+    assert store.meta('603696')['tiers']['1m']['first_time'] == '2024-03-11 09:30'
+
+
+def test_resample_sessions(frame):
+    """测试集合竞价并入首根K线，30分钟线每日8根"""
+    day = make_minutes(DAYS[0])
+    columns = {
+        'time': pd.to_datetime(day['时间']).dt.strftime('%Y%m%d%H%M').astype(np.int64).to_numpy(),
+        'open': day['开盘'].to_numpy(), 'close': day['收盘'].to_numpy(), 'high': day['最高'].to_numpy(),
+        'low': day['最低'].to_numpy(), 'volume': day['成交量'].to_numpy(), 'amount': day['成交额'].to_numpy(),
+    }
+    five = resample(columns, 5)
+    assert len(five['time']) == 48
+    assert five['time'][0] == 202403040935
+    assert five['volume'][0] == day['成交量'][:6].sum()
+    assert five['open'][0] == day['开盘'][0]
+    assert five['high'][0] == day['最高'][:6].max()
+
+    thirty = resample(five, 30)
+    assert [t % 10000 for t in thirty['time']] == [1000, 1030, 1100, 1130, 1330, 1400, 1430, 1500]
+    assert thirty['volume'].sum() == day['成交量'].sum()
+    assert to_minute_int('2024-03-04', end=True) == 202403042359
+
+
+def test_tiered_compaction_and_reads(store, frame):
+    """测试到期的1分钟线降采样为5分钟线、再降采样为30分钟线，跨级别读取结果一致"""
+    store.sync('603696', now=datetime(2024, 3, 11, 15, 5))
+    counts = store.compact('603696', today=date(2024, 3, 11))
+    assert counts == {'1m': 0, '5m': 0}
+
+    meta = store.meta('603696')
+    # 1分钟线保留3月9日之后，5分钟线保留3月7日之后
+    assert meta['tiers']['1m']['first_time'] == '2024-03-11 09:30'
+    assert meta['tiers']['5m']['first_time'] == '2024-03-07 09:35'
+    assert meta['tiers']['5m']['last_time'] == '2024-03-08 15:00'
+    assert meta['tiers']['30m']['chunks'] == 1
+    assert meta['tiers']['30m']['last_time'] == '2024-03-06 15:00'
+
+    full = {
+        'time': pd.to_datetime(frame['时间']).dt.strftime('%Y%m%d%H%M').astype(np.int64).to_numpy(),
+        'open': frame['开盘'].to_numpy(), 'close': frame['收盘'].to_numpy(), 'high': frame['最高'].to_numpy(),
+        'low': frame['最低'].to_numpy(), 'volume': frame['成交量'].to_numpy(), 'amount': frame['成交额'].to_numpy(),
+    }
+    expected = resample(full, 30)
+    bars = store.get_bars('603696', period='30m', sync=False)
+    for name, values in expected.items():
+        assert bars[name] == pytest.approx(values), name
+
+    # 1分钟线只覆盖保留期，5分钟线由5分钟级别与1分钟级别拼接
+    assert store.get_bars('603696', '2024-03-04', period='1m', sync=False)['time'][0] == 202403110930
+    assert len(store.get_bars('603696', '2024-03-07', period='5m', sync=False)['time']) == 3 * 48
+
+    reads = store.stats()['chunk_reads']
+    store.get_bars('603696', period='30m', sync=False)
+    assert store.stats()['chunk_reads'] == reads
+
+    with pytest.raises(ValueError):
+        store.get_bars('603696', period='15m')
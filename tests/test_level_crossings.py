@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+"""
+整数关口穿越分析测试
+"""
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from data_handlers.level_crossings import LevelCrossingService, analyze_levels
+
+
+def make_dates(length):
+    return pd.bdate_range('2005-01-03', periods=length).strftime('%Y%m%d').astype(np.int64).to_numpy()
+
+
+def reference_breakthroughs(dates, close, step, start_level):
+    """history_file/daily-open-close.py中的原始二次复杂度实现（参数化步长与起始点位）"""
+    dates = pd.to_datetime(dates.astype(str))
+    start_index = next((i for i, price in enumerate(close) if price >= start_level), None)
+    if start_index is None:
+        return []
+    result = []
+    current_level = 0
+    for i in range(start_index, len(close)):
+        target = (int(close[i]) // step) * step
+        if target > current_level:
+            prev_below = next((j for j in range(i - 1, -1, -1) if close[j] < target), None)
+            if prev_below is not None:
+                result.append((target, i, (dates[i] - dates[prev_below]).days, prev_below))
+                current_level = target
+    return result
+
+
+def test_breakthroughs_match_original():
+    """测试突破记录与原始逐个回溯的实现一致"""
+    rng = np.random.default_rng(3)
+    close = np.round(2800 * np.exp(np.cumsum(rng.normal(0.0003, 0.012, 3000))), 2)
+    dates = make_dates(len(close))
+
+    result = analyze_levels(dates, close, 100, start_level=3000)
+    expected = reference_breakthroughs(dates, close, 100, 3000)
+    assert len(expected) > 5
+    assert [(item['level'], item['date'], item['days'], item['from_date']) for item in result['breakthroughs']] == [
+        (level, pd.Timestamp(str(dates[i])).strftime('%Y-%m-%d'), days,
+         pd.Timestamp(str(dates[j])).strftime('%Y-%m-%d'))
+        for level, i, days, j in expected
+    ]
+
+
+def test_crossings_and_advances():
+    """测试多关口跳空穿越、回撤下穿以及推进用时"""
+    close = np.array([95, 105, 99, 101, 230, 190, np.nan, 210])
+    result = analyze_levels(make_dates(len(close)), close, 50)
+
+    assert [(item['level'], item['direction']) for item in result['crossings']] == [
+        (100, 'up'), (100, 'down'), (100, 'up'), (150, 'up'), (200, 'up'), (200, 'down'), (200, 'up')]
+    assert result['crossings'][-1]['date'] == '2005-01-12'
+    levels = {item['level']: item for item in result['levels']}
+    assert (levels[100]['up'], levels[100]['down']) == (2, 1)
+
+    # 上穿100→150用时1根K线，150→200在同一根K线跨过用时为0；下穿后重新上穿同一关口不计推进
+    assert result['advance_stats']['up']['count'] == 2
+    assert result['advance_stats']['up']['mean_bars'] == 0.5
+    assert result['advance_stats']['down'] == {'count': 0}
+    assert [(item['level'], item['bars']) for item in result['breakthroughs']] == [(100, 1), (200, 1)]
+
+    with pytest.raises(ValueError):
+        analyze_levels(make_dates(2), np.array([1.0, 2.0]), 0)
+
+
+def test_service_cache_per_last_bar():
+    """测试结果按最后一根K线缓存，盘中最后一根K线变化时重新计算"""
+    class FakeIndexStore:
+        def __init__(self):
+            self.rows = [{'date': f'2024-01-{day:02d}', '收盘': 2950.0 + 30 * day} for day in range(1, 11)]
+            self.calls = 0
+
+        def get_bars(self, code, start_date, end_date):
+            self.calls += 1
+            return list(self.rows)
+
+    store = FakeIndexStore()
+    service = LevelCrossingService(index_store=store)
+    first = service.analyze('000001', 100)
+    assert service.analyze('000001', 100) is first
+    assert service.analyze('sh000001', 100) is first
+    assert service.analyze('000001', 50) is not first
+
+    store.rows[-1] = dict(store.rows[-1], 收盘=3500.0)
+    updated = service.analyze('000001', 100)
+    assert updated is not first
+    assert updated['breakthroughs'][-1]['level'] == 3500
+    assert service.stats()['hits'] == 2
+
+    with pytest.raises(ValueError):
+        service.analyze('000001', 100, kind='fund')
@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+"""
+全市场选股测试
+"""
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from data_handlers.industry_index import IndustryIndex
+from data_handlers.screener import Screener, ScreenError, compile_screen, parse_sort
+from data_handlers.stock_snapshot import StockSnapshot
+
+
+def make_snapshot(size=5000, seed=0):
+    rng = np.random.default_rng(seed)
+    df = pd.DataFrame({
+        '代码': [f'{600000 + i:06d}' for i in range(size)],
+        '名称': [f'股票{i}' for i in range(size)],
+        '最新价': rng.uniform(5, 80, size).round(2),
+        '涨跌幅': rng.normal(0, 2, size).round(2),
+        '市盈率-动态': np.where(rng.random(size) < 0.1, np.nan, rng.uniform(-20, 80, size).round(2)),
+        '60日涨跌幅': rng.normal(0, 10, size).round(2),
+        '流通市值': rng.uniform(1e9, 1e12, size),
+    })
+    return StockSnapshot.from_dataframe(df)
+
+
+class FakeHandler:
+    def __init__(self, snapshot, industry_map):
+        self.snapshot = snapshot
+        self.index = IndustryIndex(snapshot, industry_map)
+
+    def get_realtime_snapshot(self):
+        return self.snapshot
+
+    def get_industry_index(self):
+        return self.index
+
+
+class FakeStream:
+    """只维护rsi14与macd的流式指标"""
+
+    def __init__(self, codes, seed=1):
+        rng = np.random.default_rng(seed)
+        self.values = {('rsi14', 'rsi'): dict(zip(codes, rng.uniform(0, 100, len(codes)))),
+                       ('macd', 'dif'): dict(zip(codes, rng.normal(0, 1, len(codes))))}
+        self.indicators = {'rsi14': None, 'macd': None}
+        self.version = 0
+        self.column_calls = 0
+
+    def outputs(self, label):
+        return ['rsi'] if label == 'rsi14' else ['dif', 'dea', 'macd']
+
+    def column(self, label, output, codes):
+        self.column_calls += 1
+        values = self.values[(label, output)]
+        return np.array([values.get(code, np.nan) for code in codes])
+
+
+@pytest.fixture
+def screener():
+    snapshot = make_snapshot()
+    codes = snapshot.column('code').tolist()
+    industry_map = {code: ('银行' if i % 3 == 0 else '证券') for i, code in enumerate(codes[:4000])}
+    return Screener(handler=FakeHandler(snapshot, industry_map), stream=FakeStream(codes))
+
+
+def test_compile_and_cache():
+    """测试between改写、连写比较、in与not，编译结果按表达式缓存"""
+    compiled = compile_screen("x between 1 and 3 and not y in ['a', 'b'] or 0 < z * 2 <= 4")
+    assert compiled.fields == ('x', 'y', 'z')
+    assert compile_screen("x between 1 and 3 and not y in ['a', 'b'] or 0 < z * 2 <= 4") is compiled
+
+    columns = {'x': np.array([1, 2, 5, 5]), 'y': np.array(['a', 'c', 'c', 'a'], dtype=object),
+               'z': np.array([9, 9, 1, np.nan])}
+    assert compiled.evaluate(columns, 4).tolist() == [False, True, True, False]
+
+    assert parse_sort('-a, b desc,c') == [('a', True), ('b', True), ('c', False)]
+    for bad in ('', 'x <', "__import__('os').system('ls')", 'x.y > 1', 'x if y else z'):
+        with pytest.raises(ScreenError):
+            compile_screen(bad)
+
+
+def test_screen_matches_pandas(screener):
+    """测试快照字段、行业与指标字段的筛选与多字段排序"""
+    expr = "rsi14 < 30 and pe_ratio between 5 and 20 and change_60day > 0 and industry != '其他'"
+    result = screener.screen(expr, sort='industry, -change_percent', limit=10)
+
+    snapshot = screener.handler.snapshot
+    df = pd.DataFrame({name: snapshot.column(name) for name in ('code', 'pe_ratio', 'change_60day', 'change_percent')})
+    df['rsi14'] = screener.stream.column('rsi14', 'rsi', df['code'].tolist())
+    df['industry'] = screener.handler.index.labels
+    expected = df[(df.rsi14 < 30) & df.pe_ratio.between(5, 20) & (df.change_60day > 0) & (df.industry != '其他')]
+    expected = expected.sort_values(['industry', 'change_percent'], ascending=[True, False], kind='stable')
+
+    assert result['total'] == len(expected)
+    assert [item['code'] for item in result['items']] == expected['code'].head(10).tolist()
+    assert result['fields'] == ['industry', 'rsi14']
+    assert result['items'][0]['rsi14'] < 30
+
+
+def test_screen_top_k_and_caching(screener):
+    """测试单字段取前k条（缺失值排最后），指标列按快照缓存"""
+    result = screener.screen('macd_dif > -10', sort='pe_ratio desc', limit=5)
+    pe = screener.handler.snapshot.column('pe_ratio')
+    assert [item['pe_ratio'] for item in result['items']] == sorted(pe[~np.isnan(pe)], reverse=True)[:5]
+
+    calls = screener.stream.column_calls
+    for _ in range(20):
+        result = screener.screen('macd_dif > 0 and latest_price < 50', sort='-macd_dif', limit=20)
+    assert screener.stream.column_calls == calls
+    assert result['elapsed_ms'] < 50
+
+    with pytest.raises(ScreenError):
+        screener.screen('kdj_k > 50')
+    with pytest.raises(ScreenError):
+        screener.screen('macd > 0')
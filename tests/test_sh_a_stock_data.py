@@ -0,0 +1,365 @@
+#!/usr/bin/env python3
+"""
+上证A股数据处理器测试
+使用构造的行情数据替代akshare接口
+"""
+
+import threading
+import time
+from datetime import datetime, time as dtime
+
+import akshare as ak
+import numpy as np
+import pandas as pd
+import pytest
+
+from data_handlers.akshare_gateway import AkshareGateway
+from data_handlers.sh_a_stock_data import SHAStockDataHandler
+from utils.trading_calendar import TradingCalendar
+
+
+class AlwaysOpenCalendar(TradingCalendar):
+    """全天交易的日历，使测试结果与运行时间无关"""
+
+    def __init__(self):
+        super().__init__(holidays=[], sessions=((dtime.min, dtime.max),), intraday_ttls={'realtime': 60})
+
+    def is_trading_day(self, day):
+        return True
+
+
+def make_spot_df(size=20, seed=0):
+    """构造ak.stock_sh_a_spot_em格式的行情数据"""
+    rng = np.random.default_rng(seed)
+    return pd.DataFrame({
+        '代码': [f'{600000 + i:06d}' for i in range(size)],
+        '名称': [f'股票{i}' for i in range(size)],
+        '最新价': rng.uniform(5, 80, size).round(2),
+        '涨跌幅': rng.normal(0, 2, size).round(2),
+        '成交量': rng.integers(1000, 10 ** 6, size).astype(float),
+        '成交额': rng.uniform(1e6, 1e9, size),
+        '换手率': rng.uniform(0, 10, size).round(2),
+        '总市值': rng.uniform(1e9, 1e12, size),
+        '流通市值': rng.uniform(1e9, 1e12, size),
+    })
+
+
+@pytest.fixture
+def handler(tmp_path, monkeypatch):
+    """创建使用临时数据库且不访问网络的处理器"""
+    monkeypatch.setenv('STOCK_BACKGROUND_JOBS', 'false')
+    handler = SHAStockDataHandler(db_path=str(tmp_path / 'stock_cache.db'))
+    handler.calendar = AlwaysOpenCalendar()
+    handler.gateway = AkshareGateway(calendar=handler.calendar)
+    handler.upstream_calls = 0
+
+    def fake_fetch():
+        handler.upstream_calls += 1
+        return make_spot_df()
+
+    handler._fetch_with_retry = fake_fetch
+    return handler
+
+def test_snapshot_is_shared_between_queries(handler):
+    """测试多个查询方法共享同一快照，只请求一次上游"""
+    assert len(handler.get_realtime_sh_a_stocks()) == 20
+    assert handler.get_stock_by_code('600003')['code'] == '600003'
+    assert handler.get_market_summary()['total_stocks'] == 20
+    assert handler.upstream_calls == 1
+
+def test_filter_stocks_sorted_and_limited(handler):
+    """测试筛选、排序与数量限制"""
+    stocks = handler.filter_stocks(min_turnover_rate=2, sort_by='turnover_rate', ascending=False, limit=3)
+    rates = [s['turnover_rate'] for s in stocks]
+    assert len(stocks) == 3
+    assert rates == sorted(rates, reverse=True)
+    assert all(rate >= 2 for rate in rates)
+
+def test_load_latest_snapshot_only(handler):
+    """测试多次刷新后只加载最新的完整快照"""
+    for _ in range(3):
+        assert handler.refresh_cache()
+    snapshot = handler._load_from_cache(max_age_minutes=60)
+    assert len(snapshot) == 20
+    assert len(set(snapshot.column('code'))) == 20
+
+def test_maintenance_evicts_expired_snapshots(handler):
+    """测试后台维护清理过期快照"""
+    handler.refresh_cache()
+    handler.cache_retention_hours = 0
+    result = handler._run_maintenance()
+    assert result['evicted']['snapshots'] == 1
+    assert result['evicted']['quote_rows'] == 20
+    assert handler._load_from_cache(max_age_minutes=60) is None
+
+def test_concurrent_cold_requests_share_one_fetch(handler):
+    """测试缓存为空时并发请求只触发一次上游请求"""
+    original_fetch = handler._fetch_with_retry
+
+    def slow_fetch():
+        time.sleep(0.2)
+        return original_fetch()
+
+    handler._fetch_with_retry = slow_fetch
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(handler.get_realtime_snapshot()))
+               for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert handler.upstream_calls == 1
+    assert len({id(snapshot) for snapshot in results}) == 1
+    assert handler.get_runtime_stats()['single_flight']['sh_a_snapshot']['coalesced'] == 7
+
+def test_stale_snapshot_served_while_refreshing(handler):
+    """测试快照过期时立即返回旧快照并由后台刷新"""
+    handler.refresh_interval = handler.off_hours_refresh_interval = 60
+    first = handler.get_realtime_snapshot()
+    first.fetched_at -= 120
+
+    # 后台刷新在断言旧快照之前不能完成
+    release = threading.Event()
+    fetch = handler._fetch_with_retry
+
+    def gated_fetch():
+        release.wait(5)
+        return fetch()
+
+    handler._fetch_with_retry = gated_fetch
+    handler.refresher_task.start()
+    try:
+        assert handler.get_realtime_snapshot() is first
+        assert handler.get_snapshot_meta()['stale'] is True
+        release.set()
+        deadline = time.time() + 5
+        while handler._snapshot is first and time.time() < deadline:
+            time.sleep(0.01)
+        assert handler._snapshot is not first
+        assert handler.upstream_calls == 2
+    finally:
+        handler.refresher_task.stop()
+
+def test_stock_type_batch_uses_cache_and_parallel_fetch(handler, monkeypatch):
+    """测试批量获取基本信息：缓存命中批量查询，未命中并发获取并按输入顺序返回"""
+    requested = []
+
+    def fake_info(symbol):
+        requested.append(symbol)
+        return pd.DataFrame({'item': ['股票简称', '行业', '总股本'],
+                             'value': [f'股票{symbol}', '银行', '1000']})
+
+    monkeypatch.setattr(ak, 'stock_individual_info_em', fake_info)
+    handler.get_stock_type_info('600002')
+    assert requested == ['600002']
+
+    codes = ['600003', '600002', '600001', '600003']
+    result = handler.get_stock_type_batch(codes)
+    assert [info['code'] for info in result] == ['600003', '600002', '600001']
+    assert sorted(requested[1:]) == ['600001', '600003']
+    assert result[0]['industry'] == '银行'
+
+    # 再次请求全部命中缓存
+    handler.get_stock_type_batch(codes)
+    assert len(requested) == 3
+
+def test_industry_index_aggregates(handler):
+    """测试行业索引按快照聚合并缓存"""
+    snapshot = handler.get_realtime_snapshot()
+    codes = snapshot.column('code').tolist()
+    handler.reference.save_many([
+        {'code': code, 'name': '', 'industry': '银行' if i < 5 else '钢铁', 'list_date': '',
+         'total_shares': 0.0, 'circulating_shares': 0.0, 'timestamp': datetime.now().isoformat()}
+        for i, code in enumerate(codes[:15])
+    ])
+
+    industries = handler.get_all_industries(include_stocks=False)
+    assert industries[0]['industry'] == '钢铁'
+    assert {item['industry']: item['count'] for item in industries} == {'钢铁': 10, '银行': 5, '其他': 5}
+    assert 'stocks' not in industries[0]
+
+    bank = next(item for item in industries if item['industry'] == '银行')
+    change = snapshot.column('change_percent')[:5]
+    cap = snapshot.column('circulation_market_cap')[:5]
+    assert bank['weighted_change_percent'] == round(float((change * cap).sum() / cap.sum()), 2)
+    assert bank['up_count'] + bank['down_count'] + bank['flat_count'] == 5
+
+    detail = handler.get_industry_detail('银行')
+    assert [stock['code'] for stock in detail['stocks']] == codes[:5]
+    assert handler.get_industry_index() is handler.get_industry_index()
+    assert handler.get_industry_detail('不存在') is None
+
+def test_reference_sweep_refetches_only_missing_and_stale(handler, monkeypatch):
+    """测试参考数据复核只请求缺失和过期的记录，并识别内容变化"""
+    requested = []
+    industries = {}
+
+    def fake_info(symbol):
+        requested.append(symbol)
+        return pd.DataFrame({'item': ['股票简称', '行业'],
+                             'value': [f'股票{symbol}', industries.get(symbol, '银行')]})
+
+    monkeypatch.setattr(ak, 'stock_individual_info_em', fake_info)
+    handler.reference_sweep_batch = 8
+    snapshot = handler.get_realtime_snapshot()
+
+    # 冷启动时缺少记录的股票不受批量限制，一次复核全部获取，行业映射随之建立
+    result = handler._sweep_reference_data()
+    assert result['missing'] == len(snapshot) and result['inserted'] == len(snapshot)
+    assert len(requested) == len(snapshot)
+    assert handler.get_industry_detail('银行')['count'] == len(snapshot)
+
+    # 全部记录有效时不再请求上游
+    assert handler._sweep_reference_data()['fetched'] == 0
+    assert len(requested) == len(snapshot)
+
+    # 过期记录按复核时间重新获取，仅内容变化的计入changed
+    code = snapshot.column('code')[0]
+    industries[code] = '钢铁'
+    with handler.db.transaction() as conn:
+        conn.execute('UPDATE stock_basic_info_cache SET checked_at = 0 WHERE code IN (?, ?)',
+                     (code, snapshot.column('code')[1]))
+    result = handler._sweep_reference_data()
+    assert (result['stale'], result['changed'], result['unchanged']) == (2, 1, 1)
+
+    # 过期记录的复核仍按批量限制
+    with handler.db.transaction() as conn:
+        conn.execute('UPDATE stock_basic_info_cache SET checked_at = 0')
+    assert handler._sweep_reference_data()['stale'] == 8
+    assert handler.get_industry_detail('钢铁')['count'] == 1
+
+    # 维护任务不清理参考数据
+    handler._clear_old_cache(max_age_hours=0)
+    assert handler.reference.stats()['rows'] == len(snapshot)
+
+def test_reference_recheck_ignores_price_moves(handler, monkeypatch):
+    """测试复核时仅股价变动（市值随之变化）不计为参考数据变化"""
+    price = {'value': 6.56}
+
+    def fake_info(symbol):
+        return pd.DataFrame({
+            'item': ['最新', '股票代码', '股票简称', '总股本', '流通股', '总市值', '流通市值', '行业', '上市时间'],
+            'value': [price['value'], symbol, f'股票{symbol}', 1.2e10, 9.7e9, price['value'] * 1.2e10,
+                      price['value'] * 9.7e9, '房地产开发', '19910129']})
+
+    monkeypatch.setattr(ak, 'stock_individual_info_em', fake_info)
+    snapshot = handler.get_realtime_snapshot()
+    assert handler._sweep_reference_data()['inserted'] == len(snapshot)
+    code = snapshot.column('code')[0]
+    assert handler.reference.load_many([code])[code]['circulating_shares'] == 9.7e9
+
+    price['value'] = 7.01
+    with handler.db.transaction() as conn:
+        conn.execute('UPDATE stock_basic_info_cache SET checked_at = 0')
+    version = handler._industry_map_version
+    result = handler._sweep_reference_data()
+    assert (result['changed'], result['unchanged']) == (0, len(snapshot))
+    assert handler._industry_map_version == version
+
+def test_basic_info_breaker_and_negative_cache(handler, monkeypatch):
+    """测试空结果进入负缓存，上游连续失败后熔断并快速失败"""
+    requested = []
+
+    def empty_info(symbol):
+        requested.append(symbol)
+        return pd.DataFrame({'item': [], 'value': []})
+
+    monkeypatch.setattr(ak, 'stock_individual_info_em', empty_info)
+    assert handler.get_stock_type_info('688999') is None
+    assert handler.get_stock_type_info('688999') is None
+    assert requested == ['688999']
+
+    def failing_info(symbol):
+        requested.append(symbol)
+        raise ConnectionError('upstream down')
+
+    monkeypatch.setattr(ak, 'stock_individual_info_em', failing_info)
+    codes = [f'{600100 + i}' for i in range(20)]
+    assert handler.get_stock_type_batch(codes) is None
+    assert len(requested) - 1 <= handler.basic_info_breaker.failure_threshold + handler.basic_info_workers
+    assert handler.basic_info_breaker.state == 'open'
+    assert handler._sweep_reference_data()['skipped'] == 'circuit_open'
+
+def test_stock_type_batch_returns_partial_result_within_budget(handler, monkeypatch):
+    """测试批量接口超出时间预算时返回部分结果，剩余请求在后台完成后写入缓存"""
+    release = threading.Event()
+
+    def slow_info(symbol):
+        if symbol == '600002':
+            release.wait(5)
+        return pd.DataFrame({'item': ['股票简称', '行业'], 'value': [f'股票{symbol}', '银行']})
+
+    monkeypatch.setattr(ak, 'stock_individual_info_em', slow_info)
+    handler.basic_info_batch_budget = 0.3
+
+    start = time.monotonic()
+    result = handler.get_stock_type_batch(['600001', '600002', '600003'])
+    assert time.monotonic() - start < 2
+    assert [info['code'] for info in result] == ['600001', '600003']
+
+    release.set()
+    for _ in range(50):
+        if '600002' in handler.reference.load_many(['600002']):
+            break
+        time.sleep(0.05)
+    assert '600002' in handler.reference.load_many(['600002'])
+
+def test_snapshot_time_travel_and_code_history(handler):
+    """测试按时刻读取历史快照、按代码读取快照序列，且查询经由索引定位"""
+    from data_handlers.stock_snapshot import StockSnapshot
+
+    base = datetime(2024, 3, 4, 10, 0).timestamp()
+    frames = [make_spot_df(seed=seed) for seed in range(3)]
+    for i, frame in enumerate(frames):
+        handler._save_to_cache(StockSnapshot.from_dataframe(frame, fetched_at=base + 60 * i))
+
+    snapshot = handler.get_snapshot_as_of(base + 90)
+    assert snapshot.fetched_at == base + 60
+    assert snapshot.get('600003')['latest_price'] == frames[1]['最新价'][3]
+    assert handler.get_snapshot_as_of(base - 1) is None
+    assert handler.get_snapshot_as_of(base + 90) is snapshot
+    assert handler.get_runtime_stats()['snapshot_history']['hits'] == 1
+
+    series = handler.get_stock_history('600003', start=base + 30)
+    assert [row['latest_price'] for row in series] == [frames[1]['最新价'][3], frames[2]['最新价'][3]]
+    assert series[0]['timestamp'] < series[1]['timestamp']
+    assert handler.get_stock_history('600003', limit=1) == series[-1:]
+    assert len(handler.get_stock_history('600003', end=base + 60)) == 2
+
+    with handler.db.connection() as conn:
+        plans = [
+            conn.execute('EXPLAIN QUERY PLAN SELECT snapshot_id FROM snapshots '
+                         'WHERE fetched_at <= ? AND complete = 1 ORDER BY fetched_at DESC LIMIT 1', (base,)).fetchall(),
+            conn.execute('EXPLAIN QUERY PLAN SELECT * FROM stock_data_cache WHERE snapshot_id = ? ORDER BY code',
+                         (1,)).fetchall(),
+            conn.execute('EXPLAIN QUERY PLAN SELECT * FROM stock_data_cache WHERE code = ? AND timestamp >= ? '
+                         'AND timestamp <= ? ORDER BY timestamp DESC LIMIT ?', ('600003', '', '9999', -1)).fetchall(),
+        ]
+    for plan in plans:
+        details = ' '.join(row[-1] for row in plan)
+        assert details.startswith('SEARCH') and 'INDEX' in details and 'TEMP B-TREE' not in details, details
+
+def test_existing_database_not_vacuumed_on_startup(tmp_path, monkeypatch):
+    """测试启动时不对已有数据的旧数据库执行VACUUM，由vacuum()一次性切换回收空间模式"""
+    import sqlite3
+
+    monkeypatch.setenv('STOCK_BACKGROUND_JOBS', 'false')
+    path = str(tmp_path / 'legacy.db')
+    conn = sqlite3.connect(path)
+    conn.execute('CREATE TABLE legacy (value TEXT)')
+    conn.commit()
+    conn.close()
+
+    handler = SHAStockDataHandler(db_path=path)
+    with handler.db.connection() as conn:
+        assert conn.execute('PRAGMA auto_vacuum').fetchone()[0] == 0
+    assert handler.vacuum()['auto_vacuum'] == 2
+
+def test_new_database_uses_incremental_vacuum(tmp_path, monkeypatch):
+    """测试新建的数据库在切换WAL之前开启增量回收空间模式"""
+    monkeypatch.setenv('STOCK_BACKGROUND_JOBS', 'false')
+    handler = SHAStockDataHandler(db_path=str(tmp_path / 'fresh.db'))
+    with handler.db.connection() as conn:
+        assert conn.execute('PRAGMA journal_mode').fetchone()[0] == 'wal'
+        assert conn.execute('PRAGMA auto_vacuum').fetchone()[0] == 2
@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+"""
+列式行情快照测试
+"""
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from data_handlers.stock_snapshot import FIELD_NAMES, StockSnapshot
+
+
+def make_record(code, price, turnover_rate):
+    """构造测试用股票数据"""
+    record = {name: 0.0 for name in FIELD_NAMES}
+    record.update({
+        'code': code,
+        'name': f'股票{code}',
+        'latest_price': price,
+        'turnover_rate': turnover_rate,
+        'volume': 100,
+        'timestamp': '2024-01-01T10:00:00'
+    })
+    return record
+
+
+@pytest.fixture
+def snapshot():
+    """创建测试快照"""
+    records = [
+        make_record('600000', 10.5, 1.2),
+        make_record('600001', 20.0, 3.4),
+        make_record('600002', 30.0, 0.8),
+    ]
+    return StockSnapshot.from_records(records, fetched_at=1700000000.0)
+
+def test_get_by_code(snapshot):
+    """测试按代码查询"""
+    stock = snapshot.get('600001')
+    assert stock['latest_price'] == 20.0
+    assert list(stock.keys()) == FIELD_NAMES
+    assert snapshot.get('999999') is None
+
+def test_to_records_selection(snapshot):
+    """测试按行渲染"""
+    assert [s['code'] for s in snapshot.to_records(slice(1, None))] == ['600001', '600002']
+    assert [s['code'] for s in snapshot.to_records(np.array([2, 0]))] == ['600002', '600000']
+    assert len(snapshot.to_records()) == 3
+
+def test_columns_are_read_only(snapshot):
+    """测试快照不可变"""
+    with pytest.raises(ValueError):
+        snapshot.column('latest_price')[0] = 1.0
+
+def test_rendered_values_are_python_types(snapshot):
+    """测试渲染结果可直接序列化为JSON"""
+    stock = snapshot.get('600000')
+    assert type(stock['volume']) is int
+    assert type(stock['latest_price']) is float
+
+def test_from_dataframe_mapping():
+    """测试DataFrame向量化转换（缺失值填充与市值单位换算）"""
+    stock_df = pd.DataFrame({
+        '代码': ['600000', '600001'],
+        '名称': ['浦发银行', '白云机场'],
+        '最新价': [10.5, np.nan],
+        '成交量': [1234.0, np.nan],
+        '总市值': [3.2e10, np.nan],
+        '换手率': [1.5, 2.5],
+    })
+    snapshot = StockSnapshot.from_dataframe(stock_df, fetched_at=1700000000.0)
+
+    first, second = snapshot.to_records()
+    assert first['latest_price'] == 10.5
+    assert first['volume'] == 1234
+    assert first['total_market_cap'] == pytest.approx(320.0)
+    assert second['latest_price'] == 0.0
+    assert second['volume'] == 0
+    assert second['total_market_cap'] == 0.0
+    # 源数据缺失的列按默认值填充，保证两条链路字段一致
+    assert first['speed'] == 0.0
+    assert list(first.keys()) == FIELD_NAMES
@@ -0,0 +1,154 @@
+#!/usr/bin/env python3
+"""
+逐笔成交采集管道测试
+"""
+
+import time
+from datetime import datetime
+
+import pandas as pd
+
+from data_handlers.tick_pipeline import TICK_SOURCES, TickPipeline
+from utils.circuit_breaker import CLOSED, OPEN
+
+NOW = datetime(2024, 3, 4, 10, 0).timestamp()
+
+
+def em_frame(rows):
+    return pd.DataFrame(rows, columns=['时间', '成交价', '手数', '买卖盘性质'])
+
+
+def tx_frame(rows):
+    return pd.DataFrame(rows, columns=['成交时间', '成交价格', '成交量', '性质'])
+
+
+def sina_frame(rows):
+    return pd.DataFrame(rows, columns=['ticktime', 'price', 'volume', 'prev_price', 'kind'])
+
+
+class FakeBreaker:
+    def __init__(self):
+        self.state = CLOSED
+
+
+class FakeGateway:
+    """按函数名返回固定结果或抛出异常的网关"""
+
+    def __init__(self, results):
+        self.results = results
+        self.breakers = {}
+        self.calls = []
+
+    def breaker(self, func_name):
+        return self.breakers.setdefault(func_name, FakeBreaker())
+
+    def call(self, func_name, use_cache=True, **kwargs):
+        self.calls.append((func_name, kwargs['symbol']))
+        result = self.results.get(func_name)
+        if isinstance(result, Exception) or result is None:
+            raise result or RuntimeError('unavailable')
+        return result(kwargs['symbol']) if callable(result) else result
+
+
+class FixedCalendar:
+    def to_local(self, ts=None):
+        return datetime.fromtimestamp(ts if ts is not None else NOW)
+
+
+def make_pipeline(root, gateway):
+    return TickPipeline(root=str(root), gateway=gateway, calendar=FixedCalendar(), watchlist=['603696', '000001'])
+
+
+def test_failover_and_latency_ranking(tmp_path):
+    """测试失败时切换数据源、连续失败的数据源降级、熔断的数据源跳过"""
+    frame = sina_frame([('09:30:01', 10.0, 500, 0, 'U'), ('09:30:04', 10.01, 300, 10.0, 'D')])
+    gateway = FakeGateway({'stock_intraday_em': RuntimeError('boom'), 'stock_zh_a_tick_tx_js': RuntimeError('boom'),
+                           'stock_intraday_sina': frame})
+    pipeline = make_pipeline(tmp_path, gateway)
+    pipeline.max_failures = 2
+
+    cycle = pipeline.run_once(['603696'], now=NOW)
+    assert cycle['sources'] == {'sina': 1}
+    assert gateway.calls[-1] == ('stock_intraday_sina', 'sh603696')
+    ticks = pipeline.read_ticks('603696', '20240304')
+    assert ticks[0] == {'time': '09:30:01', 'price': 10.0, 'volume': 5, 'side': 'B', 'source': 'sina'}
+
+    # 连续失败达到阈值后，其余数据源排在后面，不再先试
+    pipeline.run_once(['603696'], now=NOW)
+    gateway.calls.clear()
+    pipeline.run_once(['603696'], now=NOW)
+    assert gateway.calls == [('stock_intraday_sina', 'sh603696')]
+
+    # 恢复的数据源按延迟排序参与竞争；熔断的数据源排在最后
+    gateway.breaker('stock_intraday_sina').state = OPEN
+    gateway.calls.clear()
+    pipeline.run_once(['603696'], now=NOW)
+    assert gateway.calls[-1][0] == 'stock_intraday_sina'
+    assert [item['name'] for item in pipeline.stats()['sources']][-1] == 'sina'
+
+
+def test_slow_failures_raise_latency(tmp_path):
+    """测试慢速失败计入延迟，未达到降级阈值前即让位于更快的数据源"""
+    def slow_failure(symbol):
+        time.sleep(0.05)
+        raise TimeoutError('read timeout')
+
+    gateway = FakeGateway({'stock_intraday_em': slow_failure,
+                           'stock_zh_a_tick_tx_js': tx_frame([('09:30:01', 10.0, 5, '买盘')])})
+    pipeline = TickPipeline(root=str(tmp_path), gateway=gateway, calendar=FixedCalendar(), watchlist=['603696'],
+                            sources=TICK_SOURCES[:2])
+    pipeline.health['em'].record_success(1.0)
+    pipeline.health['tx'].record_success(5.0)
+
+    assert pipeline.fetch('603696', datetime(2024, 3, 4).date())[0] == 'tx'
+    assert pipeline.health['em'].consecutive_failures < pipeline.max_failures
+    assert pipeline.health['em'].latency_ms > pipeline.health['tx'].latency_ms
+    assert pipeline.ranked_sources()[0].source.name == 'tx'
+
+
+def test_dedup_across_polls(tmp_path):
+    """测试重复拉取只追加新成交，同一秒内价格与成交量相同的成交视为重复"""
+    rows = [('09:30:01', 10.0, 5, '买盘'), ('09:30:01', 10.01, 3, '卖盘'), ('09:30:03', 10.02, 1, '中性盘')]
+    gateway = FakeGateway({'stock_intraday_em': lambda symbol: em_frame(rows)})
+    pipeline = make_pipeline(tmp_path, gateway)
+
+    assert pipeline.run_once(now=NOW)['appended'] == 6
+    rows.append(('09:30:03', 10.03, 2, '买盘'))
+    rows.append(('09:30:05', 10.03, 2, '买盘'))
+    cycle = pipeline.run_once(now=NOW)
+    assert cycle['appended'] == 4
+    assert cycle['fetched'] == 10
+
+    ticks = pipeline.read_ticks('000001', '20240304')
+    assert [(t['time'], t['price'], t['side']) for t in ticks] == [
+        ('09:30:01', 10.0, 'B'), ('09:30:01', 10.01, 'S'), ('09:30:03', 10.02, 'M'),
+        ('09:30:03', 10.03, 'B'), ('09:30:05', 10.03, 'B')]
+    stats = pipeline.stats()
+    assert stats['ticks'] == 10 and stats['duplicates'] == 6
+
+
+def test_resume_from_checkpoint(tmp_path):
+    """测试崩溃重启后日志截断到检查点位置，恢复去重状态后不重复写入"""
+    rows = [('09:30:01', 10.0, 5, '买盘'), ('09:30:02', 10.01, 3, '卖盘')]
+    gateway = FakeGateway({'stock_intraday_em': lambda symbol: em_frame(rows)})
+    pipeline = make_pipeline(tmp_path, gateway)
+    pipeline.run_once(['603696'], now=NOW)
+    log = tmp_path / '20240304.csv'
+    size = log.stat().st_size
+
+    # 模拟写入日志后、写入检查点前崩溃
+    with open(log, 'a') as f:
+        f.write('603696,093003,10.020,1,M,em\n603696,0930')
+
+    resumed = make_pipeline(tmp_path, gateway)
+    assert resumed.load_checkpoint()
+    assert log.stat().st_size == size
+
+    rows.append(('09:30:03', 10.02, 1, '中性盘'))
+    assert resumed.run_once(['603696'], now=NOW)['appended'] == 1
+    assert [t['time'] for t in resumed.read_ticks('603696', '20240304')] == ['09:30:01', '09:30:02', '09:30:03']
+
+    # 换日后去重状态清空
+    next_day = datetime(2024, 3, 5, 9, 31).timestamp()
+    assert resumed.run_once(['603696'], now=next_day)['appended'] == 3
+    assert len(resumed.read_ticks('603696', '20240305')) == 3
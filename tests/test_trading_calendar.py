@@ -0,0 +1,46 @@
+#!/usr/bin/env python3
+"""
+交易日历测试
+"""
+
+from datetime import date, datetime
+
+import pytest
+
+from utils.trading_calendar import CHINA_TZ, TradingCalendar
+
+
+def at(*args):
+    """构造北京时间"""
+    return datetime(*args, tzinfo=CHINA_TZ)
+
+
+@pytest.fixture
+def calendar():
+    """国庆休市的测试日历"""
+    return TradingCalendar(holidays=[date(2025, 10, d) for d in (1, 2, 3, 6, 7, 8)],
+                           intraday_ttls={'realtime': 60})
+
+def test_trading_time(calendar):
+    """测试交易时段判断"""
+    assert calendar.is_trading_time(at(2025, 9, 30, 10, 0))
+    assert not calendar.is_trading_time(at(2025, 9, 30, 12, 0))  # 午休
+    assert not calendar.is_trading_time(at(2025, 9, 27, 10, 0))  # 周六
+    assert not calendar.is_trading_time(at(2025, 10, 8, 10, 0))  # 节假日
+
+def test_intraday_ttl(calendar):
+    """测试交易时段内使用短有效期"""
+    fetched = at(2025, 9, 30, 10, 0)
+    assert calendar.expires_at('realtime', fetched) == at(2025, 9, 30, 10, 1).timestamp()
+
+def test_lunch_break_extends_to_afternoon(calendar):
+    """测试午休期间获取的数据有效至下午开盘"""
+    fetched = at(2025, 9, 30, 11, 40)
+    assert calendar.expires_at('realtime', fetched) == at(2025, 9, 30, 13, 0).timestamp()
+
+def test_closed_market_cached_until_next_open(calendar):
+    """测试收盘后获取的数据跨越长假有效至下一次开盘"""
+    fetched = at(2025, 9, 30, 16, 0)
+    assert calendar.next_session_open(fetched) == at(2025, 10, 9, 9, 15)
+    assert calendar.is_fresh('realtime', fetched, now=at(2025, 10, 5, 12, 0))
+    assert not calendar.is_fresh('realtime', fetched, now=at(2025, 10, 9, 9, 16))
@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+"""
+上游调用超时控制测试
+"""
+
+import socket
+import threading
+import time
+
+import pytest
+import requests
+
+from utils.upstream import Budget, UpstreamExecutor, UpstreamSaturated, UpstreamTimeout
+
+
+def test_call_timeout_abandons_slow_call():
+    """测试单次超时后立即返回，不修改进程级socket超时"""
+    executor = UpstreamExecutor(max_workers=2)
+    release = threading.Event()
+
+    start = time.monotonic()
+    with pytest.raises(UpstreamTimeout):
+        executor.call('slow', release.wait, 5, timeout=0.05)
+    assert time.monotonic() - start < 1
+    assert socket.getdefaulttimeout() is None
+    assert executor.stats()['slow']['abandoned'] == 1
+
+    release.set()
+    time.sleep(0.05)
+    assert executor.stats()['slow']['abandoned'] == 0
+    assert executor.call('fast', lambda: 42, timeout=1) == 42
+
+
+def test_budget_bounds_total_wait():
+    """测试整体预算用完后不再发起调用"""
+    executor = UpstreamExecutor(max_workers=2)
+    budget = Budget(0.1)
+    with pytest.raises(UpstreamTimeout):
+        executor.call('slow', time.sleep, 1, timeout=10, budget=budget)
+    assert budget.expired
+
+    calls = []
+    with pytest.raises(UpstreamTimeout):
+        executor.call('next', calls.append, 1, timeout=10, budget=budget)
+    assert calls == []
+
+
+def test_hung_calls_do_not_exhaust_pool():
+    """测试挂起的调用超过工作线程数时，达到放弃上限后立即拒绝新调用，挂起调用结束后恢复"""
+    executor = UpstreamExecutor(max_workers=4, max_abandoned_ratio=0.5)
+    release = threading.Event()
+
+    start = time.monotonic()
+    outcomes = []
+    for _ in range(6):
+        try:
+            executor.call('hung', release.wait, 5, timeout=0.05)
+        except UpstreamSaturated:
+            outcomes.append('rejected')
+        except UpstreamTimeout:
+            outcomes.append('timeout')
+    assert outcomes == ['timeout', 'timeout', 'rejected', 'rejected', 'rejected', 'rejected']
+    assert time.monotonic() - start < 1
+    with pytest.raises(UpstreamSaturated):
+        executor.call('other', lambda: 42, timeout=1)
+    assert executor.stats()['hung']['abandoned'] == 2
+    assert executor.stats()['other']['rejected'] == 1
+
+    release.set()
+    time.sleep(0.05)
+    assert executor.call('other', lambda: 42, timeout=1) == 42
+
+
+def test_worker_requests_get_default_read_timeout():
+    """测试工作线程中未指定超时的requests请求按默认读超时结束，释放工作线程"""
+    server = socket.socket()
+    server.bind(('127.0.0.1', 0))
+    server.listen(1)
+    url = f'http://127.0.0.1:{server.getsockname()[1]}/'
+    executor = UpstreamExecutor(max_workers=1, socket_timeout=0.2)
+    try:
+        start = time.monotonic()
+        with pytest.raises(requests.exceptions.ReadTimeout):
+            executor.call('silent', requests.get, url, timeout=5)
+        assert time.monotonic() - start < 2
+        assert executor.stats()['silent']['abandoned'] == 0
+    finally:
+        server.close()
@@ -0,0 +1,201 @@
+#!/usr/bin/env python3
+"""
+上游调用保护
+熔断器：连续失败后短路调用，按指数退避（带随机抖动）定期放行一次试探请求；
+负缓存：记录一段时间内确定没有结果的键，避免重复请求
+"""
+
+import logging
+import os
+import random
+import threading
+import time
+from typing import Callable, Dict, Hashable, Optional, TypeVar
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar('T')
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+
+
+class CircuitOpenError(Exception):
+    """熔断器处于打开状态，调用被拒绝"""
+
+    def __init__(self, name: str, retry_in: float):
+        super().__init__(f"上游接口 {name} 已熔断，{retry_in:.0f} 秒后重试")
+        self.name = name
+        self.retry_in = retry_in
+
+
+class CircuitBreaker:
+    """单个上游接口的熔断器"""
+
+    def __init__(self, name: str,
+                 failure_threshold: Optional[int] = None,
+                 base_backoff: Optional[float] = None,
+                 max_backoff: Optional[float] = None,
+                 jitter: float = 0.2):
+        """
+        Args:
+            name: 上游接口名称
+            failure_threshold: 连续失败多少次后打开，默认读取CIRCUIT_FAILURE_THRESHOLD
+            base_backoff: 首次打开的持续时间（秒），默认读取CIRCUIT_BASE_BACKOFF_SECONDS
+            max_backoff: 打开持续时间上限（秒），默认读取CIRCUIT_MAX_BACKOFF_SECONDS
+            jitter: 持续时间的随机抖动比例，避免多个实例同时试探
+        """
+        self.name = name
+        self.failure_threshold = failure_threshold or int(os.environ.get('CIRCUIT_FAILURE_THRESHOLD', 5))
+        self.base_backoff = base_backoff or float(os.environ.get('CIRCUIT_BASE_BACKOFF_SECONDS', 10))
+        self.max_backoff = max_backoff or float(os.environ.get('CIRCUIT_MAX_BACKOFF_SECONDS', 600))
+        self.jitter = jitter
+
+        self._lock = threading.Lock()
+        self.state = CLOSED
+        self.consecutive_failures = 0
+        self.open_count = 0  # 连续打开次数，决定退避时长
+        self.open_until = 0.0
+        self._probe_in_flight = False
+
+        self.calls = 0
+        self.rejected = 0
+        self.failures = 0
+        self.last_error: Optional[str] = None
+
+    def _backoff(self) -> float:
+        backoff = min(self.base_backoff * (2 ** (self.open_count - 1)), self.max_backoff)
+        return backoff * (1 + random.uniform(-self.jitter, self.jitter))
+
+    def _open(self, now: float):
+        self.open_count += 1
+        backoff = self._backoff()
+        self.state = OPEN
+        self.open_until = now + backoff
+        logger.warning(f"上游接口 {self.name} 熔断 {backoff:.1f} 秒（第 {self.open_count} 次）: {self.last_error}")
+
+    def retry_in(self, now: Optional[float] = None) -> float:
+        """距离允许下一次试探的秒数"""
+        if self.state != OPEN:
+            return 0.0
+        return max(self.open_until - (now if now is not None else time.time()), 0.0)
+
+    def allow(self) -> bool:
+        """
+        判断是否允许发起调用；打开状态到期后转为半开，只放行一个试探请求
+
+        Returns:
+            是否允许调用
+        """
+        with self._lock:
+            now = time.time()
+            if self.state == OPEN and now >= self.open_until:
+                self.state = HALF_OPEN
+                self._probe_in_flight = False
+            if self.state == CLOSED:
+                return True
+            if self.state == HALF_OPEN and not self._probe_in_flight:
+                self._probe_in_flight = True
+                return True
+            self.rejected += 1
+            return False
+
+    def record_success(self):
+        """记录调用成功，关闭熔断器"""
+        with self._lock:
+            if self.state != CLOSED:
+                logger.info(f"上游接口 {self.name} 已恢复")
+            self.state = CLOSED
+            self.consecutive_failures = 0
+            self.open_count = 0
+            self._probe_in_flight = False
+
+    def record_failure(self, error: Optional[BaseException] = None):
+        """记录调用失败，达到阈值或试探失败时打开熔断器"""
+        with self._lock:
+            now = time.time()
+            self.failures += 1
+            self.consecutive_failures += 1
+            self.last_error = str(error) if error is not None else None
+            if self.state == HALF_OPEN or self.consecutive_failures >= self.failure_threshold:
+                self._probe_in_flight = False
+                self._open(now)
+
+    def call(self, func: Callable[..., T], *args, **kwargs) -> T:
+        """
+        通过熔断器调用func
+
+        Raises:
+            CircuitOpenError: 熔断器打开时不发起调用
+        """
+        if not self.allow():
+            raise CircuitOpenError(self.name, self.retry_in())
+        self.calls += 1
+        try:
+            result = func(*args, **kwargs)
+        except Exception as e:
+            self.record_failure(e)
+            raise
+        self.record_success()
+        return result
+
+    def stats(self) -> Dict:
+        """获取熔断器状态"""
+        with self._lock:
+            return {
+                'state': self.state,
+                'consecutive_failures': self.consecutive_failures,
+                'retry_in': round(self.retry_in(), 1),
+                'calls': self.calls,
+                'rejected': self.rejected,
+                'failures': self.failures,
+                'last_error': self.last_error
+            }
+
+
+class NegativeCache:
+    """带有效期的负缓存"""
+
+    def __init__(self, ttl_seconds: float, max_size: int = 10000):
+        """
+        Args:
+            ttl_seconds: 负缓存有效期（秒）
+            max_size: 最大记录数，超过后清理过期记录，仍超过时清空
+        """
+        self.ttl_seconds = ttl_seconds
+        self.max_size = max_size
+        self._expires: Dict[Hashable, float] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+
+    def add(self, key: Hashable):
+        """记录没有结果的键"""
+        with self._lock:
+            now = time.time()
+            if len(self._expires) >= self.max_size:
+                self._expires = {k: v for k, v in self._expires.items() if v > now}
+                if len(self._expires) >= self.max_size:
+                    self._expires.clear()
+            self._expires[key] = now + self.ttl_seconds
+
+    def discard(self, key: Hashable):
+        """移除记录"""
+        with self._lock:
+            self._expires.pop(key, None)
+
+    def __contains__(self, key: Hashable) -> bool:
+        with self._lock:
+            expires = self._expires.get(key)
+            if expires is None:
+                return False
+            if expires <= time.time():
+                del self._expires[key]
+                return False
+            self.hits += 1
+            return True
+
+    def stats(self) -> Dict:
+        """获取负缓存状态"""
+        with self._lock:
+            return {'size': len(self._expires), 'hits': self.hits, 'ttl_seconds': self.ttl_seconds}
@@ -0,0 +1,152 @@
+#!/usr/bin/env python3
+"""
+SQLite连接管理
+提供复用连接的连接池，统一设置WAL等性能相关参数
+"""
+
+import logging
+import os
+import queue
+import sqlite3
+import threading
+from contextlib import contextmanager
+from typing import Dict, Iterator, List
+
+logger = logging.getLogger(__name__)
+
+
+class SQLiteConnectionManager:
+    """SQLite连接池"""
+
+    def __init__(self, db_path: str,
+                 pool_size: int = None,
+                 mmap_size: int = None,
+                 cache_size_kb: int = None,
+                 busy_timeout_ms: int = None,
+                 cached_statements: int = 256,
+                 auto_vacuum: str = None):
+        """
+        Args:
+            db_path: 数据库文件路径
+            pool_size: 最大连接数
+            mmap_size: 内存映射I/O大小（字节）
+            cache_size_kb: 每个连接的页缓存大小（KB）
+            busy_timeout_ms: 等待数据库锁的超时时间（毫秒）
+            cached_statements: 每个连接缓存的预编译语句数量
+            auto_vacuum: 回收空间模式（如INCREMENTAL），只对尚未写入的新数据库生效
+        """
+        self.db_path = db_path
+        self.pool_size = pool_size or int(os.environ.get('SQLITE_POOL_SIZE', 8))
+        self.mmap_size = mmap_size if mmap_size is not None else int(os.environ.get('SQLITE_MMAP_SIZE', 268435456))
+        self.cache_size_kb = cache_size_kb or int(os.environ.get('SQLITE_CACHE_SIZE_KB', 65536))
+        self.busy_timeout_ms = busy_timeout_ms or int(os.environ.get('SQLITE_BUSY_TIMEOUT_MS', 5000))
+        self.cached_statements = cached_statements
+        self.auto_vacuum = auto_vacuum
+
+        self._pool: 'queue.LifoQueue[sqlite3.Connection]' = queue.LifoQueue()
+        self._connections: List[sqlite3.Connection] = []
+        self._lock = threading.Lock()
+
+    def _connect(self) -> sqlite3.Connection:
+        """创建并配置新连接"""
+        # isolation_level=None: 由transaction()显式控制事务，读操作不持有事务
+        conn = sqlite3.connect(
+            self.db_path,
+            timeout=self.busy_timeout_ms / 1000,
+            isolation_level=None,
+            check_same_thread=False,
+            cached_statements=self.cached_statements
+        )
+        if self.auto_vacuum:
+            # 必须在journal_mode之前设置：切换WAL会写入数据库头，之后的auto_vacuum设置被静默忽略
+            conn.execute(f'PRAGMA auto_vacuum={self.auto_vacuum}')
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=NORMAL')
+        conn.execute(f'PRAGMA mmap_size={int(self.mmap_size)}')
+        conn.execute(f'PRAGMA cache_size=-{int(self.cache_size_kb)}')
+        conn.execute(f'PRAGMA busy_timeout={int(self.busy_timeout_ms)}')
+        conn.execute('PRAGMA temp_store=MEMORY')
+        return conn
+
+    def _acquire(self) -> sqlite3.Connection:
+        """从连接池获取连接，连接数未达上限时新建连接"""
+        try:
+            return self._pool.get_nowait()
+        except queue.Empty:
+            pass
+
+        with self._lock:
+            if len(self._connections) < self.pool_size:
+                conn = self._connect()
+                self._connections.append(conn)
+                logger.debug(f"新建SQLite连接 {len(self._connections)}/{self.pool_size}: {self.db_path}")
+                return conn
+
+        try:
+            return self._pool.get(timeout=self.busy_timeout_ms / 1000)
+        except queue.Empty:
+            raise sqlite3.OperationalError(f"等待SQLite连接超时: {self.db_path}")
+
+    def _release(self, conn: sqlite3.Connection):
+        """归还连接，未结束的事务会被回滚"""
+        if conn.in_transaction:
+            conn.rollback()
+        self._pool.put(conn)
+
+    @contextmanager
+    def connection(self) -> Iterator[sqlite3.Connection]:
+        """
+        获取自动提交模式的连接，适用于只读查询
+
+        Yields:
+            数据库连接
+        """
+        conn = self._acquire()
+        try:
+            yield conn
+        finally:
+            self._release(conn)
+
+    @contextmanager
+    def transaction(self) -> Iterator[sqlite3.Connection]:
+        """
+        获取处于写事务中的连接，正常退出时提交，异常时回滚
+
+        Yields:
+            数据库连接
+        """
+        with self.connection() as conn:
+            conn.execute('BEGIN IMMEDIATE')
+            try:
+                yield conn
+            except BaseException:
+                conn.execute('ROLLBACK')
+                raise
+            conn.execute('COMMIT')
+
+    def close_all(self):
+        """关闭所有连接"""
+        with self._lock:
+            for conn in self._connections:
+                try:
+                    conn.close()
+                except sqlite3.Error:
+                    pass
+            self._connections.clear()
+            self._pool = queue.LifoQueue()
+
+
+def ensure_columns(cursor: sqlite3.Cursor, table: str, columns: Dict[str, str]):
+    """
+    为已存在的表补充缺失的列
+
+    Args:
+        cursor: 数据库游标
+        table: 表名
+        columns: 列名到列定义的映射
+    """
+    existing = {row[1] for row in cursor.execute(f'PRAGMA table_info({table})')}
+    for name, definition in columns.items():
+        if name not in existing:
+            cursor.execute(f'ALTER TABLE {table} ADD COLUMN {name} {definition}')
+            logger.info(f"数据表 {table} 新增列 {name}")
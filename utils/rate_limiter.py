@@ -0,0 +1,74 @@
+#!/usr/bin/env python3
+"""
+令牌桶限流
+限制对同一上游数据源的请求速率，供多个工作线程共享
+"""
+
+import threading
+import time
+from typing import Dict, Optional
+
+
+class RateLimiter:
+    """线程安全的令牌桶限流器"""
+
+    def __init__(self, rate: float, burst: Optional[int] = None):
+        """
+        Args:
+            rate: 每秒补充的令牌数，即稳定请求速率，<=0表示不限流
+            burst: 令牌桶容量，即允许的瞬时并发请求数，默认等于rate
+        """
+        self.rate = float(rate)
+        self.burst = max(int(burst if burst is not None else rate), 1)
+        self._tokens = float(self.burst)
+        self._updated_at = time.monotonic()
+        self._lock = threading.Lock()
+
+        self.acquired = 0
+        self.waited_seconds = 0.0
+
+    def _refill(self, now: float):
+        self._tokens = min(self.burst, self._tokens + (now - self._updated_at) * self.rate)
+        self._updated_at = now
+
+    def acquire(self, timeout: Optional[float] = None) -> bool:
+        """
+        获取一个令牌，令牌不足时阻塞等待
+
+        Args:
+            timeout: 最长等待时间（秒），None表示一直等待
+
+        Returns:
+            是否获取成功
+        """
+        if self.rate <= 0:
+            return True
+
+        start = time.monotonic()
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._refill(now)
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    self.acquired += 1
+                    self.waited_seconds += now - start
+                    return True
+                wait = (1 - self._tokens) / self.rate
+
+            if timeout is not None:
+                remaining = timeout - (time.monotonic() - start)
+                if remaining <= 0:
+                    return False
+                wait = min(wait, remaining)
+            time.sleep(wait)
+
+    def stats(self) -> Dict:
+        """获取限流统计"""
+        with self._lock:
+            return {
+                'rate': self.rate,
+                'burst': self.burst,
+                'acquired': self.acquired,
+                'waited_seconds': round(self.waited_seconds, 3)
+            }
@@ -0,0 +1,125 @@
+#!/usr/bin/env python3
+"""
+后台周期任务
+在守护线程中按固定或动态间隔执行任务，记录执行统计
+"""
+
+import logging
+import threading
+import time
+from typing import Callable, Dict, Optional, Union
+
+logger = logging.getLogger(__name__)
+
+Interval = Union[float, Callable[[], float]]
+
+
+class PeriodicTask:
+    """后台周期任务"""
+
+    def __init__(self, name: str, func: Callable[[], object], interval: Interval,
+                 initial_delay: float = 0):
+        """
+        Args:
+            name: 任务名称
+            func: 任务函数
+            interval: 执行间隔（秒），也可以是每次执行后调用、返回下次间隔的函数
+            initial_delay: 首次执行前的等待时间（秒）
+        """
+        self.name = name
+        self.func = func
+        self.interval = interval
+        self.initial_delay = initial_delay
+
+        self._wakeup = threading.Event()
+        self._stopped = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+
+        self.runs = 0
+        self.failures = 0
+        self.last_run_at: Optional[float] = None
+        self.last_duration_ms: Optional[float] = None
+        self.last_error: Optional[str] = None
+        self.last_result: object = None
+        self.next_run_at: Optional[float] = None
+
+    def start(self) -> 'PeriodicTask':
+        """启动任务线程，重复调用无副作用"""
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._stopped.clear()
+                self._thread = threading.Thread(target=self._loop, name=self.name, daemon=True)
+                self._thread.start()
+                logger.info(f"后台任务 {self.name} 已启动")
+        return self
+
+    def stop(self, timeout: float = 5):
+        """停止任务线程"""
+        self._stopped.set()
+        self._wakeup.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def trigger(self):
+        """立即唤醒任务执行一次"""
+        self._wakeup.set()
+
+    @property
+    def running(self) -> bool:
+        """任务线程是否在运行"""
+        return self._thread is not None and self._thread.is_alive()
+
+    def run_once(self) -> object:
+        """在当前线程中执行一次任务并记录统计"""
+        start = time.perf_counter()
+        self.last_run_at = time.time()
+        try:
+            self.last_result = self.func()
+            self.last_error = None
+            return self.last_result
+        except Exception as e:
+            self.failures += 1
+            self.last_error = str(e)
+            logger.error(f"后台任务 {self.name} 执行失败: {str(e)}")
+            return None
+        finally:
+            self.runs += 1
+            self.last_duration_ms = round((time.perf_counter() - start) * 1000, 1)
+
+    def _next_interval(self) -> float:
+        """计算下次执行间隔"""
+        try:
+            interval = self.interval() if callable(self.interval) else self.interval
+        except Exception as e:
+            logger.error(f"后台任务 {self.name} 计算执行间隔失败: {str(e)}")
+            interval = 60
+        return max(float(interval), 0.0)
+
+    def _wait(self, seconds: float):
+        """等待指定时间，可被trigger或stop提前唤醒"""
+        self.next_run_at = time.time() + seconds
+        self._wakeup.wait(seconds)
+        self._wakeup.clear()
+
+    def _loop(self):
+        if self.initial_delay > 0:
+            self._wait(self.initial_delay)
+        while not self._stopped.is_set():
+            self.run_once()
+            if self._stopped.is_set():
+                break
+            self._wait(self._next_interval())
+
+    def stats(self) -> Dict:
+        """获取任务执行统计"""
+        return {
+            'name': self.name,
+            'running': self.running,
+            'runs': self.runs,
+            'failures': self.failures,
+            'last_run_at': self.last_run_at,
+            'last_duration_ms': self.last_duration_ms,
+            'last_error': self.last_error,
+            'next_run_in': round(self.next_run_at - time.time(), 1) if self.next_run_at else None
+        }
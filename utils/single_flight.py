@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+"""
+请求合并（single-flight）
+同一个key同时只执行一次，并发的调用者等待并共享该次执行的结果或异常
+"""
+
+import threading
+from typing import Callable, Dict, Hashable, TypeVar
+
+T = TypeVar('T')
+
+
+class _Flight:
+    """一次进行中的调用"""
+
+    __slots__ = ('done', 'result', 'error', 'waiters')
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        self.waiters = 0
+
+
+class SingleFlight:
+    """请求合并器"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._flights: Dict[Hashable, _Flight] = {}
+        self._stats: Dict[Hashable, Dict[str, int]] = {}
+
+    def _key_stats(self, key: Hashable) -> Dict[str, int]:
+        stats = self._stats.get(key)
+        if stats is None:
+            stats = self._stats[key] = {'calls': 0, 'executions': 0, 'coalesced': 0, 'errors': 0, 'in_flight': 0}
+        return stats
+
+    def do(self, key: Hashable, func: Callable[[], T]) -> T:
+        """
+        执行func，若同一key已有调用在进行中则等待其结果
+
+        Args:
+            key: 合并键，例如数据集名称
+            func: 实际执行的函数
+
+        Returns:
+            func的返回值（与同批调用者共享）
+        """
+        with self._lock:
+            stats = self._key_stats(key)
+            stats['calls'] += 1
+            flight = self._flights.get(key)
+            if flight is not None:
+                flight.waiters += 1
+                stats['coalesced'] += 1
+                leader = False
+            else:
+                flight = self._flights[key] = _Flight()
+                stats['executions'] += 1
+                stats['in_flight'] = 1
+                leader = True
+
+        if not leader:
+            flight.done.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.result
+
+        try:
+            flight.result = func()
+            return flight.result
+        except BaseException as e:
+            flight.error = e
+            with self._lock:
+                stats['errors'] += 1
+            raise
+        finally:
+            with self._lock:
+                del self._flights[key]
+                stats['in_flight'] = 0
+            flight.done.set()
+
+    def stats(self) -> Dict[str, Dict[str, int]]:
+        """获取各key的调用统计"""
+        with self._lock:
+            return {str(key): dict(value) for key, value in self._stats.items()}
@@ -0,0 +1,185 @@
+#!/usr/bin/env python3
+"""
+A股交易日历
+提供交易时段判断、下一次开盘时间计算，以及按交易时段确定各类缓存数据的有效期
+"""
+
+import json
+import logging
+import os
+import time
+from datetime import date, datetime, time as dtime, timedelta, timezone
+from pathlib import Path
+from typing import Dict, Iterable, Optional, Set, Tuple, Union
+
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+# 上海证券交易所使用北京时间，无夏令时
+CHINA_TZ = timezone(timedelta(hours=8))
+
+# 交易时段（含集合竞价），收盘后保留少量时间等待收盘数据落定
+DEFAULT_SESSIONS: Tuple[Tuple[dtime, dtime], ...] = (
+    (dtime(9, 15), dtime(11, 32)),
+    (dtime(13, 0), dtime(15, 2)),
+)
+
+# 交易时段内各类数据的缓存有效期（秒）
+DEFAULT_INTRADAY_TTLS: Dict[str, float] = {
+    'realtime': Config.DATA_UPDATE_INTERVAL,  # 实时行情快照
+    'fundamental': 12 * 3600,  # 财务报表等基本面数据
+    'company_info': 3600,  # 个股资料（含最新价、市值）
+    'valuation': 600,  # 估值指标
+    'fund_flow': 300,  # 资金流向
+    'index_history': 300,  # 指数日线（当日K线盘中变化）
+    'daily_bars': 300,  # 个股日线
+    'intraday_bars': 60,  # 个股分钟线
+}
+
+DEFAULT_HOLIDAYS_FILE = Path(__file__).parent / 'trading_holidays.json'
+
+Timestamp = Union[float, datetime, None]
+
+
+class TradingCalendar:
+    """A股交易日历"""
+
+    def __init__(self, holidays: Optional[Iterable[date]] = None,
+                 holidays_file: Optional[str] = None,
+                 sessions: Tuple[Tuple[dtime, dtime], ...] = DEFAULT_SESSIONS,
+                 intraday_ttls: Optional[Dict[str, float]] = None):
+        """
+        Args:
+            holidays: 休市日期，提供时不再读取文件
+            holidays_file: 休市日期文件，默认读取TRADING_HOLIDAYS_FILE或内置文件
+            sessions: 交易时段列表
+            intraday_ttls: 交易时段内各类数据的缓存有效期（秒），覆盖默认值
+        """
+        self.sessions = sessions
+        self.intraday_ttls = dict(DEFAULT_INTRADAY_TTLS, **(intraday_ttls or {}))
+        if holidays is not None:
+            self.holidays: Set[date] = set(holidays)
+        else:
+            self.holidays = self._load_holidays(
+                holidays_file or os.environ.get('TRADING_HOLIDAYS_FILE') or str(DEFAULT_HOLIDAYS_FILE))
+
+    @staticmethod
+    def _load_holidays(path: str) -> Set[date]:
+        """从JSON文件加载休市日期，文件格式为 {"holidays": ["2025-01-01", ...]}"""
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            holidays = {date.fromisoformat(day) for day in data.get('holidays', [])}
+            logger.info(f"已加载 {len(holidays)} 个休市日期: {path}")
+            return holidays
+        except FileNotFoundError:
+            logger.warning(f"休市日期文件不存在，仅按周末判断休市: {path}")
+        except Exception as e:
+            logger.error(f"加载休市日期文件失败: {str(e)}")
+        return set()
+
+    @staticmethod
+    def to_local(ts: Timestamp = None) -> datetime:
+        """将epoch秒或datetime转换为北京时间，naive datetime视为本地时间"""
+        if ts is None:
+            ts = time.time()
+        if isinstance(ts, datetime):
+            ts = ts.timestamp()
+        return datetime.fromtimestamp(ts, CHINA_TZ)
+
+    def is_trading_day(self, day: date) -> bool:
+        """判断是否为交易日"""
+        return day.weekday() < 5 and day not in self.holidays
+
+    def is_trading_time(self, ts: Timestamp = None) -> bool:
+        """判断是否处于交易时段"""
+        local = self.to_local(ts)
+        if not self.is_trading_day(local.date()):
+            return False
+        now = local.time()
+        return any(start <= now < end for start, end in self.sessions)
+
+    def next_session_open(self, ts: Timestamp = None) -> datetime:
+        """
+        计算下一个交易时段的开始时间
+
+        Args:
+            ts: 参考时间，默认当前时间
+
+        Returns:
+            下一个交易时段开始时间（北京时间），处于交易时段中时返回参考时间本身
+        """
+        local = self.to_local(ts)
+        day = local.date()
+        for offset in range(0, 366):
+            current = day + timedelta(days=offset)
+            if not self.is_trading_day(current):
+                continue
+            for start, end in self.sessions:
+                session_start = datetime.combine(current, start, CHINA_TZ)
+                session_end = datetime.combine(current, end, CHINA_TZ)
+                if local < session_start:
+                    return session_start
+                if local < session_end:
+                    return local
+        # 休市日期配置异常时避免无限等待
+        return local + timedelta(days=1)
+
+    def last_session_date(self, ts: Timestamp = None) -> date:
+        """
+        最近一个已开盘的交易日：当日首个交易时段已开始时为当日，
+        否则（开盘前、周末及节假日）为此前最后一个交易日
+
+        Args:
+            ts: 参考时间，默认当前时间
+
+        Returns:
+            交易日日期（北京时间）
+        """
+        local = self.to_local(ts)
+        day = local.date()
+        if self.is_trading_day(day) and local.time() >= self.sessions[0][0]:
+            return day
+        for offset in range(1, 366):
+            current = day - timedelta(days=offset)
+            if self.is_trading_day(current):
+                return current
+        # 休市日期配置异常时退回参考日期
+        return day
+
+    def seconds_until_open(self, ts: Timestamp = None) -> float:
+        """距离下一个交易时段开始的秒数，交易时段中返回0"""
+        local = self.to_local(ts)
+        return max((self.next_session_open(local) - local).total_seconds(), 0.0)
+
+    def expires_at(self, kind: str, fetched_at: Timestamp) -> float:
+        """
+        计算缓存数据的过期时间
+
+        数据在交易时段内按kind对应的有效期过期；过期时间落在休市时段时
+        （午休、收盘后、周末及节假日），顺延到下一个交易时段开始
+
+        Args:
+            kind: 数据类别，见DEFAULT_INTRADAY_TTLS
+            fetched_at: 数据获取时间
+
+        Returns:
+            过期时间（epoch秒）
+        """
+        fetched = self.to_local(fetched_at)
+        expiry = fetched + timedelta(seconds=self.intraday_ttls[kind])
+        return self.next_session_open(expiry).timestamp()
+
+    def ttl_seconds(self, kind: str, ts: Timestamp = None) -> float:
+        """在指定时间获取的数据还能缓存的秒数"""
+        local = self.to_local(ts)
+        return self.expires_at(kind, local) - local.timestamp()
+
+    def is_fresh(self, kind: str, fetched_at: Timestamp, now: Timestamp = None) -> bool:
+        """判断缓存数据是否仍在有效期内"""
+        return self.expires_at(kind, fetched_at) > self.to_local(now).timestamp()
+
+
+# 全局交易日历
+trading_calendar = TradingCalendar()
@@ -0,0 +1,190 @@
+#!/usr/bin/env python3
+"""
+上游调用超时控制
+在共享工作线程中执行上游调用，调用方按单次超时与整体时间预算等待结果，
+超时后放弃等待（调用在工作线程中自行结束），不修改进程级socket超时。
+工作线程中未指定超时的requests请求使用默认读超时，使被放弃的调用最终释放线程；
+仍在运行的已放弃调用占用过多工作线程时拒绝新的调用，避免线程池耗尽后所有上游调用都超时
+"""
+
+import logging
+import os
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from typing import Callable, Dict, Optional, TypeVar
+
+from requests.adapters import HTTPAdapter
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar('T')
+
+
+class UpstreamTimeout(Exception):
+    """上游调用超过超时时间或时间预算"""
+
+
+class UpstreamSaturated(UpstreamTimeout):
+    """仍在运行的已放弃调用过多，拒绝新的上游调用"""
+
+
+# 工作线程的线程局部配置，requests请求未指定超时时使用其中的socket_timeout
+_worker = threading.local()
+
+
+def _install_requests_timeout():
+    """
+    为requests的HTTPAdapter.send补充默认超时：只在上游工作线程中、且调用方未指定超时时生效，
+    其他线程的请求不受影响。重复调用无副作用
+    """
+    if getattr(HTTPAdapter.send, 'upstream_default_timeout', False):
+        return
+    original = HTTPAdapter.send
+
+    def send(self, request, stream=False, timeout=None, *args, **kwargs):
+        if timeout is None:
+            timeout = getattr(_worker, 'socket_timeout', None)
+        return original(self, request, stream, timeout, *args, **kwargs)
+
+    send.upstream_default_timeout = True
+    HTTPAdapter.send = send
+
+
+class Budget:
+    """一次请求的整体时间预算"""
+
+    def __init__(self, seconds: Optional[float]):
+        """
+        Args:
+            seconds: 预算时长（秒），None表示不限
+        """
+        self.seconds = seconds
+        self.deadline = time.monotonic() + seconds if seconds is not None else None
+
+    def remaining(self) -> Optional[float]:
+        """剩余秒数，不限时返回None"""
+        if self.deadline is None:
+            return None
+        return max(self.deadline - time.monotonic(), 0.0)
+
+    @property
+    def expired(self) -> bool:
+        """预算是否已用完"""
+        return self.deadline is not None and time.monotonic() >= self.deadline
+
+    def timeout(self, per_call: Optional[float]) -> Optional[float]:
+        """单次调用可等待的时间：单次超时与剩余预算中较小者"""
+        remaining = self.remaining()
+        if remaining is None:
+            return per_call
+        if per_call is None:
+            return remaining
+        return min(per_call, remaining)
+
+
+class UpstreamExecutor:
+    """执行上游调用的共享线程池"""
+
+    def __init__(self, max_workers: Optional[int] = None, socket_timeout: Optional[float] = None,
+                 max_abandoned_ratio: Optional[float] = None):
+        """
+        Args:
+            max_workers: 最大工作线程数，默认读取UPSTREAM_WORKERS
+            socket_timeout: 工作线程中requests请求的默认读超时（秒），默认读取UPSTREAM_SOCKET_TIMEOUT
+            max_abandoned_ratio: 已放弃调用占工作线程数的比例上限，达到后拒绝新调用，默认读取UPSTREAM_MAX_ABANDONED_RATIO
+        """
+        self.max_workers = max_workers or int(os.environ.get('UPSTREAM_WORKERS', 16))
+        self.socket_timeout = socket_timeout or float(os.environ.get('UPSTREAM_SOCKET_TIMEOUT', 120))
+        ratio = max_abandoned_ratio or float(os.environ.get('UPSTREAM_MAX_ABANDONED_RATIO', 0.5))
+        self.max_abandoned = max(1, int(self.max_workers * ratio))
+        _install_requests_timeout()
+        self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='upstream',
+                                            initializer=self._init_worker)
+        self._lock = threading.Lock()
+        self._stats: Dict[str, Dict[str, int]] = {}
+        self._abandoned = 0  # 仍在运行的已放弃调用数
+
+    def _init_worker(self):
+        _worker.socket_timeout = self.socket_timeout
+
+    def _abandon(self, name: str, future: Future):
+        """记录放弃的调用，调用结束后释放"""
+        def release(_):
+            with self._lock:
+                self._abandoned -= 1
+            self._count(name, 'abandoned', -1)
+
+        with self._lock:
+            self._abandoned += 1
+            saturated = self._abandoned == self.max_abandoned
+        self._count(name, 'abandoned')
+        if saturated:
+            logger.error(f"上游线程池中已放弃但仍在运行的调用达到 {self.max_abandoned} 个"
+                         f"（共 {self.max_workers} 个工作线程），在其结束前拒绝新的上游调用")
+        future.add_done_callback(release)
+
+    def _count(self, name: str, field: str, delta: int = 1):
+        with self._lock:
+            stats = self._stats.setdefault(name, {'calls': 0, 'timeouts': 0, 'errors': 0, 'abandoned': 0,
+                                                   'rejected': 0})
+            stats[field] += delta
+
+    def submit(self, name: str, func: Callable[..., T], *args, **kwargs) -> 'Future[T]':
+        """
+        提交上游调用，返回Future
+
+        Raises:
+            UpstreamSaturated: 仍在运行的已放弃调用达到上限
+        """
+        with self._lock:
+            abandoned = self._abandoned
+        if abandoned >= self.max_abandoned:
+            self._count(name, 'rejected')
+            raise UpstreamSaturated(f"上游线程池被 {abandoned} 个超时调用占用，拒绝调用 {name}")
+        self._count(name, 'calls')
+        return self._executor.submit(func, *args, **kwargs)
+
+    def call(self, name: str, func: Callable[..., T], *args,
+             timeout: Optional[float] = None, budget: Optional[Budget] = None, **kwargs) -> T:
+        """
+        在工作线程中执行上游调用并等待结果
+
+        Args:
+            name: 上游接口名称，用于统计
+            func: 上游调用
+            timeout: 单次调用超时（秒）
+            budget: 请求整体时间预算
+
+        Returns:
+            func的返回值
+
+        Raises:
+            UpstreamTimeout: 超时或预算已用完
+            UpstreamSaturated: 仍在运行的已放弃调用达到上限
+        """
+        wait = budget.timeout(timeout) if budget is not None else timeout
+        if wait is not None and wait <= 0:
+            raise UpstreamTimeout(f"上游接口 {name} 时间预算已用完")
+
+        future = self.submit(name, func, *args, **kwargs)
+        try:
+            return future.result(timeout=wait)
+        except FutureTimeoutError:
+            # 未开始的调用直接取消，已开始的调用在工作线程中继续执行直至结束，结果被丢弃
+            if not future.cancel():
+                self._abandon(name, future)
+            self._count(name, 'timeouts')
+            raise UpstreamTimeout(f"上游接口 {name} 调用超时（{wait:.1f}秒）")
+        except Exception:
+            self._count(name, 'errors')
+            raise
+
+    def stats(self) -> Dict[str, Dict[str, int]]:
+        """获取各上游接口的调用统计，abandoned为仍在运行的已放弃调用数，rejected为线程池饱和时被拒绝的调用数"""
+        with self._lock:
+            return {name: dict(value) for name, value in self._stats.items()}
+
+
+# 全局上游调用线程池
+upstream = UpstreamExecutor()